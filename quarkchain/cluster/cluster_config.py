@@ -121,6 +121,17 @@ class ClusterConfig(BaseConfig):
     JSON_RPC_PORT = 38391
     PRIVATE_JSON_RPC_PORT = 38491
     ENABLE_TRANSACTION_HISTORY = False
+    # processes per slave to recover the tx senders of blocks and tx lists, 0 to disable
+    SIGNATURE_RECOVERY_WORKERS = 0
+    # processes per shard to execute the txs of a block optimistically in parallel, 0 to disable
+    PARALLEL_TX_EXECUTION_WORKERS = 0
+    # processes per master and per slave to verify the seals of synced headers, 0 to disable
+    SEAL_VERIFICATION_WORKERS = 0
+    # root blocks behind the tip of the pivot block whose evm state is downloaded by a cluster
+    # syncing from far behind, instead of running the blocks up to it, 0 to disable
+    FAST_SYNC_PIVOT_DISTANCE = 0
+    # run each shard of a slave in its own worker process, with the slave routing to them
+    PROCESS_PER_SHARD = False
 
     DB_PATH_ROOT = "./db"
     LOG_LEVEL = "info"
@@ -230,6 +241,32 @@ class ClusterConfig(BaseConfig):
             default=False,
             dest="enable_transaction_history",
         )
+        parser.add_argument(
+            "--signature_recovery_workers",
+            default=ClusterConfig.SIGNATURE_RECOVERY_WORKERS,
+            type=int,
+        )
+        parser.add_argument(
+            "--parallel_tx_execution_workers",
+            default=ClusterConfig.PARALLEL_TX_EXECUTION_WORKERS,
+            type=int,
+        )
+        parser.add_argument(
+            "--seal_verification_workers",
+            default=ClusterConfig.SEAL_VERIFICATION_WORKERS,
+            type=int,
+        )
+        parser.add_argument(
+            "--fast_sync_pivot_distance",
+            default=ClusterConfig.FAST_SYNC_PIVOT_DISTANCE,
+            type=int,
+        )
+        parser.add_argument(
+            "--process_per_shard",
+            action="store_true",
+            default=ClusterConfig.PROCESS_PER_SHARD,
+            dest="process_per_shard",
+        )
 
         parser.add_argument(
             "--simple_network_bootstrap_host",
@@ -295,6 +332,11 @@ class ClusterConfig(BaseConfig):
             config.CLEAN = args.clean
             config.START_SIMULATED_MINING = args.start_simulated_mining
             config.ENABLE_TRANSACTION_HISTORY = args.enable_transaction_history
+            config.SIGNATURE_RECOVERY_WORKERS = args.signature_recovery_workers
+            config.PARALLEL_TX_EXECUTION_WORKERS = args.parallel_tx_execution_workers
+            config.SEAL_VERIFICATION_WORKERS = args.seal_verification_workers
+            config.FAST_SYNC_PIVOT_DISTANCE = args.fast_sync_pivot_distance
+            config.PROCESS_PER_SHARD = args.process_per_shard
 
             config.QUARKCHAIN.update(
                 args.num_shards,
@@ -58,25 +58,20 @@ class Filter:
     def _get_block_candidates(self) -> List[MinorBlock]:
         """Use given criteria to generate potential blocks matching the bloom."""
         ret = []
-        for i in range(self.start_block, self.end_block + 1):
-            block = self.db.get_minor_block_by_height(i)
+        for i, height in enumerate(
+            self.db.get_minor_block_heights_by_bloom(
+                self.bloom_bits, self.start_block, self.end_block + 1
+            )
+        ):
+            block = self.db.get_minor_block_by_height(height)
             if not block:
                 Logger.error(
                     "No block found for height {} at shard {}".format(
-                        i, self.db.branch.get_shard_id()
+                        height, self.db.branch.get_shard_id()
                     )
                 )
                 continue
-            should_skip_block = False
-            # same byte order as in bloom.py
-            header_bloom = block.header.bloom
-            for bit_list in self.bloom_bits:
-                if not any((header_bloom & i) == i for i in bit_list):
-                    should_skip_block = True
-                    break
-
-            if not should_skip_block:
-                ret.append(block)
+            ret.append(block)
 
             if (1 + i) % 100 == 0 and time.time() - self.start_ts > Filter.TIMEOUT:
                 raise Exception("Filter timeout")
@@ -87,8 +82,7 @@ class Filter:
         """Given potential blocks, re-run tx to find exact matches."""
         ret = []
         for b_i, block in enumerate(blocks):
-            for i in range(len(block.tx_list or [])):
-                r = block.get_receipt(self.db.db, i)
+            for r in self.db.get_minor_block_receipts(block):
                 for log in r.logs:
                     # empty recipient means no filtering
                     if self.recipients and log.recipient not in self.recipients:
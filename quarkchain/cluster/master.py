@@ -10,6 +10,7 @@ from typing import Optional, List, Union, Dict, Tuple
 
 from quarkchain.cluster.guardian import Guardian
 from quarkchain.cluster.miner import Miner, MiningWork, validate_seal
+from quarkchain.cluster.neighbor import is_neighbor
 from quarkchain.cluster.p2p_commands import (
     CommandOp,
     Direction,
@@ -24,6 +25,7 @@ from quarkchain.cluster.protocol import (
     NULL_CONNECTION,
 )
 from quarkchain.cluster.root_state import RootState
+from quarkchain.cluster.seal_verification import SealVerification
 from quarkchain.cluster.rpc import (
     AddMinorBlockHeaderResponse,
     GetEcoInfoListRequest,
@@ -36,6 +38,8 @@ from quarkchain.cluster.rpc import (
     CreateClusterPeerConnectionRequest,
     DestroyClusterPeerConnectionCommand,
     SyncMinorBlockListRequest,
+    FastSyncMinorBlockListRequest,
+    FastSyncStateRequest,
     GetMinorBlockRequest,
     GetTransactionRequest,
     ArtificialTxConfig,
@@ -87,8 +91,17 @@ TIMEOUT = 10
 class SyncTask:
     """ Given a header and a peer, the task will synchronize the local state
     including root chain and shards with the peer up to the height of the header.
+    The minor blocks of the next root blocks are synced while a root block is added,
+    and the next batch of root blocks is downloaded while the current one is synced.
+    A cluster catching up from far behind may fast sync instead, by adding the root blocks
+    up to a pivot with their minor blocks not run, and downloading the evm state of each
+    shard at the pivot.
     """
 
+    BLOCK_BATCH_SIZE = 100
+    # root blocks whose minor blocks are synced ahead of adding them
+    MAX_BLOCKS_IN_FLIGHT = 8
+
     def __init__(self, header, peer):
         self.header = header
         self.peer = peer
@@ -97,6 +110,10 @@ class SyncTask:
         self.max_staleness = (
             self.root_state.env.quark_chain_config.ROOT.MAX_STALE_ROOT_BLOCK_HEIGHT_DIFF
         )
+        # root block hash -> future done once the block is added, for the blocks being synced
+        self.block_added_futures = dict()
+        # branch -> future of the last minor block sync requested for the shard
+        self.shard_sync_futures = dict()
 
     async def sync(self):
         try:
@@ -134,7 +151,7 @@ class SyncTask:
             block_header_list = await asyncio.wait_for(
                 self.__download_block_headers(block_hash), TIMEOUT
             )
-            self.__validate_block_headers(block_header_list)
+            await self.__validate_block_headers(block_header_list)
             for header in block_header_list:
                 if self.__has_block_hash(header.get_hash()):
                     break
@@ -150,32 +167,61 @@ class SyncTask:
             )
         )
 
-        while len(block_header_chain) > 0:
-            block_chain = await asyncio.wait_for(
-                self.__download_blocks(block_header_chain[:100]), TIMEOUT
-            )
-            Logger.info(
-                "[R] downloaded {} blocks ({} - {}) from peer".format(
-                    len(block_chain),
-                    block_chain[0].header.height,
-                    block_chain[-1].header.height,
-                )
-            )
-            if len(block_chain) != len(block_header_chain[:100]):
-                # TODO: tag bad peer
-                raise RuntimeError("Bad peer missing blocks for headers they have")
+        pivot_index = self.__get_fast_sync_pivot_index(block_header_chain)
+        if pivot_index is not None:
+            await self.__fast_sync(block_header_chain[: pivot_index + 1])
+            block_header_chain = block_header_chain[pivot_index + 1 :]
+
+        batches = deque(
+            block_header_chain[i : i + self.BLOCK_BATCH_SIZE]
+            for i in range(0, len(block_header_chain), self.BLOCK_BATCH_SIZE)
+        )
+        batch_downloads = deque()
+        blocks = deque()  # downloaded but not in flight yet
+        # (root block, future of syncing its minor blocks) in ascending height
+        blocks_in_flight = deque()
+        try:
+            while True:
+                while len(blocks_in_flight) < self.MAX_BLOCKS_IN_FLIGHT:
+                    # the next batch is downloaded while the current one is synced
+                    while batches and len(batch_downloads) < 2:
+                        batch_downloads.append(
+                            asyncio.ensure_future(
+                                self.__download_block_batch(batches.popleft())
+                            )
+                        )
+                    if not blocks:
+                        if not batch_downloads:
+                            break
+                        blocks.extend(await batch_downloads.popleft())
+                    root_block = blocks.popleft()
+                    blocks_in_flight.append(
+                        (root_block, self.__start_syncing_minor_blocks(root_block))
+                    )
+                if not blocks_in_flight:
+                    break
 
-            for block in block_chain:
-                await self.__add_block(block)
-                block_header_chain.pop(0)
+                await self.__add_block(*blocks_in_flight.popleft())
+        finally:
+            futures = list(batch_downloads) + [f for _, f in blocks_in_flight]
+            for future in futures + list(self.shard_sync_futures.values()):
+                # the exception, if any, of a future not needed anymore is ignored
+                if not future.cancel() and not future.cancelled():
+                    future.exception()
 
     def __has_block_hash(self, block_hash):
         return self.root_state.contain_root_block_by_hash(block_hash)
 
-    def __validate_block_headers(self, block_header_list):
+    async def __validate_block_headers(self, block_header_list):
         """Raise on validation failure"""
         # TODO: tag bad peer
         consensus_type = self.root_state.env.quark_chain_config.ROOT.CONSENSUS_TYPE
+        adjusted_diff_list = [
+            self.__get_adjusted_difficulty(header) for header in block_header_list[:-1]
+        ]
+        await self.master_server.seal_verification.verify(
+            block_header_list[:-1], consensus_type, adjusted_diff_list
+        )
         for i in range(len(block_header_list) - 1):
             header, prev = block_header_list[i : i + 2]
             if header.height != prev.height + 1:
@@ -187,18 +233,19 @@ class SyncTask:
                     "Bad peer sending root block headers with discontinuous hash_prev_block"
                 )
 
-            # check difficulty, potentially adjusted by guardian mechanism
-            adjusted_diff = None  # type: Optional[int]
-            if not self.root_state.env.quark_chain_config.SKIP_ROOT_DIFFICULTY_CHECK:
-                # lower the difficulty for root block signed by guardian
-                if header.verify_signature(
-                    self.root_state.env.quark_chain_config.guardian_public_key
-                ):
-                    adjusted_diff = Guardian.adjust_difficulty(
-                        header.difficulty, header.height
-                    )
             # check PoW if applicable
-            validate_seal(header, consensus_type, adjusted_diff=adjusted_diff)
+            validate_seal(header, consensus_type, adjusted_diff=adjusted_diff_list[i])
+
+    def __get_adjusted_difficulty(self, header) -> Optional[int]:
+        """ The difficulty potentially adjusted by guardian mechanism """
+        if self.root_state.env.quark_chain_config.SKIP_ROOT_DIFFICULTY_CHECK:
+            return None
+        # lower the difficulty for root block signed by guardian
+        if header.verify_signature(
+            self.root_state.env.quark_chain_config.guardian_public_key
+        ):
+            return Guardian.adjust_difficulty(header.difficulty, header.height)
+        return None
 
     async def __download_block_headers(self, block_hash):
         request = GetRootBlockHeaderListRequest(
@@ -209,6 +256,22 @@ class SyncTask:
         )
         return resp.block_header_list
 
+    async def __download_block_batch(self, block_header_list):
+        block_chain = await asyncio.wait_for(
+            self.__download_blocks(block_header_list), TIMEOUT
+        )
+        Logger.info(
+            "[R] downloaded {} blocks ({} - {}) from peer".format(
+                len(block_chain),
+                block_chain[0].header.height,
+                block_chain[-1].header.height,
+            )
+        )
+        if len(block_chain) != len(block_header_list):
+            # TODO: tag bad peer
+            raise RuntimeError("Bad peer missing blocks for headers they have")
+        return block_chain
+
     async def __download_blocks(self, block_header_list):
         block_hash_list = [b.get_hash() for b in block_header_list]
         op, resp, rpc_id = await self.peer.write_rpc_request(
@@ -217,15 +280,129 @@ class SyncTask:
         )
         return resp.root_block_list
 
-    async def __add_block(self, root_block):
+    def __get_fast_sync_pivot_index(self, block_header_chain) -> Optional[int]:
+        """ Return the index of the pivot block in block_header_chain if fast sync applies """
+        pivot_distance = self.root_state.env.cluster_config.FAST_SYNC_PIVOT_DISTANCE
+        if pivot_distance <= 0 or len(block_header_chain) <= pivot_distance:
+            return None
+        # only for catching up with the chain from the root tip, with all the shards created
+        if block_header_chain[0].hash_prev_block != self.root_state.tip.get_hash():
+            return None
+        qkc_config = self.root_state.env.quark_chain_config
+        for shard_id in range(qkc_config.SHARD_SIZE):
+            if (
+                qkc_config.get_genesis_root_height(shard_id)
+                > self.root_state.tip.height
+            ):
+                return None
+        return len(block_header_chain) - 1 - pivot_distance
+
+    async def __fast_sync(self, block_header_list):
+        """ Add the root blocks with their minor blocks stored but not run, and then download
+        the evm state of each shard at the last minor block confirmed by the pivot block.
+        """
+        Logger.info(
+            "[R] fast syncing {} blocks ({} - {})".format(
+                len(block_header_list),
+                block_header_list[0].height,
+                block_header_list[-1].height,
+            )
+        )
+        batches = deque(
+            block_header_list[i : i + self.BLOCK_BATCH_SIZE]
+            for i in range(0, len(block_header_list), self.BLOCK_BATCH_SIZE)
+        )
+        # the next batch is downloaded while the current one is synced
+        batch_download = asyncio.ensure_future(
+            self.__download_block_batch(batches.popleft())
+        )
+        try:
+            while batch_download:
+                root_block_list = await batch_download
+                batch_download = (
+                    asyncio.ensure_future(
+                        self.__download_block_batch(batches.popleft())
+                    )
+                    if batches
+                    else None
+                )
+                await self.__fast_sync_minor_blocks(root_block_list)
+                for root_block in root_block_list:
+                    await self.master_server.add_root_block(root_block)
+        finally:
+            if batch_download and not batch_download.cancel():
+                batch_download.exception()
+
+        start = time.time()
+        future_list = []
+        for branch_value in self.master_server.branch_to_slaves:
+            branch = Branch(branch_value)
+            slave_conn = self.master_server.get_slave_connection(branch=branch)
+            future_list.append(
+                slave_conn.write_rpc_request(
+                    op=ClusterOp.FAST_SYNC_STATE_REQUEST,
+                    cmd=FastSyncStateRequest(branch, self.peer.get_cluster_peer_id()),
+                )
+            )
+        for _, result, _ in await asyncio.gather(*future_list):
+            if result.error_code != 0:
+                raise RuntimeError("Unable to download the state of the pivot block")
+            self.master_server.update_shard_stats(result.shard_stats)
+        Logger.info(
+            "[R] downloaded the state at root block {} {} in {:.2f} seconds".format(
+                block_header_list[-1].height,
+                block_header_list[-1].get_hash().hex(),
+                time.time() - start,
+            )
+        )
+
+    async def __fast_sync_minor_blocks(self, root_block_list):
+        # branch -> hashes of the minor blocks in the root blocks
+        block_hash_map = dict()
+        for root_block in root_block_list:
+            for m_header in root_block.minor_block_header_list:
+                block_hash_map.setdefault(m_header.branch, []).append(
+                    m_header.get_hash()
+                )
+
+        future_list = []
+        for branch, m_block_hash_list in block_hash_map.items():
+            xshard_block_hash_list = [
+                h
+                for b, hash_list in block_hash_map.items()
+                if b != branch and is_neighbor(branch, b)
+                for h in hash_list
+            ]
+            slave_conn = self.master_server.get_slave_connection(branch=branch)
+            future_list.append(
+                slave_conn.write_rpc_request(
+                    op=ClusterOp.FAST_SYNC_MINOR_BLOCK_LIST_REQUEST,
+                    cmd=FastSyncMinorBlockListRequest(
+                        m_block_hash_list,
+                        xshard_block_hash_list,
+                        branch,
+                        self.peer.get_cluster_peer_id(),
+                    ),
+                )
+            )
+        for _, result, _ in await asyncio.gather(*future_list):
+            if result.error_code != 0:
+                raise RuntimeError("Unable to fast sync minor blocks from root blocks")
+
+        for m_block_hash_list in block_hash_map.values():
+            for m_block_hash in m_block_hash_list:
+                self.root_state.add_validated_minor_block_hash(m_block_hash)
+
+    async def __add_block(self, root_block, minor_block_sync):
         Logger.info(
             "[R] syncing root block {} {}".format(
                 root_block.header.height, root_block.header.get_hash().hex()
             )
         )
         start = time.time()
-        await self.__sync_minor_blocks(root_block.minor_block_header_list)
+        await minor_block_sync
         await self.master_server.add_root_block(root_block)
+        self.block_added_futures.pop(root_block.header.get_hash()).set_result(None)
         elapse = time.time() - start
         Logger.info(
             "[R] syncing root block {} {} took {:.2f} seconds".format(
@@ -233,26 +410,66 @@ class SyncTask:
             )
         )
 
-    async def __sync_minor_blocks(self, minor_block_header_list):
+    def __start_syncing_minor_blocks(self, root_block):
+        """ Return the future of syncing the minor blocks of the root block, which are synced
+        for each shard after those of the previous root blocks, and after the root blocks
+        they are on are added.
+        """
         minor_block_download_map = dict()
-        for m_block_header in minor_block_header_list:
+        prev_root_hash_map = dict()
+        for m_block_header in root_block.minor_block_header_list:
             m_block_hash = m_block_header.get_hash()
             if not self.root_state.is_minor_block_validated(m_block_hash):
                 minor_block_download_map.setdefault(m_block_header.branch, []).append(
                     m_block_hash
                 )
+                prev_root_hash_map.setdefault(m_block_header.branch, set()).add(
+                    m_block_header.hash_prev_root_block
+                )
 
         future_list = []
         for branch, m_block_hash_list in minor_block_download_map.items():
-            slave_conn = self.master_server.get_slave_connection(branch=branch)
-            future = slave_conn.write_rpc_request(
-                op=ClusterOp.SYNC_MINOR_BLOCK_LIST_REQUEST,
-                cmd=SyncMinorBlockListRequest(
-                    m_block_hash_list, branch, self.peer.get_cluster_peer_id()
-                ),
+            # only the root blocks before this one are waited for
+            added_future_list = [
+                self.block_added_futures[h]
+                for h in prev_root_hash_map[branch]
+                if h in self.block_added_futures
+            ]
+            future = asyncio.ensure_future(
+                self.__sync_shard_minor_blocks(
+                    branch,
+                    m_block_hash_list,
+                    self.shard_sync_futures.get(branch, None),
+                    added_future_list,
+                )
             )
+            self.shard_sync_futures[branch] = future
             future_list.append(future)
 
+        self.block_added_futures[
+            root_block.header.get_hash()
+        ] = asyncio.get_event_loop().create_future()
+        return asyncio.ensure_future(
+            self.__sync_minor_blocks(root_block.minor_block_header_list, future_list)
+        )
+
+    async def __sync_shard_minor_blocks(
+        self, branch, m_block_hash_list, prev_shard_sync, added_future_list
+    ):
+        if prev_shard_sync:
+            await prev_shard_sync
+        for future in added_future_list:
+            await future
+
+        slave_conn = self.master_server.get_slave_connection(branch=branch)
+        return await slave_conn.write_rpc_request(
+            op=ClusterOp.SYNC_MINOR_BLOCK_LIST_REQUEST,
+            cmd=SyncMinorBlockListRequest(
+                m_block_hash_list, branch, self.peer.get_cluster_peer_id()
+            ),
+        )
+
+    async def __sync_minor_blocks(self, minor_block_header_list, future_list):
         result_list = await asyncio.gather(*future_list)
         for result in result_list:
             if result is Exception:
@@ -612,6 +829,9 @@ class MasterServer:
         )
 
         self.synchronizer = Synchronizer()
+        self.seal_verification = SealVerification(
+            self.cluster_config.SEAL_VERIFICATION_WORKERS, self.loop
+        )
 
         self.branch_to_shard_stats = dict()  # type: Dict[int, ShardStats]
         # (epoch in minute, tx_count in the minute)
@@ -806,6 +1026,7 @@ class MasterServer:
 
     def shutdown(self):
         # TODO: May set exception and disconnect all slaves
+        self.seal_verification.shutdown()
         if not self.shutdown_future.done():
             self.shutdown_future.set_result(None)
         if not self.cluster_active_future.done():
@@ -1305,6 +1526,24 @@ class MasterServer:
             shards[shard_id]["blockCount60s"] = shard_stats.block_count60s
             shards[shard_id]["staleBlockCount60s"] = shard_stats.stale_block_count60s
             shards[shard_id]["lastBlockTime"] = shard_stats.last_block_time
+            block_cache_lookups = (
+                shard_stats.block_cache_hits + shard_stats.block_cache_misses
+            )
+            shards[shard_id]["blockCacheHitRate"] = (
+                shard_stats.block_cache_hits / block_cache_lookups
+                if block_cache_lookups
+                else 0
+            )
+            node_cache_lookups = (
+                shard_stats.node_cache_hits + shard_stats.node_cache_misses
+            )
+            shards[shard_id]["nodeCacheHitRate"] = (
+                shard_stats.node_cache_hits / node_cache_lookups
+                if node_cache_lookups
+                else 0
+            )
+            shards[shard_id]["evictedTxCount"] = shard_stats.evicted_tx_count
+            shards[shard_id]["rejectedTxCount"] = shard_stats.rejected_tx_count
 
         tx_count60s = sum(
             [
@@ -1361,6 +1600,7 @@ class MasterServer:
             "rootCoinbaseAddress": "0x" + self.root_state.tip.coinbase_address.to_hex(),
             "rootTimestamp": self.root_state.tip.create_time,
             "rootLastBlockTime": root_last_block_time,
+            "rootBlockCacheHitRate": self.root_state.db.r_block_cache.hit_rate(),
             "txCount60s": tx_count60s,
             "blockCount60s": block_count60s,
             "staleBlockCount60s": stale_block_count60s,
@@ -16,38 +16,57 @@ from qkchash.qkcpow import QkchashMiner, check_pow as qkchash_check_pow
 from quarkchain.cluster.guardian import Guardian
 from quarkchain.config import ConsensusType
 from quarkchain.core import MinorBlock, MinorBlockHeader, RootBlock, RootBlockHeader
-from quarkchain.utils import Logger, sha256, time_ms
+from quarkchain.utils import Logger, LRUCache, sha256, time_ms
 
 Block = Union[MinorBlock, RootBlock]
 MAX_NONCE = 2 ** 64 - 1  # 8-byte nonce max
 
 
+# the valid seals keyed by get_seal_key(), so that a header validated again (e.g., when
+# the block is added after it is validated on arrival, or is both synced and
+# broadcasted) is not hashed again
+SEAL_CACHE_SIZE = 16384
+seal_cache = LRUCache(SEAL_CACHE_SIZE)
+
+
+def get_seal_key(
+    block_header: Union[RootBlockHeader, MinorBlockHeader],
+    consensus_type: ConsensusType,
+    adjusted_diff: int = None,
+):
+    diff = adjusted_diff if adjusted_diff is not None else block_header.difficulty
+    return (
+        consensus_type,
+        block_header.get_hash_for_mining(),
+        block_header.nonce,
+        block_header.mixhash,
+        diff,
+    )
+
+
 def validate_seal(
     block_header: Union[RootBlockHeader, MinorBlockHeader],
     consensus_type: ConsensusType,
     adjusted_diff: int = None,  # for overriding
 ) -> None:
-    diff = adjusted_diff if adjusted_diff is not None else block_header.difficulty
-    nonce_bytes = block_header.nonce.to_bytes(8, byteorder="big")
+    key = get_seal_key(block_header, consensus_type, adjusted_diff)
+    if seal_cache.get(key):
+        return
+
+    _, header_hash, nonce, mixhash, diff = key
+    nonce_bytes = nonce.to_bytes(8, byteorder="big")
     if consensus_type == ConsensusType.POW_ETHASH:
-        if not check_pow(
-            block_header.height,
-            block_header.get_hash_for_mining(),
-            block_header.mixhash,
-            nonce_bytes,
-            diff,
-        ):
+        if not check_pow(block_header.height, header_hash, mixhash, nonce_bytes, diff):
             raise ValueError("invalid pow proof")
     elif consensus_type == ConsensusType.POW_QKCHASH:
-        if not qkchash_check_pow(
-            block_header.get_hash_for_mining(), block_header.mixhash, nonce_bytes, diff
-        ):
+        if not qkchash_check_pow(header_hash, mixhash, nonce_bytes, diff):
             raise ValueError("invalid pow proof")
     elif consensus_type == ConsensusType.POW_SHA3SHA3:
         target = (2 ** 256 // (diff or 1) - 1).to_bytes(32, byteorder="big")
-        h = sha256(sha256(block_header.get_hash_for_mining() + nonce_bytes))
+        h = sha256(sha256(header_hash + nonce_bytes))
         if not h < target:
             raise ValueError("invalid pow proof")
+    seal_cache.put(key, True)
 
 
 MiningWork = NamedTuple(
@@ -4,6 +4,7 @@ Usage:
 multi_cluster.py accepts the same arguments as cluster.py
 additional arguments:
 --num_clusters
+--start_interval: seconds to wait before starting the clusters other than the first one
 also note that p2p bootstrap key is fixed to a test value
 
 Examples:
@@ -11,6 +12,9 @@ Examples:
 python multi_cluster.py --start_simulated_mining
 2. p2p module, with one (random) cluster mining
 python multi_cluster.py --p2p --start_simulated_mining
+3. simple network, with the first cluster mining, and the others joining 10 minutes later and
+fast syncing the state of the 10th last root block
+python multi_cluster.py --start_simulated_mining --fast_sync_pivot_distance 10 --start_interval 600
 """
 
 
@@ -28,9 +32,13 @@ async def main():
     parser = argparse.ArgumentParser()
     ClusterConfig.attach_arguments(parser)
     parser.add_argument("--num_clusters", default=2, type=int)
+    parser.add_argument("--start_interval", default=3, type=int)
     args = parser.parse_args()
     clusters = []
     mine_i = random.randint(0, args.num_clusters - 1)
+    if args.fast_sync_pivot_distance > 0:
+        # the clusters started later fast sync from the mining one
+        mine_i = 0
     mine = args.start_simulated_mining
     if mine:
         print("cluster {} will be mining".format(mine_i))
@@ -71,7 +79,7 @@ async def main():
 
     tasks = list()
     tasks.append(asyncio.ensure_future(clusters[0].run()))
-    await asyncio.sleep(3)
+    await asyncio.sleep(args.start_interval)
     for cluster in clusters[1:]:
         tasks.append(asyncio.ensure_future(cluster.run()))
     try:
@@ -2,7 +2,12 @@ from enum import IntEnum
 
 from quarkchain.core import Branch, uint8, uint16, uint32, uint128, hash256, Transaction
 from quarkchain.core import RootBlockHeader, MinorBlockHeader, RootBlock, MinorBlock
-from quarkchain.core import Serializable, PrependedSizeListSerializer
+from quarkchain.core import CrossShardTransactionList, boolean
+from quarkchain.core import (
+    Serializable,
+    PrependedSizeBytesSerializer,
+    PrependedSizeListSerializer,
+)
 
 
 class HelloCommand(Serializable):
@@ -189,6 +194,83 @@ class NewBlockMinorCommand(Serializable):
         self.block = block
 
 
+class GetStateTrieRangeRequest(Serializable):
+    """ RPC to get the leaves of an evm trie (accounts or storage) with the root in the
+    order of the keys, starting from the first key not less than start_key.
+    """
+
+    FIELDS = [
+        ("root_hash", hash256),
+        ("start_key", PrependedSizeBytesSerializer(4)),
+        ("limit", uint32),
+    ]
+
+    def __init__(self, root_hash, start_key, limit):
+        self.root_hash = root_hash
+        self.start_key = start_key
+        self.limit = limit
+
+
+class GetStateTrieRangeResponse(Serializable):
+    """ Empty if the trie is not found.  more is True if there are leaves after the range.
+    """
+
+    FIELDS = [
+        ("key_list", PrependedSizeListSerializer(4, PrependedSizeBytesSerializer(4))),
+        ("value_list", PrependedSizeListSerializer(4, PrependedSizeBytesSerializer(4))),
+        ("more", boolean),
+    ]
+
+    def __init__(self, key_list, value_list, more):
+        self.key_list = key_list
+        self.value_list = value_list
+        self.more = more
+
+
+class GetCodeListRequest(Serializable):
+    FIELDS = [("code_hash_list", PrependedSizeListSerializer(4, hash256))]
+
+    def __init__(self, code_hash_list):
+        self.code_hash_list = code_hash_list
+
+
+class GetCodeListResponse(Serializable):
+    """ The code of each hash in the request, empty if not found """
+
+    FIELDS = [
+        ("code_list", PrependedSizeListSerializer(4, PrependedSizeBytesSerializer(4)))
+    ]
+
+    def __init__(self, code_list):
+        self.code_list = code_list
+
+
+class GetXshardTxListRequest(Serializable):
+    """ RPC to get the cross-shard deposits of neighbor minor blocks received by a shard
+    """
+
+    FIELDS = [("minor_block_hash_list", PrependedSizeListSerializer(4, hash256))]
+
+    def __init__(self, minor_block_hash_list):
+        self.minor_block_hash_list = minor_block_hash_list
+
+
+class GetXshardTxListResponse(Serializable):
+    """ The deposits of the minor blocks found in the request """
+
+    FIELDS = [
+        ("minor_block_hash_list", PrependedSizeListSerializer(4, hash256)),
+        (
+            "xshard_tx_list_list",
+            PrependedSizeListSerializer(4, CrossShardTransactionList),
+        ),
+    ]
+
+    def __init__(self, minor_block_hash_list, xshard_tx_list_list):
+        self.minor_block_hash_list = minor_block_hash_list
+        self.xshard_tx_list_list = xshard_tx_list_list
+
+
 class CommandOp:
     HELLO = 0
     NEW_MINOR_BLOCK_HEADER_LIST = 1
@@ -204,6 +286,12 @@ class CommandOp:
     GET_MINOR_BLOCK_HEADER_LIST_REQUEST = 11
     GET_MINOR_BLOCK_HEADER_LIST_RESPONSE = 12
     NEW_BLOCK_MINOR = 13
+    GET_STATE_TRIE_RANGE_REQUEST = 14
+    GET_STATE_TRIE_RANGE_RESPONSE = 15
+    GET_CODE_LIST_REQUEST = 16
+    GET_CODE_LIST_RESPONSE = 17
+    GET_XSHARD_TX_LIST_REQUEST = 18
+    GET_XSHARD_TX_LIST_RESPONSE = 19
 
 
 OP_SERIALIZER_MAP = {
@@ -221,4 +309,10 @@ OP_SERIALIZER_MAP = {
     CommandOp.GET_MINOR_BLOCK_HEADER_LIST_REQUEST: GetMinorBlockHeaderListRequest,
     CommandOp.GET_MINOR_BLOCK_HEADER_LIST_RESPONSE: GetMinorBlockHeaderListResponse,
     CommandOp.NEW_BLOCK_MINOR: NewBlockMinorCommand,
+    CommandOp.GET_STATE_TRIE_RANGE_REQUEST: GetStateTrieRangeRequest,
+    CommandOp.GET_STATE_TRIE_RANGE_RESPONSE: GetStateTrieRangeResponse,
+    CommandOp.GET_CODE_LIST_REQUEST: GetCodeListRequest,
+    CommandOp.GET_CODE_LIST_RESPONSE: GetCodeListResponse,
+    CommandOp.GET_XSHARD_TX_LIST_REQUEST: GetXshardTxListRequest,
+    CommandOp.GET_XSHARD_TX_LIST_RESPONSE: GetXshardTxListResponse,
 }
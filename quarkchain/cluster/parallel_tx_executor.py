@@ -0,0 +1,581 @@
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional
+
+import rlp
+
+from quarkchain.cluster.sender_recovery import recover_senders
+from quarkchain.core import ByteBuffer, CrossShardTransactionDeposit, Transaction
+from quarkchain.db import InMemoryDb
+from quarkchain.evm import messages, utils
+from quarkchain.evm.config import Env
+from quarkchain.evm.messages import (
+    Log,
+    apply_transaction,
+    mk_contract_address,
+    mk_receipt,
+    validate_transaction,
+)
+from quarkchain.evm.state import (
+    BLANK_HASH,
+    BLANK_ROOT,
+    STATE_DEFAULTS,
+    Account,
+    State as EvmState,
+    _Account,
+)
+from quarkchain.evm.transactions import Transaction as EvmTransaction
+from quarkchain.evm.trie import BLANK_NODE
+from quarkchain.utils import Logger, sha3_256
+
+
+class AccessRecordingState(EvmState):
+    """ An evm state that records the accounts and storage slots read and written.
+    An existing state is switched to (and back from) it by assigning __class__.
+    """
+
+    def reset_access(self):
+        self.header_reads = set()
+        # address -> (nonce, balance, code hash) before the first write
+        self.header_writes = dict()
+        self.code_writes = set()
+        self.storage_reads = set()
+        self.storage_writes = set()
+        # accounts whose whole storage is reset, e.g., by a suicide
+        self.storage_resets = set()
+
+    def __write_header(self, address):
+        address = utils.normalize_address(address)
+        if address not in self.header_writes:
+            acct = EvmState.get_and_cache_account(self, address)
+            self.header_writes[address] = (acct.nonce, acct.balance, acct.code_hash)
+
+    def changed_headers(self):
+        """ The written accounts whose nonce, balance or code is changed """
+        changed = set()
+        for address, header in self.header_writes.items():
+            acct = self.cache[address]
+            if (acct.nonce, acct.balance, acct.code_hash) != header:
+                changed.add(address)
+        return changed
+
+    def get_and_cache_account(self, address):
+        self.header_reads.add(address)
+        return super().get_and_cache_account(address)
+
+    def get_storage_data(self, address, key):
+        address = utils.normalize_address(address)
+        self.storage_reads.add((address, key))
+        return EvmState.get_and_cache_account(self, address).get_storage_data(key)
+
+    def set_storage_data(self, address, key, value):
+        address = utils.normalize_address(address)
+        self.storage_reads.add((address, key))
+        self.storage_writes.add((address, key))
+        acct = EvmState.get_and_cache_account(self, address)
+        preval = acct.get_storage_data(key)
+        acct.set_storage_data(key, value)
+        self.journal.append(lambda: acct.set_storage_data(key, preval))
+        self.set_and_journal(acct, "touched", True)
+
+    def set_balance(self, address, value):
+        self.__write_header(address)
+        super().set_balance(address, value)
+
+    def set_code(self, address, value):
+        self.__write_header(address)
+        self.code_writes.add(utils.normalize_address(address))
+        super().set_code(address, value)
+
+    def set_nonce(self, address, value):
+        self.__write_header(address)
+        super().set_nonce(address, value)
+
+    def increment_nonce(self, address):
+        self.__write_header(address)
+        super().increment_nonce(address)
+
+    def delta_balance(self, address, value):
+        self.__write_header(address)
+        super().delta_balance(address, value)
+
+    def reset_storage(self, address):
+        self.storage_resets.add(utils.normalize_address(address))
+        super().reset_storage(address)
+
+
+class SpeculativeState(AccessRecordingState):
+    """ Executes a tx against the pre-block state, which is restored afterwards.
+    The fees paid to the coinbase are accumulated in coinbase_delta instead of written
+    to the coinbase account, which every tx would otherwise conflict on.
+    """
+
+    def begin(self):
+        self.reset_access()
+        self.coinbase_delta = 0
+        self.base_gas_used = self.gas_used
+        self.base_block_fee = self.block_fee
+        self.base_receipt_count = len(self.receipts)
+        self.base_xshard_count = len(self.xshard_list)
+
+    def delta_balance(self, address, value):
+        address = utils.normalize_address(address)
+        if address != self.block_coinbase:
+            super().delta_balance(address, value)
+            return
+        preval = self.coinbase_delta
+        self.coinbase_delta += value
+        self.journal.append(lambda: setattr(self, "coinbase_delta", preval))
+
+    def commit(self, allow_empties=False, flush=True):
+        # the state must stay revertible to the pre-block state
+        pass
+
+
+class TxSpeculation:
+    """ The outcome of a tx executed against the pre-block state """
+
+    def __init__(self, state: SpeculativeState, evm_tx: EvmTransaction):
+        self.header_reads = state.header_reads
+        self.storage_reads = state.storage_reads
+        self.mergeable = (
+            not state.storage_resets
+            and state.block_coinbase not in state.header_reads
+            and len(state.receipts) == state.base_receipt_count + 1
+        )
+
+        # the writes reverted by the journal leave the account untouched
+        written = {
+            addr
+            for addr in state.header_writes.keys()
+            | {a for a, _ in state.storage_writes}
+            if state.cache[addr].touched
+        }
+        self.full_shard_ids = {
+            addr: state.cache[addr].full_shard_id for addr in written
+        }
+        # the headers only touched, e.g., by a transfer of 0, do not conflict
+        self.changed_headers = state.changed_headers()
+        self.headers = dict()  # address -> (nonce, balance, code or None)
+        for addr in state.header_writes.keys() & written:
+            acct = state.cache[addr]
+            code = acct.code if addr in state.code_writes else None
+            self.headers[addr] = (acct.nonce, acct.balance, code)
+        self.storage = {
+            (addr, key): state.cache[addr].get_storage_data(key)
+            for addr, key in state.storage_writes
+            if addr in written
+        }
+
+        self.coinbase_delta = state.coinbase_delta
+        self.gas_used = state.gas_used - state.base_gas_used
+        self.block_fee = state.block_fee - state.base_block_fee
+        receipt = state.receipts[-1] if self.mergeable else None
+        self.success = receipt.state_root == b"\x01" if receipt else False
+        self.contract_address = receipt.contract_address if receipt else b""
+        self.logs = (
+            [(log.address, log.topics, log.data) for log in receipt.logs]
+            if receipt
+            else []
+        )
+        self.deposits = [
+            deposit.serialize()
+            for deposit in state.xshard_list[state.base_xshard_count :]
+        ]
+
+
+def speculate(
+    state: SpeculativeState, evm_tx: EvmTransaction, tx_hash: bytes
+) -> Optional[TxSpeculation]:
+    """ Returns None if the tx fails, i.e., is left to the sequential execution to raise """
+    state.begin()
+    snapshot = state.snapshot()
+    try:
+        apply_transaction(state, evm_tx, tx_hash)
+        return TxSpeculation(state, evm_tx)
+    except Exception:
+        return None
+    finally:
+        state.revert(snapshot)
+
+
+class MissingPreState(Exception):
+    """ Raised by a worker on a read outside the pre-state it is given """
+
+
+class _PreStateTrie:
+    """ Stands for the account trie of the pre-block state in a worker.  The accounts
+    that exist are cached in the state up front, so only the others are read from it.
+    """
+
+    def __init__(self, absent_addresses):
+        self.absent_addresses = absent_addresses
+        self.root_hash = BLANK_ROOT
+
+    def get(self, address):
+        if address not in self.absent_addresses:
+            raise MissingPreState(address)
+        return BLANK_NODE
+
+
+class _PreStateStorage:
+    """ Stands for the storage trie of an account in a worker.  items maps the hashed
+    keys to the rlp values of all the slots, or is None if the storage is too large to
+    be sent, in which case only the slots cached by the parent can be read.
+    """
+
+    def __init__(self, root_hash, items):
+        self.initial_root_hash = root_hash
+        self.root_hash = root_hash
+        self.items = items
+
+    def get(self, key):
+        if self.root_hash != self.initial_root_hash:
+            # reset, e.g., by a suicide
+            return b""
+        if self.items is None:
+            raise MissingPreState(key)
+        return self.items.get(sha3_256(key), b"")
+
+
+class PreState:
+    """ The part of the pre-block state that the workers execute the txs against.
+    It is built by the parent from the accounts the txs are known to touch, i.e., the
+    senders, the recipients and the contracts created, as the workers have no access to
+    the db.  A tx reading any other account, e.g., a contract calling another one, fails
+    with MissingPreState and is left to the sequential execution.
+    """
+
+    def __init__(self, state: EvmState, addresses, shard_size, storage_limit):
+        self.config = state.env.config
+        self.global_config = state.env.global_config
+        self.qkc_config = state.qkc_config
+        self.shard_size = shard_size
+        self.params = {
+            k: getattr(state, k)
+            for k in STATE_DEFAULTS
+            if k not in ("logs", "receipts", "suicides", "xshard_list")
+        }
+        self.absent_addresses = set()
+        # address -> (nonce, balance, code hash, full shard id, code, storage root,
+        #             storage items, storage cache, (touched, existent at start, deleted))
+        self.accounts = dict()
+        for address in addresses:
+            acct = self.__get_account(state, address)
+            if acct is None:
+                self.absent_addresses.add(address)
+                continue
+            root_hash = acct.storage_trie.root_hash
+            items = dict()
+            if root_hash != BLANK_ROOT:
+                items = dict(
+                    itertools.islice(
+                        acct.storage_trie.trie.iter_branch(), storage_limit + 1
+                    )
+                )
+                if len(items) > storage_limit:
+                    items = None
+            self.accounts[address] = (
+                acct.nonce,
+                acct.balance,
+                acct.code_hash,
+                acct.full_shard_id,
+                None if acct.code_hash == BLANK_HASH else acct.code,
+                root_hash,
+                items,
+                dict(acct.storage_cache),
+                (acct.touched, acct.existent_at_start, acct.deleted),
+            )
+
+    @staticmethod
+    def __get_account(state: EvmState, address) -> Optional[Account]:
+        """ Reads the account without caching it in state, e.g., as a blank account """
+        if address in state.cache:
+            return state.cache[address]
+        rlpdata = state.trie.get(address)
+        if rlpdata == BLANK_NODE:
+            return None
+        o = rlp.decode(rlpdata, _Account)
+        return Account(
+            nonce=o.nonce,
+            balance=o.balance,
+            storage=o.storage,
+            code_hash=o.code_hash,
+            full_shard_id=o.full_shard_id,
+            env=state.env,
+            address=address,
+            db=state.db,
+            dirty_nodes=state.dirty_nodes,
+        )
+
+    def to_state(self) -> SpeculativeState:
+        """ Runs in the worker processes """
+        db = InMemoryDb()
+        db.put(BLANK_HASH, b"")
+        env = Env(db, self.config, self.global_config)
+        state = SpeculativeState(env=env, qkc_config=self.qkc_config, **self.params)
+        state.trie = _PreStateTrie(self.absent_addresses)
+        for address, fields in self.accounts.items():
+            nonce, balance, code_hash, full_shard_id, code, root_hash = fields[:6]
+            items, storage_cache, flags = fields[6:]
+            # the storage trie is not in db, and replaced below
+            acct = Account(
+                nonce,
+                balance,
+                BLANK_ROOT,
+                code_hash,
+                full_shard_id,
+                env,
+                address,
+                db=db,
+            )
+            if code is not None:
+                db.put(code_hash, code)
+            acct.storage = root_hash
+            acct.storage_trie = _PreStateStorage(root_hash, items)
+            acct.storage_cache = storage_cache
+            acct.touched, acct.existent_at_start, acct.deleted = flags
+            state.cache[address] = acct
+        return state
+
+
+def _init_worker():
+    """ Runs in the worker processes when they start, by which this module is imported """
+    pass
+
+
+def _speculate_chunk(pre_state: PreState, tx_list):
+    """ Runs in the worker processes.  tx_list is a list of (tx rlp, sender, tx hash) """
+    state = pre_state.to_state()
+    speculations = []
+    for data, sender, tx_hash in tx_list:
+        evm_tx = rlp.decode(data, EvmTransaction)
+        evm_tx.sender = sender
+        evm_tx.set_shard_size(pre_state.shard_size)
+        speculations.append(speculate(state, evm_tx, tx_hash))
+    return speculations
+
+
+class ParallelTxExecutor:
+    """ Optimistic concurrent execution of the txs of a block.
+
+    All the txs are first executed speculatively against the pre-block state in a pool
+    of num_workers processes, which record the accounts and storage slots each tx reads
+    and writes.  The txs are then applied in order: a tx whose reads do not overlap the
+    writes of the txs before it in the block has its writes replayed on the state, and
+    the other txs are re-executed.  The resulting state, receipts and cross-shard
+    deposits are the same as applying the txs one by one.
+
+    The workers are spawned once rather than forked per block, so they inherit neither
+    the db handle nor the threads of the shard, and each chunk of txs is sent along with
+    the PreState it is executed against.
+    """
+
+    def __init__(self, num_workers, min_tx_count=64, storage_limit=256):
+        self.num_workers = num_workers
+        # below which sending the txs to the workers costs more than it saves
+        self.min_tx_count = min_tx_count
+        # the storage of a contract with more slots is not sent to the workers
+        self.storage_limit = storage_limit
+        self.num_merged = 0
+        self.num_reexecuted = 0
+        self.executor = None
+        if num_workers > 0:
+            self.executor = ProcessPoolExecutor(
+                num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            # start the workers now rather than on the first block
+            self.executor.submit(_init_worker)
+
+    def is_applicable(self, tx_list: List[Transaction]) -> bool:
+        return self.num_workers > 0 and len(tx_list) >= max(self.min_tx_count, 1)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __split(self, items):
+        chunk_size = (len(items) + self.num_workers - 1) // self.num_workers
+        return [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    def __recover_senders(self, evm_tx_list):
+        """ The PreState is built from the senders, which are recovered in the workers """
+        pending = [
+            evm_tx
+            for evm_tx in evm_tx_list
+            if evm_tx is not None and evm_tx._sender is None
+        ]
+        if not pending:
+            return
+        chunks = self.__split(pending)
+        results = self.executor.map(
+            recover_senders, [[rlp.encode(evm_tx) for evm_tx in c] for c in chunks]
+        )
+        for chunk, senders in zip(chunks, results):
+            for evm_tx, sender in zip(chunk, senders):
+                if sender is not None:
+                    evm_tx.sender = sender
+
+    def __speculate_all(self, state, tx_list, shard_size):
+        evm_tx_list = []
+        for tx in tx_list:
+            try:
+                evm_tx = tx.code.get_evm_transaction()
+            except Exception:
+                evm_tx = None
+            evm_tx_list.append(evm_tx)
+        self.__recover_senders(evm_tx_list)
+        # the txs failing to decode or recover are left to the validation to raise
+        indices = [
+            i
+            for i, evm_tx in enumerate(evm_tx_list)
+            if evm_tx is not None and evm_tx._sender is not None
+        ]
+        if not indices:
+            return [None] * len(tx_list)
+
+        chunks = self.__split(indices)
+        pre_states = []
+        for chunk in chunks:
+            addresses = set()
+            for i in chunk:
+                evm_tx = evm_tx_list[i]
+                addresses.add(evm_tx.sender)
+                addresses.add(
+                    evm_tx.to
+                    or mk_contract_address(
+                        evm_tx.sender, evm_tx.to_full_shard_id, evm_tx.nonce
+                    )
+                )
+            pre_states.append(
+                PreState(state, addresses, shard_size, self.storage_limit)
+            )
+        results = self.executor.map(
+            _speculate_chunk,
+            pre_states,
+            [
+                [
+                    (
+                        rlp.encode(evm_tx_list[i]),
+                        evm_tx_list[i].sender,
+                        tx_list[i].get_hash(),
+                    )
+                    for i in chunk
+                ]
+                for chunk in chunks
+            ],
+        )
+
+        speculations = [None] * len(tx_list)
+        for chunk, chunk_results in zip(chunks, results):
+            for i, r in zip(chunk, chunk_results):
+                speculations[i] = r
+        return speculations
+
+    def __merge(self, state: EvmState, evm_tx: EvmTransaction, r: TxSpeculation):
+        """ Replay the writes of the tx as apply_transaction() would have made them.
+        Returns False, without changing the state, if the tx must be re-executed.
+        """
+        # raises as apply_transaction() does, e.g., if the block gas limit is reached
+        validate_transaction(state, evm_tx)
+        state.full_shard_id = evm_tx.to_full_shard_id
+        for addr, full_shard_id in r.full_shard_ids.items():
+            if state.get_and_cache_account(addr).full_shard_id != full_shard_id:
+                return False
+
+        state.logs = []
+        state.suicides = []
+        state.refunds = 0
+        for addr, (nonce, balance, code) in r.headers.items():
+            state.set_nonce(addr, nonce)
+            state.set_balance(addr, balance)
+            if code is not None:
+                state.set_code(addr, code)
+        for (addr, key), value in r.storage.items():
+            state.set_storage_data(addr, key, value)
+        state.delta_balance(state.block_coinbase, r.coinbase_delta)
+        state.block_fee += r.block_fee
+        state.gas_used += r.gas_used
+        for data in r.deposits:
+            state.xshard_list.append(
+                CrossShardTransactionDeposit.deserialize(ByteBuffer(data))
+            )
+        if not state.is_METROPOLIS() and not messages.SKIP_MEDSTATES:
+            state.commit(flush=False)
+
+        logs = [Log(address, topics, data) for address, topics, data in r.logs]
+        receipt = mk_receipt(
+            state, r.success, logs, r.contract_address, state.full_shard_id
+        )
+        state.add_receipt(receipt)
+        state.set_param("bloom", state.bloom | receipt.bloom)
+        state.set_param("txindex", state.txindex + 1)
+        return True
+
+    @staticmethod
+    def __reexecute(state: EvmState, evm_tx: EvmTransaction, tx_hash: bytes):
+        """ Returns the state switched to AccessRecordingState to read the writes of the tx """
+        cls = state.__class__
+        state.__class__ = AccessRecordingState
+        state.reset_access()
+        try:
+            apply_transaction(state, evm_tx, tx_hash)
+            return (state.changed_headers(), state.storage_writes, state.storage_resets)
+        finally:
+            state.__class__ = cls
+
+    def apply_transactions(
+        self,
+        state: EvmState,
+        tx_list: List[Transaction],
+        validate_tx: Callable[[Transaction], EvmTransaction],
+        shard_size: int,
+    ) -> List[EvmTransaction]:
+        """ Apply the txs to state in order.  validate_tx(tx) validates the tx against
+        the state and returns its evm tx.  Returns the applied evm txs.  Raises on any
+        invalid tx as the sequential execution does.
+        """
+        speculations = self.__speculate_all(state, tx_list, shard_size)
+
+        written_headers = set()
+        written_slots = set()
+        # accounts whose storage is reset
+        written_storage = set()
+        evm_tx_included = []
+        for idx, (tx, r) in enumerate(zip(tx_list, speculations)):
+            try:
+                evm_tx = validate_tx(tx)
+                evm_tx.set_shard_size(shard_size)
+
+                if (
+                    r is not None
+                    and r.mergeable
+                    and r.header_reads.isdisjoint(written_headers)
+                    and r.storage_reads.isdisjoint(written_slots)
+                    and all(addr not in written_storage for addr, _ in r.storage_reads)
+                    and self.__merge(state, evm_tx, r)
+                ):
+                    self.num_merged += 1
+                    written_headers.update(r.changed_headers)
+                    written_slots.update(r.storage)
+                else:
+                    self.num_reexecuted += 1
+                    headers, slots, resets = self.__reexecute(
+                        state, evm_tx, tx.get_hash()
+                    )
+                    written_headers.update(headers)
+                    written_slots.update(slots)
+                    written_storage.update(resets)
+                evm_tx_included.append(evm_tx)
+            except Exception as e:
+                Logger.debug_exception()
+                Logger.debug(
+                    "failed to process Tx {}, idx {}, reason {}".format(
+                        tx.get_hash().hex(), idx, e
+                    )
+                )
+                raise e
+        return evm_tx_included
@@ -1,5 +1,7 @@
 import time
+import itertools
 import json
+import math
 import asyncio
 from fractions import Fraction
 from typing import Optional
@@ -9,12 +11,13 @@ from quarkchain.cluster.guardian import Guardian
 from quarkchain.core import RootBlock, MinorBlockHeader, RootBlockHeader
 from quarkchain.core import (
     calculate_merkle_root,
+    hash256,
     Serializable,
     PrependedSizeListSerializer,
 )
 from quarkchain.diff import EthDifficultyCalculator
 from quarkchain.genesis import GenesisManager
-from quarkchain.utils import Logger, check, time_ms
+from quarkchain.utils import Logger, check, time_ms, LRUCache, HeightWindowPool
 
 
 class LastMinorBlockHeaderList(Serializable):
@@ -24,6 +27,21 @@ class LastMinorBlockHeaderList(Serializable):
         self.header_list = header_list
 
 
+class RootBlockHeaderAndMinorBlockHashList(Serializable):
+    """ Stored along with each root block so that the root chain can be recovered
+    without deserializing the full blocks
+    """
+
+    FIELDS = [
+        ("header", RootBlockHeader),
+        ("minor_block_hash_list", PrependedSizeListSerializer(4, hash256)),
+    ]
+
+    def __init__(self, header, minor_block_hash_list):
+        self.header = header
+        self.minor_block_hash_list = minor_block_hash_list
+
+
 class RootDb:
     """ Storage for all validated root blocks and minor blocks
 
@@ -33,20 +51,57 @@ class RootDb:
     we don't save "tipHash"s for the forks and thus their consistency state is hard to reason about.
     For example, a root block might not be received by all the shards when the cluster is down.
     Forks can always be downloaded again from peers if they ever became the best chain.
+
+    Only the headers of the recent blocks (max_num_blocks_to_recover) are kept in memory and the
+    older ones are read from the database on demand.  The hashes of the recent validated minor blocks
+    (max_num_minor_blocks_to_recover, unbounded if None) are cached in memory in front of their
+    index in the database, which are only needed for validating new root blocks.
     """
 
-    def __init__(self, db, max_num_blocks_to_recover, count_minor_blocks=False):
-        # TODO: evict old blocks from memory
+    # version of the database layout, see __upgrade()
+    DB_VERSION = 1
+
+    def __init__(
+        self,
+        db,
+        max_num_blocks_to_recover,
+        count_minor_blocks=False,
+        max_num_minor_blocks_to_recover=None,
+    ):
         self.db = db
         self.max_num_blocks_to_recover = max_num_blocks_to_recover
         self.count_minor_blocks = count_minor_blocks
-        # TODO: May store locally to save memory space (e.g., with LRU cache)
-        self.m_hash_set = set()
-        self.r_header_pool = dict()
+        # minor block hash -> True
+        self.m_hash_set = LRUCache(
+            math.inf
+            if max_num_minor_blocks_to_recover is None
+            else max_num_minor_blocks_to_recover
+        )
+        self.r_header_pool = HeightWindowPool(
+            max_num_blocks_to_recover, self.__load_root_block_header
+        )
         self.tip_header = None
+        # hash -> deserialized block, shared by all the callers so the blocks must not be modified
+        self.r_block_cache = LRUCache(max_num_blocks_to_recover)
 
+        self.__upgrade()
         self.__recover_from_db()
 
+    def __upgrade(self):
+        version = int.from_bytes(self.db.get(b"rootDbVersion", b""), "big")
+        if version >= self.DB_VERSION:
+            return
+        Logger.info(
+            "Upgrading root db from version {} to {}".format(version, self.DB_VERSION)
+        )
+        with self.db.write_batch():
+            if version < 1:
+                # height index b"ri_%d" -> fixed-width big-endian so that it sorts by height
+                for key, block_hash in list(self.db.range_iter(b"ri_", b"ri`")):
+                    self.db.put(self.__root_block_index_key(int(key[3:])), block_hash)
+                    self.db.remove(key)
+            self.db.put(b"rootDbVersion", self.DB_VERSION.to_bytes(4, "big"))
+
     def __recover_from_db(self):
         """ Recover the best chain from local database.
         """
@@ -56,26 +111,67 @@ class RootDb:
             return None
 
         r_hash = self.db.get(b"tipHash")
-        r_block = RootBlock.deserialize(self.db.get(b"rblock_" + r_hash))
+        r_block = self.__get_root_block_for_recovery(r_hash, dict())
         if r_block.header.height <= 0:
             return None
         # use the parent of the tipHash block as the new tip
         # since it's guaranteed to have been accepted by all the shards
         # while shards might not have seen the block of tipHash
         r_hash = r_block.header.hash_prev_block
-        r_block = RootBlock.deserialize(self.db.get(b"rblock_" + r_hash))
+        prefetched = self.__prefetch_root_block_headers(
+            r_block.header.height - 1, self.max_num_blocks_to_recover
+        )
+        r_block = self.__get_root_block_for_recovery(r_hash, prefetched)
         self.tip_header = r_block.header  # type: RootBlockHeader
 
+        m_hash_list = []
         while len(self.r_header_pool) < self.max_num_blocks_to_recover:
-            self.r_header_pool[r_hash] = r_block.header
-            for m_header in r_block.minor_block_header_list:
-                self.m_hash_set.add(m_header.get_hash())
+            self.r_header_pool.put(r_hash, r_block.header, r_block.header.height)
+            m_hash_list.extend(reversed(r_block.minor_block_hash_list))
 
             if r_block.header.height <= 0:
                 break
 
             r_hash = r_block.header.hash_prev_block
-            r_block = RootBlock.deserialize(self.db.get(b"rblock_" + r_hash))
+            r_block = self.__get_root_block_for_recovery(r_hash, prefetched)
+
+        # keep the most recent ones
+        for m_hash in reversed(m_hash_list):
+            self.m_hash_set.put(m_hash, True)
+
+    def __get_root_block_for_recovery(self, h, prefetched):
+        """ Return the RootBlockHeaderAndMinorBlockHashList of the block, which is built from
+        the full block if the block was stored before the header keys were introduced,
+        or None if the block is not found
+        """
+        data = prefetched.get(h) or self.db.get(b"rheader_" + h, None)
+        if data:
+            return RootBlockHeaderAndMinorBlockHashList.deserialize(data)
+        data = self.db.get(b"rblock_" + h, None)
+        if not data:
+            return None
+        block = RootBlock.deserialize(data)
+        return RootBlockHeaderAndMinorBlockHashList(
+            block.header,
+            [m_header.get_hash() for m_header in block.minor_block_header_list],
+        )
+
+    def __load_root_block_header(self, h):
+        r_block = self.__get_root_block_for_recovery(h, dict())
+        return (r_block.header, r_block.header.height) if r_block else None
+
+    def __prefetch_root_block_headers(self, height, num_blocks):
+        """ Bulk-read the header keys of the blocks indexed by height.
+        Returns hash -> serialized RootBlockHeaderAndMinorBlockHashList.
+        """
+        hash_list = [
+            h
+            for _, h in self.__get_root_block_index_range(
+                height - num_blocks + 1, height + 1
+            )
+        ]
+        result = self.db.multi_get([b"rheader_" + h for h in hash_list])
+        return {h: result[b"rheader_" + h] for h in hash_list}
 
     def get_tip_header(self):
         return self.tip_header
@@ -89,8 +185,26 @@ class RootDb:
 
         last_list = LastMinorBlockHeaderList(header_list=last_minor_block_header_list)
         self.db.put(b"rblock_" + root_block_hash, root_block.serialize())
+        self.db.put(
+            b"rheader_" + root_block_hash,
+            RootBlockHeaderAndMinorBlockHashList(
+                root_block.header,
+                [
+                    m_header.get_hash()
+                    for m_header in root_block.minor_block_header_list
+                ],
+            ).serialize(),
+        )
         self.db.put(b"lastlist_" + root_block_hash, last_list.serialize())
-        self.r_header_pool[root_block_hash] = root_block.header
+        self.r_block_cache.put(root_block_hash, root_block)
+        self.r_header_pool.put(
+            root_block_hash, root_block.header, root_block.header.height
+        )
+
+    def discard_root_block(self, block_hash):
+        """ Remove a block put inside a write batch that is not committed from memory """
+        self.r_block_cache.pop(block_hash)
+        self.r_header_pool.pop(block_hash)
 
     def update_tip_hash(self, block_hash):
         self.db.put(b"tipHash", block_hash)
@@ -99,13 +213,17 @@ class RootDb:
         if consistency_check and h not in self.r_header_pool:
             return None
 
-        raw_block = self.db.get(b"rblock_" + h, None)
-        if not raw_block:
-            return None
-        return RootBlock.deserialize(raw_block)
+        block = self.r_block_cache.get(h)
+        if block is None:
+            raw_block = self.db.get(b"rblock_" + h, None)
+            if not raw_block:
+                return None
+            block = RootBlock.deserialize(raw_block)
+            self.r_block_cache.put(h, block)
+        return block
 
     def get_root_block_header_by_hash(self, h, consistency_check=True):
-        header = self.r_header_pool.get(h, None)
+        header = self.r_header_pool.get(h)
         if not header and not consistency_check:
             block = self.get_root_block_by_hash(h, False)
             if block:
@@ -122,8 +240,26 @@ class RootDb:
     def contain_root_block_by_hash(self, h):
         return h in self.r_header_pool
 
+    @staticmethod
+    def __root_block_index_key(height):
+        return b"rhi_" + height.to_bytes(4, "big")
+
+    def __get_root_block_index_range(self, start, end):
+        """ Yield (height, hash) of the indexed blocks with height in [start, end) in ascending order """
+        start = max(start, 0)
+        end = min(end, 2 ** 32)
+        if start >= end:
+            return
+        end_key = self.__root_block_index_key(end) if end < 2 ** 32 else b"rhi`"
+        for key, block_hash in self.db.range_iter(
+            self.__root_block_index_key(start), end_key
+        ):
+            yield int.from_bytes(key[4:], "big"), block_hash
+
     def put_root_block_index(self, block):
-        self.db.put(b"ri_%d" % block.header.height, block.header.get_hash())
+        self.db.put(
+            self.__root_block_index_key(block.header.height), block.header.get_hash()
+        )
 
         if not self.count_minor_blocks:
             return
@@ -168,19 +304,46 @@ class RootDb:
         return shard_recipient_cnt
 
     def get_root_block_by_height(self, height):
-        key = b"ri_%d" % height
-        if key not in self.db:
+        block_hash = self.db.get(self.__root_block_index_key(height), None)
+        if not block_hash:
             return None
-        block_hash = self.db.get(key)
         return self.get_root_block_by_hash(block_hash, False)
 
+    def get_root_blocks_by_height_range(self, start, end, batch_size=100):
+        """ Yield the indexed blocks with height in [start, end) in ascending order.
+        The index is read with one range scan and the blocks not in the cache are read
+        with multi_get() in batches of batch_size.
+        The blocks read from db are not put into the cache to keep the recent blocks there.
+        """
+        index = self.__get_root_block_index_range(start, end)
+        while True:
+            hash_list = [h for _, h in itertools.islice(index, batch_size)]
+            if not hash_list:
+                return
+            missing = [b"rblock_" + h for h in hash_list if h not in self.r_block_cache]
+            data_map = self.db.multi_get(missing) if missing else dict()
+            for h in hash_list:
+                block = self.r_block_cache.get(h)
+                if block is None:
+                    data = data_map.get(b"rblock_" + h)
+                    if not data:
+                        continue
+                    block = RootBlock.deserialize(data)
+                yield block
+
     # ------------------------- Minor block db operations --------------------------------
     def contain_minor_block_by_hash(self, h):
-        return h in self.m_hash_set
+        if h in self.m_hash_set:
+            return True
+        # evicted by the hashes of the other shards, or validated before a restart
+        if b"mheader_" + h not in self.db:
+            return False
+        self.m_hash_set.put(h, True)
+        return True
 
     def put_minor_block_hash(self, m_hash):
         self.db.put(b"mheader_" + m_hash, b"")
-        self.m_hash_set.add(m_hash)
+        self.m_hash_set.put(m_hash, True)
 
     # ------------------------- Common operations -----------------------------------------
     def put(self, key, value):
@@ -213,6 +376,10 @@ class RootState:
             self.raw_db,
             env.quark_chain_config.ROOT.max_root_blocks_in_memory,
             count_minor_blocks=env.cluster_config.ENABLE_TRANSACTION_HISTORY,
+            max_num_minor_blocks_to_recover=sum(
+                shard.max_minor_blocks_in_memory
+                for shard in env.quark_chain_config.SHARD_LIST
+            ),
         )
 
         persisted_tip = self.db.get_tip_header()
@@ -459,9 +626,23 @@ class RootState:
             block, block_hash
         )
 
-        self.db.put_root_block(
-            block, last_minor_block_header_list, root_block_hash=block_hash
-        )
+        # the block, the tip and the height indexes are committed atomically,
+        # and the tip in memory is only updated once they are committed
+        try:
+            with self.raw_db.write_batch():
+                self.db.put_root_block(
+                    block, last_minor_block_header_list, root_block_hash=block_hash
+                )
+                updated = self.tip.height < block.header.height
+                if updated:
+                    self.db.update_tip_hash(block_hash)
+                    self.__rewrite_block_index_to(block)
+        except Exception:
+            # the block put into the in-memory pool and cache is not in db
+            self.db.discard_root_block(block_hash)
+            raise
+        if updated:
+            self.tip = block.header
 
         tracking_data_str = block.tracking_data.decode("utf-8")
         if tracking_data_str != "":
@@ -487,12 +668,7 @@ class RootState:
                 )
             )
 
-        if self.tip.height < block.header.height:
-            self.tip = block.header
-            self.db.update_tip_hash(block_hash)
-            self.__rewrite_block_index_to(block)
-            return True
-        return False
+        return updated
 
     # -------------------------------- Root block db related operations ------------------------------
     def get_root_block_by_hash(self, h):
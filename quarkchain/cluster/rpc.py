@@ -506,6 +506,12 @@ class ShardStats(Serializable):
         ("block_count60s", uint32),
         ("stale_block_count60s", uint32),
         ("last_block_time", uint32),
+        ("block_cache_hits", uint64),
+        ("block_cache_misses", uint64),
+        ("node_cache_hits", uint64),
+        ("node_cache_misses", uint64),
+        ("evicted_tx_count", uint64),
+        ("rejected_tx_count", uint64),
     ]
 
     def __init__(
@@ -521,6 +527,12 @@ class ShardStats(Serializable):
         block_count60s: int,
         stale_block_count60s: int,
         last_block_time: int,
+        block_cache_hits: int,
+        block_cache_misses: int,
+        node_cache_hits: int,
+        node_cache_misses: int,
+        evicted_tx_count: int,
+        rejected_tx_count: int,
     ):
         self.branch = branch
         self.height = height
@@ -533,6 +545,12 @@ class ShardStats(Serializable):
         self.block_count60s = block_count60s
         self.stale_block_count60s = stale_block_count60s
         self.last_block_time = last_block_time
+        self.block_cache_hits = block_cache_hits
+        self.block_cache_misses = block_cache_misses
+        self.node_cache_hits = node_cache_hits
+        self.node_cache_misses = node_cache_misses
+        self.evicted_tx_count = evicted_tx_count
+        self.rejected_tx_count = rejected_tx_count
 
 
 class SyncMinorBlockListRequest(Serializable):
@@ -556,6 +574,58 @@ class SyncMinorBlockListResponse(Serializable):
         self.shard_stats = shard_stats
 
 
+class FastSyncMinorBlockListRequest(Serializable):
+    """ Add the minor blocks of the root blocks below the pivot of a fast sync without running
+    them, and download the cross-shard deposits of the neighbor minor blocks in the root blocks.
+    """
+
+    FIELDS = [
+        ("minor_block_hash_list", PrependedSizeListSerializer(4, hash256)),
+        ("xshard_minor_block_hash_list", PrependedSizeListSerializer(4, hash256)),
+        ("branch", Branch),
+        ("cluster_peer_id", uint64),
+    ]
+
+    def __init__(
+        self,
+        minor_block_hash_list,
+        xshard_minor_block_hash_list,
+        branch,
+        cluster_peer_id,
+    ):
+        self.minor_block_hash_list = minor_block_hash_list
+        self.xshard_minor_block_hash_list = xshard_minor_block_hash_list
+        self.branch = branch
+        self.cluster_peer_id = cluster_peer_id
+
+
+class FastSyncMinorBlockListResponse(Serializable):
+    FIELDS = [("error_code", uint32)]
+
+    def __init__(self, error_code):
+        self.error_code = error_code
+
+
+class FastSyncStateRequest(Serializable):
+    """ Download the evm state of the shard tip, the pivot block of a fast sync, once the root
+    blocks up to the pivot are added.
+    """
+
+    FIELDS = [("branch", Branch), ("cluster_peer_id", uint64)]
+
+    def __init__(self, branch, cluster_peer_id):
+        self.branch = branch
+        self.cluster_peer_id = cluster_peer_id
+
+
+class FastSyncStateResponse(Serializable):
+    FIELDS = [("error_code", uint32), ("shard_stats", Optional(ShardStats))]
+
+    def __init__(self, error_code, shard_stats=None):
+        self.error_code = error_code
+        self.shard_stats = shard_stats
+
+
 # slave -> master
 
 
@@ -849,6 +919,10 @@ class ClusterOp:
     GET_WORK_RESPONSE = 56 + CLUSTER_OP_BASE
     SUBMIT_WORK_REQUEST = 57 + CLUSTER_OP_BASE
     SUBMIT_WORK_RESPONSE = 58 + CLUSTER_OP_BASE
+    FAST_SYNC_MINOR_BLOCK_LIST_REQUEST = 59 + CLUSTER_OP_BASE
+    FAST_SYNC_MINOR_BLOCK_LIST_RESPONSE = 60 + CLUSTER_OP_BASE
+    FAST_SYNC_STATE_REQUEST = 61 + CLUSTER_OP_BASE
+    FAST_SYNC_STATE_RESPONSE = 62 + CLUSTER_OP_BASE
 
 
 CLUSTER_OP_SERIALIZER_MAP = {
@@ -909,4 +983,8 @@ CLUSTER_OP_SERIALIZER_MAP = {
     ClusterOp.GET_WORK_RESPONSE: GetWorkResponse,
     ClusterOp.SUBMIT_WORK_REQUEST: SubmitWorkRequest,
     ClusterOp.SUBMIT_WORK_RESPONSE: SubmitWorkResponse,
+    ClusterOp.FAST_SYNC_MINOR_BLOCK_LIST_REQUEST: FastSyncMinorBlockListRequest,
+    ClusterOp.FAST_SYNC_MINOR_BLOCK_LIST_RESPONSE: FastSyncMinorBlockListResponse,
+    ClusterOp.FAST_SYNC_STATE_REQUEST: FastSyncStateRequest,
+    ClusterOp.FAST_SYNC_STATE_RESPONSE: FastSyncStateResponse,
 }
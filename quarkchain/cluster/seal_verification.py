@@ -0,0 +1,84 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Union
+
+from quarkchain.cluster import miner
+from quarkchain.config import ConsensusType
+from quarkchain.core import MinorBlockHeader, RootBlockHeader
+
+Header = Union[MinorBlockHeader, RootBlockHeader]
+
+
+def verify_seals(
+    header_list: List[Header],
+    consensus_type: ConsensusType,
+    adjusted_diff_list: List[Optional[int]],
+) -> List[bool]:
+    """ Runs in the worker processes.  Returns whether the seal of each header is valid """
+    results = []
+    for header, adjusted_diff in zip(header_list, adjusted_diff_list):
+        try:
+            miner.validate_seal(header, consensus_type, adjusted_diff=adjusted_diff)
+            results.append(True)
+        except Exception:
+            results.append(False)
+    return results
+
+
+class SealVerification:
+    """ Verify the seals of a batch of headers (e.g., the headers or blocks downloaded by a
+    sync task) in a process pool before they are validated one by one, and seed the valid
+    ones into the seal cache so that validate_seal() does not hash them again.
+    Does nothing if num_workers is 0, and the seals are verified one at a time by
+    validate_seal() as before.
+    """
+
+    def __init__(self, num_workers=0, loop=None):
+        self.num_workers = num_workers
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = ProcessPoolExecutor(num_workers) if num_workers > 0 else None
+
+    async def verify(
+        self,
+        header_list: List[Header],
+        consensus_type: ConsensusType,
+        adjusted_diff_list: List[Optional[int]] = None,
+    ):
+        if self.executor is None:
+            return
+        if adjusted_diff_list is None:
+            adjusted_diff_list = [None] * len(header_list)
+
+        pending = []  # (header, adjusted diff, seal key)
+        for header, adjusted_diff in zip(header_list, adjusted_diff_list):
+            key = miner.get_seal_key(header, consensus_type, adjusted_diff)
+            if miner.seal_cache.get(key) is None:
+                pending.append((header, adjusted_diff, key))
+        if not pending:
+            return
+
+        chunk_size = (len(pending) + self.num_workers - 1) // self.num_workers
+        chunks = [
+            pending[i : i + chunk_size] for i in range(0, len(pending), chunk_size)
+        ]
+        results = await asyncio.gather(
+            *[
+                self.loop.run_in_executor(
+                    self.executor,
+                    verify_seals,
+                    [header for header, _, _ in chunk],
+                    consensus_type,
+                    [adjusted_diff for _, adjusted_diff, _ in chunk],
+                )
+                for chunk in chunks
+            ]
+        )
+        for chunk, valid_list in zip(chunks, results):
+            for (_, _, key), valid in zip(chunk, valid_list):
+                # leave it to the validation to raise on the invalid ones
+                if valid:
+                    miner.seal_cache.put(key, True)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
@@ -0,0 +1,84 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import rlp
+
+from quarkchain.core import Transaction
+from quarkchain.evm import transactions
+from quarkchain.evm.transactions import Transaction as EvmTransaction
+from quarkchain.utils import sha3_256
+
+
+def recover_senders(rlp_list: List[bytes]) -> List[bytes]:
+    """ Runs in the worker processes.  Returns None for the txs that fail to recover """
+    senders = []
+    for data in rlp_list:
+        try:
+            senders.append(rlp.decode(data, EvmTransaction).sender)
+        except Exception:
+            senders.append(None)
+    return senders
+
+
+class SenderRecovery:
+    """ Recover the senders of a batch of txs (e.g., all the txs of a block or of a
+    NewTransactionListCommand) in a process pool before they are validated and executed,
+    and seed the senders into the decoded evm txs and the sender cache.
+    Does nothing if num_workers is 0, and the senders are recovered one at a time
+    on first use as before.
+    """
+
+    def __init__(self, num_workers=0, loop=None):
+        self.num_workers = num_workers
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = ProcessPoolExecutor(num_workers) if num_workers > 0 else None
+
+    async def recover(self, tx_list: List[Transaction]):
+        if self.executor is None:
+            return
+
+        pending = []  # (evm_tx, tx hash, rlp)
+        for tx in tx_list:
+            if not tx.code.is_evm():
+                continue
+            try:
+                evm_tx = tx.code.get_evm_transaction()
+            except Exception:
+                # leave it to the validation to raise
+                continue
+            if evm_tx._sender is not None:
+                continue
+            data = tx.code.code[1:]
+            tx_hash = sha3_256(data)
+            sender = transactions.sender_cache.get(tx_hash)
+            if sender is not None:
+                evm_tx.sender = sender
+                continue
+            pending.append((evm_tx, tx_hash, data))
+        if not pending:
+            return
+
+        chunk_size = (len(pending) + self.num_workers - 1) // self.num_workers
+        chunks = [
+            pending[i : i + chunk_size] for i in range(0, len(pending), chunk_size)
+        ]
+        results = await asyncio.gather(
+            *[
+                self.loop.run_in_executor(
+                    self.executor, recover_senders, [data for _, _, data in chunk]
+                )
+                for chunk in chunks
+            ]
+        )
+        for chunk, senders in zip(chunks, results):
+            for (evm_tx, tx_hash, _), sender in zip(chunk, senders):
+                if sender is None:
+                    # leave it to the validation to raise
+                    continue
+                evm_tx.sender = sender
+                transactions.sender_cache.put(tx_hash, sender)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
@@ -1,5 +1,7 @@
 import asyncio
+import functools
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from quarkchain.cluster.p2p_commands import (
     CommandOp,
@@ -12,11 +14,15 @@ from quarkchain.cluster.p2p_commands import (
     GetMinorBlockHeaderListResponse,
     NewTransactionListCommand,
     NewBlockMinorCommand,
+    GetStateTrieRangeResponse,
+    GetCodeListResponse,
+    GetXshardTxListResponse,
 )
 from quarkchain.cluster.miner import Miner, validate_seal
 from quarkchain.cluster.tx_generator import TransactionGenerator
 from quarkchain.cluster.protocol import VirtualConnection, ClusterMetadata
 from quarkchain.cluster.shard_state import ShardState
+from quarkchain.cluster.state_sync import StateSyncTask
 from quarkchain.config import ShardConfig, ConsensusType
 from quarkchain.core import (
     RootBlock,
@@ -26,6 +32,7 @@ from quarkchain.core import (
     Transaction,
     Address,
 )
+from quarkchain.evm.trie import Trie
 from quarkchain.utils import Logger, check, time_ms
 from quarkchain.db import InMemoryDb, PersistentDb
 
@@ -100,9 +107,14 @@ class PeerShardConnection(VirtualConnection):
         if request.direction != Direction.GENESIS:
             self.close_with_error("Bad direction")
 
-        block_hash = request.block_hash
+        # the db is read in the state thread like the other shard state reads
+        return await self.shard.run_state_op(
+            self.__get_minor_block_header_list, request.block_hash, request.limit
+        )
+
+    def __get_minor_block_header_list(self, block_hash, limit):
         header_list = []
-        for i in range(request.limit):
+        for i in range(limit):
             header = self.shard_state.db.get_minor_block_header_by_hash(
                 block_hash, consistency_check=False
             )
@@ -116,8 +128,13 @@ class PeerShardConnection(VirtualConnection):
         )
 
     async def handle_get_minor_block_list_request(self, request):
+        return await self.shard.run_state_op(
+            self.__get_minor_block_list, request.minor_block_hash_list
+        )
+
+    def __get_minor_block_list(self, minor_block_hash_list):
         m_block_list = []
-        for m_block_hash in request.minor_block_hash_list:
+        for m_block_hash in minor_block_hash_list:
             m_block = self.shard_state.db.get_minor_block_by_hash(
                 m_block_hash, consistency_check=False
             )
@@ -128,6 +145,58 @@ class PeerShardConnection(VirtualConnection):
 
         return GetMinorBlockListResponse(m_block_list)
 
+    async def handle_get_state_trie_range_request(self, request):
+        if request.limit <= 0 or request.limit > MAX_STATE_TRIE_RANGE_SIZE:
+            self.close_with_error("Bad limit")
+            return
+
+        return await self.shard.run_state_op(
+            self.__get_state_trie_range,
+            request.root_hash,
+            request.start_key,
+            request.limit,
+        )
+
+    def __get_state_trie_range(self, root_hash, start_key, limit):
+        key_list, value_list = [], []
+        if root_hash not in self.shard_state.raw_db:
+            return GetStateTrieRangeResponse(key_list, value_list, more=False)
+
+        trie = Trie(self.shard_state.raw_db, root_hash)
+        for key, value in trie.iter_from(start_key):
+            if len(key_list) == limit:
+                return GetStateTrieRangeResponse(key_list, value_list, more=True)
+            key_list.append(key)
+            value_list.append(value)
+        return GetStateTrieRangeResponse(key_list, value_list, more=False)
+
+    async def handle_get_code_list_request(self, request):
+        return await self.shard.run_state_op(
+            self.__get_code_list, request.code_hash_list
+        )
+
+    def __get_code_list(self, code_hash_list):
+        code_list = []
+        for code_hash in code_hash_list:
+            code_list.append(self.shard_state.raw_db.get(code_hash, b""))
+        return GetCodeListResponse(code_list)
+
+    async def handle_get_xshard_tx_list_request(self, request):
+        return await self.shard.run_state_op(
+            self.__get_xshard_tx_list, request.minor_block_hash_list
+        )
+
+    def __get_xshard_tx_list(self, minor_block_hash_list):
+        m_block_hash_list, xshard_tx_list_list = [], []
+        for m_block_hash in minor_block_hash_list:
+            if not self.shard_state.contain_remote_minor_block_hash(m_block_hash):
+                continue
+            m_block_hash_list.append(m_block_hash)
+            xshard_tx_list_list.append(
+                self.shard_state.db.get_minor_block_xshard_tx_list(m_block_hash)
+            )
+        return GetXshardTxListResponse(m_block_hash_list, xshard_tx_list_list)
+
     async def handle_new_block_minor_command(self, _op, cmd, _rpc_id):
         self.best_minor_block_header_observed = cmd.block.header
         await self.shard.handle_new_block(cmd.block)
@@ -189,7 +258,7 @@ class PeerShardConnection(VirtualConnection):
         self.shard.synchronizer.add_task(m_header, self)
 
     async def handle_new_transaction_list_command(self, op_code, cmd, rpc_id):
-        self.shard.add_tx_list(cmd.transaction_list, self)
+        await self.shard.add_tx_list(cmd.transaction_list, self)
 
 
 # P2P command definitions
@@ -209,16 +278,35 @@ OP_RPC_MAP = {
         CommandOp.GET_MINOR_BLOCK_LIST_RESPONSE,
         PeerShardConnection.handle_get_minor_block_list_request,
     ),
+    CommandOp.GET_STATE_TRIE_RANGE_REQUEST: (
+        CommandOp.GET_STATE_TRIE_RANGE_RESPONSE,
+        PeerShardConnection.handle_get_state_trie_range_request,
+    ),
+    CommandOp.GET_CODE_LIST_REQUEST: (
+        CommandOp.GET_CODE_LIST_RESPONSE,
+        PeerShardConnection.handle_get_code_list_request,
+    ),
+    CommandOp.GET_XSHARD_TX_LIST_REQUEST: (
+        CommandOp.GET_XSHARD_TX_LIST_RESPONSE,
+        PeerShardConnection.handle_get_xshard_tx_list_request,
+    ),
 }
 
 TIMEOUT = 10
+# the max number of trie leaves in a response of GET_STATE_TRIE_RANGE_REQUEST
+MAX_STATE_TRIE_RANGE_SIZE = 1024
 
 
 class SyncTask:
     """ Given a header and a shard connection, the synchronizer will synchronize
     the shard state with the peer shard up to the height of the header.
+    The blocks are downloaded in batches, several at a time and from several peers,
+    and added in order as they arrive.
     """
 
+    BLOCK_BATCH_SIZE = 100
+    MAX_BATCHES_IN_FLIGHT = 4
+
     def __init__(self, header: MinorBlockHeader, shard_conn: PeerShardConnection):
         self.header = header
         self.shard_conn = shard_conn
@@ -237,14 +325,16 @@ class SyncTask:
             self.shard_conn.close_with_error(str(e))
 
     async def __run_sync(self):
-        if self.__has_block_hash(self.header.get_hash()):
+        if await self.__has_block_hash(self.header.get_hash()):
             return
 
         # descending height
         block_header_chain = [self.header]
 
         # TODO: Stop if too many headers to revert
-        while not self.__has_block_hash(block_header_chain[-1].hash_prev_minor_block):
+        while not await self.__has_block_hash(
+            block_header_chain[-1].hash_prev_minor_block
+        ):
             block_hash = block_header_chain[-1].hash_prev_minor_block
             height = block_header_chain[-1].height - 1
 
@@ -258,7 +348,7 @@ class SyncTask:
                 )
                 return
 
-            if not self.shard_state.db.contain_root_block_by_hash(
+            if not await self.__has_root_block_hash(
                 block_header_chain[-1].hash_prev_root_block
             ):
                 return
@@ -275,41 +365,72 @@ class SyncTask:
                     self.shard_state.branch.get_shard_id(), len(block_header_list)
                 )
             )
+            await self.shard.slave.seal_verification.verify(
+                block_header_list, self.__get_consensus_type()
+            )
             if not self.__validate_block_headers(block_header_list):
                 # TODO: tag bad peer
                 return self.shard_conn.close_with_error(
                     "Bad peer sending discontinuing block headers"
                 )
             for header in block_header_list:
-                if self.__has_block_hash(header.get_hash()):
+                if await self.__has_block_hash(header.get_hash()):
                     break
                 block_header_chain.append(header)
 
         # ascending height
         block_header_chain.reverse()
-        while len(block_header_chain) > 0:
-            block_chain = await asyncio.wait_for(
-                self.__download_blocks(block_header_chain[:100]), TIMEOUT
-            )
-            Logger.info(
-                "[{}] downloaded {} blocks from peer".format(
-                    self.shard_state.branch.get_shard_id(), len(block_chain)
+        batches = [
+            block_header_chain[i : i + self.BLOCK_BATCH_SIZE]
+            for i in range(0, len(block_header_chain), self.BLOCK_BATCH_SIZE)
+        ]
+        downloads = deque()  # of the batches in ascending height
+        next_batch = 0
+        try:
+            for _ in batches:
+                # the following batches are downloaded while the first one is added
+                while len(downloads) < self.MAX_BATCHES_IN_FLIGHT and next_batch < len(
+                    batches
+                ):
+                    peer = self.__get_peer_for_batch(next_batch, batches[next_batch])
+                    downloads.append(
+                        asyncio.ensure_future(
+                            self.__download_blocks_with_fallback(
+                                batches[next_batch], peer
+                            )
+                        )
+                    )
+                    next_batch += 1
+                block_chain = await downloads.popleft()
+                Logger.info(
+                    "[{}] downloaded {} blocks from peer".format(
+                        self.shard_state.branch.get_shard_id(), len(block_chain)
+                    )
                 )
-            )
-            check(len(block_chain) == len(block_header_chain[:100]))
 
-            for block in block_chain:
-                # Stop if the block depends on an unknown root block
-                # TODO: move this check to early stage to avoid downloading unnecessary headers
-                if not self.shard_state.db.contain_root_block_by_hash(
-                    block.header.hash_prev_root_block
-                ):
-                    return
-                await self.shard.add_block(block)
-                block_header_chain.pop(0)
+                for block in block_chain:
+                    # Stop if the block depends on an unknown root block
+                    # TODO: move this check to early stage to avoid downloading unnecessary headers
+                    if not await self.__has_root_block_hash(
+                        block.header.hash_prev_root_block
+                    ):
+                        return
+                    await self.shard.add_block(block)
+        finally:
+            for download in downloads:
+                # the exception, if any, of a download not needed anymore is ignored
+                if not download.cancel():
+                    download.exception()
+
+    async def __has_block_hash(self, block_hash):
+        return await self.shard.run_state_op(
+            self.shard_state.db.contain_minor_block_by_hash, block_hash
+        )
 
-    def __has_block_hash(self, block_hash):
-        return self.shard_state.db.contain_minor_block_by_hash(block_hash)
+    async def __has_root_block_hash(self, block_hash):
+        return await self.shard.run_state_op(
+            self.shard_state.db.contain_root_block_by_hash, block_hash
+        )
 
     def __validate_block_headers(self, block_header_list):
         for i in range(len(block_header_list) - 1):
@@ -318,13 +439,13 @@ class SyncTask:
                 return False
             if header.hash_prev_minor_block != prev.get_hash():
                 return False
-            shard_id = header.branch.get_shard_id()
-            consensus_type = self.shard.env.quark_chain_config.SHARD_LIST[
-                shard_id
-            ].CONSENSUS_TYPE
-            validate_seal(header, consensus_type)
+            validate_seal(header, self.__get_consensus_type())
         return True
 
+    def __get_consensus_type(self):
+        shard_id = self.header.branch.get_shard_id()
+        return self.shard.env.quark_chain_config.SHARD_LIST[shard_id].CONSENSUS_TYPE
+
     async def __download_block_headers(self, block_hash):
         request = GetMinorBlockHeaderListRequest(
             block_hash=block_hash,
@@ -337,9 +458,51 @@ class SyncTask:
         )
         return resp.block_header_list
 
-    async def __download_blocks(self, block_header_list):
+    def __get_peer_for_batch(self, index, block_header_list):
+        """ Spread the batches over the task's peer and the other peers that have observed
+        a tip at least as high as the batch, at the time the batch is requested.
+        """
+        peers = [self.shard_conn]
+        for peer in self.shard.peers.values():
+            header = peer.best_minor_block_header_observed
+            if (
+                peer is not self.shard_conn
+                and not peer.is_closed()
+                and header is not None
+                and header.height >= block_header_list[-1].height
+            ):
+                peers.append(peer)
+        return peers[index % len(peers)]
+
+    async def __download_blocks_with_fallback(self, block_header_list, peer):
+        """ Download the blocks from the peer, or from the peer of the task if the peer
+        fails or does not have them, e.g., as it is on another fork.
+        """
         block_hash_list = [b.get_hash() for b in block_header_list]
-        op, resp, rpc_id = await self.shard_conn.write_rpc_request(
+        if peer is not self.shard_conn:
+            try:
+                block_chain = await asyncio.wait_for(
+                    self.__download_blocks(peer, block_hash_list), TIMEOUT
+                )
+                if [b.header.get_hash() for b in block_chain] == block_hash_list:
+                    return block_chain
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                Logger.info(
+                    "[{}] failed to download blocks from peer {}: {}".format(
+                        self.shard_state.branch.get_shard_id(), peer.cluster_peer_id, e
+                    )
+                )
+
+        block_chain = await asyncio.wait_for(
+            self.__download_blocks(self.shard_conn, block_hash_list), TIMEOUT
+        )
+        check([b.header.get_hash() for b in block_chain] == block_hash_list)
+        return block_chain
+
+    async def __download_blocks(self, peer, block_hash_list):
+        op, resp, rpc_id = await peer.write_rpc_request(
             CommandOp.GET_MINOR_BLOCK_LIST_REQUEST,
             GetMinorBlockListRequest(block_hash_list),
         )
@@ -376,6 +539,9 @@ class Shard:
         self.state = ShardState(env, shard_id, self.__init_shard_db())
 
         self.loop = asyncio.get_event_loop()
+        # the shard state is mutated (blocks executed, txs validated, etc.) in this thread
+        # one call at a time so that the event loop keeps serving peers and rpcs
+        self.state_executor = ThreadPoolExecutor(max_workers=1)
         self.synchronizer = Synchronizer()
 
         self.peers = dict()  # cluster_peer_id -> PeerShardConnection
@@ -412,7 +578,9 @@ class Shard:
                     break
                 await asyncio.sleep(0.1)
 
-            return self.state.create_block_to_mine(address=miner_address)
+            return await self.run_state_op(
+                self.state.create_block_to_mine, address=miner_address
+            )
 
         async def __add_block(block):
             # Do not add block if there is a sync in progress
@@ -449,8 +617,18 @@ class Shard:
     def add_peer(self, peer: PeerShardConnection):
         self.peers[peer.cluster_peer_id] = peer
 
+    async def run_state_op(self, func, *args, **kwargs):
+        """ Run func, which reads or mutates the shard state, in the state thread """
+        return await self.loop.run_in_executor(
+            self.state_executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def shutdown(self):
+        self.state_executor.shutdown(wait=False)
+        self.state.parallel_tx_executor.shutdown()
+
     async def __init_genesis_state(self, root_block: RootBlock):
-        block = self.state.init_genesis_state(root_block)
+        block = await self.run_state_op(self.state.init_genesis_state, root_block)
         xshard_list = []
         await self.slave.broadcast_xshard_tx_list(
             block, xshard_list, root_block.header.height
@@ -459,13 +637,13 @@ class Shard:
             block.header,
             len(block.tx_list),
             len(xshard_list),
-            self.state.get_shard_stats(),
+            await self.run_state_op(self.state.get_shard_stats),
         )
 
     async def init_from_root_block(self, root_block: RootBlock):
         """ Either recover state from local db or create genesis state based on config"""
         if root_block.header.height > self.genesis_root_height:
-            return self.state.init_from_root_block(root_block)
+            return await self.run_state_op(self.state.init_from_root_block, root_block)
 
         if root_block.header.height == self.genesis_root_height:
             await self.__init_genesis_state(root_block)
@@ -474,7 +652,7 @@ class Shard:
         check(root_block.header.height >= self.genesis_root_height)
 
         if root_block.header.height > self.genesis_root_height:
-            return self.state.add_root_block(root_block)
+            return await self.run_state_op(self.state.add_root_block, root_block)
 
         # this happens when there is a root chain fork
         if root_block.header.height == self.genesis_root_height:
@@ -511,15 +689,22 @@ class Shard:
 
         if block.header.get_hash() in self.state.new_block_pool:
             return
-        if self.state.db.contain_minor_block_by_hash(block.header.get_hash()):
+        if await self.run_state_op(
+            self.state.db.contain_minor_block_by_hash, block.header.get_hash()
+        ):
             return
 
-        if not self.state.db.contain_minor_block_by_hash(
-            block.header.hash_prev_minor_block
-        ):
-            if block.header.hash_prev_minor_block not in self.state.new_block_pool:
+        if block.header.hash_prev_minor_block not in self.state.new_block_pool:
+            if not await self.run_state_op(
+                self.state.db.contain_minor_block_by_hash,
+                block.header.hash_prev_minor_block,
+            ):
                 return
 
+        # may be added by another peer while looking up the db
+        if block.header.get_hash() in self.state.new_block_pool:
+            return
+
         shard_id = block.header.branch.get_shard_id()
         consensus_type = self.env.quark_chain_config.SHARD_LIST[shard_id].CONSENSUS_TYPE
         try:
@@ -547,7 +732,7 @@ class Shard:
         """
         old_tip = self.state.header_tip
         try:
-            xshard_list = self.state.add_block(block)
+            xshard_list = await self.run_state_op(self.state.add_block, block)
         except Exception as e:
             Logger.error_exception()
             return False
@@ -579,15 +764,18 @@ class Shard:
 
         self.add_block_futures[block.header.get_hash()] = self.loop.create_future()
 
-        prev_root_height = self.state.db.get_root_block_by_hash(
-            block.header.hash_prev_root_block
-        ).header.height
+        prev_root_height = (
+            await self.run_state_op(
+                self.state.db.get_root_block_header_by_hash,
+                block.header.hash_prev_root_block,
+            )
+        ).height
         await self.slave.broadcast_xshard_tx_list(block, xshard_list, prev_root_height)
         await self.slave.send_minor_block_header_to_master(
             block.header,
             len(block.tx_list),
             len(xshard_list),
-            self.state.get_shard_stats(),
+            await self.run_state_op(self.state.get_shard_stats),
         )
 
         self.add_block_futures[block.header.get_hash()].set_result(None)
@@ -605,6 +793,14 @@ class Shard:
         if not block_list:
             return True
 
+        await self.slave.sender_recovery.recover(
+            [tx for block in block_list for tx in block.tx_list]
+        )
+        await self.slave.seal_verification.verify(
+            [block.header for block in block_list],
+            self.env.quark_chain_config.SHARD_LIST[self.shard_id].CONSENSUS_TYPE,
+        )
+
         existing_add_block_futures = []
         block_hash_to_x_shard_list = dict()
         for block in block_list:
@@ -612,7 +808,9 @@ class Shard:
 
             block_hash = block.header.get_hash()
             try:
-                xshard_list = self.state.add_block(block, skip_if_too_old=False)
+                xshard_list = await self.run_state_op(
+                    self.state.add_block, block, skip_if_too_old=False
+                )
             except Exception as e:
                 Logger.error_exception()
                 return False
@@ -625,9 +823,12 @@ class Shard:
                 if future:
                     existing_add_block_futures.append(future)
             else:
-                prev_root_height = self.state.db.get_root_block_by_hash(
-                    block.header.hash_prev_root_block
-                ).header.height
+                prev_root_height = (
+                    await self.run_state_op(
+                        self.state.db.get_root_block_header_by_hash,
+                        block.header.hash_prev_root_block,
+                    )
+                ).height
                 block_hash_to_x_shard_list[block_hash] = (xshard_list, prev_root_height)
                 self.add_block_futures[block_hash] = self.loop.create_future()
 
@@ -643,13 +844,38 @@ class Shard:
 
         return True
 
-    def add_tx_list(self, tx_list, source_peer=None):
+    async def add_block_list_for_fast_sync(self, block_list):
+        """ Add the blocks below the pivot of a fast sync without running them.
+        Will NOT broadcast to peers or propagate xshard lists to other shards, whose lists of
+        the blocks below their own pivots are downloaded from peers instead.
+
+        Raises on any error.
+        """
+        await self.slave.seal_verification.verify(
+            [block.header for block in block_list],
+            self.env.quark_chain_config.SHARD_LIST[self.shard_id].CONSENSUS_TYPE,
+        )
+        for block in block_list:
+            check(block.header.branch.get_shard_id() == self.shard_id)
+            await self.run_state_op(self.state.add_block_for_fast_sync, block)
+
+    async def sync_state_for_fast_sync(self, peer: PeerShardConnection):
+        """ Download the evm state of the tip, which is the pivot block of a fast sync once
+        the root blocks up to the pivot are added, and switch to it.
+
+        Raises on any error.
+        """
+        header = self.state.header_tip
+        await StateSyncTask(self, peer).sync(self.state.meta_tip.hash_evm_state_root)
+        await self.run_state_op(self.state.finish_fast_sync, header)
+
+    async def add_tx_list(self, tx_list, source_peer=None):
         if not tx_list:
             return
-        valid_tx_list = []
-        for tx in tx_list:
-            if self.add_tx(tx):
-                valid_tx_list.append(tx)
+        await self.slave.sender_recovery.recover(tx_list)
+        valid_tx_list = await self.run_state_op(
+            lambda: [tx for tx in tx_list if self.add_tx(tx)]
+        )
         if not valid_tx_list:
             return
         self.broadcast_tx_list(valid_tx_list, source_peer)
@@ -1,15 +1,46 @@
+import itertools
 from typing import Tuple, Optional
 
+import rlp
+
 from quarkchain.cluster.rpc import TransactionDetail
 from quarkchain.core import (
     RootBlock,
+    RootBlockHeader,
     MinorBlock,
     MinorBlockHeader,
+    MinorBlockMeta,
     CrossShardTransactionList,
     Branch,
     Address,
+    Serializable,
+    Optional as OptionalSerializer,
 )
-from quarkchain.utils import check, Logger
+from quarkchain.evm.messages import Receipt
+from quarkchain.utils import check, Logger, LRUCache, HeightWindowPool
+
+
+class MinorBlockHeaderAndMeta(Serializable):
+    """ Stored along with each minor block so that the header pools can be recovered
+    without deserializing the full blocks
+    """
+
+    FIELDS = [("header", MinorBlockHeader), ("meta", MinorBlockMeta)]
+
+    def __init__(self, header, meta):
+        self.header = header
+        self.meta = meta
+
+
+class RootBlockHeaderAndLastMinorBlockHeader(Serializable):
+    FIELDS = [
+        ("header", RootBlockHeader),
+        ("last_minor_block_header", OptionalSerializer(MinorBlockHeader)),
+    ]
+
+    def __init__(self, header, last_minor_block_header):
+        self.header = header
+        self.last_minor_block_header = last_minor_block_header
 
 
 class TransactionHistoryMixin:
@@ -135,7 +166,7 @@ class TransactionHistoryMixin:
                 )
             else:
                 m_block = self.get_minor_block_by_height(height)
-                receipt = m_block.get_receipt(self.db, index)
+                receipt = self.get_minor_block_receipt(m_block, index)
                 tx = m_block.tx_list[index]  # tx is Transaction
                 evm_tx = tx.code.get_evm_transaction()
                 tx_list.append(
@@ -148,7 +179,8 @@ class TransactionHistoryMixin:
                         evm_tx.value,
                         height,
                         m_block.header.create_time,
-                        receipt.success == b"\x01",
+                        # not known for a block below the pivot of a fast sync
+                        receipt is not None and receipt.success == b"\x01",
                     )
                 )
             next = (int.from_bytes(k, byteorder="big") - 1).to_bytes(
@@ -158,20 +190,183 @@ class TransactionHistoryMixin:
         return tx_list, next
 
 
-class ShardDbOperator(TransactionHistoryMixin):
+def bloom_matches(header_bloom, bloom_bits):
+    """ bloom_bits: a list (AND) of lists (OR) of bloom values """
+    return all(
+        any((header_bloom & b) == b for b in bit_list) for bit_list in bloom_bits
+    )
+
+
+def _iter_set_bits(value):
+    """ Yield the positions of the set bits of value in ascending order """
+    while value:
+        low = value & -value
+        yield low.bit_length() - 1
+        value ^= low
+
+
+class BloomBitsIndexMixin:
+    """ A bloom bits index of the canonical chain to find the blocks matching a log filter
+    without reading the headers of all the blocks in the range.
+
+    The chain is divided into sections of BLOOM_BITS_SECTION_SIZE blocks.  For each section and
+    each of the 2048 bits of the header bloom, the blocks in the section with the bit set are
+    stored as a bit vector (omitted if empty) so that the candidates of a filter are computed
+    by AND/OR of a few vectors.  A section is indexed when its last block is indexed and is
+    invalidated when any of its blocks is removed from the index.  The blocks of the sections
+    not indexed are checked one by one.
+    """
+
+    BLOOM_BITS_SECTION_SIZE = 4096
+
+    @staticmethod
+    def __bloom_bits_section_key(section):
+        return b"bbs_" + section.to_bytes(4, "big")
+
+    @staticmethod
+    def __bloom_bits_key(section, bit):
+        return b"bb_" + section.to_bytes(4, "big") + bit.to_bytes(2, "big")
+
+    def put_bloom_bits_index(self, block):
+        size = self.BLOOM_BITS_SECTION_SIZE
+        if (block.header.height + 1) % size != 0:
+            return
+        section = block.header.height // size
+
+        vectors = dict()  # bit -> bit vector of the blocks in the section
+        header = block.header
+        for i in range(size - 1, -1, -1):
+            for bit in _iter_set_bits(header.bloom):
+                vectors[bit] = vectors.get(bit, 0) | (1 << i)
+            if i > 0:
+                header = self.get_minor_block_header_by_hash(
+                    header.hash_prev_minor_block, consistency_check=False
+                )
+
+        with self.db.write_batch():
+            for key, _ in list(
+                self.db.range_iter(
+                    self.__bloom_bits_key(section, 0),
+                    self.__bloom_bits_key(section + 1, 0),
+                )
+            ):
+                if key in self.db:
+                    self.db.remove(key)
+            for bit, vector in vectors.items():
+                self.db.put(
+                    self.__bloom_bits_key(section, bit),
+                    vector.to_bytes(size // 8, "big"),
+                )
+            self.db.put(self.__bloom_bits_section_key(section), block.header.get_hash())
+
+    def remove_bloom_bits_index(self, block):
+        key = self.__bloom_bits_section_key(
+            block.header.height // self.BLOOM_BITS_SECTION_SIZE
+        )
+        if key in self.db:
+            self.db.remove(key)
+
+    def __match_bloom_bits_section(self, section, bloom_bits):
+        """ Return the bit vector of the blocks in the indexed section matching bloom_bits """
+        size = self.BLOOM_BITS_SECTION_SIZE
+        bits = set()
+        for bit_list in bloom_bits:
+            for b in bit_list:
+                bits.update(_iter_set_bits(b))
+        keys = [self.__bloom_bits_key(section, bit) for bit in bits]
+        data_map = self.db.multi_get(keys) if keys else dict()
+        vectors = {
+            bit: int.from_bytes(data_map[key] or b"", "big")
+            for bit, key in zip(bits, keys)
+        }
+
+        result = (1 << size) - 1
+        for bit_list in bloom_bits:
+            group = 0
+            for b in bit_list:
+                vector = (1 << size) - 1
+                for bit in _iter_set_bits(b):
+                    vector &= vectors[bit]
+                group |= vector
+            result &= group
+        return result
+
+    def get_minor_block_heights_by_bloom(self, bloom_bits, start, end):
+        """ Yield in ascending order the heights in [start, end) of the indexed blocks whose header
+        bloom matches bloom_bits, a list (AND) of lists (OR) of bloom values
+        """
+        size = self.BLOOM_BITS_SECTION_SIZE
+        height = max(start, 0)
+        while height < end:
+            section = height // size
+            section_start = section * size
+            section_end = min(section_start + size, end)
+            if self.__bloom_bits_section_key(section) in self.db:
+                matched = self.__match_bloom_bits_section(section, bloom_bits)
+                matched &= (1 << (section_end - section_start)) - 1
+                matched >>= height - section_start
+                for i in _iter_set_bits(matched):
+                    yield height + i
+            else:
+                for h, header in self.get_minor_block_headers_by_height_range(
+                    height, section_end
+                ):
+                    if bloom_matches(header.bloom, bloom_bits):
+                        yield h
+            height = section_end
+
+
+class ShardDbOperator(TransactionHistoryMixin, BloomBitsIndexMixin):
+    # version of the database layout, see __upgrade()
+    DB_VERSION = 1
+
     def __init__(self, db, env, branch: Branch):
         self.env = env
         self.db = db
         self.branch = branch
-        # TODO:  iterate db to recover pools and set
-        self.m_header_pool = dict()
-        self.m_meta_pool = dict()
+        self.__upgrade()
+        shard_config = self.env.quark_chain_config.SHARD_LIST[
+            self.branch.get_shard_id()
+        ]
+        # hash -> MinorBlockHeaderAndMeta of the blocks near the tip, older ones are read from db
+        self.m_header_pool = HeightWindowPool(
+            shard_config.max_minor_blocks_in_memory,
+            self.__load_minor_block_header_and_meta,
+        )
         self.x_shard_set = set()
-        self.r_header_pool = dict()
-        self.r_minor_header_pool = dict()
+        # hash -> RootBlockHeaderAndLastMinorBlockHeader, older ones are read from db
+        self.r_header_pool = HeightWindowPool(
+            self.env.quark_chain_config.ROOT.max_root_blocks_in_memory,
+            self.__load_root_block_header,
+        )
 
-        # height -> set(minor block hash) for counting wasted blocks
-        self.height_to_minor_block_hashes = dict()
+        # height -> set(minor block hash) for counting wasted blocks near the tip
+        self.height_to_minor_block_hashes = LRUCache(
+            shard_config.max_minor_blocks_in_memory
+        )
+
+        # hash -> deserialized block, shared by all the callers so the blocks must not be modified
+        self.m_block_cache = LRUCache(shard_config.max_minor_blocks_in_memory)
+        self.r_block_cache = LRUCache(
+            self.env.quark_chain_config.ROOT.max_root_blocks_in_memory
+        )
+
+    def __upgrade(self):
+        version = int.from_bytes(self.db.get(b"shardDbVersion", b""), "big")
+        if version >= self.DB_VERSION:
+            return
+        Logger.info(
+            "[{}] upgrading db from version {} to {}".format(
+                self.branch.get_shard_id(), version, self.DB_VERSION
+            )
+        )
+        with self.db.write_batch():
+            if version < 1:
+                # height index b"mi_%d" -> fixed-width big-endian so that it sorts by height
+                for key, block_hash in list(self.db.range_iter(b"mi_", b"mi`")):
+                    self.db.put(self.__minor_block_index_key(int(key[3:])), block_hash)
+                    self.db.remove(key)
+            self.db.put(b"shardDbVersion", self.DB_VERSION.to_bytes(4, "big"))
 
     def __get_last_minor_block_in_root_block(self, root_block):
         # genesis root block contains no minor block header
@@ -198,34 +393,36 @@ class ShardDbOperator(TransactionHistoryMixin):
         """ When recovering from local database, we can only guarantee the consistency of the best chain.
         Forking blocks can be in inconsistent state and thus should be pruned from the database
         so that they can be retried in the future.
+        Only the compact header keys are read; full blocks are read for the blocks stored
+        before the header keys were introduced.
         """
         r_hash = r_header.get_hash()
         while (
             len(self.r_header_pool)
             < self.env.quark_chain_config.ROOT.max_root_blocks_in_memory
         ):
-            block = RootBlock.deserialize(self.db.get(b"rblock_" + r_hash))
-            self.r_minor_header_pool[
-                r_hash
-            ] = self.__get_last_minor_block_in_root_block(block)
-            self.r_header_pool[r_hash] = block.header
-            if (
-                block.header.height
-                <= self.env.quark_chain_config.get_genesis_root_height(
-                    self.branch.get_shard_id()
-                )
+            r = self.__get_root_block_header(r_hash)
+            self.r_header_pool.put(r_hash, r, r.header.height)
+            if r.header.height <= self.env.quark_chain_config.get_genesis_root_height(
+                self.branch.get_shard_id()
             ):
                 break
-            r_hash = block.header.hash_prev_block
+            r_hash = r.header.hash_prev_block
 
         m_hash = m_header.get_hash()
         shard_config = self.env.quark_chain_config.SHARD_LIST[
             self.branch.get_shard_id()
         ]
+        prefetched = self.__prefetch_minor_block_headers(
+            m_header.height, shard_config.max_minor_blocks_in_memory
+        )
         while len(self.m_header_pool) < shard_config.max_minor_blocks_in_memory:
-            block = MinorBlock.deserialize(self.db.get(b"mblock_" + m_hash))
-            self.m_header_pool[m_hash] = block.header
-            self.m_meta_pool[m_hash] = block.meta
+            data = prefetched.get(m_hash)
+            if data:
+                block = MinorBlockHeaderAndMeta.deserialize(data)
+            else:
+                block = self.__get_minor_block_header_and_meta(m_hash)
+            self.m_header_pool.put(m_hash, block, block.header.height)
             if block.header.height <= 0:
                 break
             m_hash = block.header.hash_prev_minor_block
@@ -238,6 +435,56 @@ class ShardDbOperator(TransactionHistoryMixin):
             )
         )
 
+    def __get_root_block_header(self, h):
+        """ Return RootBlockHeaderAndLastMinorBlockHeader, built from the full block if the block
+        was stored before the header keys were introduced, or None if the block is not found
+        """
+        data = self.db.get(self.__root_block_header_key(h), None)
+        if data:
+            return RootBlockHeaderAndLastMinorBlockHeader.deserialize(data)
+        data = self.db.get(b"rblock_" + h, None)
+        if not data:
+            return None
+        block = RootBlock.deserialize(data)
+        return RootBlockHeaderAndLastMinorBlockHeader(
+            block.header, self.__get_last_minor_block_in_root_block(block)
+        )
+
+    def __load_root_block_header(self, h):
+        r = self.__get_root_block_header(h)
+        return (r, r.header.height) if r else None
+
+    def __get_minor_block_header_and_meta(self, h):
+        """ Return MinorBlockHeaderAndMeta, built from the full block if the block
+        was stored before the header keys were introduced, or None if the block is not found
+        """
+        data = self.db.get(b"mblockheader_" + h, None)
+        if data:
+            return MinorBlockHeaderAndMeta.deserialize(data)
+        data = self.db.get(b"mblock_" + h, None)
+        if not data:
+            return None
+        block = MinorBlock.deserialize(data)
+        return MinorBlockHeaderAndMeta(block.header, block.meta)
+
+    def __load_minor_block_header_and_meta(self, h):
+        block = self.__get_minor_block_header_and_meta(h)
+        return (block, block.header.height) if block else None
+
+    def __prefetch_minor_block_headers(self, height, num_blocks):
+        """ Bulk-read the header keys of the blocks indexed by height (the best chain before
+        the shutdown), which are expected to be mostly the same as the chain to recover.
+        Returns hash -> serialized MinorBlockHeaderAndMeta.
+        """
+        hash_list = [
+            h
+            for _, h in self.__get_minor_block_index_range(
+                height - num_blocks + 1, height + 1
+            )
+        ]
+        result = self.db.multi_get([b"mblockheader_" + h for h in hash_list])
+        return {h: result[b"mblockheader_" + h] for h in hash_list}
+
     # ------------------------- Root block db operations --------------------------------
     def put_root_block(self, root_block, r_minor_header=None, root_block_hash=None):
         """ r_minor_header: the minor header of the shard in the root block with largest height
@@ -246,44 +493,73 @@ class ShardDbOperator(TransactionHistoryMixin):
             root_block_hash = root_block.header.get_hash()
 
         self.db.put(b"rblock_" + root_block_hash, root_block.serialize())
-        self.r_header_pool[root_block_hash] = root_block.header
-        self.r_minor_header_pool[root_block_hash] = r_minor_header
+        self.db.put(
+            self.__root_block_header_key(root_block_hash),
+            RootBlockHeaderAndLastMinorBlockHeader(
+                root_block.header, r_minor_header
+            ).serialize(),
+        )
+        self.r_block_cache.put(root_block_hash, root_block)
+        self.r_header_pool.put(
+            root_block_hash,
+            RootBlockHeaderAndLastMinorBlockHeader(root_block.header, r_minor_header),
+            root_block.header.height,
+        )
+
+    def __root_block_header_key(self, h):
+        # the last minor block header differs by shard
+        return b"rheader_" + self.branch.serialize() + h
 
     def get_root_block_by_hash(self, h):
         if h not in self.r_header_pool:
             return None
-        return RootBlock.deserialize(self.db.get(b"rblock_" + h))
+        block = self.r_block_cache.get(h)
+        if block is None:
+            block = RootBlock.deserialize(self.db.get(b"rblock_" + h))
+            self.r_block_cache.put(h, block)
+        return block
 
     def get_root_block_header_by_hash(self, h):
-        return self.r_header_pool.get(h, None)
+        r = self.r_header_pool.get(h)
+        return r.header if r else None
 
     def contain_root_block_by_hash(self, h):
         return h in self.r_header_pool
 
     # TODO: make sure all the callers check None
     def get_last_minor_block_in_root_block(self, h):
-        if h not in self.r_header_pool:
-            return None
-        return self.r_minor_header_pool.get(h)
+        r = self.r_header_pool.get(h)
+        return r.last_minor_block_header if r else None
 
     # ------------------------- Minor block db operations --------------------------------
     def put_minor_block(self, m_block, x_shard_receive_tx_list):
         m_block_hash = m_block.header.get_hash()
 
         self.db.put(b"mblock_" + m_block_hash, m_block.serialize())
+        header_and_meta = MinorBlockHeaderAndMeta(m_block.header, m_block.meta)
+        self.db.put(b"mblockheader_" + m_block_hash, header_and_meta.serialize())
+        self.m_block_cache.put(m_block_hash, m_block)
         self.put_total_tx_count(m_block)
 
-        self.m_header_pool[m_block_hash] = m_block.header
-        self.m_meta_pool[m_block_hash] = m_block.meta
+        self.m_header_pool.put(m_block_hash, header_and_meta, m_block.header.height)
 
-        self.height_to_minor_block_hashes.setdefault(m_block.header.height, set()).add(
-            m_block.header.get_hash()
-        )
+        hash_set = self.height_to_minor_block_hashes.get(m_block.header.height, set())
+        hash_set.add(m_block_hash)
+        self.height_to_minor_block_hashes.put(m_block.header.height, hash_set)
 
         self.put_confirmed_cross_shard_transaction_deposit_list(
             m_block_hash, x_shard_receive_tx_list
         )
 
+    def discard_minor_block(self, m_block):
+        """ Remove a block put inside a write batch that is not committed from memory """
+        m_block_hash = m_block.header.get_hash()
+        self.m_block_cache.pop(m_block_hash)
+        self.m_header_pool.pop(m_block_hash)
+        hash_set = self.height_to_minor_block_hashes.get(m_block.header.height)
+        if hash_set:
+            hash_set.discard(m_block_hash)
+
     def put_total_tx_count(self, m_block):
         prev_count = 0
         if m_block.header.height > 2:
@@ -297,52 +573,170 @@ class ShardDbOperator(TransactionHistoryMixin):
             return 0
         return int.from_bytes(count_bytes, "big")
 
+    # A flat receipts blob per block so that a receipt can be sliced out without
+    # walking the receipt trie, which is only kept for verifying the receipt root.
+    # Layout: number of receipts (4 bytes), then for each receipt the end offset of its
+    # rlp encoding (4 bytes) and its cumulative gas used (8 bytes), then the rlp
+    # encodings concatenated.  An empty blob marks a block whose receipts are not
+    # available, i.e., a block below the pivot of a fast sync, which is not run.
+    RECEIPT_INDEX_ENTRY_SIZE = 12
+
+    def put_minor_block_receipts(self, m_block_hash, receipts):
+        index = [len(receipts).to_bytes(4, "big")]
+        data = []
+        offset = 0
+        for receipt in receipts:
+            encoded = rlp.encode(receipt)
+            offset += len(encoded)
+            index.append(offset.to_bytes(4, "big"))
+            index.append(receipt.gas_used.to_bytes(8, "big"))
+            data.append(encoded)
+        self.db.put(b"receipts_" + m_block_hash, b"".join(index + data))
+
+    def put_minor_block_receipts_unavailable(self, m_block_hash):
+        self.db.put(b"receipts_" + m_block_hash, b"")
+
+    def __get_receipt_index_entry(self, blob, i):
+        pos = 4 + i * self.RECEIPT_INDEX_ENTRY_SIZE
+        return (
+            int.from_bytes(blob[pos : pos + 4], "big"),
+            int.from_bytes(blob[pos + 4 : pos + 12], "big"),
+        )
+
+    def __decode_receipt(self, m_block, blob, i):
+        size = int.from_bytes(blob[:4], "big")
+        data_start = 4 + size * self.RECEIPT_INDEX_ENTRY_SIZE
+        end, _ = self.__get_receipt_index_entry(blob, i)
+        if i > 0:
+            start, prev_gas_used = self.__get_receipt_index_entry(blob, i - 1)
+        else:
+            start, prev_gas_used = 0, m_block.meta.evm_cross_shard_receive_gas_used
+        receipt = rlp.decode(blob[data_start + start : data_start + end], Receipt)
+        return m_block.create_receipt(i, receipt, prev_gas_used)
+
+    def get_minor_block_receipt(self, m_block, i):
+        """ Return the TransactionReceipt of the i-th tx in the block, or None if the
+        receipts of the block are not available
+        """
+        blob = self.db.get(b"receipts_" + m_block.header.get_hash())
+        if blob is None:
+            # blocks stored before the receipts blob was introduced
+            return m_block.get_receipt(self.db, i)
+        if not blob:
+            return None
+        return self.__decode_receipt(m_block, blob, i)
+
+    def get_minor_block_receipts(self, m_block):
+        """ Return the TransactionReceipts of all the txs in the block, or an empty list
+        if the receipts of the block are not available
+        """
+        blob = self.db.get(b"receipts_" + m_block.header.get_hash())
+        if blob is None:
+            return [
+                m_block.get_receipt(self.db, i) for i in range(len(m_block.tx_list))
+            ]
+        if not blob:
+            return []
+        size = int.from_bytes(blob[:4], "big")
+        return [self.__decode_receipt(m_block, blob, i) for i in range(size)]
+
     def get_minor_block_header_by_hash(
         self, h, consistency_check=True
     ) -> Optional[MinorBlockHeader]:
-        header = self.m_header_pool.get(h, None)
-        if not header and not consistency_check:
-            block = self.get_minor_block_by_hash(h, False)
-            header = block.header if block else None
-        return header
+        block = self.m_header_pool.get(h)
+        if not block and not consistency_check:
+            block = self.__get_minor_block_header_and_meta(h)
+        return block.header if block else None
 
     def get_minor_block_evm_root_hash_by_hash(self, h):
-        if h not in self.m_header_pool:
-            return None
-        check(h in self.m_meta_pool)
-        meta = self.m_meta_pool[h]
-        return meta.hash_evm_state_root
+        block = self.m_header_pool.get(h)
+        return block.meta.hash_evm_state_root if block else None
 
     def get_minor_block_meta_by_hash(self, h):
-        return self.m_meta_pool.get(h, None)
+        block = self.m_header_pool.get(h)
+        return block.meta if block else None
 
     def get_minor_block_by_hash(
         self, h: bytes, consistency_check=True
     ) -> Optional[MinorBlock]:
         if consistency_check and h not in self.m_header_pool:
             return None
-        data = self.db.get(b"mblock_" + h, None)
-        return MinorBlock.deserialize(data) if data else None
+        block = self.m_block_cache.get(h)
+        if block is None:
+            data = self.db.get(b"mblock_" + h, None)
+            if not data:
+                return None
+            block = MinorBlock.deserialize(data)
+            self.m_block_cache.put(h, block)
+        return block
 
     def contain_minor_block_by_hash(self, h):
         return h in self.m_header_pool
 
+    @staticmethod
+    def __minor_block_index_key(height):
+        return b"mhi_" + height.to_bytes(4, "big")
+
+    def __get_minor_block_index_range(self, start, end):
+        """ Yield (height, hash) of the indexed blocks with height in [start, end) in ascending order """
+        start = max(start, 0)
+        end = min(end, 2 ** 32)
+        if start >= end:
+            return
+        end_key = self.__minor_block_index_key(end) if end < 2 ** 32 else b"mhi`"
+        for key, block_hash in self.db.range_iter(
+            self.__minor_block_index_key(start), end_key
+        ):
+            yield int.from_bytes(key[4:], "big"), block_hash
+
     def put_minor_block_index(self, block):
-        self.db.put(b"mi_%d" % block.header.height, block.header.get_hash())
+        self.db.put(
+            self.__minor_block_index_key(block.header.height), block.header.get_hash()
+        )
+        self.put_bloom_bits_index(block)
 
     def remove_minor_block_index(self, block):
-        self.db.remove(b"mi_%d" % block.header.height)
+        self.db.remove(self.__minor_block_index_key(block.header.height))
+        self.remove_bloom_bits_index(block)
 
     def get_minor_block_by_height(self, height) -> Optional[MinorBlock]:
-        key = b"mi_%d" % height
-        if key not in self.db:
+        block_hash = self.db.get(self.__minor_block_index_key(height), None)
+        if not block_hash:
             return None
-        block_hash = self.db.get(key)
         return self.get_minor_block_by_hash(block_hash, False)
 
+    def get_minor_block_headers_by_height_range(self, start, end):
+        """ Yield (height, header) of the indexed blocks with height in [start, end) in ascending order """
+        for height, h in self.__get_minor_block_index_range(start, end):
+            header = self.get_minor_block_header_by_hash(h, consistency_check=False)
+            if header:
+                yield height, header
+
+    def get_minor_blocks_by_height_range(self, start, end, batch_size=100):
+        """ Yield the indexed blocks with height in [start, end) in ascending order.
+        The index is read with one range scan and the blocks not in the cache are read
+        with multi_get() in batches of batch_size.
+        The blocks read from db are not put into the cache to keep the recent blocks there.
+        """
+        index = self.__get_minor_block_index_range(start, end)
+        while True:
+            hash_list = [h for _, h in itertools.islice(index, batch_size)]
+            if not hash_list:
+                return
+            missing = [b"mblock_" + h for h in hash_list if h not in self.m_block_cache]
+            data_map = self.db.multi_get(missing) if missing else dict()
+            for h in hash_list:
+                block = self.m_block_cache.get(h)
+                if block is None:
+                    data = data_map.get(b"mblock_" + h)
+                    if not data:
+                        continue
+                    block = MinorBlock.deserialize(data)
+                yield block
+
     def get_block_count_by_height(self, height):
         """ Return the total number of blocks with the given height"""
-        return len(self.height_to_minor_block_hashes.setdefault(height, set()))
+        return len(self.height_to_minor_block_hashes.get(height, set()))
 
     # ------------------------- Transaction db operations --------------------------------
     def put_transaction_index(self, tx, block_height, index):
@@ -1,13 +1,17 @@
 import asyncio
+import copy
 import json
 import time
 from collections import defaultdict
 from fractions import Fraction
 from typing import Optional, Tuple, List, Union, Dict
 
+import rlp
+
 from quarkchain.cluster.filter import Filter
 from quarkchain.cluster.miner import validate_seal
 from quarkchain.cluster.neighbor import is_neighbor
+from quarkchain.cluster.parallel_tx_executor import ParallelTxExecutor
 from quarkchain.cluster.rpc import ShardStats, TransactionDetail
 from quarkchain.cluster.shard_db_operator import ShardDbOperator
 from quarkchain.core import (
@@ -34,9 +38,10 @@ from quarkchain.evm.messages import apply_transaction, validate_transaction
 from quarkchain.evm.state import State as EvmState
 from quarkchain.evm.transaction_queue import TransactionQueue
 from quarkchain.evm.transactions import Transaction as EvmTransaction
+from quarkchain.evm.trie import Trie, node_cache
 from quarkchain.genesis import GenesisManager
 from quarkchain.reward import ConstMinorBlockRewardCalcultor
-from quarkchain.utils import Logger, check, time_ms
+from quarkchain.utils import Logger, LRUCache, check, time_ms
 
 
 class GasPriceSuggestionOracle:
@@ -49,6 +54,56 @@ class GasPriceSuggestionOracle:
         self.percentile = percentile
 
 
+class PendingBlock:
+    """ The block to mine on top of the tip, whose evm state the txs are applied to as they
+    are added to the tx queue, so that it is only finalized to create a block to mine.
+    """
+
+    def __init__(
+        self, block, evm_state, address, gas_limit, root_tip, xshard_tx_limits
+    ):
+        self.block = block
+        self.evm_state = evm_state
+        # the arguments of create_block_to_mine() it is built with
+        self.address = address
+        self.gas_limit = gas_limit
+        self.root_tip = root_tip
+        self.xshard_tx_limits = xshard_tx_limits
+        self.xshard_tx_counters = defaultdict(int)
+        # the lowest gas price of the txs included, None if there is no tx
+        self.min_gas_price = None
+        # the receipt trie of the txs applied up to the last sync
+        self.receipt_trie = Trie(evm_state.db)
+        self.receipt_count = 0
+
+    def add_tx(self, tx: Transaction, evm_tx: EvmTransaction):
+        self.block.add_tx(tx)
+        self.xshard_tx_counters[evm_tx.to_shard_id()] += 1
+        if self.min_gas_price is None or evm_tx.gasprice < self.min_gas_price:
+            self.min_gas_price = evm_tx.gasprice
+
+    def is_built_with(self, address, gas_limit):
+        if (address is None) != (self.address is None):
+            return False
+        return (address is None or address == self.address) and (
+            gas_limit == self.gas_limit
+        )
+
+    def sync(self):
+        """ Update the state and receipt roots with the txs applied since the last sync """
+        self.evm_state.commit(keep_cache=True)
+        receipts = self.evm_state.receipts
+        for i in range(self.receipt_count, len(receipts)):
+            self.receipt_trie.update(rlp.encode(i), rlp.encode(receipts[i]))
+        self.receipt_count = len(receipts)
+
+    def is_on(self, header_tip, root_tip):
+        return (
+            self.block.header.hash_prev_minor_block == header_tip.get_hash()
+            and self.root_tip == root_tip
+        )
+
+
 class ShardState:
     """  State of a shard, which includes
     - evm state
@@ -75,8 +130,11 @@ class ShardState:
         self.raw_db = db if db is not None else env.db
         self.branch = Branch.create(env.quark_chain_config.SHARD_SIZE, shard_id)
         self.db = ShardDbOperator(self.raw_db, self.env, self.branch)
-        self.tx_queue = TransactionQueue()  # queue of EvmTransaction
-        self.tx_dict = dict()  # hash -> Transaction for explorer
+        qkc_config = env.quark_chain_config
+        self.tx_queue = TransactionQueue(
+            max_size=qkc_config.TRANSACTION_QUEUE_SIZE_LIMIT_PER_SHARD,
+            max_size_per_sender=qkc_config.TRANSACTION_QUEUE_SIZE_LIMIT_PER_SENDER,
+        )  # tx hash -> EvmTransaction
         self.initialized = False
         # TODO: make the oracle configurable
         self.gas_price_suggestion_oracle = GasPriceSuggestionOracle(
@@ -85,6 +143,14 @@ class ShardState:
 
         # new blocks that passed POW validation and should be made available to whole network
         self.new_block_pool = dict()
+        self.parallel_tx_executor = ParallelTxExecutor(
+            env.cluster_config.PARALLEL_TX_EXECUTION_WORKERS
+        )
+        self.pending_block = None  # type: Optional[PendingBlock]
+        # root block hash -> the deposits to the shard, which must not be modified
+        self.xshard_deposit_cache = LRUCache(qkc_config.ROOT.max_root_blocks_in_memory)
+        # add_block() may run in a thread other than the event loop's (see Shard)
+        self.loop = asyncio.get_event_loop()
 
     def init_from_root_block(self, root_block):
         """ Master will send its root chain tip when it connects to slaves.
@@ -265,30 +331,24 @@ class ShardState:
         return evm_tx
 
     def add_tx(self, tx: Transaction):
-        if (
-            len(self.tx_queue)
-            > self.env.quark_chain_config.TRANSACTION_QUEUE_SIZE_LIMIT_PER_SHARD
-        ):
-            # exceeding tx queue size limit
-            return False
-
         if self.db.contain_transaction_hash(tx.get_hash()):
             return False
 
         tx_hash = tx.get_hash()
-        if tx_hash in self.tx_dict:
+        if tx_hash in self.tx_queue:
             return False
 
         evm_state = self.evm_state.ephemeral_clone()
         evm_state.gas_used = 0
         try:
             evm_tx = self.__validate_tx(tx, evm_state)
-            self.tx_queue.add_transaction(evm_tx)
-            self.tx_dict[tx_hash] = tx
-            return True
+            if not self.tx_queue.add_transaction(evm_tx, tx_hash=tx_hash):
+                return False
         except Exception as e:
             Logger.warning_every_sec("Failed to add transaction: {}".format(e), 1)
             return False
+        self.__add_tx_to_pending_block(evm_tx, tx)
+        return True
 
     def _get_evm_state_for_new_block(self, block, ephemeral=True):
         state = self.__create_evm_state()
@@ -415,7 +475,7 @@ class ShardState:
         else:
             return gas_limit
 
-    def __validate_block(self, block: MinorBlock):
+    def __validate_block(self, block: MinorBlock, check_prev_root_block=True):
         """ Validate a block before running evm transactions
         """
         height = block.header.height
@@ -485,6 +545,16 @@ class ShardState:
         if not self.branch.is_in_shard(block.header.coinbase_address.full_shard_id):
             raise ValueError("coinbase output must be in local shard")
 
+        if check_prev_root_block:
+            self.__validate_prev_root_block(block, prev_header)
+
+        # Check PoW if applicable
+        consensus_type = self.env.quark_chain_config.SHARD_LIST[
+            self.shard_id
+        ].CONSENSUS_TYPE
+        validate_seal(block.header, consensus_type)
+
+    def __validate_prev_root_block(self, block: MinorBlock, prev_header):
         # Check whether the root header is in the root chain
         root_block_header = self.db.get_root_block_header_by_hash(
             block.header.hash_prev_root_block
@@ -516,12 +586,6 @@ class ShardState:
         ):
             raise ValueError("prev root blocks are not on the same chain")
 
-        # Check PoW if applicable
-        consensus_type = self.env.quark_chain_config.SHARD_LIST[
-            self.shard_id
-        ].CONSENSUS_TYPE
-        validate_seal(block.header, consensus_type)
-
     def run_block(
         self, block, evm_state=None, evm_tx_included=None, x_shard_receive_tx_list=None
     ):
@@ -548,20 +612,30 @@ class ShardState:
             )
         )
 
-        for idx, tx in enumerate(block.tx_list):
-            try:
-                evm_tx = self.__validate_tx(tx, evm_state)
-                evm_tx.set_shard_size(self.branch.get_shard_size())
-                apply_transaction(evm_state, evm_tx, tx.get_hash())
-                evm_tx_included.append(evm_tx)
-            except Exception as e:
-                Logger.debug_exception()
-                Logger.debug(
-                    "failed to process Tx {}, idx {}, reason {}".format(
-                        tx.get_hash().hex(), idx, e
-                    )
+        if self.parallel_tx_executor.is_applicable(block.tx_list):
+            evm_tx_included.extend(
+                self.parallel_tx_executor.apply_transactions(
+                    evm_state,
+                    block.tx_list,
+                    lambda tx: self.__validate_tx(tx, evm_state),
+                    self.branch.get_shard_size(),
                 )
-                raise e
+            )
+        else:
+            for idx, tx in enumerate(block.tx_list):
+                try:
+                    evm_tx = self.__validate_tx(tx, evm_state)
+                    evm_tx.set_shard_size(self.branch.get_shard_size())
+                    apply_transaction(evm_state, evm_tx, tx.get_hash())
+                    evm_tx_included.append(evm_tx)
+                except Exception as e:
+                    Logger.debug_exception()
+                    Logger.debug(
+                        "failed to process Tx {}, idx {}, reason {}".format(
+                            tx.get_hash().hex(), idx, e
+                        )
+                    )
+                    raise e
 
         # Pay miner
         pure_coinbase_amount = self.get_coinbase_amount()
@@ -591,6 +665,13 @@ class ShardState:
 
     def __rewrite_block_index_to(self, minor_block, add_tx_back_to_queue=True):
         """ Find the common ancestor in the current chain and rewrite index till minor_block """
+        old_chain, new_chain = self.__rewrite_block_db_index_to(minor_block)
+        self.__update_tx_queue(old_chain, new_chain, add_tx_back_to_queue)
+
+    def __rewrite_block_db_index_to(self, minor_block):
+        """ Rewrite the db index till minor_block without touching the tx queue.
+        Returns the blocks removed from and added to the index.
+        """
         new_chain = []
         old_chain = []
 
@@ -620,24 +701,27 @@ class ShardState:
         for block in old_chain:
             self.db.remove_transaction_index_from_block(block)
             self.db.remove_minor_block_index(block)
-            if add_tx_back_to_queue:
-                self.__add_transactions_from_block(block)
         for block in new_chain:
             self.db.put_transaction_index_from_block(block)
             self.db.put_minor_block_index(block)
+        return old_chain, new_chain
+
+    def __update_tx_queue(self, old_chain, new_chain, add_tx_back_to_queue=True):
+        if add_tx_back_to_queue:
+            for block in old_chain:
+                self.__add_transactions_from_block(block)
+        for block in new_chain:
             self.__remove_transactions_from_block(block)
 
     def __add_transactions_from_block(self, block):
         for tx in block.tx_list:
-            self.tx_dict[tx.get_hash()] = tx
-            self.tx_queue.add_transaction(tx.code.get_evm_transaction())
+            self.tx_queue.add_transaction(
+                tx.code.get_evm_transaction(), tx_hash=tx.get_hash()
+            )
 
     def __remove_transactions_from_block(self, block):
-        evm_tx_list = []
         for tx in block.tx_list:
-            self.tx_dict.pop(tx.get_hash(), None)
-            evm_tx_list.append(tx.code.get_evm_transaction())
-        self.tx_queue = self.tx_queue.diff(evm_tx_list)
+            self.tx_queue.remove_transaction(tx.get_hash())
 
     def add_block(self, block, skip_if_too_old=True):
         """  Add a block to local db.  Perform validate and update tip accordingly
@@ -672,95 +756,117 @@ class ShardState:
         if self.db.contain_minor_block_by_hash(block.header.get_hash()):
             return None
 
-        evm_tx_included = []
-        x_shard_receive_tx_list = []
-        # Throw exception if fail to run
-        self.__validate_block(block)
-        evm_state = self.run_block(
-            block,
-            evm_tx_included=evm_tx_included,
-            x_shard_receive_tx_list=x_shard_receive_tx_list,
-        )
+        # all the writes of the block (trie nodes, block, indexes) are committed atomically,
+        # and the tip and the tx queue in memory are only updated once they are committed
+        try:
+            with self.raw_db.write_batch():
+                evm_tx_included = []
+                x_shard_receive_tx_list = []
+                # Throw exception if fail to run
+                self.__validate_block(block)
+                evm_state = self.run_block(
+                    block,
+                    evm_tx_included=evm_tx_included,
+                    x_shard_receive_tx_list=x_shard_receive_tx_list,
+                )
 
-        # ------------------------ Validate ending result of the block --------------------
-        if block.meta.hash_evm_state_root != evm_state.trie.root_hash:
-            raise ValueError(
-                "State root mismatch: header %s computed %s"
-                % (block.meta.hash_evm_state_root.hex(), evm_state.trie.root_hash.hex())
-            )
+                # ------------------------ Validate ending result of the block --------------------
+                if block.meta.hash_evm_state_root != evm_state.trie.root_hash:
+                    raise ValueError(
+                        "State root mismatch: header %s computed %s"
+                        % (
+                            block.meta.hash_evm_state_root.hex(),
+                            evm_state.trie.root_hash.hex(),
+                        )
+                    )
 
-        receipt_root = mk_receipt_sha(evm_state.receipts, evm_state.db)
-        if block.meta.hash_evm_receipt_root != receipt_root:
-            raise ValueError(
-                "Receipt root mismatch: header {} computed {}".format(
-                    block.meta.hash_evm_receipt_root.hex(), receipt_root.hex()
-                )
-            )
+                receipt_root = mk_receipt_sha(evm_state.receipts, evm_state.db)
+                if block.meta.hash_evm_receipt_root != receipt_root:
+                    raise ValueError(
+                        "Receipt root mismatch: header {} computed {}".format(
+                            block.meta.hash_evm_receipt_root.hex(), receipt_root.hex()
+                        )
+                    )
 
-        if evm_state.gas_used != block.meta.evm_gas_used:
-            raise ValueError(
-                "Gas used mismatch: header %d computed %d"
-                % (block.meta.evm_gas_used, evm_state.gas_used)
-            )
+                if evm_state.gas_used != block.meta.evm_gas_used:
+                    raise ValueError(
+                        "Gas used mismatch: header %d computed %d"
+                        % (block.meta.evm_gas_used, evm_state.gas_used)
+                    )
 
-        if (
-            evm_state.xshard_receive_gas_used
-            != block.meta.evm_cross_shard_receive_gas_used
-        ):
-            raise ValueError(
-                "X-shard gas used mismatch: header %d computed %d"
-                % (
-                    block.meta.evm_cross_shard_receive_gas_used,
-                    evm_state.xshard_receive_gas_used,
-                )
-            )
-        coinbase_amount = self.get_coinbase_amount() + evm_state.block_fee
-        if coinbase_amount != block.header.coinbase_amount:
-            raise ValueError("Coinbase reward incorrect")
+                if (
+                    evm_state.xshard_receive_gas_used
+                    != block.meta.evm_cross_shard_receive_gas_used
+                ):
+                    raise ValueError(
+                        "X-shard gas used mismatch: header %d computed %d"
+                        % (
+                            block.meta.evm_cross_shard_receive_gas_used,
+                            evm_state.xshard_receive_gas_used,
+                        )
+                    )
+                coinbase_amount = self.get_coinbase_amount() + evm_state.block_fee
+                if coinbase_amount != block.header.coinbase_amount:
+                    raise ValueError("Coinbase reward incorrect")
 
-        if evm_state.bloom != block.header.bloom:
-            raise ValueError("Bloom mismatch")
+                if evm_state.bloom != block.header.bloom:
+                    raise ValueError("Bloom mismatch")
 
-        self.db.put_minor_block(block, x_shard_receive_tx_list)
+                self.db.put_minor_block(block, x_shard_receive_tx_list)
+                self.db.put_minor_block_receipts(
+                    block.header.get_hash(), evm_state.receipts
+                )
 
-        # Update tip if a block is appended or a fork is longer (with the same ancestor confirmed by root block tip)
-        # or they are equal length but the root height confirmed by the block is longer
-        update_tip = False
-        if not self.__is_same_root_chain(
-            self.root_tip,
-            self.db.get_root_block_header_by_hash(block.header.hash_prev_root_block),
-        ):
-            # Don't update tip if the block depends on a root block that is not root_tip or root_tip's ancestor
-            update_tip = False
-        elif block.header.hash_prev_minor_block == self.header_tip.get_hash():
-            update_tip = True
-        elif self.__is_minor_block_linked_to_root_tip(block):
-            if block.header.height > self.header_tip.height:
-                update_tip = True
-            elif block.header.height == self.header_tip.height:
-                update_tip = (
+                # Update tip if a block is appended or a fork is longer (with the same ancestor confirmed by root block tip)
+                # or they are equal length but the root height confirmed by the block is longer
+                update_tip = False
+                if not self.__is_same_root_chain(
+                    self.root_tip,
                     self.db.get_root_block_header_by_hash(
                         block.header.hash_prev_root_block
-                    ).height
-                    > self.db.get_root_block_header_by_hash(
-                        self.header_tip.hash_prev_root_block
-                    ).height
+                    ),
+                ):
+                    # Don't update tip if the block depends on a root block that is not root_tip or root_tip's ancestor
+                    update_tip = False
+                elif block.header.hash_prev_minor_block == self.header_tip.get_hash():
+                    update_tip = True
+                elif self.__is_minor_block_linked_to_root_tip(block):
+                    if block.header.height > self.header_tip.height:
+                        update_tip = True
+                    elif block.header.height == self.header_tip.height:
+                        update_tip = (
+                            self.db.get_root_block_header_by_hash(
+                                block.header.hash_prev_root_block
+                            ).height
+                            > self.db.get_root_block_header_by_hash(
+                                self.header_tip.hash_prev_root_block
+                            ).height
+                        )
+
+                header_tip = self.header_tip
+                if update_tip:
+                    old_chain, new_chain = self.__rewrite_block_db_index_to(block)
+                    header_tip = block.header
+
+                check(
+                    self.__is_same_root_chain(
+                        self.root_tip,
+                        self.db.get_root_block_header_by_hash(
+                            header_tip.hash_prev_root_block
+                        ),
+                    )
                 )
+        except Exception:
+            # the block put into the in-memory pools and cache is not in db
+            self.db.discard_minor_block(block)
+            raise
 
         if update_tip:
-            self.__rewrite_block_index_to(block)
+            self.__update_tx_queue(old_chain, new_chain)
             self.evm_state = evm_state
             self.header_tip = block.header
             self.meta_tip = block.meta
 
-        check(
-            self.__is_same_root_chain(
-                self.root_tip,
-                self.db.get_root_block_header_by_hash(
-                    self.header_tip.hash_prev_root_block
-                ),
-            )
-        )
         Logger.debug(
             "Add block took {} seconds for {} tx".format(
                 time.time() - start_time, len(block.tx_list)
@@ -784,13 +890,40 @@ class ShardState:
                 "propagation_latency_ms": start_ms - tracking_data.get("mined", 0),
                 "num_tx": len(block.tx_list),
             }
-            asyncio.ensure_future(
+            asyncio.run_coroutine_threadsafe(
                 self.env.cluster_config.kafka_logger.log_kafka_sample_async(
                     self.env.cluster_config.MONITORING.PROPAGATION_TOPIC, sample
-                )
+                ),
+                self.loop,
             )
         return evm_state.xshard_list
 
+    def add_block_for_fast_sync(self, block):
+        """ Add a block below the pivot of a fast sync to local db without running it, as
+        the evm state of the pivot block is downloaded instead.  Unlike add_block(), the root
+        block it is on is not validated (it may be added later in the same root block batch),
+        and neither the receipts nor the cross-shard deposits received are stored, so the
+        receipts of its txs are reported as not available.
+        The tip is updated by the root blocks confirming the block.
+        Returns False if block is already added.
+        Raises on any error.
+        """
+        if self.db.contain_minor_block_by_hash(block.header.get_hash()):
+            return False
+        self.__validate_block(block, check_prev_root_block=False)
+        self.db.put_minor_block(block, [])
+        self.db.put_minor_block_receipts_unavailable(block.header.get_hash())
+        return True
+
+    def finish_fast_sync(self, header):
+        """ Switch to the evm state of header, the pivot block of a fast sync, which must be
+        the tip after the root blocks up to the pivot are added, once its state is downloaded.
+        """
+        check(self.header_tip == header)
+        evm_state = self.__create_evm_state()
+        evm_state.trie.root_hash = self.meta_tip.hash_evm_state_root
+        self.evm_state = evm_state
+
     def get_coinbase_amount(self) -> int:
         local_fee_rate = (
             1 - self.env.quark_chain_config.reward_tax_rate
@@ -876,8 +1009,7 @@ class ShardState:
         # TODO: add block reward
         # TODO: the current calculation is bogus and just serves as a placeholder.
         coinbase = 0
-        for tx_wrapper in self.tx_queue.peek():
-            tx = tx_wrapper.tx
+        for tx in self.tx_queue:
             coinbase += tx.gasprice * tx.startgas
 
         if self.root_tip.get_hash() != self.header_tip.hash_prev_root_block:
@@ -935,13 +1067,26 @@ class ShardState:
             )
         return results
 
-    def __add_transactions_to_block(self, block: MinorBlock, evm_state: EvmState):
+    def __is_xshard_tx_limit_reached(
+        self, evm_tx, xshard_tx_counters, xshard_tx_limits
+    ) -> bool:
+        to_branch = Branch.create(self.branch.get_shard_size(), evm_tx.to_shard_id())
+        if self.branch == to_branch:
+            return False
+        check(is_neighbor(self.branch, to_branch))
+        return xshard_tx_counters[evm_tx.to_shard_id()] + 1 > xshard_tx_limits.get(
+            evm_tx.to_shard_id(), 0
+        )
+
+    def __add_transactions_to_block(
+        self,
+        block: MinorBlock,
+        evm_state: EvmState,
+        xshard_tx_counters: Dict[int, int],
+        xshard_tx_limits: Dict[int, int],
+    ):
         """ Fill up the block tx list with tx from the tx queue"""
         poped_txs = []
-        xshard_tx_counters = defaultdict(int)
-        xshard_tx_limits = self.__get_xshard_tx_limits(
-            self.db.get_root_block_by_hash(block.header.hash_prev_root_block)
-        )
 
         while evm_state.gas_used < evm_state.gas_limit:
             evm_tx = self.tx_queue.pop_transaction(
@@ -949,48 +1094,30 @@ class ShardState:
             )
             if evm_tx is None:  # tx_queue is exhausted
                 break
+            tx = Transaction(code=Code.create_evm_code(evm_tx))
 
             evm_tx.set_shard_size(self.branch.get_shard_size())
-            to_branch = Branch.create(
-                self.branch.get_shard_size(), evm_tx.to_shard_id()
-            )
-
-            if self.branch != to_branch:
-                check(is_neighbor(self.branch, to_branch))
-                if xshard_tx_counters[evm_tx.to_shard_id()] + 1 > xshard_tx_limits.get(
-                    evm_tx.to_shard_id(), 0
-                ):
-                    poped_txs.append(evm_tx)  # will be put back later
-                    continue
+            if self.__is_xshard_tx_limit_reached(
+                evm_tx, xshard_tx_counters, xshard_tx_limits
+            ):
+                poped_txs.append((evm_tx, tx))  # will be put back later
+                continue
 
             try:
-                tx = Transaction(code=Code.create_evm_code(evm_tx))
                 apply_transaction(evm_state, evm_tx, tx.get_hash())
                 block.add_tx(tx)
-                poped_txs.append(evm_tx)
+                poped_txs.append((evm_tx, tx))
                 xshard_tx_counters[evm_tx.to_shard_id()] += 1
             except Exception as e:
                 Logger.warning_every_sec(
                     "Failed to include transaction: {}".format(e), 1
                 )
-                tx = Transaction(code=Code.create_evm_code(evm_tx))
-                self.tx_dict.pop(tx.get_hash(), None)
 
         # We don't want to drop the transactions if the mined block failed to be appended
-        for evm_tx in poped_txs:
-            self.tx_queue.add_transaction(evm_tx)
+        for evm_tx, tx in poped_txs:
+            self.tx_queue.add_transaction(evm_tx, tx_hash=tx.get_hash())
 
-    def create_block_to_mine(self, create_time=None, address=None, gas_limit=None):
-        """ Create a block to append and include TXs to maximize rewards
-        """
-        start_time = time.time()
-        tracking_data = {
-            "inception": time_ms(),
-            "cluster": self.env.cluster_config.MONITORING.CLUSTER_ID,
-        }
-        if not create_time:
-            create_time = max(int(time.time()), self.header_tip.create_time + 1)
-        difficulty = self.get_next_block_difficulty(create_time)
+    def __create_pending_block(self, create_time, difficulty, address, gas_limit):
         prev_block = self.get_tip()
         block = prev_block.create_block_to_append(
             create_time=create_time, address=address, difficulty=difficulty
@@ -1025,7 +1152,121 @@ class ShardState:
             ancestor_root_header=ancestor_root_header,
         ).get_hash()
 
-        self.__add_transactions_to_block(block, evm_state)
+        pending = PendingBlock(
+            block,
+            evm_state,
+            address,
+            gas_limit,
+            self.root_tip,
+            self.__get_xshard_tx_limits(
+                self.db.get_root_block_by_hash(block.header.hash_prev_root_block)
+            ),
+        )
+        self.__add_transactions_to_block(
+            block, evm_state, pending.xshard_tx_counters, pending.xshard_tx_limits
+        )
+        pending.min_gas_price = min(
+            (tx.code.get_evm_transaction().gasprice for tx in block.tx_list),
+            default=None,
+        )
+        return pending
+
+    def __add_tx_to_pending_block(self, evm_tx: EvmTransaction, tx: Transaction):
+        """ Apply the tx just added to the tx queue to the pending block, followed by the
+        txs of the same sender in the queue left out for the nonce gap it may fill, e.g.,
+        the txs of a block put back by a reorg
+        """
+        pending = self.pending_block
+        if pending is None or not pending.is_on(self.header_tip, self.root_tip):
+            return
+        if not self.__apply_tx_to_pending_block(evm_tx, tx):
+            return
+        nonce = evm_tx.nonce + 1
+        for queued_evm_tx in self.tx_queue.get_transactions_by_sender(evm_tx.sender):
+            if queued_evm_tx.nonce < nonce:
+                continue
+            if queued_evm_tx.nonce > nonce or not self.__apply_tx_to_pending_block(
+                queued_evm_tx, Transaction(code=Code.create_evm_code(queued_evm_tx))
+            ):
+                break
+            nonce += 1
+
+    def __apply_tx_to_pending_block(
+        self, evm_tx: EvmTransaction, tx: Transaction
+    ) -> bool:
+        pending = self.pending_block
+        evm_tx.set_shard_size(self.branch.get_shard_size())
+        if self.__is_xshard_tx_limit_reached(
+            evm_tx, pending.xshard_tx_counters, pending.xshard_tx_limits
+        ):
+            self.__leave_tx_out_of_pending_block(evm_tx)
+            return False
+        try:
+            apply_transaction(pending.evm_state, evm_tx, tx.get_hash())
+        except Exception as e:
+            # e.g., the block is full, the tx stays in the queue for the next block
+            Logger.debug("Failed to include transaction: {}".format(e))
+            self.__leave_tx_out_of_pending_block(evm_tx)
+            return False
+        pending.add_tx(tx, evm_tx)
+        return True
+
+    def __leave_tx_out_of_pending_block(self, evm_tx: EvmTransaction):
+        """ Drop the pending block, to be rebuilt from the tx queue by gas price, if the
+        tx left out pays more than a tx included, which it may replace
+        """
+        min_gas_price = self.pending_block.min_gas_price
+        if min_gas_price is not None and evm_tx.gasprice > min_gas_price:
+            self.pending_block = None
+
+    def create_block_to_mine(self, create_time=None, address=None, gas_limit=None):
+        """ Create a block to append and include TXs to maximize rewards
+        The pending block is rebuilt when the tip or the arguments change, otherwise the
+        txs added since are already applied to it and it is only finalized.  These txs
+        are appended in the order they arrive rather than by gas price, which earns the
+        same fees as long as they all fit, so the block is also rebuilt once a tx paying
+        more than the cheapest tx included does not fit.
+        """
+        start_time = time.time()
+        tracking_data = {
+            "inception": time_ms(),
+            "cluster": self.env.cluster_config.MONITORING.CLUSTER_ID,
+        }
+        is_default_time = not create_time
+        if not create_time:
+            create_time = max(int(time.time()), self.header_tip.create_time + 1)
+        difficulty = self.get_next_block_difficulty(create_time)
+
+        pending = self.pending_block
+        if not (
+            pending
+            and pending.is_on(self.header_tip, self.root_tip)
+            and pending.is_built_with(address, gas_limit)
+            and (
+                pending.block.header.create_time == create_time
+                # a later time only matters if it lowers the difficulty
+                or (is_default_time and pending.block.header.difficulty == difficulty)
+            )
+        ):
+            pending = self.pending_block = self.__create_pending_block(
+                create_time, difficulty, address, gas_limit
+            )
+
+        block = MinorBlock(
+            copy.copy(pending.block.header),
+            copy.copy(pending.block.meta),
+            list(pending.block.tx_list),
+        )
+        # only the changes since the last sync are committed, to a clone as the pending
+        # evm state is kept to apply the following txs
+        pending.sync()
+        evm_state = pending.evm_state.ephemeral_clone()
+        coinbase = evm_state.block_coinbase
+        if coinbase in pending.evm_state.cache:
+            # e.g., a blank coinbase, which is not in the trie
+            evm_state.cache[coinbase] = pending.evm_state.cache[coinbase].copy(
+                evm_state.env, evm_state.db, evm_state.dirty_nodes
+            )
 
         # Pay miner
         pure_coinbase_amount = self.get_coinbase_amount()
@@ -1035,7 +1276,11 @@ class ShardState:
         evm_state.commit()
 
         coinbase_amount = pure_coinbase_amount + evm_state.block_fee
-        block.finalize(evm_state=evm_state, coinbase_amount=coinbase_amount)
+        block.finalize(
+            evm_state=evm_state,
+            coinbase_amount=coinbase_amount,
+            hash_evm_receipt_root=pending.receipt_trie.root_hash,
+        )
 
         tracking_data["creation_ms"] = time_ms() - tracking_data["inception"]
         block.tracking_data = json.dumps(tracking_data).encode("utf-8")
@@ -1124,6 +1369,8 @@ class ShardState:
         shard_header = shard_headers[-1]
 
         self.db.put_root_block(root_block, shard_header)
+        # assembled once here for the blocks to mine and run on top of the root block
+        self.__get_cross_shard_tx_list_by_root_block_hash(root_block.header.get_hash())
         check(
             self.__is_same_root_chain(
                 root_block.header,
@@ -1196,7 +1443,15 @@ class ShardState:
         return is_neighbor(self.branch, remote_branch)
 
     def __get_cross_shard_tx_list_by_root_block_hash(self, h):
-        r_block = self.db.get_root_block_by_hash(h)
+        tx_list = self.xshard_deposit_cache.get(h)
+        if tx_list is None:
+            tx_list = self.__create_cross_shard_tx_list(
+                self.db.get_root_block_by_hash(h)
+            )
+            self.xshard_deposit_cache.put(h, tx_list)
+        return tx_list
+
+    def __create_cross_shard_tx_list(self, r_block):
         tx_list = []
         for m_header in r_block.minor_block_header_list:
             if m_header.branch == self.branch:
@@ -1205,15 +1460,17 @@ class ShardState:
             if not self.__is_neighbor(m_header.branch):
                 continue
 
-            xshard_tx_list = self.db.get_minor_block_xshard_tx_list(m_header.get_hash())
-            prev_root = self.db.get_root_block_by_hash(m_header.hash_prev_root_block)
+            prev_root = self.db.get_root_block_header_by_hash(
+                m_header.hash_prev_root_block
+            )
             if (
                 not prev_root
-                or prev_root.header.height
+                or prev_root.height
                 <= self.env.quark_chain_config.get_genesis_root_height(self.shard_id)
             ):
-                check(xshard_tx_list is None)
+                # no x-shard tx before the genesis root block of the shard
                 continue
+            xshard_tx_list = self.db.get_minor_block_xshard_tx_list(m_header.get_hash())
             tx_list.extend(xshard_tx_list.tx_list)
 
         # Apply root block coinbase
@@ -1316,9 +1573,10 @@ class ShardState:
         block, index = self.db.get_transaction_by_hash(h)
         if block:
             return block, index
-        if h in self.tx_dict:
+        evm_tx = self.tx_queue.get_transaction(h)
+        if evm_tx:
             block = MinorBlock(MinorBlockHeader(), MinorBlockMeta())
-            block.tx_list.append(self.tx_dict[h])
+            block.tx_list.append(Transaction(code=Code.create_evm_code(evm_tx)))
             return block, 0
         return None, None
 
@@ -1328,7 +1586,9 @@ class ShardState:
         block, index = self.db.get_transaction_by_hash(h)
         if not block:
             return None
-        receipt = block.get_receipt(self.evm_state.db, index)
+        receipt = self.db.get_minor_block_receipt(block, index)
+        if receipt is None:
+            return None
         if receipt.contract_address != Address.create_empty_account(0):
             address = receipt.contract_address
             check(
@@ -1343,8 +1603,7 @@ class ShardState:
 
         if start == bytes(1):  # get pending tx
             tx_list = []
-            for orderable_tx in self.tx_queue.txs + self.tx_queue.aside:
-                tx = orderable_tx.tx
+            for tx in self.tx_queue.get_transactions_by_sender(address.recipient):
                 if Address(tx.sender, tx.from_full_shard_id) == address:
                     tx_list.append(
                         TransactionDetail(
@@ -1391,6 +1650,13 @@ class ShardState:
             block_count60s=block_count,
             stale_block_count60s=stale_block_count,
             last_block_time=last_block_time,
+            block_cache_hits=self.db.m_block_cache.hits,
+            block_cache_misses=self.db.m_block_cache.misses,
+            # the trie node cache is shared by all the shards of the process
+            node_cache_hits=node_cache.hits,
+            node_cache_misses=node_cache.misses,
+            evicted_tx_count=self.tx_queue.num_evicted,
+            rejected_tx_count=self.tx_queue.num_rejected,
         )
 
     def get_logs(
@@ -1456,11 +1722,9 @@ class ShardState:
         if start_height < 3:
             start_height = 3
         prices = []
-        for i in range(start_height, curr_height + 1):
-            block = self.db.get_minor_block_by_height(i)
-            if not block:
-                Logger.error("Failed to get block {} to retrieve gas price".format(i))
-                continue
+        for block in self.db.get_minor_blocks_by_height_range(
+            start_height, curr_height + 1
+        ):
             prices.extend(block.get_block_prices())
         if not prices:
             return None
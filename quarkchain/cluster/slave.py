@@ -7,7 +7,11 @@ from typing import Optional, Tuple, Dict, List, Union
 from quarkchain.cluster.cluster_config import ClusterConfig
 from quarkchain.cluster.miner import MiningWork
 from quarkchain.cluster.neighbor import is_neighbor
-from quarkchain.cluster.p2p_commands import CommandOp, GetMinorBlockListRequest
+from quarkchain.cluster.p2p_commands import (
+    CommandOp,
+    GetMinorBlockListRequest,
+    GetXshardTxListRequest,
+)
 from quarkchain.cluster.protocol import (
     ClusterConnection,
     ForwardingVirtualConnection,
@@ -44,6 +48,8 @@ from quarkchain.cluster.rpc import (
     AddTransactionResponse,
     CreateClusterPeerConnectionResponse,
     SyncMinorBlockListResponse,
+    FastSyncMinorBlockListResponse,
+    FastSyncStateResponse,
     GetMinorBlockResponse,
     GetTransactionResponse,
     AccountBranchData,
@@ -64,8 +70,10 @@ from quarkchain.cluster.rpc import (
     GetTransactionReceiptResponse,
     SlaveInfo,
 )
+from quarkchain.cluster.seal_verification import SealVerification
+from quarkchain.cluster.sender_recovery import SenderRecovery
 from quarkchain.cluster.shard import Shard, PeerShardConnection
-from quarkchain.core import Branch, Transaction, Address, Log
+from quarkchain.core import Branch, ByteBuffer, Transaction, Address, Log
 from quarkchain.core import (
     CrossShardTransactionList,
     MinorBlock,
@@ -77,7 +85,7 @@ from quarkchain.core import (
 )
 from quarkchain.env import DEFAULT_ENV
 from quarkchain.protocol import Connection
-from quarkchain.utils import check, Logger
+from quarkchain.utils import check, EventLoopLagMonitor, Logger
 
 
 TIMEOUT = 10
@@ -215,27 +223,34 @@ class MasterConnection(ClusterConnection):
             if not shard.state.initialized:
                 continue
             eco_info_list.append(
-                EcoInfo(
-                    branch=branch,
-                    height=shard.state.header_tip.height + 1,
-                    coinbase_amount=shard.state.get_next_block_coinbase_amount(),
-                    difficulty=shard.state.get_next_block_difficulty(),
-                    unconfirmed_headers_coinbase_amount=shard.state.get_unconfirmed_headers_coinbase_amount(),
-                )
+                await shard.run_state_op(self.__get_eco_info, branch, shard.state)
             )
         return GetEcoInfoListResponse(error_code=0, eco_info_list=eco_info_list)
 
+    @staticmethod
+    def __get_eco_info(branch, state):
+        return EcoInfo(
+            branch=branch,
+            height=state.header_tip.height + 1,
+            coinbase_amount=state.get_next_block_coinbase_amount(),
+            difficulty=state.get_next_block_difficulty(),
+            unconfirmed_headers_coinbase_amount=state.get_unconfirmed_headers_coinbase_amount(),
+        )
+
     async def handle_get_next_block_to_mine_request(self, req):
         shard = self.shards.get(req.branch, None)
         check(shard is not None)
-        block = shard.state.create_block_to_mine(address=req.address)
+        block = await shard.run_state_op(
+            shard.state.create_block_to_mine, address=req.address
+        )
         response = GetNextBlockToMineResponse(error_code=0, block=block)
         return response
 
     async def handle_add_minor_block_request(self, req):
         """ For local miner to submit mined blocks through master """
         try:
-            block = MinorBlock.deserialize(req.minor_block_data)
+            # decode the whole block now to reject malformed data
+            block = MinorBlock.deserialize(ByteBuffer(req.minor_block_data))
         except Exception:
             return AddMinorBlockResponse(error_code=errno.EBADMSG)
         shard = self.shards.get(block.header.branch, None)
@@ -261,7 +276,10 @@ class MasterConnection(ClusterConnection):
                 continue
             headers_info_list.append(
                 HeadersInfo(
-                    branch=branch, header_list=shard.state.get_unconfirmed_header_list()
+                    branch=branch,
+                    header_list=await shard.run_state_op(
+                        shard.state.get_unconfirmed_header_list
+                    ),
                 )
             )
         return GetUnconfirmedHeadersResponse(
@@ -271,7 +289,7 @@ class MasterConnection(ClusterConnection):
     async def handle_get_account_data_request(
         self, req: GetAccountDataRequest
     ) -> GetAccountDataResponse:
-        account_branch_data_list = self.slave_server.get_account_data(
+        account_branch_data_list = await self.slave_server.get_account_data(
             req.address, req.block_height
         )
         return GetAccountDataResponse(
@@ -279,13 +297,13 @@ class MasterConnection(ClusterConnection):
         )
 
     async def handle_add_transaction(self, req):
-        success = self.slave_server.add_tx(req.tx)
+        success = await self.slave_server.add_tx(req.tx)
         return AddTransactionResponse(error_code=0 if success else 1)
 
     async def handle_execute_transaction(
         self, req: ExecuteTransactionRequest
     ) -> ExecuteTransactionResponse:
-        res = self.slave_server.execute_tx(req.tx, req.from_address)
+        res = await self.slave_server.execute_tx(req.tx, req.from_address)
         fail = res is None
         return ExecuteTransactionResponse(
             error_code=int(fail), result=res if not fail else b""
@@ -330,11 +348,13 @@ class MasterConnection(ClusterConnection):
 
     async def handle_get_minor_block_request(self, req):
         if req.minor_block_hash != bytes(32):
-            block = self.slave_server.get_minor_block_by_hash(
+            block = await self.slave_server.get_minor_block_by_hash(
                 req.minor_block_hash, req.branch
             )
         else:
-            block = self.slave_server.get_minor_block_by_height(req.height, req.branch)
+            block = await self.slave_server.get_minor_block_by_height(
+                req.height, req.branch
+            )
 
         if not block:
             empty_block = MinorBlock(MinorBlockHeader(), MinorBlockMeta())
@@ -343,7 +363,7 @@ class MasterConnection(ClusterConnection):
         return GetMinorBlockResponse(error_code=0, minor_block=block)
 
     async def handle_get_transaction_request(self, req):
-        minor_block, i = self.slave_server.get_transaction_by_hash(
+        minor_block, i = await self.slave_server.get_transaction_by_hash(
             req.tx_hash, req.branch
         )
         if not minor_block:
@@ -355,7 +375,7 @@ class MasterConnection(ClusterConnection):
         return GetTransactionResponse(error_code=0, minor_block=minor_block, index=i)
 
     async def handle_get_transaction_receipt_request(self, req):
-        resp = self.slave_server.get_transaction_receipt(req.tx_hash, req.branch)
+        resp = await self.slave_server.get_transaction_receipt(req.tx_hash, req.branch)
         if not resp:
             empty_block = MinorBlock(MinorBlockHeader(), MinorBlockMeta())
             empty_receipt = TransactionReceipt.create_empty_receipt()
@@ -368,7 +388,7 @@ class MasterConnection(ClusterConnection):
         )
 
     async def handle_get_transaction_list_by_address_request(self, req):
-        result = self.slave_server.get_transaction_list_by_address(
+        result = await self.slave_server.get_transaction_list_by_address(
             req.address, req.start, req.limit
         )
         if not result:
@@ -440,14 +460,94 @@ class MasterConnection(ClusterConnection):
             shard = self.slave_server.shards.get(branch, None)
             check(shard is not None)
             return SyncMinorBlockListResponse(
-                error_code=0, shard_stats=shard.state.get_shard_stats()
+                error_code=0,
+                shard_stats=await shard.run_state_op(shard.state.get_shard_stats),
             )
         except Exception:
             Logger.error_exception()
             return SyncMinorBlockListResponse(error_code=1)
 
+    async def handle_fast_sync_minor_block_list_request(self, req):
+        shard = self.shards.get(req.branch, None)
+        if not shard:
+            return FastSyncMinorBlockListResponse(error_code=errno.EBADMSG)
+        peer_shard_conn = shard.peers.get(req.cluster_peer_id, None)
+        if not peer_shard_conn:
+            return FastSyncMinorBlockListResponse(error_code=errno.EBADMSG)
+
+        BLOCK_BATCH_SIZE = 100
+        try:
+            block_hash_list = req.minor_block_hash_list
+            for i in range(0, len(block_hash_list), BLOCK_BATCH_SIZE):
+                blocks_to_download = block_hash_list[i : i + BLOCK_BATCH_SIZE]
+                op, resp, rpc_id = await asyncio.wait_for(
+                    peer_shard_conn.write_rpc_request(
+                        CommandOp.GET_MINOR_BLOCK_LIST_REQUEST,
+                        GetMinorBlockListRequest(blocks_to_download),
+                    ),
+                    TIMEOUT,
+                )
+                block_chain = resp.minor_block_list
+                if [b.header.get_hash() for b in block_chain] != blocks_to_download:
+                    raise RuntimeError("Bad peer missing minor blocks for fast sync")
+                await shard.add_block_list_for_fast_sync(block_chain)
+
+            # not verified until the blocks after the pivot receiving them are run,
+            # like those propagated by the neighbor shards
+            block_hash_list = req.xshard_minor_block_hash_list
+            num_xshard_lists = 0
+            for i in range(0, len(block_hash_list), BLOCK_BATCH_SIZE):
+                op, resp, rpc_id = await asyncio.wait_for(
+                    peer_shard_conn.write_rpc_request(
+                        CommandOp.GET_XSHARD_TX_LIST_REQUEST,
+                        GetXshardTxListRequest(
+                            block_hash_list[i : i + BLOCK_BATCH_SIZE]
+                        ),
+                    ),
+                    TIMEOUT,
+                )
+                for block_hash, tx_list in zip(
+                    resp.minor_block_hash_list, resp.xshard_tx_list_list
+                ):
+                    await shard.run_state_op(
+                        shard.state.add_cross_shard_tx_list_by_minor_block_hash,
+                        block_hash,
+                        tx_list,
+                    )
+                num_xshard_lists += len(resp.minor_block_hash_list)
+
+            Logger.info(
+                "[{}] fast sync request from master, added {} blocks and {} xshard lists".format(
+                    req.branch.get_shard_id(),
+                    len(req.minor_block_hash_list),
+                    num_xshard_lists,
+                )
+            )
+            return FastSyncMinorBlockListResponse(error_code=0)
+        except Exception:
+            Logger.error_exception()
+            return FastSyncMinorBlockListResponse(error_code=1)
+
+    async def handle_fast_sync_state_request(self, req):
+        shard = self.shards.get(req.branch, None)
+        if not shard:
+            return FastSyncStateResponse(error_code=errno.EBADMSG)
+        peer_shard_conn = shard.peers.get(req.cluster_peer_id, None)
+        if not peer_shard_conn:
+            return FastSyncStateResponse(error_code=errno.EBADMSG)
+
+        try:
+            await shard.sync_state_for_fast_sync(peer_shard_conn)
+            return FastSyncStateResponse(
+                error_code=0,
+                shard_stats=await shard.run_state_op(shard.state.get_shard_stats),
+            )
+        except Exception:
+            Logger.error_exception()
+            return FastSyncStateResponse(error_code=1)
+
     async def handle_get_logs(self, req: GetLogRequest) -> GetLogResponse:
-        res = self.slave_server.get_logs(
+        res = await self.slave_server.get_logs(
             req.addresses, req.topics, req.start_block, req.end_block, req.branch
         )
         fail = res is None
@@ -457,22 +557,24 @@ class MasterConnection(ClusterConnection):
         )
 
     async def handle_estimate_gas(self, req: EstimateGasRequest) -> EstimateGasResponse:
-        res = self.slave_server.estimate_gas(req.tx, req.from_address)
+        res = await self.slave_server.estimate_gas(req.tx, req.from_address)
         fail = res is None
         return EstimateGasResponse(error_code=int(fail), result=res or 0)
 
     async def handle_get_storage_at(self, req: GetStorageRequest) -> GetStorageResponse:
-        res = self.slave_server.get_storage_at(req.address, req.key, req.block_height)
+        res = await self.slave_server.get_storage_at(
+            req.address, req.key, req.block_height
+        )
         fail = res is None
         return GetStorageResponse(error_code=int(fail), result=res or b"")
 
     async def handle_get_code(self, req: GetCodeRequest) -> GetCodeResponse:
-        res = self.slave_server.get_code(req.address, req.block_height)
+        res = await self.slave_server.get_code(req.address, req.block_height)
         fail = res is None
         return GetCodeResponse(error_code=int(fail), result=res or b"")
 
     async def handle_gas_price(self, req: GasPriceRequest) -> GasPriceResponse:
-        res = self.slave_server.gas_price(req.branch)
+        res = await self.slave_server.gas_price(req.branch)
         fail = res is None
         return GasPriceResponse(error_code=int(fail), result=res or 0)
 
@@ -498,6 +600,16 @@ class MasterConnection(ClusterConnection):
 
         return SubmitWorkResponse(error_code=0, success=res)
 
+    async def handle_add_xshard_tx_list_request(self, req):
+        """ Only sent by a SlaveRouter to its workers """
+        error_code = await self.slave_server.add_xshard_tx_list(req)
+        return AddXshardTxListResponse(error_code=error_code)
+
+    async def handle_batch_add_xshard_tx_list_request(self, batch_request):
+        """ Only sent by a SlaveRouter to its workers """
+        error_code = await self.slave_server.batch_add_xshard_tx_list(batch_request)
+        return BatchAddXshardTxListResponse(error_code=error_code)
+
 
 MASTER_OP_NONRPC_MAP = {
     ClusterOp.DESTROY_CLUSTER_PEER_CONNECTION_COMMAND: MasterConnection.handle_destroy_cluster_peer_connection_command
@@ -562,6 +674,14 @@ MASTER_OP_RPC_MAP = {
         ClusterOp.SYNC_MINOR_BLOCK_LIST_RESPONSE,
         MasterConnection.handle_sync_minor_block_list_request,
     ),
+    ClusterOp.FAST_SYNC_MINOR_BLOCK_LIST_REQUEST: (
+        ClusterOp.FAST_SYNC_MINOR_BLOCK_LIST_RESPONSE,
+        MasterConnection.handle_fast_sync_minor_block_list_request,
+    ),
+    ClusterOp.FAST_SYNC_STATE_REQUEST: (
+        ClusterOp.FAST_SYNC_STATE_RESPONSE,
+        MasterConnection.handle_fast_sync_state_request,
+    ),
     ClusterOp.EXECUTE_TRANSACTION_REQUEST: (
         ClusterOp.EXECUTE_TRANSACTION_RESPONSE,
         MasterConnection.handle_execute_transaction,
@@ -602,6 +722,14 @@ MASTER_OP_RPC_MAP = {
         ClusterOp.SUBMIT_WORK_RESPONSE,
         MasterConnection.handle_submit_work,
     ),
+    ClusterOp.ADD_XSHARD_TX_LIST_REQUEST: (
+        ClusterOp.ADD_XSHARD_TX_LIST_RESPONSE,
+        MasterConnection.handle_add_xshard_tx_list_request,
+    ),
+    ClusterOp.BATCH_ADD_XSHARD_TX_LIST_REQUEST: (
+        ClusterOp.BATCH_ADD_XSHARD_TX_LIST_RESPONSE,
+        MasterConnection.handle_batch_add_xshard_tx_list_request,
+    ),
 }
 
 
@@ -621,15 +749,11 @@ class SlaveConnection(Connection):
         self.slave_server = slave_server
         self.id = slave_id
         self.shard_mask_list = shard_mask_list
-        self.shards = self.slave_server.shards
 
         self.ping_received_future = asyncio.get_event_loop().create_future()
 
         asyncio.ensure_future(self.active_and_loop_forever())
 
-    def __get_shard_size(self):
-        return self.slave_server.env.quark_chain_config.SHARD_SIZE
-
     async def wait_until_ping_received(self):
         await self.ping_received_future
 
@@ -672,32 +796,12 @@ class SlaveConnection(Connection):
     # Blockchain RPC handlers
 
     async def handle_add_xshard_tx_list_request(self, req):
-        if req.branch.get_shard_size() != self.__get_shard_size():
-            Logger.error(
-                "add xshard tx list request shard size mismatch! "
-                "Expect: {}, actual: {}".format(
-                    self.__get_shard_size(), req.branch.get_shard_size()
-                )
-            )
-            return AddXshardTxListResponse(error_code=errno.ESRCH)
-
-        if req.branch not in self.shards:
-            Logger.error(
-                "cannot find shard id {} locally".format(req.branch.get_shard_id())
-            )
-            return AddXshardTxListResponse(error_code=errno.ENOENT)
-
-        self.shards[req.branch].state.add_cross_shard_tx_list_by_minor_block_hash(
-            req.minor_block_hash, req.tx_list
-        )
-        return AddXshardTxListResponse(error_code=0)
+        error_code = await self.slave_server.add_xshard_tx_list(req)
+        return AddXshardTxListResponse(error_code=error_code)
 
     async def handle_batch_add_xshard_tx_list_request(self, batch_request):
-        for request in batch_request.add_xshard_tx_list_request_list:
-            response = await self.handle_add_xshard_tx_list_request(request)
-            if response.error_code != 0:
-                return BatchAddXshardTxListResponse(error_code=response.error_code)
-        return BatchAddXshardTxListResponse(error_code=0)
+        error_code = await self.slave_server.batch_add_xshard_tx_list(batch_request)
+        return BatchAddXshardTxListResponse(error_code=error_code)
 
 
 SLAVE_OP_NONRPC_MAP = {}
@@ -822,6 +926,13 @@ class SlaveServer:
         self.artificial_tx_config = None
         self.shards = dict()  # type: Dict[Branch, Shard]
         self.shutdown_future = self.loop.create_future()
+        self.sender_recovery = SenderRecovery(
+            self.env.cluster_config.SIGNATURE_RECOVERY_WORKERS, self.loop
+        )
+        self.seal_verification = SealVerification(
+            self.env.cluster_config.SEAL_VERIFICATION_WORKERS, self.loop
+        )
+        self.loop_lag_monitor = EventLoopLagMonitor(loop=self.loop)
 
         # block hash -> future (that will return when the block is fully propagated in the cluster)
         # the block that has been added locally but not have been fully propagated will have an entry here
@@ -877,7 +988,7 @@ class SlaveServer:
     def __get_shard_size(self):
         return self.env.quark_chain_config.SHARD_SIZE
 
-    async def __handle_new_connection(self, reader, writer):
+    async def handle_new_connection(self, reader, writer):
         # The first connection should always come from master
         if not self.master:
             self.master = MasterConnection(
@@ -889,7 +1000,7 @@ class SlaveServer:
     async def __start_server(self):
         """ Run the server until shutdown is called """
         self.server = await asyncio.start_server(
-            self.__handle_new_connection,
+            self.handle_new_connection,
             "0.0.0.0",
             self.env.slave_config.PORT,
             loop=self.loop,
@@ -899,6 +1010,7 @@ class SlaveServer:
                 self.server.sockets[0].getsockname()
             )
         )
+        self.loop_lag_monitor.start()
 
     def start(self):
         self.loop.create_task(self.__start_server())
@@ -915,6 +1027,11 @@ class SlaveServer:
 
         self.slave_connection_manager.close_all()
         self.server.close()
+        self.sender_recovery.shutdown()
+        self.seal_verification.shutdown()
+        self.loop_lag_monitor.stop()
+        for shard in self.shards.values():
+            shard.shutdown()
 
     def get_shutdown_future(self):
         return self.shutdown_future
@@ -979,8 +1096,11 @@ class SlaveServer:
                 continue
 
             if branch in self.shards:
-                self.shards[branch].state.add_cross_shard_tx_list_by_minor_block_hash(
-                    block_hash, request.tx_list
+                shard = self.shards[branch]
+                await shard.run_state_op(
+                    shard.state.add_cross_shard_tx_list_by_minor_block_hash,
+                    block_hash,
+                    request.tx_list,
                 )
 
             for slave_conn in self.slave_connection_manager.get_connections_by_shard(
@@ -1021,11 +1141,12 @@ class SlaveServer:
             check(is_neighbor(branch, source_branch))
 
             if branch in self.shards:
+                shard = self.shards[branch]
                 for request in request_list:
-                    self.shards[
-                        branch
-                    ].state.add_cross_shard_tx_list_by_minor_block_hash(
-                        request.minor_block_hash, request.tx_list
+                    await shard.run_state_op(
+                        shard.state.add_cross_shard_tx_list_by_minor_block_hash,
+                        request.minor_block_hash,
+                        request.tx_list,
                     )
 
             batch_request = BatchAddXshardTxListRequest(request_list)
@@ -1039,6 +1160,40 @@ class SlaveServer:
         responses = await asyncio.gather(*rpc_futures)
         check(all([response.error_code == 0 for _, response, _ in responses]))
 
+    async def add_xshard_tx_list(self, req: AddXshardTxListRequest) -> int:
+        """ Add the cross-shard deposits from a neighbor shard.  Returns the error code """
+        if req.branch.get_shard_size() != self.__get_shard_size():
+            Logger.error(
+                "add xshard tx list request shard size mismatch! "
+                "Expect: {}, actual: {}".format(
+                    self.__get_shard_size(), req.branch.get_shard_size()
+                )
+            )
+            return errno.ESRCH
+
+        if req.branch not in self.shards:
+            Logger.error(
+                "cannot find shard id {} locally".format(req.branch.get_shard_id())
+            )
+            return errno.ENOENT
+
+        shard = self.shards[req.branch]
+        await shard.run_state_op(
+            shard.state.add_cross_shard_tx_list_by_minor_block_hash,
+            req.minor_block_hash,
+            req.tx_list,
+        )
+        return 0
+
+    async def batch_add_xshard_tx_list(
+        self, batch_request: BatchAddXshardTxListRequest
+    ) -> int:
+        for request in batch_request.add_xshard_tx_list_request_list:
+            error_code = await self.add_xshard_tx_list(request)
+            if error_code != 0:
+                return error_code
+        return 0
+
     async def add_block_list_for_sync(self, block_list):
         """ Add blocks in batch to reduce RPCs. Will NOT broadcast to peers.
         Returns true if blocks are successfully added. False on any error.
@@ -1050,98 +1205,106 @@ class SlaveServer:
         check(shard is not None)
         return await shard.add_block_list_for_sync(block_list)
 
-    def add_tx(self, tx: Transaction) -> bool:
+    async def add_tx(self, tx: Transaction) -> bool:
         evm_tx = tx.code.get_evm_transaction()
         evm_tx.set_shard_size(self.__get_shard_size())
         branch = Branch.create(self.__get_shard_size(), evm_tx.from_shard_id())
         shard = self.shards.get(branch, None)
         if not shard:
             return False
-        return shard.add_tx(tx)
+        return await shard.run_state_op(shard.add_tx, tx)
 
-    def execute_tx(self, tx, from_address) -> Optional[bytes]:
+    async def execute_tx(self, tx, from_address) -> Optional[bytes]:
         evm_tx = tx.code.get_evm_transaction()
         evm_tx.set_shard_size(self.__get_shard_size())
         branch = Branch.create(self.__get_shard_size(), evm_tx.from_shard_id())
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.execute_tx(tx, from_address)
+        return await shard.run_state_op(shard.state.execute_tx, tx, from_address)
 
-    def get_transaction_count(self, address):
+    async def get_transaction_count(self, address):
         branch = Branch.create(
             self.__get_shard_size(), address.get_shard_id(self.__get_shard_size())
         )
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.get_transaction_count(address.recipient)
+        return await shard.run_state_op(
+            shard.state.get_transaction_count, address.recipient
+        )
 
-    def get_balance(self, address):
+    async def get_balance(self, address):
         branch = Branch.create(
             self.__get_shard_size(), address.get_shard_id(self.__get_shard_size())
         )
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.get_balance(address.recipient)
+        return await shard.run_state_op(shard.state.get_balance, address.recipient)
 
-    def get_account_data(
+    async def get_account_data(
         self, address: Address, block_height: Optional[int]
     ) -> List[AccountBranchData]:
+        def get_account_branch_data(branch, state):
+            return AccountBranchData(
+                branch=branch,
+                transaction_count=state.get_transaction_count(
+                    address.recipient, block_height
+                ),
+                balance=state.get_balance(address.recipient, block_height),
+                is_contract=len(state.get_code(address.recipient, block_height)) > 0,
+            )
+
         results = []
         for branch, shard in self.shards.items():
             results.append(
-                AccountBranchData(
-                    branch=branch,
-                    transaction_count=shard.state.get_transaction_count(
-                        address.recipient, block_height
-                    ),
-                    balance=shard.state.get_balance(address.recipient, block_height),
-                    is_contract=len(
-                        shard.state.get_code(address.recipient, block_height)
-                    )
-                    > 0,
-                )
+                await shard.run_state_op(get_account_branch_data, branch, shard.state)
             )
         return results
 
-    def get_minor_block_by_hash(self, block_hash, branch: Branch):
+    async def get_minor_block_by_hash(self, block_hash, branch: Branch):
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.db.get_minor_block_by_hash(block_hash, False)
+        return await shard.run_state_op(
+            shard.state.db.get_minor_block_by_hash, block_hash, False
+        )
 
-    def get_minor_block_by_height(self, height, branch):
+    async def get_minor_block_by_height(self, height, branch):
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.db.get_minor_block_by_height(height)
+        return await shard.run_state_op(
+            shard.state.db.get_minor_block_by_height, height
+        )
 
-    def get_transaction_by_hash(self, tx_hash, branch):
+    async def get_transaction_by_hash(self, tx_hash, branch):
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.get_transaction_by_hash(tx_hash)
+        return await shard.run_state_op(shard.state.get_transaction_by_hash, tx_hash)
 
-    def get_transaction_receipt(
+    async def get_transaction_receipt(
         self, tx_hash, branch
     ) -> Optional[Tuple[MinorBlock, int, TransactionReceipt]]:
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.get_transaction_receipt(tx_hash)
+        return await shard.run_state_op(shard.state.get_transaction_receipt, tx_hash)
 
-    def get_transaction_list_by_address(self, address, start, limit):
+    async def get_transaction_list_by_address(self, address, start, limit):
         branch = Branch.create(
             self.__get_shard_size(), address.get_shard_id(self.__get_shard_size())
         )
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.get_transaction_list_by_address(address, start, limit)
+        return await shard.run_state_op(
+            shard.state.get_transaction_list_by_address, address, start, limit
+        )
 
-    def get_logs(
+    async def get_logs(
         self,
         addresses: List[Address],
         topics: List[Optional[Union[str, List[str]]]],
@@ -1152,18 +1315,20 @@ class SlaveServer:
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.get_logs(addresses, topics, start_block, end_block)
+        return await shard.run_state_op(
+            shard.state.get_logs, addresses, topics, start_block, end_block
+        )
 
-    def estimate_gas(self, tx, from_address) -> Optional[int]:
+    async def estimate_gas(self, tx, from_address) -> Optional[int]:
         evm_tx = tx.code.get_evm_transaction()
         evm_tx.set_shard_size(self.__get_shard_size())
         branch = Branch.create(self.__get_shard_size(), evm_tx.from_shard_id())
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.estimate_gas(tx, from_address)
+        return await shard.run_state_op(shard.state.estimate_gas, tx, from_address)
 
-    def get_storage_at(
+    async def get_storage_at(
         self, address: Address, key: int, block_height: Optional[int]
     ) -> Optional[bytes]:
         shard_size = self.__get_shard_size()
@@ -1172,9 +1337,11 @@ class SlaveServer:
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.get_storage_at(address.recipient, key, block_height)
+        return await shard.run_state_op(
+            shard.state.get_storage_at, address.recipient, key, block_height
+        )
 
-    def get_code(
+    async def get_code(
         self, address: Address, block_height: Optional[int]
     ) -> Optional[bytes]:
         shard_size = self.__get_shard_size()
@@ -1183,13 +1350,15 @@ class SlaveServer:
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.get_code(address.recipient, block_height)
+        return await shard.run_state_op(
+            shard.state.get_code, address.recipient, block_height
+        )
 
-    def gas_price(self, branch: Branch) -> Optional[int]:
+    async def gas_price(self, branch: Branch) -> Optional[int]:
         shard = self.shards.get(branch, None)
         if not shard:
             return None
-        return shard.state.gas_price()
+        return await shard.run_state_op(shard.state.gas_price)
 
     async def get_work(self, branch: Branch) -> Optional[MiningWork]:
         shard = self.shards.get(branch, None)
@@ -1227,7 +1396,13 @@ def main():
 
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
-    slave_server = SlaveServer(env)
+    if env.cluster_config.PROCESS_PER_SHARD:
+        # imported here as slave_router imports this module
+        from quarkchain.cluster.slave_router import SlaveRouter
+
+        slave_server = SlaveRouter(env)
+    else:
+        slave_server = SlaveServer(env)
     slave_server.start()
     slave_server.do_loop()
 
@@ -0,0 +1,647 @@
+import asyncio
+import errno
+import multiprocessing
+import os
+import shutil
+import tempfile
+from typing import Dict, List
+
+from quarkchain.cluster.cluster_config import SlaveConfig
+from quarkchain.cluster.protocol import ClusterConnection
+from quarkchain.cluster.rpc import (
+    AddMinorBlockResponse,
+    AddRootBlockResponse,
+    AddXshardTxListRequest,
+    AddXshardTxListResponse,
+    BatchAddXshardTxListRequest,
+    BatchAddXshardTxListResponse,
+    ClusterOp,
+    CLUSTER_OP_SERIALIZER_MAP,
+    ConnectToSlavesResponse,
+    CreateClusterPeerConnectionResponse,
+    GenTxResponse,
+    GetAccountDataResponse,
+    GetEcoInfoListResponse,
+    GetUnconfirmedHeadersResponse,
+    MineResponse,
+    Pong,
+)
+from quarkchain.cluster.slave import SlaveConnectionManager, SlaveServer
+from quarkchain.core import Branch, ByteBuffer, MinorBlock, ShardMask
+from quarkchain.env import Env
+from quarkchain.utils import check, Logger
+
+WORKER_CONNECT_RETRY_DELAY = 0.1
+WORKER_SHUTDOWN_TIMEOUT = 10
+
+
+class WorkerSlaveConnectionManager(SlaveConnectionManager):
+    """ A worker sends the cross-shard deposits of its shard to the router, which
+    forwards them to the workers and the slaves running the recipient shards
+    """
+
+    def get_connections_by_shard(self, shard: int):
+        return [self.slave_server.master]
+
+
+class ShardWorker(SlaveServer):
+    """ Runs a shard of a SlaveRouter in a worker process.  The router connects to the
+    worker through a Unix socket, and is taken as the master by the worker.
+    """
+
+    def __init__(self, env, path, name="worker"):
+        super().__init__(env, name)
+        self.path = path
+        self.slave_connection_manager = WorkerSlaveConnectionManager(env, self)
+
+    async def __start_server(self):
+        self.server = await asyncio.start_unix_server(
+            self.handle_new_connection, self.path, loop=self.loop
+        )
+        Logger.info("Listening on {} for the slave router".format(self.path))
+        self.loop_lag_monitor.start()
+
+    def start(self):
+        self.loop.create_task(self.__start_server())
+
+
+def run_worker(cluster_config, evm_config, slave_config, path):
+    """ Entry point of the worker processes """
+    Logger.set_logging_level(cluster_config.LOG_LEVEL)
+    Logger.set_kafka_logger(cluster_config.kafka_logger)
+    env = Env(evm_config=evm_config, cluster_config=cluster_config)
+    env.slave_config = slave_config
+
+    worker = ShardWorker(env, path, name=slave_config.ID)
+    worker.start()
+    worker.do_loop()
+
+    Logger.info("Shard worker {} is shutdown".format(slave_config.ID))
+
+
+class WorkerConnection(ClusterConnection):
+    """ Connection from the router to a worker.  The traffic of the shard with its peers
+    is forwarded to the master as is.
+    """
+
+    def __init__(self, env, reader, writer, router, name=None):
+        super().__init__(
+            env,
+            reader,
+            writer,
+            CLUSTER_OP_SERIALIZER_MAP,
+            WORKER_OP_NONRPC_MAP,
+            WORKER_OP_RPC_MAP,
+            name=name,
+        )
+        self.router = router  # type: SlaveRouter
+
+        asyncio.ensure_future(self.active_and_loop_forever())
+
+    def get_connection_to_forward(self, metadata):
+        """ Override ProxyConnection.get_connection_to_forward()
+        """
+        if metadata.cluster_peer_id == 0:
+            # RPC from the worker
+            return None
+        return self.router.master
+
+    def get_metadata_to_forward(self, metadata):
+        return metadata
+
+    def close(self):
+        if not self.router.shutting_down:
+            Logger.info(
+                "Lost connection with worker {}. Shutting down slave router ...".format(
+                    self.name
+                )
+            )
+        super().close()
+        self.router.shutdown()
+
+    # RPC handlers
+
+    async def handle_add_minor_block_header_request(self, req):
+        _, resp, _ = await self.router.master.write_rpc_request(
+            ClusterOp.ADD_MINOR_BLOCK_HEADER_REQUEST, req
+        )
+        return resp
+
+    async def handle_add_xshard_tx_list_request(self, req):
+        error_code = await self.router.broadcast_xshard_request(
+            req.branch, ClusterOp.ADD_XSHARD_TX_LIST_REQUEST, req
+        )
+        return AddXshardTxListResponse(error_code=error_code)
+
+    async def handle_batch_add_xshard_tx_list_request(self, batch_request):
+        # the requests of a batch are for the same branch
+        error_code = await self.router.broadcast_xshard_request(
+            batch_request.add_xshard_tx_list_request_list[0].branch,
+            ClusterOp.BATCH_ADD_XSHARD_TX_LIST_REQUEST,
+            batch_request,
+        )
+        return BatchAddXshardTxListResponse(error_code=error_code)
+
+
+WORKER_OP_NONRPC_MAP = {}
+
+
+WORKER_OP_RPC_MAP = {
+    ClusterOp.ADD_MINOR_BLOCK_HEADER_REQUEST: (
+        ClusterOp.ADD_MINOR_BLOCK_HEADER_RESPONSE,
+        WorkerConnection.handle_add_minor_block_header_request,
+    ),
+    ClusterOp.ADD_XSHARD_TX_LIST_REQUEST: (
+        ClusterOp.ADD_XSHARD_TX_LIST_RESPONSE,
+        WorkerConnection.handle_add_xshard_tx_list_request,
+    ),
+    ClusterOp.BATCH_ADD_XSHARD_TX_LIST_REQUEST: (
+        ClusterOp.BATCH_ADD_XSHARD_TX_LIST_RESPONSE,
+        WorkerConnection.handle_batch_add_xshard_tx_list_request,
+    ),
+}
+
+
+class RouterMasterConnection(ClusterConnection):
+    """ Connection from the router to the master.  The requests for a shard are forwarded
+    to its worker, and the others to all the workers with the responses merged.
+    """
+
+    def __init__(self, env, reader, writer, router, name=None):
+        super().__init__(
+            env,
+            reader,
+            writer,
+            CLUSTER_OP_SERIALIZER_MAP,
+            ROUTER_MASTER_OP_NONRPC_MAP,
+            ROUTER_MASTER_OP_RPC_MAP,
+            name=name,
+        )
+        self.router = router  # type: SlaveRouter
+
+        asyncio.ensure_future(self.active_and_loop_forever())
+
+    def get_connection_to_forward(self, metadata):
+        """ Override ProxyConnection.get_connection_to_forward()
+        """
+        if metadata.cluster_peer_id == 0:
+            # RPC from master
+            return None
+
+        worker = self.router.workers.get(metadata.branch, None)
+        if not worker:
+            self.close_with_error("incorrect forwarding branch")
+            return
+        return worker
+
+    def get_metadata_to_forward(self, metadata):
+        return metadata
+
+    def close(self):
+        Logger.info("Lost connection with master. Shutting down slave router ...")
+        super().close()
+        self.router.shutdown()
+
+    def close_with_error(self, error):
+        Logger.info("Closing connection with master: {}".format(error))
+        return super().close_with_error(error)
+
+    # Cluster RPC handlers
+
+    async def handle_ping(self, ping):
+        await self.router.call_all_workers(ClusterOp.PING, ping)
+        return Pong(self.router.id, self.router.shard_mask_list)
+
+    async def handle_connect_to_slaves_request(self, connect_to_slave_request):
+        futures = []
+        for slave_info in connect_to_slave_request.slave_info_list:
+            futures.append(
+                self.router.slave_connection_manager.connect_to_slave(slave_info)
+            )
+        result_str_list = await asyncio.gather(*futures)
+        result_list = [bytes(result_str, "ascii") for result_str in result_str_list]
+        return ConnectToSlavesResponse(result_list)
+
+    async def handle_mine_request(self, request):
+        resp_list = await self.router.call_all_workers(ClusterOp.MINE_REQUEST, request)
+        return MineResponse(error_code=get_error_code(resp_list))
+
+    async def handle_gen_tx_request(self, request):
+        resp_list = await self.router.call_all_workers(
+            ClusterOp.GEN_TX_REQUEST, request
+        )
+        return GenTxResponse(error_code=get_error_code(resp_list))
+
+    async def handle_add_root_block_request(self, req):
+        resp_list = await self.router.call_all_workers(
+            ClusterOp.ADD_ROOT_BLOCK_REQUEST, req
+        )
+        return AddRootBlockResponse(
+            get_error_code(resp_list), any(resp.switched for resp in resp_list)
+        )
+
+    async def handle_get_eco_info_list_request(self, req):
+        resp_list = await self.router.call_all_workers(
+            ClusterOp.GET_ECO_INFO_LIST_REQUEST, req
+        )
+        return GetEcoInfoListResponse(
+            error_code=get_error_code(resp_list),
+            eco_info_list=[info for resp in resp_list for info in resp.eco_info_list],
+        )
+
+    async def handle_get_unconfirmed_header_list_request(self, req):
+        resp_list = await self.router.call_all_workers(
+            ClusterOp.GET_UNCONFIRMED_HEADERS_REQUEST, req
+        )
+        return GetUnconfirmedHeadersResponse(
+            error_code=get_error_code(resp_list),
+            headers_info_list=[
+                info for resp in resp_list for info in resp.headers_info_list
+            ],
+        )
+
+    async def handle_get_account_data_request(self, req):
+        resp_list = await self.router.call_all_workers(
+            ClusterOp.GET_ACCOUNT_DATA_REQUEST, req
+        )
+        return GetAccountDataResponse(
+            error_code=get_error_code(resp_list),
+            account_branch_data_list=[
+                data for resp in resp_list for data in resp.account_branch_data_list
+            ],
+        )
+
+    async def handle_create_cluster_peer_connection_request(self, req):
+        resp_list = await self.router.call_all_workers(
+            ClusterOp.CREATE_CLUSTER_PEER_CONNECTION_REQUEST, req
+        )
+        return CreateClusterPeerConnectionResponse(error_code=get_error_code(resp_list))
+
+    async def handle_destroy_cluster_peer_connection_command(self, op, cmd, rpc_id):
+        for worker in self.router.workers.values():
+            worker.write_command(op, cmd)
+
+    # Blockchain RPC handlers
+
+    async def handle_add_minor_block_request(self, req):
+        try:
+            branch = MinorBlock.deserialize(
+                ByteBuffer(req.minor_block_data)
+            ).header.branch
+        except Exception:
+            return AddMinorBlockResponse(error_code=errno.EBADMSG)
+        return await self.router.call_worker(
+            branch, ClusterOp.ADD_MINOR_BLOCK_REQUEST, req
+        )
+
+
+def get_error_code(resp_list) -> int:
+    """ Returns the first error code of the responses of the workers, or 0 """
+    for resp in resp_list:
+        if resp.error_code != 0:
+            return resp.error_code
+    return 0
+
+
+def forward_by_branch(op, get_branch):
+    """ Returns the handler of a request for the shard returned by get_branch(router, req)
+    """
+
+    async def handle(self, req):
+        return await self.router.call_worker(get_branch(self.router, req), op, req)
+
+    return handle
+
+
+def get_request_branch(router, req) -> Branch:
+    return req.branch
+
+
+def get_tx_branch(router, req) -> Branch:
+    evm_tx = req.tx.code.get_evm_transaction()
+    evm_tx.set_shard_size(router.get_shard_size())
+    return Branch.create(router.get_shard_size(), evm_tx.from_shard_id())
+
+
+def get_address_branch(router, req) -> Branch:
+    shard_size = router.get_shard_size()
+    return Branch.create(shard_size, req.address.get_shard_id(shard_size))
+
+
+ROUTER_MASTER_OP_NONRPC_MAP = {
+    ClusterOp.DESTROY_CLUSTER_PEER_CONNECTION_COMMAND: RouterMasterConnection.handle_destroy_cluster_peer_connection_command
+}
+
+
+ROUTER_MASTER_OP_RPC_MAP = {
+    ClusterOp.PING: (ClusterOp.PONG, RouterMasterConnection.handle_ping),
+    ClusterOp.CONNECT_TO_SLAVES_REQUEST: (
+        ClusterOp.CONNECT_TO_SLAVES_RESPONSE,
+        RouterMasterConnection.handle_connect_to_slaves_request,
+    ),
+    ClusterOp.MINE_REQUEST: (
+        ClusterOp.MINE_RESPONSE,
+        RouterMasterConnection.handle_mine_request,
+    ),
+    ClusterOp.GEN_TX_REQUEST: (
+        ClusterOp.GEN_TX_RESPONSE,
+        RouterMasterConnection.handle_gen_tx_request,
+    ),
+    ClusterOp.ADD_ROOT_BLOCK_REQUEST: (
+        ClusterOp.ADD_ROOT_BLOCK_RESPONSE,
+        RouterMasterConnection.handle_add_root_block_request,
+    ),
+    ClusterOp.GET_ECO_INFO_LIST_REQUEST: (
+        ClusterOp.GET_ECO_INFO_LIST_RESPONSE,
+        RouterMasterConnection.handle_get_eco_info_list_request,
+    ),
+    ClusterOp.GET_NEXT_BLOCK_TO_MINE_REQUEST: (
+        ClusterOp.GET_NEXT_BLOCK_TO_MINE_RESPONSE,
+        forward_by_branch(ClusterOp.GET_NEXT_BLOCK_TO_MINE_REQUEST, get_request_branch),
+    ),
+    ClusterOp.ADD_MINOR_BLOCK_REQUEST: (
+        ClusterOp.ADD_MINOR_BLOCK_RESPONSE,
+        RouterMasterConnection.handle_add_minor_block_request,
+    ),
+    ClusterOp.GET_UNCONFIRMED_HEADERS_REQUEST: (
+        ClusterOp.GET_UNCONFIRMED_HEADERS_RESPONSE,
+        RouterMasterConnection.handle_get_unconfirmed_header_list_request,
+    ),
+    ClusterOp.GET_ACCOUNT_DATA_REQUEST: (
+        ClusterOp.GET_ACCOUNT_DATA_RESPONSE,
+        RouterMasterConnection.handle_get_account_data_request,
+    ),
+    ClusterOp.ADD_TRANSACTION_REQUEST: (
+        ClusterOp.ADD_TRANSACTION_RESPONSE,
+        forward_by_branch(ClusterOp.ADD_TRANSACTION_REQUEST, get_tx_branch),
+    ),
+    ClusterOp.CREATE_CLUSTER_PEER_CONNECTION_REQUEST: (
+        ClusterOp.CREATE_CLUSTER_PEER_CONNECTION_RESPONSE,
+        RouterMasterConnection.handle_create_cluster_peer_connection_request,
+    ),
+    ClusterOp.GET_MINOR_BLOCK_REQUEST: (
+        ClusterOp.GET_MINOR_BLOCK_RESPONSE,
+        forward_by_branch(ClusterOp.GET_MINOR_BLOCK_REQUEST, get_request_branch),
+    ),
+    ClusterOp.GET_TRANSACTION_REQUEST: (
+        ClusterOp.GET_TRANSACTION_RESPONSE,
+        forward_by_branch(ClusterOp.GET_TRANSACTION_REQUEST, get_request_branch),
+    ),
+    ClusterOp.SYNC_MINOR_BLOCK_LIST_REQUEST: (
+        ClusterOp.SYNC_MINOR_BLOCK_LIST_RESPONSE,
+        forward_by_branch(ClusterOp.SYNC_MINOR_BLOCK_LIST_REQUEST, get_request_branch),
+    ),
+    ClusterOp.FAST_SYNC_MINOR_BLOCK_LIST_REQUEST: (
+        ClusterOp.FAST_SYNC_MINOR_BLOCK_LIST_RESPONSE,
+        forward_by_branch(
+            ClusterOp.FAST_SYNC_MINOR_BLOCK_LIST_REQUEST, get_request_branch
+        ),
+    ),
+    ClusterOp.FAST_SYNC_STATE_REQUEST: (
+        ClusterOp.FAST_SYNC_STATE_RESPONSE,
+        forward_by_branch(ClusterOp.FAST_SYNC_STATE_REQUEST, get_request_branch),
+    ),
+    ClusterOp.EXECUTE_TRANSACTION_REQUEST: (
+        ClusterOp.EXECUTE_TRANSACTION_RESPONSE,
+        forward_by_branch(ClusterOp.EXECUTE_TRANSACTION_REQUEST, get_tx_branch),
+    ),
+    ClusterOp.GET_TRANSACTION_RECEIPT_REQUEST: (
+        ClusterOp.GET_TRANSACTION_RECEIPT_RESPONSE,
+        forward_by_branch(
+            ClusterOp.GET_TRANSACTION_RECEIPT_REQUEST, get_request_branch
+        ),
+    ),
+    ClusterOp.GET_TRANSACTION_LIST_BY_ADDRESS_REQUEST: (
+        ClusterOp.GET_TRANSACTION_LIST_BY_ADDRESS_RESPONSE,
+        forward_by_branch(
+            ClusterOp.GET_TRANSACTION_LIST_BY_ADDRESS_REQUEST, get_address_branch
+        ),
+    ),
+    ClusterOp.GET_LOG_REQUEST: (
+        ClusterOp.GET_LOG_RESPONSE,
+        forward_by_branch(ClusterOp.GET_LOG_REQUEST, get_request_branch),
+    ),
+    ClusterOp.ESTIMATE_GAS_REQUEST: (
+        ClusterOp.ESTIMATE_GAS_RESPONSE,
+        forward_by_branch(ClusterOp.ESTIMATE_GAS_REQUEST, get_tx_branch),
+    ),
+    ClusterOp.GET_STORAGE_REQUEST: (
+        ClusterOp.GET_STORAGE_RESPONSE,
+        forward_by_branch(ClusterOp.GET_STORAGE_REQUEST, get_address_branch),
+    ),
+    ClusterOp.GET_CODE_REQUEST: (
+        ClusterOp.GET_CODE_RESPONSE,
+        forward_by_branch(ClusterOp.GET_CODE_REQUEST, get_address_branch),
+    ),
+    ClusterOp.GAS_PRICE_REQUEST: (
+        ClusterOp.GAS_PRICE_RESPONSE,
+        forward_by_branch(ClusterOp.GAS_PRICE_REQUEST, get_request_branch),
+    ),
+    ClusterOp.GET_WORK_REQUEST: (
+        ClusterOp.GET_WORK_RESPONSE,
+        forward_by_branch(ClusterOp.GET_WORK_REQUEST, get_request_branch),
+    ),
+    ClusterOp.SUBMIT_WORK_REQUEST: (
+        ClusterOp.SUBMIT_WORK_RESPONSE,
+        forward_by_branch(ClusterOp.SUBMIT_WORK_REQUEST, get_request_branch),
+    ),
+}
+
+
+class SlaveRouter:
+    """ Slave node in a cluster running each of its shards in a worker process, so that
+    the shards are not serialized by the GIL of a single process.
+
+    The router only forwards: the RPCs of the master for a shard go to its worker and the
+    others to all the workers, the traffic of the shards with their peers goes between
+    the master and the workers as is, and the cross-shard deposits of a worker go to the
+    workers and the other slaves running the recipient shards.  The workers are ShardWorkers
+    connected to the router through Unix sockets.
+    """
+
+    def __init__(self, env, name="slave"):
+        self.loop = asyncio.get_event_loop()
+        self.env = env
+        self.id = bytes(self.env.slave_config.ID, "ascii")
+        self.shard_mask_list = self.env.slave_config.SHARD_MASK_LIST
+
+        # shard id -> a list of slave running the shard
+        self.slave_connection_manager = SlaveConnectionManager(env, self)
+
+        self.master = None
+        self.name = name
+        self.server = None
+        self.socket_dir = None
+        self.processes = []  # type: List[multiprocessing.Process]
+        self.workers = dict()  # type: Dict[Branch, WorkerConnection]
+        self.shutting_down = False
+        self.shutdown_future = self.loop.create_future()
+
+    def __cover_shard_id(self, shard_id):
+        """ Does the shard belong to this slave? """
+        for shard_mask in self.shard_mask_list:
+            if shard_mask.contain_shard_id(shard_id):
+                return True
+        return False
+
+    def get_shard_size(self):
+        return self.env.quark_chain_config.SHARD_SIZE
+
+    async def __connect_to_worker(self, process, path):
+        """ Retries until the worker listens on the socket """
+        while True:
+            try:
+                return await asyncio.open_unix_connection(path, loop=self.loop)
+            except (FileNotFoundError, ConnectionRefusedError):
+                check(process.is_alive(), "worker {} exited".format(process.name))
+                await asyncio.sleep(WORKER_CONNECT_RETRY_DELAY)
+
+    async def __start_workers(self):
+        # spawned rather than forked so that a worker inherits no state of the router
+        context = multiprocessing.get_context("spawn")
+        self.socket_dir = tempfile.mkdtemp(prefix="qkc-slave-")
+        futures = []
+        branches = []
+        for shard_id, shard_config in enumerate(self.env.quark_chain_config.SHARD_LIST):
+            if not self.__cover_shard_id(shard_id) or not shard_config.GENESIS:
+                continue
+            slave_config = SlaveConfig()
+            slave_config.ID = "{}_shard{}".format(self.env.slave_config.ID, shard_id)
+            slave_config.SHARD_MASK_LIST = [ShardMask(self.get_shard_size() | shard_id)]
+            path = os.path.join(self.socket_dir, "shard-{}.sock".format(shard_id))
+            process = context.Process(
+                target=run_worker,
+                args=(self.env.cluster_config, self.env.evm_config, slave_config, path),
+                name=slave_config.ID,
+            )
+            process.start()
+            self.processes.append(process)
+            futures.append(self.__connect_to_worker(process, path))
+            branches.append(Branch.create(self.get_shard_size(), shard_id))
+
+        for branch, (reader, writer) in zip(branches, await asyncio.gather(*futures)):
+            worker = WorkerConnection(
+                self.env,
+                reader,
+                writer,
+                self,
+                name="{}_worker{}".format(self.name, branch.get_shard_id()),
+            )
+            await worker.wait_until_active()
+            self.workers[branch] = worker
+
+    async def __handle_new_connection(self, reader, writer):
+        # The first connection should always come from master
+        if not self.master:
+            self.master = RouterMasterConnection(
+                self.env, reader, writer, self, name="{}_master".format(self.name)
+            )
+            return
+        await self.slave_connection_manager.handle_new_connection(reader, writer)
+
+    async def __start_server(self):
+        """ Start the workers, then accept the master once they are all connected """
+        try:
+            await self.__start_workers()
+        except Exception:
+            Logger.error_exception()
+            self.shutdown()
+            return
+        Logger.info("Started {} shard workers".format(len(self.workers)))
+
+        self.server = await asyncio.start_server(
+            self.__handle_new_connection,
+            "0.0.0.0",
+            self.env.slave_config.PORT,
+            loop=self.loop,
+        )
+        Logger.info(
+            "Listening on {} for intra-cluster RPC".format(
+                self.server.sockets[0].getsockname()
+            )
+        )
+
+    def start(self):
+        self.loop.create_task(self.__start_server())
+
+    def do_loop(self):
+        try:
+            self.loop.run_until_complete(self.shutdown_future)
+        except KeyboardInterrupt:
+            pass
+
+    async def __join_workers(self):
+        for process in self.processes:
+            await self.loop.run_in_executor(None, process.join, WORKER_SHUTDOWN_TIMEOUT)
+            if process.is_alive():
+                Logger.error("Terminating worker {}".format(process.name))
+                process.terminate()
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
+        self.shutdown_future.set_result(None)
+
+    def shutdown(self):
+        """ The workers shut down once their connections are closed """
+        if self.shutting_down:
+            return
+        self.shutting_down = True
+
+        self.slave_connection_manager.close_all()
+        if self.server:
+            self.server.close()
+        for worker in self.workers.values():
+            worker.close()
+        self.loop.create_task(self.__join_workers())
+
+    def get_shutdown_future(self):
+        return self.shutdown_future
+
+    # Forwarding functions
+
+    async def call_worker(self, branch: Branch, op, request):
+        """ Returns the response of the worker running the shard """
+        # a branch not run by any worker is sent to one of them to reply with its error
+        worker = self.workers.get(branch, None) or next(iter(self.workers.values()))
+        _, resp, _ = await worker.write_rpc_request(op, request)
+        return resp
+
+    async def call_all_workers(self, op, request) -> List:
+        """ Returns the responses of the workers in the order of their shards """
+        futures = [
+            worker.write_rpc_request(op, request) for worker in self.workers.values()
+        ]
+        return [resp for _, resp, _ in await asyncio.gather(*futures)]
+
+    async def broadcast_xshard_request(self, branch: Branch, op, request) -> int:
+        """ Send the cross-shard deposits from a worker to the worker and the other slaves
+        running the recipient shard.  Returns the error code.
+        """
+        futures = []
+        if branch in self.workers:
+            futures.append(self.workers[branch].write_rpc_request(op, request))
+        for slave_conn in self.slave_connection_manager.get_connections_by_shard(
+            branch.get_shard_id()
+        ):
+            futures.append(slave_conn.write_rpc_request(op, request))
+        responses = await asyncio.gather(*futures)
+        return get_error_code([resp for _, resp, _ in responses])
+
+    async def add_xshard_tx_list(self, req: AddXshardTxListRequest) -> int:
+        """ Add the cross-shard deposits from another slave.  Returns the error code """
+        if req.branch not in self.workers:
+            Logger.error(
+                "cannot find shard id {} locally".format(req.branch.get_shard_id())
+            )
+            return errno.ENOENT
+        resp = await self.call_worker(
+            req.branch, ClusterOp.ADD_XSHARD_TX_LIST_REQUEST, req
+        )
+        return resp.error_code
+
+    async def batch_add_xshard_tx_list(
+        self, batch_request: BatchAddXshardTxListRequest
+    ) -> int:
+        for request in batch_request.add_xshard_tx_list_request_list:
+            error_code = await self.add_xshard_tx_list(request)
+            if error_code != 0:
+                return error_code
+        return 0
@@ -0,0 +1,141 @@
+import asyncio
+from typing import List
+
+import rlp
+
+from quarkchain.cluster.p2p_commands import (
+    CommandOp,
+    GetCodeListRequest,
+    GetStateTrieRangeRequest,
+)
+from quarkchain.evm.state import _Account
+from quarkchain.evm.trie import BLANK_ROOT, Trie
+from quarkchain.utils import Logger, sha3_256
+
+TIMEOUT = 10
+
+
+class StateSyncTask:
+    """ Download the evm state with the given root from a peer shard (e.g., the state of the
+    pivot block of a fast sync), and rebuild it locally from the leaves of the account trie
+    and the storage tries downloaded in ranges.  A trie is verified by its root once rebuilt,
+    and a code by its hash.
+    The storage tries and the code of the accounts in a range are downloaded before the range
+    is added to the account trie, so that the root node of a trie is only written to db once
+    the trie is complete, and a trie whose root node is already in db is skipped.
+    """
+
+    RANGE_SIZE = 1024
+    CODE_BATCH_SIZE = 64
+
+    def __init__(self, shard, shard_conn):
+        self.shard = shard
+        self.shard_conn = shard_conn
+        self.db = shard.state.raw_db
+        self.num_accounts = 0
+        self.num_storage_tries = 0
+        self.num_codes = 0
+
+    async def sync(self, state_root):
+        """ Raises on any error, e.g., if the state rebuilt does not match state_root """
+        await self.__sync_trie(state_root, self.__sync_accounts)
+        Logger.info(
+            "[{}] downloaded state {} ({} accounts, {} storage tries, {} codes)".format(
+                self.shard.shard_id,
+                state_root.hex(),
+                self.num_accounts,
+                self.num_storage_tries,
+                self.num_codes,
+            )
+        )
+
+    async def __sync_trie(self, root_hash, on_range=None):
+        if root_hash == BLANK_ROOT or await self.shard.run_state_op(
+            self.db.__contains__, root_hash
+        ):
+            return
+
+        trie = Trie(self.db, dirty_nodes=dict())
+        start_key = b""
+        while True:
+            resp = await asyncio.wait_for(
+                self.__download_range(root_hash, start_key), TIMEOUT
+            )
+            if not resp.key_list and (resp.more or not start_key):
+                raise RuntimeError(
+                    "Bad peer missing trie {} for state sync".format(root_hash.hex())
+                )
+            if len(resp.key_list) != len(resp.value_list):
+                raise RuntimeError("Bad peer sending trie leaves without values")
+            for key in resp.key_list:
+                if key < start_key:
+                    raise RuntimeError("Bad peer sending trie leaves out of order")
+                start_key = key + b"\x00"
+
+            if on_range:
+                await on_range(resp.value_list)
+            await self.shard.run_state_op(
+                self.__add_range, trie, resp.key_list, resp.value_list
+            )
+            if not resp.more:
+                break
+
+        if trie.root_hash != root_hash:
+            raise RuntimeError(
+                "Trie root mismatch: expected {} downloaded {}".format(
+                    root_hash.hex(), trie.root_hash.hex()
+                )
+            )
+
+    async def __download_range(self, root_hash, start_key):
+        op, resp, rpc_id = await self.shard_conn.write_rpc_request(
+            CommandOp.GET_STATE_TRIE_RANGE_REQUEST,
+            GetStateTrieRangeRequest(root_hash, start_key, self.RANGE_SIZE),
+        )
+        return resp
+
+    def __add_range(self, trie, key_list: List[bytes], value_list: List[bytes]):
+        for key, value in zip(key_list, value_list):
+            trie.update(key, value)
+        # only the nodes of the trie so far are written
+        trie.flush()
+        trie.deletes = []
+
+    async def __sync_accounts(self, value_list: List[bytes]):
+        code_hash_set = set()
+        for value in value_list:
+            account = rlp.decode(value, _Account)
+            if account.storage != BLANK_ROOT:
+                await self.__sync_trie(account.storage)
+                self.num_storage_tries += 1
+            code_hash_set.add(account.code_hash)
+        self.num_accounts += len(value_list)
+
+        code_hash_list = await self.shard.run_state_op(
+            lambda: [h for h in code_hash_set if h not in self.db]
+        )
+        for i in range(0, len(code_hash_list), self.CODE_BATCH_SIZE):
+            await self.__sync_code(code_hash_list[i : i + self.CODE_BATCH_SIZE])
+
+    async def __sync_code(self, code_hash_list: List[bytes]):
+        op, resp, rpc_id = await asyncio.wait_for(
+            self.shard_conn.write_rpc_request(
+                CommandOp.GET_CODE_LIST_REQUEST, GetCodeListRequest(code_hash_list)
+            ),
+            TIMEOUT,
+        )
+        if len(resp.code_list) != len(code_hash_list):
+            raise RuntimeError("Bad peer sending incomplete code list")
+        for code_hash, code in zip(code_hash_list, resp.code_list):
+            if sha3_256(code) != code_hash:
+                raise RuntimeError(
+                    "Bad peer missing code {} for state sync".format(code_hash.hex())
+                )
+
+        def put_code_list():
+            with self.db.write_batch():
+                for code_hash, code in zip(code_hash_list, resp.code_list):
+                    self.db.put(code_hash, code)
+
+        await self.shard.run_state_op(put_code_list)
+        self.num_codes += len(code_hash_list)
@@ -1,6 +1,11 @@
 import unittest
+from unittest import mock
+
 from quarkchain.genesis import GenesisManager
+from quarkchain.cluster.master import SyncTask as RootSyncTask
+from quarkchain.cluster.shard import SyncTask as ShardSyncTask
 from quarkchain.cluster.tests.test_utils import (
+    create_contract_with_storage_transaction,
     create_transfer_transaction,
     ClusterContext,
 )
@@ -81,7 +86,7 @@ class TestCluster(unittest.TestCase):
                 gas=opcodes.GTXXSHARDCOST + opcodes.GTXCOST,
                 gas_price=3,
             )
-            self.assertTrue(slaves[0].add_tx(tx))
+            self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
             # Expect to mine shard 0 since it has one tx
             is_root, block1 = call_async(master.get_next_block_to_mine(address=acc2))
@@ -171,7 +176,7 @@ class TestCluster(unittest.TestCase):
                 to_address=acc1,
                 value=12345,
             )
-            self.assertTrue(slaves[0].add_tx(tx))
+            self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
             is_root, root = call_async(
                 master.get_next_block_to_mine(address=acc1, prefer_root=True)
@@ -394,6 +399,174 @@ class TestCluster(unittest.TestCase):
                 == b2.header
             )
 
+    def test_root_block_sync_pipeline(self):
+        acc1 = Address.create_random_account(full_shard_id=0)
+
+        with ClusterContext(2, acc1) as clusters, mock.patch.object(
+            RootSyncTask, "BLOCK_BATCH_SIZE", 2
+        ), mock.patch.object(RootSyncTask, "MAX_BLOCKS_IN_FLIGHT", 3):
+            # shutdown cluster connection
+            clusters[1].peer.close()
+
+            # each minor block is on the previous root block
+            master = clusters[0].master
+            for i in range(6):
+                header_list = []
+                for shard_id in range(2):
+                    shard_state = clusters[0].get_shard_state(shard_id)
+                    if i == 0:
+                        # the first root block starts with the genesis blocks
+                        header_list.append(shard_state.header_tip)
+                    block = shard_state.create_block_to_mine()
+                    add_result = call_async(
+                        master.add_raw_minor_block(
+                            block.header.branch, block.serialize()
+                        )
+                    )
+                    self.assertTrue(add_result)
+                    header_list.append(block.header)
+                root_block = master.root_state.create_block_to_mine(header_list, acc1)
+                call_async(master.add_root_block(root_block))
+
+            # reestablish cluster connection
+            call_async(
+                clusters[1].network.connect(
+                    "127.0.0.1",
+                    clusters[0].master.env.cluster_config.SIMPLE_NETWORK.BOOTSTRAP_PORT,
+                )
+            )
+
+            assert_true_with_timeout(
+                lambda: clusters[1].master.root_state.tip == root_block.header
+            )
+            for shard_id in range(2):
+                self.assertEqual(
+                    clusters[1].get_shard_state(shard_id).header_tip,
+                    clusters[0].get_shard_state(shard_id).header_tip,
+                )
+
+    def test_root_block_fast_sync(self):
+        id1 = Identity.create_random_identity()
+        acc1 = Address.create_from_identity(id1, full_shard_id=0)
+        acc2 = Address.create_random_account(full_shard_id=0)
+        acc3 = Address.create_random_account(full_shard_id=1)
+
+        with ClusterContext(2, acc1) as clusters:
+            # shutdown cluster connection
+            clusters[1].peer.close()
+            # the state of the 3rd last root block is downloaded
+            clusters[1].master.env.cluster_config.FAST_SYNC_PIVOT_DISTANCE = 2
+
+            master = clusters[0].master
+            shard_state0 = clusters[0].get_shard_state(0)
+            tx_list = [
+                create_contract_with_storage_transaction(
+                    shard_state=shard_state0,
+                    key=id1.get_key(),
+                    from_address=acc1,
+                    to_full_shard_id=0,
+                ),
+                None,
+                None,
+                # a cross-shard tx confirmed by the pivot root block
+                create_transfer_transaction(
+                    shard_state=shard_state0,
+                    key=id1.get_key(),
+                    from_address=acc1,
+                    to_address=acc3,
+                    value=54321,
+                    gas=opcodes.GTXXSHARDCOST + opcodes.GTXCOST,
+                    nonce=1,
+                ),
+                None,
+                create_transfer_transaction(
+                    shard_state=shard_state0,
+                    key=id1.get_key(),
+                    from_address=acc1,
+                    to_address=acc2,
+                    value=12345,
+                    nonce=2,
+                ),
+            ]
+            block_list = []
+            for i in range(6):
+                if tx_list[i]:
+                    self.assertTrue(shard_state0.add_tx(tx_list[i]))
+                header_list = []
+                for shard_id in range(2):
+                    shard_state = clusters[0].get_shard_state(shard_id)
+                    if i == 0:
+                        header_list.append(shard_state.header_tip)
+                    block = shard_state.create_block_to_mine()
+                    add_result = call_async(
+                        master.add_raw_minor_block(
+                            block.header.branch, block.serialize()
+                        )
+                    )
+                    self.assertTrue(add_result)
+                    header_list.append(block.header)
+                    block_list.append(block)
+                root_block = master.root_state.create_block_to_mine(header_list, acc1)
+                call_async(master.add_root_block(root_block))
+            self.assertEqual(len(block_list[0].tx_list), 1)
+            self.assertEqual(len(block_list[6].tx_list), 1)
+
+            # reestablish cluster connection
+            call_async(
+                clusters[1].network.connect(
+                    "127.0.0.1",
+                    clusters[0].master.env.cluster_config.SIMPLE_NETWORK.BOOTSTRAP_PORT,
+                )
+            )
+
+            assert_true_with_timeout(
+                lambda: clusters[1].master.root_state.tip == root_block.header
+            )
+            for shard_id in range(2):
+                shard_state = clusters[1].get_shard_state(shard_id)
+                self.assertEqual(
+                    shard_state.header_tip,
+                    clusters[0].get_shard_state(shard_id).header_tip,
+                )
+                self.assertEqual(
+                    shard_state.evm_state.trie.root_hash,
+                    clusters[0].get_shard_state(shard_id).evm_state.trie.root_hash,
+                )
+
+            shard_state1 = clusters[1].get_shard_state(0)
+            self.assertEqual(shard_state1.get_balance(acc2.recipient), 12345)
+            self.assertEqual(
+                clusters[1].get_shard_state(1).get_balance(acc3.recipient), 54321
+            )
+            _, _, receipt = shard_state0.get_transaction_receipt(tx_list[0].get_hash())
+            contract = receipt.contract_address.recipient
+            self.assertEqual(
+                shard_state1.get_code(contract), shard_state0.get_code(contract)
+            )
+            self.assertEqual(
+                shard_state1.get_storage_at(contract, 0),
+                shard_state0.get_storage_at(contract, 0),
+            )
+            self.assertNotEqual(shard_state1.get_storage_at(contract, 0), bytes(32))
+            # the blocks before the pivot are not run
+            self.assertTrue(
+                shard_state1.db.contain_minor_block_by_hash(
+                    block_list[2].header.get_hash()
+                )
+            )
+            self.assertNotIn(
+                block_list[2].meta.hash_evm_state_root, shard_state1.raw_db
+            )
+            # nor are their receipts available
+            block, index = shard_state1.get_transaction_by_hash(tx_list[0].get_hash())
+            self.assertEqual(block, block_list[0])
+            self.assertIsNone(
+                shard_state1.get_transaction_receipt(tx_list[0].get_hash())
+            )
+            self.assertEqual(
+                shard_state1.get_logs([], [], 0, shard_state1.header_tip.height), []
+            )
+
     def test_shard_synchronizer_with_fork(self):
         id1 = Identity.create_random_identity()
         acc1 = Address.create_from_identity(id1, full_shard_id=0)
@@ -506,6 +679,47 @@ class TestCluster(unittest.TestCase):
                 clusters[0].slave_list[0].shards[Branch(0b10)].state.header_tip,
             )
 
+    def test_shard_synchronizer_with_multiple_peers(self):
+        acc1 = Address.create_random_account(full_shard_id=0)
+
+        with ClusterContext(3, acc1) as clusters, mock.patch.object(
+            ShardSyncTask, "BLOCK_BATCH_SIZE", 3
+        ):
+            # shutdown the connection of cluster 2
+            clusters[2].peer.close()
+
+            def add_block_to_cluster0():
+                shard_state0 = clusters[0].get_shard_state(0)
+                block = shard_state0.create_block_to_mine()
+                add_result = call_async(
+                    clusters[0].master.add_raw_minor_block(
+                        block.header.branch, block.serialize()
+                    )
+                )
+                self.assertTrue(add_result)
+                return block
+
+            # cluster 0 and 1 have 12 blocks
+            for i in range(12):
+                block = add_block_to_cluster0()
+            assert_true_with_timeout(
+                lambda: clusters[1].get_shard_state(0).header_tip == block.header
+            )
+
+            # cluster 2 connects to both
+            for i in range(2):
+                call_async(
+                    clusters[2].network.connect(
+                        "127.0.0.1", clusters[i].master.env.cluster_config.P2P_PORT
+                    )
+                )
+
+            # a new block will trigger the sync of the 13 blocks in batches
+            block = add_block_to_cluster0()
+            assert_true_with_timeout(
+                lambda: clusters[2].get_shard_state(0).header_tip == block.header
+            )
+
     def test_shard_genesis_fork_fork(self):
         """ Test shard forks at genesis blocks due to root chain fork at GENESIS.ROOT_HEIGHT"""
         acc1 = Address.create_random_account(0)
@@ -594,7 +808,7 @@ class TestCluster(unittest.TestCase):
                 value=54321,
                 gas=opcodes.GTXXSHARDCOST + opcodes.GTXCOST,
             )
-            self.assertTrue(slaves[0].add_tx(tx1))
+            self.assertTrue(call_async(slaves[0].add_tx(tx1)))
 
             b1 = clusters[0].get_shard_state(0).create_block_to_mine(address=acc1)
             b2 = clusters[0].get_shard_state(0).create_block_to_mine(address=acc1)
@@ -38,3 +38,15 @@ class TestClusterConfig(unittest.TestCase):
         deserialized = ClusterConfig.create_from_args(args)
 
         self.assertTrue(cluster_config == deserialized)
+
+    def test_process_per_shard(self):
+        parser = argparse.ArgumentParser()
+        ClusterConfig.attach_arguments(parser)
+        args = parser.parse_args(["--process_per_shard", "--genesis_dir="])
+        cluster_config = ClusterConfig.create_from_args(args)
+        self.assertTrue(cluster_config.PROCESS_PER_SHARD)
+
+        # the slaves read it from the json file
+        args = parser.parse_args(["--cluster_config=" + cluster_config.json_filepath])
+        deserialized = ClusterConfig.create_from_args(args)
+        self.assertTrue(deserialized.PROCESS_PER_SHARD)
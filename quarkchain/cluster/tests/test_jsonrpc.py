@@ -73,7 +73,7 @@ class TestJSONRPC(unittest.TestCase):
                     to_address=acc1,
                     value=12345,
                 )
-                self.assertTrue(slaves[0].add_tx(tx))
+                self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
                 _, block = call_async(master.get_next_block_to_mine(address=acc1))
                 self.assertEqual(i + 1, block.header.height)
@@ -224,7 +224,7 @@ class TestJSONRPC(unittest.TestCase):
                 value=14,
                 gas=opcodes.GTXXSHARDCOST + opcodes.GTXCOST,
             )
-            self.assertTrue(slaves[0].add_tx(tx))
+            self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
             # Expect to mine shard 0 since it has one tx
             response = send_request(
@@ -322,7 +322,7 @@ class TestJSONRPC(unittest.TestCase):
                 to_address=acc1,
                 value=12345,
             )
-            self.assertTrue(slaves[0].add_tx(tx))
+            self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
             _, block1 = call_async(master.get_next_block_to_mine(address=acc1))
             self.assertTrue(call_async(clusters[0].get_shard(0).add_block(block1)))
@@ -384,7 +384,7 @@ class TestJSONRPC(unittest.TestCase):
                 to_address=acc1,
                 value=12345,
             )
-            self.assertTrue(slaves[0].add_tx(tx))
+            self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
             _, block1 = call_async(master.get_next_block_to_mine(address=acc1))
             self.assertTrue(call_async(clusters[0].get_shard(0).add_block(block1)))
@@ -491,7 +491,7 @@ class TestJSONRPC(unittest.TestCase):
                 to_address=acc1,
                 value=12345,
             )
-            self.assertTrue(slaves[0].add_tx(tx))
+            self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
             _, block1 = call_async(master.get_next_block_to_mine(address=acc1))
             self.assertTrue(call_async(clusters[0].get_shard(0).add_block(block1)))
@@ -532,7 +532,7 @@ class TestJSONRPC(unittest.TestCase):
                 gas=21000 if f == t else 30000,
                 value=12345,
             )
-            self.assertTrue(slaves[0].add_tx(tx_gen(s1, acc1, acc2)))
+            self.assertTrue(call_async(slaves[0].add_tx(tx_gen(s1, acc1, acc2))))
             _, b1 = call_async(master.get_next_block_to_mine(address=acc1))
             self.assertTrue(call_async(clusters[0].get_shard(0).add_block(b1)))
             _, b2 = call_async(master.get_next_block_to_mine(address=acc2))
@@ -544,7 +544,7 @@ class TestJSONRPC(unittest.TestCase):
             call_async(master.add_root_block(root_block))
 
             tx = tx_gen(s2, acc2, acc2)
-            self.assertTrue(slaves[1].add_tx(tx))
+            self.assertTrue(call_async(slaves[1].add_tx(tx)))
             _, b3 = call_async(master.get_next_block_to_mine(address=acc2))
             self.assertTrue(call_async(clusters[0].get_shard(1).add_block(b3)))
 
@@ -583,7 +583,7 @@ class TestJSONRPC(unittest.TestCase):
                 from_address=acc1,
                 to_full_shard_id=to_full_shard_id,
             )
-            self.assertTrue(slaves[0].add_tx(tx))
+            self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
             _, block1 = call_async(master.get_next_block_to_mine(address=acc1))
             self.assertTrue(call_async(clusters[0].get_shard(0).add_block(block1)))
@@ -632,7 +632,7 @@ class TestJSONRPC(unittest.TestCase):
                 from_address=acc1,
                 to_full_shard_id=to_full_shard_id,
             )
-            self.assertTrue(slaves[0].add_tx(tx))
+            self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
             _, block1 = call_async(master.get_next_block_to_mine(address=acc1))
             self.assertTrue(call_async(clusters[0].get_shard(0).add_block(block1)))
@@ -671,7 +671,7 @@ class TestJSONRPC(unittest.TestCase):
                 from_address=acc1,
                 to_full_shard_id=acc1.full_shard_id,
             )
-            self.assertTrue(slaves[0].add_tx(tx))
+            self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
             _, block = call_async(master.get_next_block_to_mine(address=acc1))
             self.assertTrue(call_async(clusters[0].get_shard(0).add_block(block)))
@@ -760,7 +760,7 @@ class TestJSONRPC(unittest.TestCase):
                 from_address=acc1,
                 to_full_shard_id=acc1.full_shard_id,
             )
-            self.assertTrue(slaves[0].add_tx(tx))
+            self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
             _, block = call_async(master.get_next_block_to_mine(address=acc1))
             self.assertTrue(call_async(clusters[0].get_shard(0).add_block(block)))
@@ -819,7 +819,7 @@ class TestJSONRPC(unittest.TestCase):
                 from_address=acc1,
                 to_full_shard_id=acc1.full_shard_id,
             )
-            self.assertTrue(slaves[0].add_tx(tx))
+            self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
             _, block = call_async(master.get_next_block_to_mine(address=acc1))
             self.assertTrue(call_async(clusters[0].get_shard(0).add_block(block)))
@@ -856,7 +856,7 @@ class TestJSONRPC(unittest.TestCase):
                     value=0,
                     gas_price=12,
                 )
-                self.assertTrue(slaves[0].add_tx(tx))
+                self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
                 _, block = call_async(master.get_next_block_to_mine(address=acc1))
                 self.assertTrue(call_async(clusters[0].get_shard(0).add_block(block)))
@@ -888,7 +888,7 @@ class TestJSONRPC(unittest.TestCase):
                 value=0,
                 gas_price=12,
             )
-            self.assertTrue(slaves[0].add_tx(tx))
+            self.assertTrue(call_async(slaves[0].add_tx(tx)))
 
             for shard_id in ["0x0", None]:  # shard, then root
                 resp = send_request("getWork", shard_id)
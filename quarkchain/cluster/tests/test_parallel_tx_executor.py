@@ -0,0 +1,212 @@
+import unittest
+
+from quarkchain.cluster.parallel_tx_executor import ParallelTxExecutor
+from quarkchain.cluster.shard_state import ShardState
+from quarkchain.cluster.tests.test_utils import (
+    get_test_env,
+    create_transfer_transaction,
+)
+from quarkchain.core import Address, Code, Identity, Transaction
+from quarkchain.evm.transactions import Transaction as EvmTransaction
+from quarkchain.evm.messages import mk_contract_address
+from quarkchain.genesis import GenesisManager
+
+# increments the counter of msg.sender, i.e., storage[caller] += 1
+COUNTER_PER_CALLER_BYTECODE = "600880600b6000396000f3" + "3354600101335500"
+# increments the counter shared by all the callers, i.e., storage[0] += 1
+COUNTER_BYTECODE = "600a80600b6000396000f3" + "60005460010160005500"
+
+
+def create_shard_state(acc_list, num_workers=0, storage_limit=256):
+    env = get_test_env()
+    for acc in acc_list:
+        env.quark_chain_config.SHARD_LIST[0].GENESIS.ALLOC[acc.serialize().hex()] = (
+            10 ** 18
+        )
+    state = ShardState(env=env, shard_id=0)
+    state.parallel_tx_executor = ParallelTxExecutor(
+        num_workers, min_tx_count=1, storage_limit=storage_limit
+    )
+    state.init_genesis_state(GenesisManager(env.quark_chain_config).create_root_block())
+    return state
+
+
+def create_contract_transaction(state, identity, acc, nonce, bytecode):
+    evm_tx = EvmTransaction(
+        nonce=nonce,
+        gasprice=1,
+        startgas=1000000,
+        value=0,
+        to=b"",
+        data=bytes.fromhex(bytecode),
+        from_full_shard_id=acc.full_shard_id,
+        to_full_shard_id=acc.full_shard_id,
+        network_id=state.env.quark_chain_config.NETWORK_ID,
+    )
+    evm_tx.sign(identity.get_key())
+    return Transaction(code=Code.create_evm_code(evm_tx))
+
+
+class TestParallelTxExecutor(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.id_list = [Identity.create_random_identity() for _ in range(5)]
+        self.acc_list = [
+            Address.create_from_identity(i, full_shard_id=0) for i in self.id_list
+        ]
+        self.state = create_shard_state(self.acc_list)
+        self.parallel_state = create_shard_state(self.acc_list, num_workers=2)
+        self.coinbase = Address.create_random_account(full_shard_id=0)
+
+    def tearDown(self):
+        self.parallel_state.parallel_tx_executor.shutdown()
+        super().tearDown()
+
+    def transfer(self, i, to, nonce, value=1, gas=21000, data=b""):
+        return create_transfer_transaction(
+            shard_state=self.state,
+            key=self.id_list[i].get_key(),
+            from_address=self.acc_list[i],
+            to_address=to,
+            value=value,
+            gas=gas,
+            nonce=nonce,
+            data=data,
+        )
+
+    def add_block(self, tx_list):
+        """ Create the block by the sequential execution and add it with the parallel one """
+        block = self.state.create_block_to_mine(address=self.coinbase)
+        for tx in tx_list:
+            block.add_tx(tx)
+        self.state.finalize_and_add_block(block)
+        self.assertEqual(self.state.header_tip, block.header)
+
+        # verifies the state root, receipts, gas used, bloom and coinbase
+        self.parallel_state.add_block(block)
+        self.assertEqual(self.parallel_state.header_tip, block.header)
+        for i in range(len(tx_list)):
+            self.assertEqual(
+                self.parallel_state.db.get_minor_block_receipt(block, i),
+                self.state.db.get_minor_block_receipt(block, i),
+            )
+        return block
+
+    def test_same_result_as_sequential(self):
+        executor = self.parallel_state.parallel_tx_executor
+        counter_per_caller = Address(
+            mk_contract_address(self.acc_list[0].recipient, 0, 0), 0
+        )
+        counter = Address(mk_contract_address(self.acc_list[0].recipient, 0, 1), 0)
+        self.add_block(
+            [
+                create_contract_transaction(
+                    self.state,
+                    self.id_list[0],
+                    self.acc_list[0],
+                    0,
+                    COUNTER_PER_CALLER_BYTECODE,
+                ),
+                # same sender
+                create_contract_transaction(
+                    self.state, self.id_list[0], self.acc_list[0], 1, COUNTER_BYTECODE
+                ),
+                self.transfer(1, self.acc_list[2], 0),
+                # reads the balance written by the tx above
+                self.transfer(2, self.acc_list[3], 0),
+                self.transfer(4, Address.create_random_account(full_shard_id=0), 0),
+            ]
+        )
+        self.assertEqual(executor.num_merged, 3)
+        self.assertEqual(executor.num_reexecuted, 2)
+
+        executor.num_merged = executor.num_reexecuted = 0
+        self.add_block(
+            [
+                # different slots of the same contract
+                self.transfer(1, counter_per_caller, 1, value=0, gas=100000),
+                self.transfer(2, counter_per_caller, 1, value=0, gas=100000),
+                # the same slot
+                self.transfer(3, counter, 0, value=0, gas=100000),
+                self.transfer(4, counter, 1, value=0, gas=100000),
+                # reads the coinbase, which the fees of every tx are paid to
+                self.transfer(0, self.coinbase, 2, value=100),
+            ]
+        )
+        self.assertEqual(executor.num_merged, 3)
+        self.assertEqual(executor.num_reexecuted, 2)
+        self.assertEqual(
+            self.parallel_state.get_storage_at(counter.recipient, 0),
+            (2).to_bytes(32, "big"),
+        )
+
+    def test_invalid_tx(self):
+        block = self.state.create_block_to_mine(address=self.coinbase)
+        block.add_tx(self.transfer(1, self.acc_list[2], 0))
+        # wrong nonce
+        block.add_tx(self.transfer(2, self.acc_list[3], 1))
+        block.finalize(evm_state=self.state.evm_state, coinbase_amount=0)
+        with self.assertRaises(Exception):
+            self.parallel_state.add_block(block)
+        self.assertEqual(self.parallel_state.header_tip, self.state.header_tip)
+
+    def test_read_outside_pre_state(self):
+        executor = self.parallel_state.parallel_tx_executor
+        # reads the balance of an account the tx calling it does not name
+        balance_reader = "601880600b6000396000f3" + (
+            "73" + self.acc_list[4].recipient.hex() + "315000"
+        )
+        contract = Address(mk_contract_address(self.acc_list[0].recipient, 0, 0), 0)
+        self.add_block(
+            [
+                create_contract_transaction(
+                    self.state, self.id_list[0], self.acc_list[0], 0, balance_reader
+                ),
+                create_contract_transaction(
+                    self.state,
+                    self.id_list[1],
+                    self.acc_list[1],
+                    0,
+                    COUNTER_PER_CALLER_BYTECODE,
+                ),
+            ]
+        )
+        self.assertEqual(executor.num_merged, 2)
+
+        executor.num_merged = executor.num_reexecuted = 0
+        self.add_block([self.transfer(2, contract, 0, value=0, gas=100000)])
+        self.assertEqual(executor.num_merged, 0)
+        self.assertEqual(executor.num_reexecuted, 1)
+
+    def test_storage_over_limit(self):
+        self.parallel_state.parallel_tx_executor.shutdown()
+        self.parallel_state = create_shard_state(
+            self.acc_list, num_workers=2, storage_limit=0
+        )
+        executor = self.parallel_state.parallel_tx_executor
+        counter_per_caller = Address(
+            mk_contract_address(self.acc_list[0].recipient, 0, 0), 0
+        )
+        self.add_block(
+            [
+                create_contract_transaction(
+                    self.state,
+                    self.id_list[0],
+                    self.acc_list[0],
+                    0,
+                    COUNTER_PER_CALLER_BYTECODE,
+                )
+            ]
+        )
+        self.add_block([self.transfer(1, counter_per_caller, 0, value=0, gas=100000)])
+
+        # the storage is not sent to the workers and only the cached slots can be read
+        executor.num_merged = executor.num_reexecuted = 0
+        self.add_block(
+            [
+                self.transfer(1, counter_per_caller, 1, value=0, gas=100000),
+                self.transfer(2, self.acc_list[3], 0),
+            ]
+        )
+        self.assertEqual(executor.num_merged, 1)
+        self.assertEqual(executor.num_reexecuted, 1)
@@ -80,6 +80,64 @@ class TestRootState(unittest.TestCase):
             r_state.get_root_block_by_hash(root_block.header.hash_prev_block),
         )
 
+    def test_root_state_add_block_with_evicted_minor_block_hash(self):
+        env = get_test_env()
+        r_state, s_states = create_default_state(env)
+        # only one validated minor block hash in memory
+        r_state.db.m_hash_set.set_max_size(1)
+        b0 = s_states[0].get_tip().create_block_to_append()
+        add_minor_block_to_cluster(s_states, b0)
+        b1 = s_states[1].get_tip().create_block_to_append()
+        add_minor_block_to_cluster(s_states, b1)
+        r_state.add_validated_minor_block_hash(b0.header.get_hash())
+        r_state.add_validated_minor_block_hash(b1.header.get_hash())
+        self.assertNotIn(b0.header.get_hash(), r_state.db.m_hash_set)
+
+        self.assertTrue(r_state.is_minor_block_validated(b0.header.get_hash()))
+        self.assertFalse(r_state.is_minor_block_validated(bytes(32)))
+        root_block = (
+            r_state.tip.create_block_to_append()
+            .add_minor_block_header(s_states[0].db.get_minor_block_by_height(0).header)
+            .add_minor_block_header(b0.header)
+            .add_minor_block_header(s_states[1].db.get_minor_block_by_height(0).header)
+            .add_minor_block_header(b1.header)
+            .finalize()
+        )
+        self.assertTrue(r_state.add_block(root_block))
+
+    def test_root_state_add_block_write_batch_failure(self):
+        env = get_test_env()
+        r_state, s_states = create_default_state(env)
+        b0 = s_states[0].get_tip().create_block_to_append()
+        add_minor_block_to_cluster(s_states, b0)
+        r_state.add_validated_minor_block_hash(b0.header.get_hash())
+        root_block = (
+            r_state.tip.create_block_to_append()
+            .add_minor_block_header(s_states[0].db.get_minor_block_by_height(0).header)
+            .add_minor_block_header(b0.header)
+            .add_minor_block_header(s_states[1].db.get_minor_block_by_height(0).header)
+            .finalize()
+        )
+
+        def fail_write_batch(batch):
+            raise IOError("disk full")
+
+        orig_write_batch = r_state.raw_db._write_batch
+        r_state.raw_db._write_batch = fail_write_batch
+        with self.assertRaises(IOError):
+            r_state.add_block(root_block)
+        r_state.raw_db._write_batch = orig_write_batch
+
+        # nothing of the block is kept in memory
+        self.assertEqual(r_state.tip.height, 0)
+        self.assertFalse(
+            r_state.contain_root_block_by_hash(root_block.header.get_hash())
+        )
+        self.assertIsNone(r_state.get_root_block_by_hash(root_block.header.get_hash()))
+
+        self.assertTrue(r_state.add_block(root_block))
+        self.assertEqual(r_state.tip, root_block.header)
+
     def test_root_state_and_shard_state_add_block(self):
         env = get_test_env()
         r_state, s_states = create_default_state(env)
@@ -371,6 +429,10 @@ class TestRootState(unittest.TestCase):
         self.assertEqual(recovered_state.tip, root_block0.header)
         self.assertEqual(recovered_state.db.get_root_block_by_height(1), root_block0)
         self.assertEqual(recovered_state.get_root_block_by_height(None), root_block0)
+        self.assertEqual(
+            list(recovered_state.db.get_root_blocks_by_height_range(0, 10)),
+            [r_state.db.get_root_block_by_height(0), root_block0, root_block1],
+        )
 
         # fork is pruned from recovered state
         self.assertIsNone(
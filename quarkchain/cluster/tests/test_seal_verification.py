@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+
+from quarkchain.cluster import miner
+from quarkchain.cluster.miner import get_seal_key, validate_seal
+from quarkchain.cluster.seal_verification import SealVerification
+from quarkchain.config import ConsensusType
+from quarkchain.core import RootBlockHeader
+
+DIFFICULTY = 1000
+
+
+def create_headers(num_headers):
+    """ Returns the headers with a valid seal of sha3sha3 at DIFFICULTY """
+    header_list = []
+    for i in range(num_headers):
+        header = RootBlockHeader(create_time=42 + i, difficulty=DIFFICULTY)
+        header.nonce = 0
+        while True:
+            try:
+                validate_seal(header, ConsensusType.POW_SHA3SHA3)
+                break
+            except ValueError:
+                header.nonce += 1
+        header_list.append(header)
+    miner.seal_cache.clear()
+    return header_list
+
+
+class TestSealVerification(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        miner.seal_cache.clear()
+
+    def test_validate_seal_cached(self):
+        header = create_headers(1)[0]
+        key = get_seal_key(header, ConsensusType.POW_SHA3SHA3)
+        validate_seal(header, ConsensusType.POW_SHA3SHA3)
+        self.assertTrue(miner.seal_cache.get(key))
+
+        # an invalid seal is not cached
+        header.nonce += 1
+        with self.assertRaises(ValueError):
+            validate_seal(header, ConsensusType.POW_SHA3SHA3, adjusted_diff=2 ** 200)
+        key = get_seal_key(header, ConsensusType.POW_SHA3SHA3, 2 ** 200)
+        self.assertIsNone(miner.seal_cache.get(key))
+
+    def test_verify(self):
+        loop = asyncio.get_event_loop()
+        verification = SealVerification(num_workers=2, loop=loop)
+        header_list = create_headers(5)
+        invalid_header = RootBlockHeader(create_time=1, difficulty=2 ** 200)
+        loop.run_until_complete(
+            verification.verify(
+                header_list + [invalid_header], ConsensusType.POW_SHA3SHA3
+            )
+        )
+        verification.shutdown()
+
+        for header in header_list:
+            key = get_seal_key(header, ConsensusType.POW_SHA3SHA3)
+            self.assertTrue(miner.seal_cache.get(key))
+        key = get_seal_key(invalid_header, ConsensusType.POW_SHA3SHA3)
+        self.assertIsNone(miner.seal_cache.get(key))
+        with self.assertRaises(ValueError):
+            validate_seal(invalid_header, ConsensusType.POW_SHA3SHA3)
+
+    def test_verify_disabled(self):
+        loop = asyncio.get_event_loop()
+        verification = SealVerification(num_workers=0, loop=loop)
+        header_list = create_headers(2)
+        loop.run_until_complete(
+            verification.verify(header_list, ConsensusType.POW_SHA3SHA3)
+        )
+
+        for header in header_list:
+            key = get_seal_key(header, ConsensusType.POW_SHA3SHA3)
+            self.assertIsNone(miner.seal_cache.get(key))
@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+
+from quarkchain.cluster.sender_recovery import SenderRecovery
+from quarkchain.core import Address, Code, Identity, Transaction
+from quarkchain.evm import transactions
+from quarkchain.evm.transactions import Transaction as EvmTransaction
+
+
+def create_transactions(num_tx):
+    """ Returns the signed txs re-created from their bytes, i.e., without the senders """
+    tx_list = []
+    senders = []
+    for i in range(num_tx):
+        identity = Identity.create_random_identity()
+        evm_tx = EvmTransaction(
+            nonce=i,
+            gasprice=1,
+            startgas=21000,
+            to=Address.create_random_account().recipient,
+            value=1,
+            data=b"",
+            from_full_shard_id=0,
+            to_full_shard_id=0,
+            network_id=1,
+        )
+        evm_tx.sign(key=identity.get_key())
+        code = Code.create_evm_code(evm_tx)
+        tx_list.append(Transaction(code=Code(code.code)))
+        senders.append(evm_tx.sender)
+    return tx_list, senders
+
+
+class TestSenderRecovery(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        transactions.sender_cache.clear()
+
+    def test_recover(self):
+        loop = asyncio.get_event_loop()
+        recovery = SenderRecovery(num_workers=2, loop=loop)
+        tx_list, senders = create_transactions(5)
+        loop.run_until_complete(recovery.recover(tx_list))
+        recovery.shutdown()
+
+        for tx, sender in zip(tx_list, senders):
+            evm_tx = tx.code.get_evm_transaction()
+            self.assertEqual(evm_tx._sender, sender)
+            self.assertEqual(transactions.sender_cache.get(evm_tx.hash), sender)
+
+    def test_recover_disabled(self):
+        loop = asyncio.get_event_loop()
+        recovery = SenderRecovery(num_workers=0, loop=loop)
+        tx_list, senders = create_transactions(2)
+        loop.run_until_complete(recovery.recover(tx_list))
+
+        for tx, sender in zip(tx_list, senders):
+            evm_tx = tx.code.get_evm_transaction()
+            self.assertIsNone(evm_tx._sender)
+            self.assertEqual(evm_tx.sender, sender)
@@ -1,8 +1,17 @@
 import unittest
 
-from quarkchain.cluster.shard_db_operator import ShardDbOperator
-from quarkchain.core import Branch, MinorBlockHeader, MinorBlock, MinorBlockMeta
+from quarkchain.cluster.shard_db_operator import ShardDbOperator, bloom_matches
+from quarkchain.cluster.tests.test_utils import get_test_env
+from quarkchain.core import (
+    Branch,
+    MinorBlockHeader,
+    MinorBlock,
+    MinorBlockMeta,
+    RootBlock,
+    RootBlockHeader,
+)
 from quarkchain.db import InMemoryDb
+from quarkchain.evm.bloom import bloom
 from quarkchain.env import DEFAULT_ENV
 
 
@@ -17,3 +26,175 @@ class TestShardDbOperator(unittest.TestCase):
 
         self.assertEqual(db.get_minor_block_header_by_hash(block_hash), block.header)
         self.assertIsNone(db.get_minor_block_header_by_hash(b""))
+
+    def test_minor_block_cache(self):
+        db = ShardDbOperator(InMemoryDb(), DEFAULT_ENV, Branch(2))
+        block = MinorBlock(MinorBlockHeader(), MinorBlockMeta())
+        block_hash = block.header.get_hash()
+        db.put_minor_block(block, [])
+        self.assertIs(db.get_minor_block_by_hash(block_hash), block)
+        self.assertEqual(db.m_block_cache.hits, 1)
+
+        # read through the cache after the block is evicted
+        db.m_block_cache.clear()
+        block1 = db.get_minor_block_by_hash(block_hash)
+        self.assertEqual(block1, block)
+        self.assertIsNot(block1, block)
+        self.assertIs(db.get_minor_block_by_hash(block_hash), block1)
+        self.assertEqual(db.m_block_cache.hits, 2)
+        self.assertEqual(db.m_block_cache.misses, 1)
+
+    def test_recover_state(self):
+        db = InMemoryDb()
+        db_op = ShardDbOperator(db, DEFAULT_ENV, Branch(2))
+        root_block = RootBlock(RootBlockHeader())
+        db_op.put_root_block(root_block)
+        block_list = []
+        for i in range(5):
+            hash_prev = block_list[-1].header.get_hash() if block_list else bytes(32)
+            block = MinorBlock(
+                MinorBlockHeader(height=i, hash_prev_minor_block=hash_prev),
+                MinorBlockMeta(),
+            )
+            db_op.put_minor_block(block, [])
+            db_op.put_minor_block_index(block)
+            block_list.append(block)
+
+        def recover():
+            db_op1 = ShardDbOperator(db, DEFAULT_ENV, Branch(2))
+            db_op1.recover_state(root_block.header, block_list[-1].header)
+            self.assertEqual(len(db_op1.m_header_pool), len(block_list))
+            for block in block_list:
+                block_hash = block.header.get_hash()
+                self.assertEqual(
+                    db_op1.get_minor_block_header_by_hash(block_hash), block.header
+                )
+                self.assertEqual(
+                    db_op1.get_minor_block_meta_by_hash(block_hash), block.meta
+                )
+            root_block_hash = root_block.header.get_hash()
+            self.assertEqual(
+                db_op1.get_root_block_header_by_hash(root_block_hash), root_block.header
+            )
+            self.assertIsNone(
+                db_op1.get_last_minor_block_in_root_block(root_block_hash)
+            )
+
+        # recover from the header keys
+        recover()
+
+        # a chain that is partially indexed
+        db_op.remove_minor_block_index(block_list[2])
+        recover()
+
+        # blocks stored without header keys are recovered from the full blocks
+        for key in list(db.kv):
+            if key.startswith(b"mblockheader_") or key.startswith(b"rheader_"):
+                db.remove(key)
+        recover()
+
+    def test_header_pool_window(self):
+        env = get_test_env()
+        env.quark_chain_config.ROOT.MAX_STALE_ROOT_BLOCK_HEIGHT_DIFF = 1
+        shard_config = env.quark_chain_config.SHARD_LIST[0]
+        max_size = shard_config.max_minor_blocks_in_memory
+        branch = Branch.create(env.quark_chain_config.SHARD_SIZE, 0)
+        db = ShardDbOperator(InMemoryDb(), env, branch)
+        block_list = []
+        for i in range(max_size * 2):
+            block = MinorBlock(MinorBlockHeader(height=i), MinorBlockMeta())
+            db.put_minor_block(block, [])
+            block_list.append(block)
+        self.assertEqual(len(db.m_header_pool), max_size)
+
+        # the evicted blocks are read from db
+        for block in block_list:
+            block_hash = block.header.get_hash()
+            self.assertTrue(db.contain_minor_block_by_hash(block_hash))
+            self.assertEqual(
+                db.get_minor_block_header_by_hash(block_hash), block.header
+            )
+            self.assertEqual(db.get_minor_block_meta_by_hash(block_hash), block.meta)
+        self.assertEqual(db.get_block_count_by_height(max_size * 2 - 1), 1)
+        self.assertEqual(db.get_block_count_by_height(0), 0)
+
+    def test_get_minor_blocks_by_height_range(self):
+        db = InMemoryDb()
+        # height index of the previous layout
+        block_list = []
+        for i in range(12):
+            block = MinorBlock(MinorBlockHeader(height=i), MinorBlockMeta())
+            db.put(b"mblock_" + block.header.get_hash(), block.serialize())
+            db.put(b"mi_%d" % i, block.header.get_hash())
+            block_list.append(block)
+        db.remove(b"mi_5")
+
+        db_op = ShardDbOperator(db, DEFAULT_ENV, Branch(2))
+        self.assertFalse(any(key.startswith(b"mi_") for key in db.kv))
+        self.assertEqual(db_op.get_minor_block_by_height(11), block_list[11])
+        self.assertIsNone(db_op.get_minor_block_by_height(5))
+        self.assertIsNone(db_op.get_minor_block_by_height(12))
+
+        self.assertEqual(
+            list(db_op.get_minor_blocks_by_height_range(2, 11, batch_size=3)),
+            block_list[2:5] + block_list[6:11],
+        )
+        self.assertEqual(
+            list(db_op.get_minor_blocks_by_height_range(-1, 2 ** 40)),
+            block_list[:5] + block_list[6:],
+        )
+        self.assertEqual(list(db_op.get_minor_blocks_by_height_range(3, 3)), [])
+
+    def test_bloom_bits_index(self):
+        db = ShardDbOperator(InMemoryDb(), DEFAULT_ENV, Branch(2))
+        db.BLOOM_BITS_SECTION_SIZE = 8
+        topic_list = [bloom(bytes([i])) for i in range(4)]
+        block_list = []
+        for i in range(20):
+            hash_prev = block_list[-1].header.get_hash() if block_list else bytes(32)
+            header_bloom = 0
+            for j, topic in enumerate(topic_list):
+                if i % (j + 2) == 0:
+                    header_bloom |= topic
+            block = MinorBlock(
+                MinorBlockHeader(
+                    height=i, hash_prev_minor_block=hash_prev, bloom=header_bloom
+                ),
+                MinorBlockMeta(),
+            )
+            db.put_minor_block(block, [])
+            db.put_minor_block_index(block)
+            block_list.append(block)
+
+        def check_heights(bloom_bits, start, end):
+            expected = [
+                b.header.height
+                for b in block_list
+                if start <= b.header.height < end
+                and bloom_matches(b.header.bloom, bloom_bits)
+            ]
+            self.assertEqual(
+                list(db.get_minor_block_heights_by_bloom(bloom_bits, start, end)),
+                expected,
+            )
+
+        def check_all():
+            for bloom_bits in [
+                [],
+                [[topic_list[0]]],
+                [[topic_list[1], topic_list[2]]],
+                [[topic_list[0]], [topic_list[1], topic_list[3]]],
+            ]:
+                check_heights(bloom_bits, 0, 20)
+                check_heights(bloom_bits, 3, 17)
+                check_heights(bloom_bits, 9, 10)
+
+        # sections 0 and 1 are indexed
+        self.assertEqual(len([k for k in db.db.kv if k.startswith(b"bbs_")]), 2)
+        check_all()
+
+        # section 1 is invalidated
+        db.remove_minor_block_index(block_list[10])
+        self.assertEqual(len([k for k in db.db.kv if k.startswith(b"bbs_")]), 1)
+        del block_list[10]
+        check_all()
@@ -196,6 +196,197 @@ class TestShardState(unittest.TestCase):
         tx_list, _ = state.db.get_transactions_by_address(acc2)
         self.assertEqual(tx_list[0].value, 12345)
 
+    def test_pending_block(self):
+        id1 = Identity.create_random_identity()
+        acc1 = Address.create_from_identity(id1, full_shard_id=0)
+        acc2 = Address.create_random_account(full_shard_id=0)
+        acc3 = Address.create_random_account(full_shard_id=0)
+
+        env = get_test_env(genesis_account=acc1, genesis_minor_quarkash=10000000)
+        state = create_default_shard_state(env=env)
+
+        b0 = state.create_block_to_mine(address=acc3)
+        self.assertEqual(len(b0.tx_list), 0)
+        pending_block = state.pending_block
+
+        tx = create_transfer_transaction(
+            shard_state=state,
+            key=id1.get_key(),
+            from_address=acc1,
+            to_address=acc2,
+            value=12345,
+        )
+        self.assertTrue(state.add_tx(tx))
+        b1 = state.create_block_to_mine(address=acc3)
+        self.assertEqual(b1.tx_list, [tx])
+        # applied to the pending block as it is added instead of rebuilding it
+        self.assertIs(state.pending_block, pending_block)
+
+        # the same as the block built from scratch
+        b2 = state.create_block_to_mine(
+            address=acc3, create_time=b1.header.create_time + 1
+        )
+        self.assertIsNot(state.pending_block, pending_block)
+        self.assertEqual(b2.tx_list, [tx])
+        self.assertEqual(b2.meta, b1.meta)
+
+        state.add_block(b1)
+        self.assertEqual(state.header_tip, b1.header)
+        self.assertEqual(
+            state.get_balance(acc3.recipient),
+            opcodes.GTXCOST // 2 + self.shard_coinbase // 2,
+        )
+
+        # rebuilt on the new tip
+        b3 = state.create_block_to_mine(address=acc3)
+        self.assertEqual(b3.header.hash_prev_minor_block, b1.header.get_hash())
+        self.assertEqual(len(b3.tx_list), 0)
+
+    def test_pending_block_rebuilt_by_gas_price(self):
+        id1 = Identity.create_random_identity()
+        id2 = Identity.create_random_identity()
+        id4 = Identity.create_random_identity()
+        acc1 = Address.create_from_identity(id1, full_shard_id=0)
+        acc2 = Address.create_from_identity(id2, full_shard_id=0)
+        acc3 = Address.create_random_account(full_shard_id=0)
+        acc4 = Address.create_from_identity(id4, full_shard_id=0)
+
+        env = get_test_env(genesis_account=acc1, genesis_minor_quarkash=10000000)
+        for acc in [acc2, acc4]:
+            env.quark_chain_config.SHARD_LIST[0].GENESIS.ALLOC[
+                acc.serialize().hex()
+            ] = 10000000
+        state = create_default_shard_state(env=env)
+
+        # room for a single transfer
+        state.create_block_to_mine(address=acc3, gas_limit=opcodes.GTXCOST)
+        pending_block = state.pending_block
+        tx1 = create_transfer_transaction(
+            shard_state=state,
+            key=id1.get_key(),
+            from_address=acc1,
+            to_address=acc3,
+            value=12345,
+            gas_price=2,
+        )
+        self.assertTrue(state.add_tx(tx1))
+
+        # left out without a rebuild as it pays no more than tx1
+        tx2 = create_transfer_transaction(
+            shard_state=state,
+            key=id2.get_key(),
+            from_address=acc2,
+            to_address=acc3,
+            value=12345,
+            gas_price=2,
+        )
+        self.assertTrue(state.add_tx(tx2))
+        b1 = state.create_block_to_mine(address=acc3, gas_limit=opcodes.GTXCOST)
+        self.assertIs(state.pending_block, pending_block)
+        self.assertEqual(b1.tx_list, [tx1])
+
+        # replaces tx1 as the block built by gas price would
+        tx3 = create_transfer_transaction(
+            shard_state=state,
+            key=id4.get_key(),
+            from_address=acc4,
+            to_address=acc3,
+            value=12345,
+            gas_price=3,
+        )
+        self.assertTrue(state.add_tx(tx3))
+        self.assertIsNone(state.pending_block)
+        b2 = state.create_block_to_mine(address=acc3, gas_limit=opcodes.GTXCOST)
+        self.assertEqual(b2.tx_list, [tx3])
+
+    def test_pending_block_fills_nonce_gap(self):
+        id1 = Identity.create_random_identity()
+        acc1 = Address.create_from_identity(id1, full_shard_id=0)
+        acc2 = Address.create_random_account(full_shard_id=0)
+
+        env = get_test_env(genesis_account=acc1, genesis_minor_quarkash=10000000)
+        state = create_default_shard_state(env=env)
+
+        state.create_block_to_mine(address=acc2)
+        pending_block = state.pending_block
+        tx1 = create_transfer_transaction(
+            shard_state=state,
+            key=id1.get_key(),
+            from_address=acc1,
+            to_address=acc2,
+            value=12345,
+            nonce=1,
+        )
+        # e.g., put back by a reorg, and left out of the pending block for the nonce gap
+        state.tx_queue.add_transaction(
+            tx1.code.get_evm_transaction(), tx_hash=tx1.get_hash()
+        )
+        tx0 = create_transfer_transaction(
+            shard_state=state,
+            key=id1.get_key(),
+            from_address=acc1,
+            to_address=acc2,
+            value=12345,
+            nonce=0,
+        )
+        self.assertTrue(state.add_tx(tx0))
+        b1 = state.create_block_to_mine(address=acc2)
+        self.assertIs(state.pending_block, pending_block)
+        self.assertEqual(b1.tx_list, [tx0, tx1])
+
+    def test_tx_queue_eviction(self):
+        id1 = Identity.create_random_identity()
+        id2 = Identity.create_random_identity()
+        acc1 = Address.create_from_identity(id1, full_shard_id=0)
+        acc2 = Address.create_from_identity(id2, full_shard_id=0)
+        acc3 = Address.create_random_account(full_shard_id=0)
+
+        env = get_test_env(genesis_account=acc1, genesis_minor_quarkash=10000000)
+        env.quark_chain_config.SHARD_LIST[0].GENESIS.ALLOC[
+            acc2.serialize().hex()
+        ] = 10000000
+        env.quark_chain_config.TRANSACTION_QUEUE_SIZE_LIMIT_PER_SHARD = 1
+        state = create_default_shard_state(env=env)
+
+        tx1 = create_transfer_transaction(
+            shard_state=state,
+            key=id1.get_key(),
+            from_address=acc1,
+            to_address=acc3,
+            value=12345,
+            gas_price=1,
+        )
+        self.assertTrue(state.add_tx(tx1))
+        tx2 = create_transfer_transaction(
+            shard_state=state,
+            key=id2.get_key(),
+            from_address=acc2,
+            to_address=acc3,
+            value=12345,
+            gas_price=1,
+        )
+        # the queue is full and tx2 pays no more than tx1
+        self.assertFalse(state.add_tx(tx2))
+
+        tx2 = create_transfer_transaction(
+            shard_state=state,
+            key=id2.get_key(),
+            from_address=acc2,
+            to_address=acc3,
+            value=12345,
+            gas_price=2,
+        )
+        self.assertTrue(state.add_tx(tx2))
+        self.assertEqual(len(state.tx_queue), 1)
+        self.assertNotIn(tx1.get_hash(), state.tx_queue)
+
+        stats = state.get_shard_stats()
+        self.assertEqual(stats.pending_tx_count, 1)
+        self.assertEqual(stats.evicted_tx_count, 1)
+        self.assertEqual(stats.rejected_tx_count, 1)
+        # the trie nodes of the state are read through the node cache
+        self.assertGreater(stats.node_cache_hits + stats.node_cache_misses, 0)
+
     def test_duplicated_tx(self):
         id1 = Identity.create_random_identity()
         acc1 = Address.create_from_identity(id1, full_shard_id=0)
@@ -216,7 +407,7 @@ class TestShardState(unittest.TestCase):
         self.assertFalse(state.add_tx(tx))  # already in tx_queue
 
         self.assertEqual(len(state.tx_queue), 1)
-        self.assertEqual(len(state.tx_dict), 1)
+        self.assertIn(tx.get_hash(), state.tx_queue)
 
         block, i = state.get_transaction_by_hash(tx.get_hash())
         self.assertEqual(len(block.tx_list), 1)
@@ -435,6 +626,22 @@ class TestShardState(unittest.TestCase):
         self.assertEqual(block, b1)
         self.assertEqual(i, 1)
 
+        # Receipts sliced from the receipts blob should match the ones in the trie
+        receipts = state.db.get_minor_block_receipts(b1)
+        self.assertEqual(len(receipts), 2)
+        for i in range(2):
+            r = b1.get_receipt(state.db.db, i)
+            self.assertEqual(state.db.get_minor_block_receipt(b1, i), r)
+            self.assertEqual(receipts[i], r)
+        self.assertEqual(receipts[0].prev_gas_used, 0)
+        self.assertEqual(receipts[1].prev_gas_used, 21000)
+        self.assertEqual(receipts[1].gas_used, 42000)
+
+        # Blocks without the receipts blob fall back to the trie
+        state.db.db.remove(b"receipts_" + b1.header.get_hash())
+        self.assertEqual(state.db.get_minor_block_receipts(b1), receipts)
+        self.assertEqual(state.db.get_minor_block_receipt(b1, 1), receipts[1])
+
         # Check acc2 full_shard_id doesn't change
         self.assertEqual(
             state.evm_state.get_full_shard_id(acc2.recipient), acc2.full_shard_id
@@ -698,6 +905,10 @@ class TestShardState(unittest.TestCase):
             .finalize()
         )
         state0.add_root_block(root_block)
+        # The deposits are assembled when the root block is added
+        deposits = state0.xshard_deposit_cache.get(root_block.header.get_hash())
+        self.assertEqual(deposits[0].tx_hash, tx.get_hash())
+        misses = state0.xshard_deposit_cache.misses
 
         # Add b0 and make sure all x-shard tx's are added
         b2 = state0.create_block_to_mine(address=acc3)
@@ -713,6 +924,7 @@ class TestShardState(unittest.TestCase):
         # X-shard gas used
         evmState0 = state0.evm_state
         self.assertEqual(evmState0.xshard_receive_gas_used, opcodes.GTXXSHARDCOST)
+        self.assertEqual(state0.xshard_deposit_cache.misses, misses)
 
     def test_xshard_tx_received_exclude_non_neighbor(self):
         id1 = Identity.create_random_identity()
@@ -1218,6 +1430,48 @@ class TestShardState(unittest.TestCase):
         with self.assertRaises(ValueError):
             state.add_block(b1)
 
+    def test_add_block_write_batch_failure(self):
+        id1 = Identity.create_random_identity()
+        acc1 = Address.create_from_identity(id1, full_shard_id=0)
+        acc2 = Address.create_random_account(full_shard_id=0)
+        env = get_test_env(genesis_account=acc1, genesis_minor_quarkash=10000000)
+        state = create_default_shard_state(env=env)
+
+        tx = create_transfer_transaction(
+            shard_state=state,
+            key=id1.get_key(),
+            from_address=acc1,
+            to_address=acc2,
+            value=12345,
+        )
+        self.assertTrue(state.add_tx(tx))
+        b1 = state.create_block_to_mine(address=acc1)
+        b1.finalize(
+            evm_state=state.run_block(b1), coinbase_amount=b1.header.coinbase_amount
+        )
+
+        def fail_write_batch(batch):
+            raise IOError("disk full")
+
+        orig_write_batch = state.raw_db._write_batch
+        state.raw_db._write_batch = fail_write_batch
+        with self.assertRaises(IOError):
+            state.add_block(b1)
+        state.raw_db._write_batch = orig_write_batch
+
+        # nothing of the block is kept in memory
+        self.assertEqual(state.header_tip.height, 0)
+        self.assertFalse(state.db.contain_minor_block_by_hash(b1.header.get_hash()))
+        self.assertIsNone(state.db.get_minor_block_by_hash(b1.header.get_hash()))
+        self.assertEqual(state.db.get_block_count_by_height(1), 0)
+        self.assertIn(tx.get_hash(), state.tx_queue)
+        self.assertEqual(state.get_balance(acc2.recipient), 0)
+
+        state.add_block(b1)
+        self.assertEqual(state.header_tip, b1.header)
+        self.assertNotIn(tx.get_hash(), state.tx_queue)
+        self.assertEqual(state.get_balance(acc2.recipient), 12345)
+
     def test_not_update_tip_on_root_fork(self):
         """ block's hash_prev_root_block must be on the same chain with root_tip to update tip.
 
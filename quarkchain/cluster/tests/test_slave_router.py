@@ -0,0 +1,133 @@
+import unittest
+
+from quarkchain.cluster.tests.test_utils import ClusterContext
+from quarkchain.core import Address, Code, Identity, Transaction
+from quarkchain.evm import opcodes
+from quarkchain.evm.transactions import Transaction as EvmTransaction
+from quarkchain.utils import call_async, assert_true_with_timeout
+
+
+def create_transfer_transaction(master, key, from_address, to_address, value, gas):
+    """ The shard states are in the workers, so the nonce is the first one """
+    evm_tx = EvmTransaction(
+        nonce=0,
+        gasprice=1,
+        startgas=gas,
+        to=to_address.recipient,
+        value=value,
+        data=b"",
+        from_full_shard_id=from_address.full_shard_id,
+        to_full_shard_id=to_address.full_shard_id,
+        network_id=master.env.quark_chain_config.NETWORK_ID,
+    )
+    evm_tx.sign(key=key)
+    return Transaction(in_list=[], code=Code.create_evm_code(evm_tx), out_list=[])
+
+
+class TestSlaveRouter(unittest.TestCase):
+    def __test_cross_shard_transaction(self, num_slaves):
+        id1 = Identity.create_random_identity()
+        acc1 = Address.create_from_identity(id1, full_shard_id=0)
+        acc2 = Address.create_random_account(full_shard_id=1)
+
+        with ClusterContext(
+            1, acc1, num_slaves=num_slaves, process_per_shard=True
+        ) as clusters:
+            master = clusters[0].master
+
+            is_root, root_block = call_async(
+                master.get_next_block_to_mine(
+                    Address.create_empty_account(), prefer_root=True
+                )
+            )
+            self.assertTrue(is_root)
+            call_async(master.add_root_block(root_block))
+
+            tx = create_transfer_transaction(
+                master,
+                key=id1.get_key(),
+                from_address=acc1,
+                to_address=acc2,
+                value=54321,
+                gas=opcodes.GTXXSHARDCOST + opcodes.GTXCOST,
+            )
+            self.assertTrue(call_async(master.add_transaction(tx)))
+
+            # the deposit of b1 is sent to the worker of shard 1 through the router(s)
+            is_root, b1 = call_async(
+                master.get_next_block_to_mine(acc1, shard_mask_value=0b10)
+            )
+            self.assertFalse(is_root)
+            self.assertEqual(b1.tx_list, [tx])
+            self.assertTrue(
+                call_async(master.add_raw_minor_block(b1.header.branch, b1.serialize()))
+            )
+
+            is_root, b2 = call_async(
+                master.get_next_block_to_mine(acc1, shard_mask_value=0b11)
+            )
+            self.assertFalse(is_root)
+            self.assertTrue(
+                call_async(master.add_raw_minor_block(b2.header.branch, b2.serialize()))
+            )
+
+            # b3 is on the root block confirming b1, so it has the deposit
+            is_root, root_block = call_async(
+                master.get_next_block_to_mine(acc1, prefer_root=True)
+            )
+            self.assertTrue(is_root)
+            self.assertEqual(root_block.minor_block_header_list, [b1.header, b2.header])
+            call_async(master.add_root_block(root_block))
+            is_root, b3 = call_async(
+                master.get_next_block_to_mine(acc1, shard_mask_value=0b11)
+            )
+            self.assertFalse(is_root)
+            self.assertTrue(
+                call_async(master.add_raw_minor_block(b3.header.branch, b3.serialize()))
+            )
+
+            self.assertEqual(
+                call_async(master.get_primary_account_data(acc1)).transaction_count, 1
+            )
+            self.assertEqual(
+                call_async(master.get_primary_account_data(acc2)).balance, 54321
+            )
+            account_data = call_async(master.get_account_data(acc1))
+            self.assertEqual(len(account_data), 2)
+
+    def test_cross_shard_transaction_between_workers(self):
+        self.__test_cross_shard_transaction(num_slaves=1)
+
+    def test_cross_shard_transaction_between_slaves(self):
+        self.__test_cross_shard_transaction(num_slaves=2)
+
+    def test_new_block_propagation(self):
+        acc1 = Address.create_random_account(full_shard_id=0)
+
+        with ClusterContext(2, acc1, num_slaves=1, process_per_shard=True) as clusters:
+            master = clusters[0].master
+            is_root, block = call_async(
+                master.get_next_block_to_mine(acc1, shard_mask_value=0b11)
+            )
+            self.assertFalse(is_root)
+            self.assertTrue(
+                call_async(
+                    master.add_raw_minor_block(block.header.branch, block.serialize())
+                )
+            )
+
+            # from the worker of the shard to the worker of the peer shard
+            assert_true_with_timeout(
+                lambda: clusters[1].master.root_state.is_minor_block_validated(
+                    block.header.get_hash()
+                ),
+                duration=10,
+            )
+            self.assertEqual(
+                call_async(
+                    clusters[1].master.get_minor_block_by_hash(
+                        block.header.get_hash(), block.header.branch
+                    )
+                ),
+                block,
+            )
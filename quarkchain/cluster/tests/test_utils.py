@@ -10,12 +10,14 @@ from quarkchain.cluster.master import MasterServer
 from quarkchain.cluster.root_state import RootState
 from quarkchain.cluster.simple_network import SimpleNetwork
 from quarkchain.cluster.slave import SlaveServer
+from quarkchain.cluster.slave_router import SlaveRouter
 from quarkchain.config import ConsensusType
 from quarkchain.core import Address, Branch, Transaction, Code, ShardMask
 from quarkchain.db import InMemoryDb
 from quarkchain.diff import EthDifficultyCalculator
 from quarkchain.env import DEFAULT_ENV
 from quarkchain.evm.transactions import Transaction as EvmTransaction
+from quarkchain.genesis import GenesisManager
 from quarkchain.cluster.shard import Shard
 from quarkchain.cluster.shard_state import ShardState
 from quarkchain.protocol import AbstractConnection
@@ -172,6 +174,49 @@ def create_contract_with_storage_transaction(
     )
 
 
+def create_shard_state_with_accounts(
+    acc_list, balance=10 ** 20, gas_limit=2 ** 32, env=None
+):
+    """ Create the state of shard 0 whose genesis allocates balance to each account,
+    e.g., for the benchmarks in quarkchain/experimental.
+    gas_limit: the genesis gas limit, or None to keep the default one
+    """
+    env = env or get_test_env()
+    shard_config = env.quark_chain_config.SHARD_LIST[0]
+    if gas_limit is not None:
+        shard_config.GENESIS.GAS_LIMIT = gas_limit
+    for acc in acc_list:
+        shard_config.GENESIS.ALLOC[acc.serialize().hex()] = balance
+    state = ShardState(env=env, shard_id=0)
+    genesis_manager = GenesisManager(env.quark_chain_config)
+    state.init_genesis_state(genesis_manager.create_root_block())
+    return state
+
+
+def create_transfer_block(state, identity, acc, num_tx, nonce=0):
+    """ Create a block on top of the tip of the shard state with num_tx transfers from
+    acc to random accounts in its shard, which is run and finalized but not added
+    """
+    block = state.create_block_to_mine(address=acc)
+    for i in range(num_tx):
+        block.add_tx(
+            create_transfer_transaction(
+                shard_state=state,
+                key=identity.get_key(),
+                from_address=acc,
+                to_address=Address.create_random_account(
+                    full_shard_id=acc.full_shard_id
+                ),
+                value=1,
+                nonce=nonce + i,
+            )
+        )
+    evm_state = state.run_block(block, state._get_evm_state_for_new_block(block))
+    coinbase_amount = state.get_coinbase_amount() + evm_state.block_fee
+    block.finalize(evm_state=evm_state, coinbase_amount=coinbase_amount)
+    return block
+
+
 class Cluster:
     def __init__(self, master, slave_list, network, peer):
         self.master = master
@@ -213,7 +258,12 @@ def create_test_clusters(
     genesis_root_heights,
     remote_mining=False,
     small_coinbase=False,
+    process_per_shard=False,
+    genesis_minor_quarkash=1000000,
 ):
+    """ process_per_shard: run the shards of each slave in worker processes behind a
+    SlaveRouter, whose shards can only be reached through the master
+    """
     # so we can have lower minimum diff
     easy_diff_calc = EthDifficultyCalculator(
         cutoff=45, diff_factor=2048, minimum_diff=10
@@ -226,7 +276,7 @@ def create_test_clusters(
     for i in range(num_cluster):
         env = get_test_env(
             genesis_account,
-            genesis_minor_quarkash=1000000,
+            genesis_minor_quarkash=genesis_minor_quarkash,
             shard_size=shard_size,
             genesis_root_heights=genesis_root_heights,
             remote_mining=remote_mining,
@@ -259,7 +309,8 @@ def create_test_clusters(
             slave_env.slave_config = env.cluster_config.get_slave_config(
                 "S{}".format(j)
             )
-            slave_server = SlaveServer(slave_env, name="cluster{}_slave{}".format(i, j))
+            slave_class = SlaveRouter if process_per_shard else SlaveServer
+            slave_server = slave_class(slave_env, name="cluster{}_slave{}".format(i, j))
             slave_server.start()
             slave_server_list.append(slave_server)
 
@@ -272,6 +323,9 @@ def create_test_clusters(
 
         # Substitute diff calculate with an easier one
         for slave in slave_server_list:
+            if process_per_shard:
+                # the shards are in the worker processes
+                continue
             for shard in slave.shards.values():
                 shard.state.diff_calc = easy_diff_calc
 
@@ -322,6 +376,7 @@ class ClusterContext(ContextDecorator):
         genesis_root_heights=None,
         remote_mining=False,
         small_coinbase=False,
+        process_per_shard=False,
     ):
         self.num_cluster = num_cluster
         self.genesis_account = genesis_account
@@ -330,6 +385,7 @@ class ClusterContext(ContextDecorator):
         self.genesis_root_heights = genesis_root_heights
         self.remote_mining = remote_mining
         self.small_coinbase = small_coinbase
+        self.process_per_shard = process_per_shard
 
     def __enter__(self):
         self.cluster_list = create_test_clusters(
@@ -340,6 +396,7 @@ class ClusterContext(ContextDecorator):
             self.genesis_root_heights,
             remote_mining=self.remote_mining,
             small_coinbase=self.small_coinbase,
+            process_per_shard=self.process_per_shard,
         )
         return self.cluster_list
 
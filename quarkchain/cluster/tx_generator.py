@@ -64,7 +64,7 @@ class TransactionGenerator:
             tx_list.append(tx)
             total += 1
             if len(tx_list) >= 600 or total >= num_tx:
-                self.shard.add_tx_list(tx_list)
+                await self.shard.add_tx_list(tx_list)
                 tx_list = []
                 await asyncio.sleep(
                     random.uniform(8, 12)
@@ -239,6 +239,7 @@ class QuarkChainConfig(BaseConfig):
 
     NETWORK_ID = NetworkId.TESTNET_PORSCHE
     TRANSACTION_QUEUE_SIZE_LIMIT_PER_SHARD = 10000
+    TRANSACTION_QUEUE_SIZE_LIMIT_PER_SENDER = 16
     BLOCK_EXTRA_DATA_SIZE_LIMIT = 1024
 
     PROOF_OF_PROGRESS_BLOCKS = 1
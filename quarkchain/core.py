@@ -7,6 +7,7 @@
 import argparse
 import copy
 import random
+import struct
 import typing
 from typing import List
 
@@ -48,9 +49,11 @@ class ByteBuffer:
     """
 
     def __init__(self, data):
-        # We don't want deserialized object to have bytearray
-        # which isn't hashable
-        self.bytes = bytes(data)
+        # Deserialized objects may keep views of the buffer (e.g., the undecoded tx_list of MinorBlock),
+        # so only immutable data is wrapped without copying
+        if not isinstance(data, (bytes, memoryview)) or not memoryview(data).readonly:
+            data = bytes(data)
+        self.bytes = memoryview(data)
         self.position = 0
         self.marked_position = 0
 
@@ -59,11 +62,11 @@ class ByteBuffer:
             raise RuntimeError("buffer is shorter than expected")
 
     def get_uint(self, size):
-        self.__check_space(size)
-        value = int.from_bytes(
-            self.bytes[self.position : self.position + size], byteorder="big"
-        )
-        self.position += size
+        end = self.position + size
+        if end > len(self.bytes):
+            raise RuntimeError("buffer is shorter than expected")
+        value = int.from_bytes(self.bytes[self.position : end], byteorder="big")
+        self.position = end
         return value
 
     def get_uint8(self):
@@ -83,10 +86,20 @@ class ByteBuffer:
 
     def get_bytes(self, size):
         self.__check_space(size)
-        value = self.bytes[self.position : self.position + size]
+        # We don't want deserialized object to have memoryview
+        # which isn't hashable
+        value = bytes(self.bytes[self.position : self.position + size])
         self.position += size
         return value
 
+    def get_struct(self, st: struct.Struct):
+        end = self.position + st.size
+        if end > len(self.bytes):
+            raise RuntimeError("buffer is shorter than expected")
+        value = st.unpack_from(self.bytes, self.position)
+        self.position = end
+        return value
+
     def get_var_bytes(self):
         # TODO: Only support 1 byte len
         size = self.get_uint8()
@@ -126,18 +139,22 @@ class BooleanSerializer:
         return bool(bb.get_uint8())
 
 
+def check_fixed_size_bytes(bs, size):
+    if len(bs) != size:
+        raise RuntimeError(
+            "FixedSizeBytesSerializer input bytes size {} expect {}".format(
+                len(bs), size
+            )
+        )
+    return bs
+
+
 class FixedSizeBytesSerializer:
     def __init__(self, size):
         self.size = size
 
     def serialize(self, bs, barray):
-        if len(bs) != self.size:
-            raise RuntimeError(
-                "FixedSizeBytesSerializer input bytes size {} expect {}".format(
-                    len(bs), self.size
-                )
-            )
-        barray.extend(bs)
+        barray.extend(check_fixed_size_bytes(bs, self.size))
         return barray
 
     def deserialize(self, bb):
@@ -192,16 +209,129 @@ class BigUintSerializer:
         return int.from_bytes(bs, byteorder="big")
 
 
+STRUCT_UINT_FORMATS = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+
+def is_compiled_serializable(ser):
+    return (
+        isinstance(ser, type)
+        and issubclass(ser, Serializable)
+        and ser.deserialize.__func__ is Serializable.deserialize.__func__
+    )
+
+
+def compile_serializers(fields):
+    """ Generate the serialize and deserialize functions of the given FIELDS.
+    Each run of consecutive fixed-size fields (uints and fixed-size bytes) is packed/unpacked with one struct.Struct,
+    where uints of sizes not supported by struct are converted from/to bytes.  The byte format is the same as
+    serializing the fields one by one.
+    """
+    namespace = {
+        "ByteBuffer": ByteBuffer,
+        "check_fixed_size_bytes": check_fixed_size_bytes,
+    }
+    ser_lines = [
+        "def serialize(self, barray=None):",
+        "    barray = bytearray() if barray is None else barray",
+    ]
+    deser_lines = [
+        "def deserialize(cls, bb):",
+        "    if not isinstance(bb, ByteBuffer):",
+        "        bb = ByteBuffer(bb)",
+    ]
+    run = []
+
+    def compile_run():
+        if not run:
+            return
+        fmt = ">"
+        pack_args = []
+        int_conversions = []
+        for i, name, ser in run:
+            if isinstance(ser, UintSerializer) and ser.size in STRUCT_UINT_FORMATS:
+                fmt += STRUCT_UINT_FORMATS[ser.size]
+                pack_args.append("self.{}".format(name))
+            elif isinstance(ser, UintSerializer):
+                fmt += "{}s".format(ser.size)
+                pack_args.append('self.{}.to_bytes({}, "big")'.format(name, ser.size))
+                int_conversions.append(
+                    '    v{0} = int.from_bytes(v{0}, "big")'.format(i)
+                )
+            else:
+                fmt += "{}s".format(ser.size)
+                pack_args.append(
+                    "check_fixed_size_bytes(self.{}, {})".format(name, ser.size)
+                )
+        st_name = "st{}".format(run[0][0])
+        namespace[st_name] = struct.Struct(fmt)
+        ser_lines.append(
+            "    barray.extend({}.pack({}))".format(st_name, ", ".join(pack_args))
+        )
+        deser_lines.append(
+            "    {}, = bb.get_struct({})".format(
+                ", ".join("v{}".format(i) for i, _, _ in run), st_name
+            )
+        )
+        deser_lines.extend(int_conversions)
+        run.clear()
+
+    for i, (name, ser) in enumerate(fields):
+        if type(ser) in (UintSerializer, FixedSizeBytesSerializer):
+            run.append((i, name, ser))
+            continue
+        compile_run()
+        namespace["s{}".format(i)] = ser.serialize
+        ser_lines.append("    s{}(self.{}, barray)".format(i, name))
+        # call the compiled deserialize functions of nested Serializables directly
+        if is_compiled_serializable(ser):
+            namespace["c{}".format(i)] = ser
+            namespace["d{}".format(i)] = ser.get_compiled_serializers()[2]
+            deser_lines.append("    v{0} = d{0}(c{0}, bb)".format(i))
+        elif isinstance(ser, PrependedSizeListSerializer) and is_compiled_serializable(
+            ser.ser
+        ):
+            namespace["c{}".format(i)] = ser.ser
+            namespace["d{}".format(i)] = ser.ser.get_compiled_serializers()[2]
+            deser_lines.append(
+                "    v{0} = [d{0}(c{0}, bb) for _ in range(bb.get_uint({1}))]".format(
+                    i, ser.size_bytes
+                )
+            )
+        elif isinstance(ser, PrependedSizeBytesSerializer):
+            deser_lines.append(
+                "    v{} = bb.get_bytes(bb.get_uint({}))".format(i, ser.size_bytes)
+            )
+        else:
+            namespace["d{}".format(i)] = ser.deserialize
+            deser_lines.append("    v{0} = d{0}(bb)".format(i))
+    compile_run()
+
+    ser_lines.append("    return barray")
+    deser_lines.append(
+        "    return cls({})".format(
+            ", ".join("{}=v{}".format(name, i) for i, (name, _) in enumerate(fields))
+        )
+    )
+    exec("\n".join(ser_lines + deser_lines), namespace)
+    return namespace["serialize"], namespace["deserialize"]
+
+
 class Serializable:
     def __init__(self, *args, **kwargs):
         for k, v in kwargs.items():
             setattr(self, k, v)
 
+    @classmethod
+    def get_compiled_serializers(cls):
+        """ The serialize and deserialize functions generated from cls.FIELDS, compiled on first use """
+        compiled = cls.__dict__.get("_compiled_serializers", None)
+        if compiled is None or compiled[0] is not cls.FIELDS:
+            compiled = (cls.FIELDS,) + compile_serializers(cls.FIELDS)
+            cls._compiled_serializers = compiled
+        return compiled
+
     def serialize(self, barray: bytearray = None):
-        barray = bytearray() if barray is None else barray
-        for name, ser in self.FIELDS:
-            ser.serialize(getattr(self, name), barray)
-        return barray
+        return self.get_compiled_serializers()[1](self, barray)
 
     def serialize_without(self, exclude_list, barray: bytearray = None):
         barray = bytearray() if barray is None else barray
@@ -212,12 +342,7 @@ class Serializable:
 
     @classmethod
     def deserialize(cls, bb):
-        if not isinstance(bb, ByteBuffer):
-            bb = ByteBuffer(bb)
-        kwargs = dict()
-        for name, ser in cls.FIELDS:
-            kwargs[name] = ser.deserialize(bb)
-        return cls(**kwargs)
+        return cls.get_compiled_serializers()[2](cls, bb)
 
     def __eq__(self, other):
         for name, ser in self.FIELDS:
@@ -232,6 +357,23 @@ class Serializable:
         return hash(tuple(h_list))
 
 
+class HashMemoSerializable(Serializable):
+    """ Serializable that memoizes its hashes.  The memoized hashes are dropped whenever an attribute is assigned,
+    so fields must be reassigned rather than mutated in place (e.g., tx.sign_list = [...] instead of append).
+    """
+
+    def __setattr__(self, name, value):
+        self.__dict__.pop("_hash_memo", None)
+        super().__setattr__(name, value)
+
+    def memoize_hash(self, name, hash_func):
+        memo = self.__dict__.setdefault("_hash_memo", dict())
+        h = memo.get(name, None)
+        if h is None:
+            h = memo[name] = hash_func()
+        return h
+
+
 class Optional:
     def __init__(self, serializer):
         self.serializer = serializer
@@ -500,8 +642,7 @@ class Code(Serializable):
     FIELDS = [("code", PrependedSizeBytesSerializer(4))]
 
     def __init__(self, code=OP_TRANSFER):
-        fields = {k: v for k, v in locals().items() if k != "self"}
-        super(type(self), self).__init__(**fields)
+        self.code = code
 
     @classmethod
     def get_transfer_code(cls):
@@ -524,7 +665,9 @@ class Code(Serializable):
 
     @classmethod
     def create_evm_code(cls, evm_tx):
-        return Code(cls.OP_EVM + rlp.encode(evm_tx))
+        code = Code(cls.OP_EVM + rlp.encode(evm_tx))
+        code._evm_tx = (code.code, evm_tx)
+        return code
 
     def is_valid_op(self):
         if len(self.code) == 0:
@@ -549,11 +692,17 @@ class Code(Serializable):
         return self.code[:1] == self.OP_EVM
 
     def get_evm_transaction(self) -> EvmTransaction:
+        """ The decoded tx is memoized (along with the sender once it is recovered)
+        until the code is reassigned, so it is shared by all the callers.
+        """
         assert self.is_evm()
-        return rlp.decode(self.code[1:], EvmTransaction)
+        memo = self.__dict__.get("_evm_tx", None)
+        if memo is None or memo[0] is not self.code:
+            memo = self._evm_tx = (self.code, rlp.decode(self.code[1:], EvmTransaction))
+        return memo[1]
 
 
-class Transaction(Serializable):
+class Transaction(HashMemoSerializable):
     FIELDS = [
         ("in_list", PrependedSizeListSerializer(1, TransactionInput)),
         ("code", Code),
@@ -572,13 +721,15 @@ class Transaction(Serializable):
         return self.serialize_without(["sign_list"], barray)
 
     def get_hash(self):
-        return sha3_256(self.serialize())
+        return self.memoize_hash("hash", lambda: sha3_256(self.serialize()))
 
     def get_hash_hex(self):
         return self.get_hash().hex()
 
     def get_hash_unsigned(self):
-        return sha3_256(self.serialize_unsigned())
+        return self.memoize_hash(
+            "hash_unsigned", lambda: sha3_256(self.serialize_unsigned())
+        )
 
     def sign(self, keys):
         """ Sign the transaction with keys.  It doesn't mean the transaction is valid in the chain since it doesn't
@@ -659,7 +810,7 @@ def mk_receipt_sha(receipts, db):
     return t.root_hash
 
 
-class MinorBlockMeta(Serializable):
+class MinorBlockMeta(HashMemoSerializable):
     """ Meta data that are not included in root block
     """
 
@@ -686,10 +837,10 @@ class MinorBlockMeta(Serializable):
         self.evm_cross_shard_receive_gas_used = evm_cross_shard_receive_gas_used
 
     def get_hash(self):
-        return sha3_256(self.serialize())
+        return self.memoize_hash("hash", lambda: sha3_256(self.serialize()))
 
 
-class MinorBlockHeader(Serializable):
+class MinorBlockHeader(HashMemoSerializable):
     """ Header fields that are included in root block so that the root chain could quickly verify
     - Verify minor block headers included are valid appends on existing shards
     - Verify minor block headers reach sufficient difficulty
@@ -750,10 +901,13 @@ class MinorBlockHeader(Serializable):
         self.mixhash = mixhash
 
     def get_hash(self):
-        return sha3_256(self.serialize())
+        return self.memoize_hash("hash", lambda: sha3_256(self.serialize()))
 
     def get_hash_for_mining(self):
-        return sha3_256(self.serialize_without(["nonce", "mixhash"]))
+        return self.memoize_hash(
+            "hash_for_mining",
+            lambda: sha3_256(self.serialize_without(["nonce", "mixhash"])),
+        )
 
 
 class MinorBlock(Serializable):
@@ -774,11 +928,81 @@ class MinorBlock(Serializable):
         tx_list: List[Transaction] = None,
         tracking_data: bytes = b"",
     ):
+        # serialized tx_list and tracking_data to be decoded on first access
+        self._undecoded_data = None
         self.header = header
         self.meta = meta
         self.tx_list = [] if tx_list is None else tx_list
         self.tracking_data = tracking_data
 
+    def __decode_undecoded_data(self):
+        # a cached block is shared by threads so the decoded fields are assigned before
+        # _undecoded_data is cleared, i.e., they are never seen half decoded
+        data = self._undecoded_data
+        if data is None:
+            return
+        bb = ByteBuffer(data)
+        tx_list = self.FIELDS[2][1].deserialize(bb)
+        tracking_data = self.FIELDS[3][1].deserialize(bb)
+        self._tx_list = tx_list
+        self._tracking_data = tracking_data
+        self._undecoded_data = None
+
+    @property
+    def tx_list(self) -> List[Transaction]:
+        if self._undecoded_data is not None:
+            self.__decode_undecoded_data()
+        return self._tx_list
+
+    @tx_list.setter
+    def tx_list(self, value):
+        if self._undecoded_data is not None:
+            self.__decode_undecoded_data()
+        self._tx_list = value
+
+    @property
+    def tracking_data(self) -> bytes:
+        if self._undecoded_data is not None:
+            self.__decode_undecoded_data()
+        return self._tracking_data
+
+    @tracking_data.setter
+    def tracking_data(self, value):
+        if self._undecoded_data is not None:
+            self.__decode_undecoded_data()
+        self._tracking_data = value
+
+    def serialize(self, barray: bytearray = None):
+        data = self._undecoded_data
+        if data is None:
+            return super().serialize(barray)
+        # forward the original bytes of tx_list and tracking_data
+        barray = bytearray() if barray is None else barray
+        self.header.serialize(barray)
+        self.meta.serialize(barray)
+        barray.extend(data)
+        return barray
+
+    @classmethod
+    def deserialize(cls, bb):
+        """ When deserializing a whole serialized block (e.g., read from db), tx_list and tracking_data are only
+        decoded on first access.  A block in a ByteBuffer (e.g., a block list in a message) is decoded eagerly
+        since its end is unknown without decoding tx_list.
+        """
+        if isinstance(bb, ByteBuffer):
+            return super().deserialize(bb)
+        bb = ByteBuffer(bb)
+        block = cls(MinorBlockHeader.deserialize(bb), MinorBlockMeta.deserialize(bb))
+        block._undecoded_data = bb.bytes[bb.position :]
+        return block
+
+    def __getstate__(self):
+        # memoryview can be neither pickled nor deep-copied
+        state = self.__dict__.copy()
+        if state["_undecoded_data"] is not None:
+            state["_undecoded_data"] = bytes(state["_undecoded_data"])
+        return state
+
     def calculate_merkle_root(self):
         return calculate_merkle_root(self.tx_list)
 
@@ -788,7 +1012,14 @@ class MinorBlock(Serializable):
         self.meta.hash_merkle_root = self.calculate_merkle_root()
         return self
 
-    def finalize(self, evm_state, coinbase_amount, hash_prev_root_block=None):
+    def finalize(
+        self,
+        evm_state,
+        coinbase_amount,
+        hash_prev_root_block=None,
+        hash_evm_receipt_root=None,
+    ):
+        """ hash_evm_receipt_root: computed from the receipts of evm_state if not given """
         if hash_prev_root_block is not None:
             self.header.hash_prev_root_block = hash_prev_root_block
         self.meta.hash_evm_state_root = evm_state.trie.root_hash
@@ -796,9 +1027,9 @@ class MinorBlock(Serializable):
         self.meta.evm_cross_shard_receive_gas_used = evm_state.xshard_receive_gas_used
         self.header.coinbase_amount = coinbase_amount
         self.finalize_merkle_root()
-        self.meta.hash_evm_receipt_root = mk_receipt_sha(
-            evm_state.receipts, evm_state.db
-        )
+        if hash_evm_receipt_root is None:
+            hash_evm_receipt_root = mk_receipt_sha(evm_state.receipts, evm_state.db)
+        self.meta.hash_evm_receipt_root = hash_evm_receipt_root
         self.header.hash_meta = self.meta.get_hash()
         self.header.bloom = evm_state.bloom
         return self
@@ -810,19 +1041,22 @@ class MinorBlock(Serializable):
     def get_receipt(self, db, i):
         t = trie.Trie(db, self.meta.hash_evm_receipt_root)
         receipt = rlp.decode(t.get(rlp.encode(i)), quarkchain.evm.messages.Receipt)
-        if receipt.contract_address != b"":
-            contract_address = Address(
-                receipt.contract_address, receipt.contract_full_shard_id
-            )
-        else:
-            contract_address = Address.create_empty_account(full_shard_id=0)
-
         if i > 0:
             prev_gas_used = rlp.decode(
                 t.get(rlp.encode(i - 1)), quarkchain.evm.messages.Receipt
             ).gas_used
         else:
             prev_gas_used = self.meta.evm_cross_shard_receive_gas_used
+        return self.create_receipt(i, receipt, prev_gas_used)
+
+    def create_receipt(self, i, receipt, prev_gas_used):
+        """ Wrap the EVM receipt of the i-th tx in the block """
+        if receipt.contract_address != b"":
+            contract_address = Address(
+                receipt.contract_address, receipt.contract_full_shard_id
+            )
+        else:
+            contract_address = Address.create_empty_account(full_shard_id=0)
 
         logs = [
             Log.create_from_eth_log(eth_log, self, tx_idx=i, log_idx=j)
@@ -878,7 +1112,7 @@ class MinorBlock(Serializable):
         return MinorBlock(header, meta, [], b"")
 
 
-class RootBlockHeader(Serializable):
+class RootBlockHeader(HashMemoSerializable):
     FIELDS = [
         ("version", uint32),
         ("height", uint32),
@@ -926,10 +1160,15 @@ class RootBlockHeader(Serializable):
         self.signature = signature
 
     def get_hash(self):
-        return sha3_256(self.serialize_without(["signature"]))
+        return self.memoize_hash(
+            "hash", lambda: sha3_256(self.serialize_without(["signature"]))
+        )
 
     def get_hash_for_mining(self):
-        return sha3_256(self.serialize_without(["nonce", "mixhash", "signature"]))
+        return self.memoize_hash(
+            "hash_for_mining",
+            lambda: sha3_256(self.serialize_without(["nonce", "mixhash", "signature"])),
+        )
 
     def sign_with_private_key(self, private_key: KeyAPI.PrivateKey):
         self.signature = private_key.sign_msg_hash(self.get_hash()).to_bytes()
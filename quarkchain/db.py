@@ -1,12 +1,27 @@
 #!/usr/bin/python3
+import contextlib
 import copy
 import pathlib
 import shutil
+import threading
 
 import rocksdb
 
 
 class Db:
+    @property
+    def _batch(self):
+        """ Pending writes of the current write batch: key -> value (None for a delete).
+        A batch belongs to the thread writing it so that the other threads (e.g., the event loop
+        reading a shard db written in its state thread) only read the committed data.
+        """
+        local = self.__dict__.get("_batch_local", None)
+        return None if local is None else getattr(local, "batch", None)
+
+    @_batch.setter
+    def _batch(self, batch):
+        self.__dict__.setdefault("_batch_local", threading.local()).batch = batch
+
     def __getitem__(self, key):
         value = self.get(key)
         if value is None:
@@ -16,6 +31,28 @@ class Db:
     def close(self):
         pass
 
+    @contextlib.contextmanager
+    def write_batch(self):
+        """ Group all the puts and removes issued inside the context into one atomic write.
+        Reads inside the context see the pending writes (except range iterators).
+        Nested batches are merged into the outermost one.
+        Nothing is written if the context exits with an exception.
+        """
+        if self._batch is not None:
+            yield self
+            return
+
+        self._batch = dict()
+        try:
+            yield self
+            batch = self._batch
+        finally:
+            self._batch = None
+        self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        raise NotImplementedError()
+
 
 class InMemoryDb(Db):
     """ A simple in-memory key-value database
@@ -44,17 +81,40 @@ class InMemoryDb(Db):
             yield k, self.kv[k]
 
     def get(self, key, default=None):
+        if self._batch is not None and key in self._batch:
+            value = self._batch[key]
+            return default if value is None else value
         return self.kv.get(key, default)
 
+    def multi_get(self, keys):
+        return {k: self.get(k) for k in keys}
+
     def put(self, key, value):
+        if self._batch is not None:
+            self._batch[key] = bytes(value)
+            return
         self.kv[key] = bytes(value)
 
     def remove(self, key):
+        if self._batch is not None:
+            if key not in self:
+                raise KeyError(key)
+            self._batch[key] = None
+            return
         del self.kv[key]
 
     def __contains__(self, key):
+        if self._batch is not None and key in self._batch:
+            return self._batch[key] is not None
         return key in self.kv
 
+    def _write_batch(self, batch):
+        for key, value in batch.items():
+            if value is None:
+                self.kv.pop(key, None)
+            else:
+                self.kv[key] = value
+
 
 class PersistentDb(Db):
     def __init__(self, db_path, clean=False):
@@ -78,20 +138,35 @@ class PersistentDb(Db):
 
     def get(self, key, default=None):
         key = key.encode() if not isinstance(key, bytes) else key
-        value = self._db.get(key)
+        if self._batch is not None and key in self._batch:
+            value = self._batch[key]
+        else:
+            value = self._db.get(key)
         return default if value is None else value
 
     def multi_get(self, keys):
         keys = [k.encode() if not isinstance(k, bytes) else k for k in keys]
-        return self._db.multi_get(keys)  # returns a dict with keys as keys
+        if self._batch is None:
+            return self._db.multi_get(keys)  # returns a dict with keys as keys
+        result = self._db.multi_get([k for k in keys if k not in self._batch])
+        for k in keys:
+            if k in self._batch:
+                result[k] = self._batch[k]
+        return result
 
     def put(self, key, value):
         key = key.encode() if not isinstance(key, bytes) else key
         value = bytes(value) if isinstance(value, bytearray) else value
+        if self._batch is not None:
+            self._batch[key] = value
+            return
         return self._db.put(key, value)
 
     def delete(self, key):
         key = key.encode() if not isinstance(key, bytes) else key
+        if self._batch is not None:
+            self._batch[key] = None
+            return
         return self._db.delete(key)
 
     def remove(self, key):
@@ -99,8 +174,19 @@ class PersistentDb(Db):
 
     def __contains__(self, key):
         key = key.encode() if not isinstance(key, bytes) else key
+        if self._batch is not None and key in self._batch:
+            return self._batch[key] is not None
         return self._db.get(key) is not None
 
+    def _write_batch(self, batch):
+        wb = rocksdb.WriteBatch()
+        for key, value in batch.items():
+            if value is None:
+                wb.delete(key)
+            else:
+                wb.put(key, value)
+        self._db.write(wb)
+
     def range_iter(self, start, end):
         """ A generator yielding (key, value) for keys in [start, end) ordered by key in ascending order"""
         it = self._db.iteritems()
@@ -150,20 +236,33 @@ class OverlayDb(Db):
         self.overlay = {}
 
     def get(self, key):
+        if self._batch is not None and key in self._batch:
+            return self._batch[key]
         if key in self.overlay:
             return self.overlay[key]
         return self._db.get(key)
 
     def put(self, key, value):
+        if self._batch is not None:
+            self._batch[key] = value
+            return
         self.overlay[key] = value
 
     def delete(self, key):
+        if self._batch is not None:
+            self._batch[key] = None
+            return
         self.overlay[key] = None
 
     def commit(self):
         pass
 
+    def _write_batch(self, batch):
+        self.overlay.update(batch)
+
     def _has_key(self, key):
+        if self._batch is not None and key in self._batch:
+            return self._batch[key] is not None
         if key in self.overlay:
             return self.overlay[key] is not None
         return self._db.get(key) is not None
@@ -303,7 +303,7 @@ def apply_transaction(state, tx: transactions.Transaction, tx_wrapper_hash):
 
     # Pre-Metropolis: commit state after every tx
     if not state.is_METROPOLIS() and not SKIP_MEDSTATES:
-        state.commit()
+        state.commit(flush=False)
 
     # Construct a receipt
     r = mk_receipt(state, success, state.logs, contract_address, state.full_shard_id)
@@ -33,6 +33,9 @@ class SecureTrie(object):
     def root_hash_valid(self):
         return self.trie.root_hash_valid()
 
+    def flush(self, on_leaf=None):
+        self.trie.flush(on_leaf)
+
     @property
     def root_hash(self):
         return self.trie.root_hash
@@ -71,7 +71,16 @@ class _Account(rlp.Serializable):
 
 class Account(rlp.Serializable):
     def __init__(
-        self, nonce, balance, storage, code_hash, full_shard_id, env, address, db=None
+        self,
+        nonce,
+        balance,
+        storage,
+        code_hash,
+        full_shard_id,
+        env,
+        address,
+        db=None,
+        dirty_nodes=None,
     ):
         self.db = env.db if db is None else db
         assert isinstance(db, Db)
@@ -86,7 +95,7 @@ class Account(rlp.Serializable):
         self.full_shard_id = acc.full_shard_id
 
         self.storage_cache = {}
-        self.storage_trie = SecureTrie(Trie(self.db))
+        self.storage_trie = SecureTrie(Trie(self.db, dirty_nodes=dirty_nodes))
         self.storage_trie.root_hash = self.storage
         self.touched = False
         self.existent_at_start = True
@@ -126,7 +135,9 @@ class Account(rlp.Serializable):
         self.storage_cache[key] = value
 
     @classmethod
-    def blank_account(cls, env, address, full_shard_id, initial_nonce=0, db=None):
+    def blank_account(
+        cls, env, address, full_shard_id, initial_nonce=0, db=None, dirty_nodes=None
+    ):
         if db is None:
             db = env.db
         db.put(BLANK_HASH, b"")
@@ -139,10 +150,31 @@ class Account(rlp.Serializable):
             env,
             address,
             db=db,
+            dirty_nodes=dirty_nodes,
         )
         o.existent_at_start = False
         return o
 
+    def copy(self, env, db, dirty_nodes):
+        """ A copy of the account, including the changes not committed yet """
+        o = Account(
+            self.nonce,
+            self.balance,
+            self.storage,
+            self.code_hash,
+            self.full_shard_id,
+            env,
+            self.address,
+            db=db,
+            dirty_nodes=dirty_nodes,
+        )
+        o.storage_cache = dict(self.storage_cache)
+        o.storage_trie.root_hash = self.storage_trie.root_hash
+        o.touched = self.touched
+        o.existent_at_start = self.existent_at_start
+        o.deleted = self.deleted
+        return o
+
     def is_blank(self):
         return self.nonce == 0 and self.balance == 0 and self.code_hash == BLANK_HASH
 
@@ -184,7 +216,9 @@ class State:
             db = env.db
         self.env = env
         self.__db = db
-        self.trie = SecureTrie(Trie(self.db, root))
+        # trie nodes of the state and the storage of its accounts not written to db yet
+        self.dirty_nodes = {}
+        self.trie = SecureTrie(Trie(self.db, root, dirty_nodes=self.dirty_nodes))
         for k, v in STATE_DEFAULTS.items():
             setattr(self, k, kwargs.get(k, copy.copy(v)))
         self.journal = []
@@ -238,6 +272,7 @@ class State:
                 env=self.env,
                 address=address,
                 db=self.db,
+                dirty_nodes=self.dirty_nodes,
             )
         else:
             o = Account.blank_account(
@@ -246,6 +281,7 @@ class State:
                 self.full_shard_id,
                 self.config["ACCOUNT_INITIAL_NONCE"],
                 db=self.db,
+                dirty_nodes=self.dirty_nodes,
             )
         self.cache[address] = o
         o._mutable = True
@@ -441,13 +477,23 @@ class State:
     def account_to_dict(self, address):
         return self.get_and_cache_account(utils.normalize_address(address)).to_dict()
 
-    def commit(self, allow_empties=False):
+    def commit(self, allow_empties=False, flush=True, keep_cache=False):
+        """ Update the tries with the cached accounts.
+        If flush is False, the new trie nodes are kept in memory, e.g., when committing
+        after each tx, and written to db (only those reachable from the latest root)
+        by the next commit with flush.
+        If keep_cache is True, the accounts stay cached as if read from the tries just
+        committed (i.e., untouched and not deleted), so that the state root reflects the
+        changes so far without reloading the accounts for the following txs, e.g., of a
+        block built incrementally.
+        """
         for addr, acct in self.cache.items():
             if acct.touched or acct.deleted:
                 acct.commit()
                 self.deletes.extend(acct.storage_trie.deletes)
                 self.changed[addr] = True
-                if self.account_exists(addr) or allow_empties:
+                exists = self.account_exists(addr) or allow_empties
+                if exists:
                     _acct = _Account(
                         acct.nonce,
                         acct.balance,
@@ -465,10 +511,26 @@ class State:
                             self.db.remove(b"address:" + addr)
                         except KeyError:
                             pass
+                if keep_cache:
+                    acct.touched = False
+                    acct.deleted = False
+                    acct.existent_at_start = exists
         self.deletes.extend(self.trie.deletes)
         self.trie.deletes = []
-        self.cache = {}
+        if not keep_cache:
+            self.cache = {}
         self.journal = []
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """ Write the trie nodes reachable from the state root to db in one batch """
+
+        def collect_storage_nodes(rlpdata, nodes):
+            storage = rlp.decode(rlpdata, _Account).storage
+            self.trie.trie.collect_dirty_nodes(storage, nodes)
+
+        self.trie.flush(on_leaf=collect_storage_nodes)
 
     def to_dict(self):
         for addr in self.trie.to_dict().keys():
@@ -590,7 +652,11 @@ class State:
 
     def ephemeral_clone(self):
         snapshot = self.to_snapshot(root_only=True, no_prevblocks=True)
-        env2 = Env(OverlayDb(self.db), self.env.config)
+        overlay_db = OverlayDb(self.db)
+        # the clone must see the nodes not flushed yet
+        for k, v in self.dirty_nodes.items():
+            overlay_db.put(k, v)
+        env2 = Env(overlay_db, self.env.config)
         s = State.from_snapshot(snapshot, env2)
         for param in STATE_DEFAULTS:
             setattr(s, param, getattr(self, param))
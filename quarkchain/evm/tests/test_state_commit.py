@@ -0,0 +1,24 @@
+import os
+import unittest
+
+from quarkchain.evm.state import State
+
+
+class TestStateCommit(unittest.TestCase):
+
+    def test_commit_keep_cache(self):
+        state = State()
+        address = os.urandom(20)
+        state.set_balance(address, 1)
+        state.commit()
+        state.del_account(address)
+        state.commit(keep_cache=True)
+        self.assertFalse(state.account_exists(address))
+
+        # the deleted account is committed only once
+        acct = state.cache[address]
+        self.assertFalse(acct.deleted)
+        self.assertFalse(acct.existent_at_start)
+        state.changed = {}
+        state.commit(keep_cache=True)
+        self.assertEqual(state.changed, {})
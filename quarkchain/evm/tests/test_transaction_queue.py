@@ -1,12 +1,15 @@
+import os
 import unittest
 
 from quarkchain.evm.transactions import Transaction
 from quarkchain.evm.transaction_queue import OrderableTx, TransactionQueue
 
 
-def make_test_tx(s=100000, g=50, data=b'', nonce=0):
-        return Transaction(nonce=nonce, startgas=s, gasprice=g,
-                           value=0, data=data, to=b'\x35' * 20)
+def make_test_tx(s=100000, g=50, data=b'', nonce=0, sender=None):
+        tx = Transaction(nonce=nonce, startgas=s, gasprice=g,
+                         value=0, data=data, to=b'\x35' * 20)
+        tx.sender = sender or os.urandom(20)
+        return tx
 
 
 class TestTransactionQueue(unittest.TestCase):
@@ -26,8 +29,9 @@ class TestTransactionQueue(unittest.TestCase):
                       (30000, None, None),
                       (999999, 50000, 74)]
         # Add transactions to queue
-        for param in params:
-            q.add_transaction(make_test_tx(s=param[0], g=param[1]))
+        # (distinct nonces so that the identical pairs have distinct hashes)
+        for i, param in enumerate(params):
+            q.add_transaction(make_test_tx(s=param[0], g=param[1], nonce=i))
         # Attempt pops from queue
         for (maxgas, expected_s, expected_g) in operations:
             tx = q.pop_transaction(max_gas=maxgas)
@@ -37,24 +41,80 @@ class TestTransactionQueue(unittest.TestCase):
                 assert expected_s is expected_g is None
         print('Test successful')
 
-    def test_diff(self):
+    def test_remove_transaction(self):
         tx1 = make_test_tx(data=b'foo')
         tx2 = make_test_tx(data=b'bar')
         tx3 = make_test_tx(data=b'baz')
         tx4 = make_test_tx(data=b'foobar')
-        q1 = TransactionQueue()
+        q = TransactionQueue()
         for tx in [tx1, tx2, tx3, tx4]:
-            q1.add_transaction(tx)
-        q2 = q1.diff([tx2])
-        assert len(q2) == 3
-        assert tx1 in [item.tx for item in q2.txs]
-        assert tx3 in [item.tx for item in q2.txs]
-        assert tx4 in [item.tx for item in q2.txs]
-
-        q3 = q2.diff([tx4])
-        assert len(q3) == 2
-        assert tx1 in [item.tx for item in q3.txs]
-        assert tx3 in [item.tx for item in q3.txs]
+            q.add_transaction(tx)
+        assert q.remove_transaction(tx2.hash) == tx2
+        assert len(q) == 3
+        assert tx2.hash not in q
+        assert set(q) == {tx1, tx3, tx4}
+
+        assert q.remove_transaction(tx4.hash) == tx4
+        assert q.remove_transaction(tx4.hash) is None
+        assert len(q) == 2
+        assert set(q) == {tx1, tx3}
+        assert q.get_transaction(tx1.hash) == tx1
+        assert q.get_transaction(tx4.hash) is None
+
+        # removed tx should not be popped
+        assert {q.pop_transaction(), q.pop_transaction()} == {tx1, tx3}
+        assert q.pop_transaction() is None
+        assert len(q) == 0
+
+    def test_sender_nonce_order(self):
+        sender1, sender2 = os.urandom(20), os.urandom(20)
+        q = TransactionQueue()
+        # the cheaper tx of sender1 blocks its pricier successor
+        txs = [
+            make_test_tx(g=100, nonce=1, sender=sender1),
+            make_test_tx(g=10, nonce=0, sender=sender1),
+            make_test_tx(g=50, nonce=0, sender=sender2),
+            make_test_tx(g=60, nonce=1, sender=sender2),
+        ]
+        for tx in txs:
+            assert q.add_transaction(tx)
+        assert q.get_transactions_by_sender(sender1) == [txs[1], txs[0]]
+        popped = [q.pop_transaction() for _ in range(4)]
+        assert popped == [txs[2], txs[3], txs[1], txs[0]]
+        assert q.pop_transaction() is None
+
+        # putting a popped tx back makes it the head again
+        for tx in txs:
+            q.add_transaction(tx)
+        assert q.pop_transaction() == txs[2]
+        q.add_transaction(txs[2])
+        assert q.pop_transaction() == txs[2]
+
+    def test_replace_transaction(self):
+        sender = os.urandom(20)
+        q = TransactionQueue()
+        tx1 = make_test_tx(g=50, sender=sender, data=b'foo')
+        tx2 = make_test_tx(g=49, sender=sender, data=b'bar')
+        tx3 = make_test_tx(g=50, sender=sender, data=b'baz')
+        assert q.add_transaction(tx1)
+        assert not q.add_transaction(tx1)
+        # same nonce but priced lower
+        assert not q.add_transaction(tx2)
+        assert q.add_transaction(tx3)
+        assert len(q) == 1
+        assert tx1.hash not in q
+        assert q.get_transactions_by_sender(sender) == [tx3]
+        assert q.pop_transaction() == tx3
+        assert q.pop_transaction() is None
+
+    def test_custom_hash(self):
+        q = TransactionQueue()
+        tx = make_test_tx()
+        assert q.add_transaction(tx, tx_hash=b'\x01' * 32)
+        assert b'\x01' * 32 in q
+        assert tx.hash not in q
+        assert q.remove_transaction(b'\x01' * 32) == tx
+        assert len(q) == 0
 
     def test_orderable_tx(self):
         assert OrderableTx(-1, 0, None) < OrderableTx(0, 0, None)
@@ -67,8 +127,9 @@ class TestTransactionQueue(unittest.TestCase):
         count = 10
         # Add <count> transactions to the queue, all with the same
         # startgas/gasprice but with sequential nonces.
+        sender = os.urandom(20)
         for i in range(count):
-            q.add_transaction(make_test_tx(nonce=i))
+            q.add_transaction(make_test_tx(nonce=i, sender=sender))
 
         expected_nonce_order = [i for i in range(count)]
         nonces = []
@@ -78,3 +139,60 @@ class TestTransactionQueue(unittest.TestCase):
         # Since they have the same gasprice they should have the same priority and
         # thus be popped in the order they were inserted.
         assert nonces == expected_nonce_order
+
+    def test_evict_lowest_price(self):
+        q = TransactionQueue(max_size=3)
+        txs = [make_test_tx(g=g) for g in [50, 30, 40]]
+        for tx in txs:
+            assert q.add_transaction(tx)
+        # not worth more than the cheapest pending tx
+        assert not q.add_transaction(make_test_tx(g=30, data=b'foo'))
+        assert (q.num_evicted, q.num_rejected) == (0, 1)
+
+        tx = make_test_tx(g=31)
+        assert q.add_transaction(tx)
+        assert len(q) == 3
+        assert txs[1].hash not in q
+        assert (q.num_evicted, q.num_rejected) == (1, 1)
+        assert [q.pop_transaction() for _ in range(3)] == [txs[0], txs[2], tx]
+
+    def test_evict_non_executable_first(self):
+        sender = os.urandom(20)
+        q = TransactionQueue(max_size=3)
+        head = make_test_tx(g=10, nonce=0, sender=sender)
+        tail = make_test_tx(g=100, nonce=1, sender=sender)
+        other = make_test_tx(g=20)
+        for tx in [head, tail, other]:
+            assert q.add_transaction(tx)
+
+        # a cheaper executable tx evicts the tail of the sender, not the cheaper head
+        tx = make_test_tx(g=15)
+        assert q.add_transaction(tx)
+        assert tail.hash not in q
+        assert head.hash in q
+
+        # only executable txs are left, so the cheapest one is evicted
+        tx2 = make_test_tx(g=11)
+        assert q.add_transaction(tx2)
+        assert head.hash not in q
+        # and a non-executable tx is not worth any of them
+        assert not q.add_transaction(
+            make_test_tx(g=1000, nonce=1, sender=tx2.sender))
+        assert set(q) == {other, tx, tx2}
+        assert (q.num_evicted, q.num_rejected) == (2, 1)
+
+    def test_sender_limit(self):
+        sender = os.urandom(20)
+        q = TransactionQueue(max_size_per_sender=2)
+        txs = [make_test_tx(nonce=i, sender=sender) for i in range(4)]
+        assert q.add_transaction(txs[1])
+        assert q.add_transaction(txs[2])
+        assert not q.add_transaction(txs[3])
+        # a lower nonce evicts the highest one
+        assert q.add_transaction(txs[0])
+        assert q.get_transactions_by_sender(sender) == txs[0:2]
+        assert (q.num_evicted, q.num_rejected) == (1, 1)
+        # replacing a pending tx does not count towards the limit
+        tx = make_test_tx(g=60, nonce=1, sender=sender)
+        assert q.add_transaction(tx)
+        assert q.get_transactions_by_sender(sender) == [txs[0], tx]
@@ -3,6 +3,7 @@ import json
 import quarkchain.evm.trie as trie
 from quarkchain.db import InMemoryDb
 import itertools
+from quarkchain import utils
 from quarkchain.utils import Logger
 import unittest
 
@@ -34,6 +35,7 @@ def load_tests_dict():
 def load_tests(loader, tests, pattern):
     # python3 unittest interface
     suite = unittest.TestSuite()
+    suite.addTests(tests)
     for key, pairs in load_tests_dict().items():
         test = unittest.FunctionTestCase((lambda key, pairs: lambda: run_test(key, pairs))(key, pairs), description=key)
         suite.addTests([test])
@@ -75,6 +77,87 @@ def run_test(name, pairs):
                 name, pairs['root'], '0x' + t.root_hash.hex(), (i, list(permut) + deletes)))
 
 
+class TestDirtyNodes(unittest.TestCase):
+
+    def test_flush(self):
+        kvs = [(utils.sha3_256(bytes([i])), bytes([i]) * 40) for i in range(100)]
+
+        db = InMemoryDb()
+        t = trie.Trie(db, dirty_nodes=dict())
+        for k, v in kvs:
+            t.update(k, v)
+        self.assertEqual(len(db.kv), 0)
+        self.assertEqual(t.get(kvs[0][0]), kvs[0][1])
+        t.flush()
+        self.assertEqual(len(t.dirty_nodes), 0)
+
+        # same root as a write-through trie with fewer nodes written
+        db2 = InMemoryDb()
+        t2 = trie.Trie(db2)
+        for k, v in kvs:
+            t2.update(k, v)
+        self.assertEqual(t.root_hash, t2.root_hash)
+        self.assertLess(len(db.kv), len(db2.kv))
+
+        # all the nodes reachable from the root are written
+        t3 = trie.Trie(db, t.root_hash)
+        for k, v in kvs:
+            self.assertEqual(t3.get(k), v)
+
+        # only nodes of the new root are written on the next flush
+        t.update(kvs[0][0], b"new value")
+        t.update(kvs[0][0], b"another new value")
+        t.flush()
+        t3 = trie.Trie(db, t.root_hash)
+        self.assertEqual(t3.get(kvs[0][0]), b"another new value")
+        self.assertEqual(t3.get(kvs[1][0]), kvs[1][1])
+
+
+class TestNodeCache(unittest.TestCase):
+
+    def test_node_cache(self):
+        db = InMemoryDb()
+        t = trie.Trie(db)
+        kvs = [(utils.sha3_256(bytes([i])), bytes([i]) * 40) for i in range(20)]
+        for k, v in kvs:
+            t.update(k, v)
+
+        trie.node_cache.clear()
+        hits = trie.node_cache.hits
+        t1 = trie.Trie(db, t.root_hash)
+        t2 = trie.Trie(db, t.root_hash)
+        self.assertGreater(trie.node_cache.hits, hits)
+        self.assertEqual(t1.get(kvs[0][0]), kvs[0][1])
+        self.assertEqual(t2.get(kvs[0][0]), kvs[0][1])
+
+        # updating a trie must not change the cached nodes seen by another trie
+        t1.update(kvs[0][0], b"new value")
+        self.assertEqual(t2.get(kvs[0][0]), kvs[0][1])
+        self.assertEqual(trie.Trie(db, t.root_hash).get(kvs[0][0]), kvs[0][1])
+
+
+class TestIterFrom(unittest.TestCase):
+
+    def test_iter_from(self):
+        t = trie.Trie(InMemoryDb())
+        self.assertEqual(list(t.iter_from()), [])
+
+        # keys of different lengths for the values in branch, extension and leaf nodes
+        keys = [b"\x01", b"\x01\x02", b"\x01\x02\x03", b"\x01\x03", b"\x02"]
+        keys += [utils.sha3_256(bytes([i])) for i in range(50)]
+        kvs = sorted((k, k * 2) for k in keys)
+        for k, v in kvs:
+            t.update(k, v)
+
+        self.assertEqual(list(t.iter_from()), kvs)
+        for start in [b"", b"\x00", b"\x01", b"\x01\x02\x00", b"\x01\x04", b"\xff"]:
+            self.assertEqual(
+                list(t.iter_from(start)), [(k, v) for k, v in kvs if k >= start])
+        # a range continues after the last key
+        k = kvs[10][0]
+        self.assertEqual(list(t.iter_from(k + b"\x00")), kvs[11:])
+
+
 if __name__ == '__main__':
     for name, pairs in load_tests_dict().items():
         run_test(name, pairs)
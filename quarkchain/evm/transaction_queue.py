@@ -5,10 +5,11 @@ PRIO_INFINITY = -2**100
 
 class OrderableTx(object):
 
-    def __init__(self, prio, counter, tx):
+    def __init__(self, prio, counter, tx, tx_hash=None):
         self.prio = prio
         self.counter = counter
         self.tx = tx
+        self.tx_hash = tx_hash
 
     def __lt__(self, other):
         if self.prio < other.prio:
@@ -19,53 +20,232 @@ class OrderableTx(object):
             return False
 
 
-class TransactionQueue():
+class SenderQueue():
+    """ Pending transactions of a sender ordered by nonce """
 
     def __init__(self):
-        self.counter = 0
-        self.txs = []
-        self.aside = []
+        self.txs = dict()  # nonce -> OrderableTx
+        self.nonces = []  # heap of nonces, may contain removed ones
 
     def __len__(self):
         return len(self.txs)
 
-    def add_transaction(self, tx, force=False):
+    def get(self, nonce):
+        return self.txs.get(nonce)
+
+    def put(self, item):
+        self.txs[item.tx.nonce] = item
+        heapq.heappush(self.nonces, item.tx.nonce)
+
+    def remove(self, nonce):
+        del self.txs[nonce]
+
+    def head(self):
+        """ The transaction with the lowest nonce, i.e., the only executable one """
+        while self.nonces and self.nonces[0] not in self.txs:
+            heapq.heappop(self.nonces)
+        return self.txs[self.nonces[0]] if self.nonces else None
+
+    def tail(self):
+        """ The transaction with the highest nonce, i.e., the first one to evict """
+        return self.txs[max(self.txs)] if self.txs else None
+
+    def values(self):
+        return [self.txs[nonce] for nonce in sorted(self.txs)]
+
+
+class TransactionQueue():
+    """ Pending transactions indexed by hash and by sender.
+
+    The transactions of a sender are queued by nonce and only the head of each sender
+    queue is executable, so only the heads are kept in the heap ordered by gas price.
+    A transaction replaces the pending one with the same sender and nonce unless it
+    pays a lower gas price.  Entries in the heaps are invalidated lazily, which makes
+    adding and removing a transaction O(log n).
+
+    Once the queue holds max_size transactions, a new one evicts the cheapest tail of
+    the sender queues, where the non-executable tails (of senders with more than one
+    pending tx) go before the executable ones, or is rejected if it is not worth more
+    than that tail.  A sender holds at most max_size_per_sender transactions.
+    """
+
+    def __init__(self, max_size=None, max_size_per_sender=None):
+        self.max_size = max_size
+        self.max_size_per_sender = max_size_per_sender
+        self.counter = 0
+        self.tx_dict = dict()  # tx hash -> OrderableTx
+        self.sender_dict = dict()  # sender -> SenderQueue
+        self.txs = []  # heap of the executable heads by price
+        self.aside = []  # heap of the heads put aside by startgas
+        self.tails = []  # heap of the sender tails by (executable, price) to evict
+        self.num_evicted = 0
+        self.num_rejected = 0
+
+    def __len__(self):
+        return len(self.tx_dict)
+
+    def __contains__(self, tx_hash):
+        return tx_hash in self.tx_dict
+
+    def __iter__(self):
+        return (item.tx for item in self.tx_dict.values())
+
+    def get_transaction(self, tx_hash):
+        item = self.tx_dict.get(tx_hash)
+        return item.tx if item else None
+
+    def get_transactions_by_sender(self, sender):
+        """ Pending transactions of the sender in nonce order """
+        queue = self.sender_dict.get(sender)
+        return [item.tx for item in queue.values()] if queue else []
+
+    def add_transaction(self, tx, force=False, tx_hash=None):
+        """ tx_hash: the key to index the tx, defaults to the hash of the evm tx
+        Returns False if the tx is already in the queue or is priced lower than the
+        pending tx with the same sender and nonce.
+        """
+        if tx_hash is None:
+            tx_hash = tx.hash
+        if tx_hash in self.tx_dict:
+            return False
+
+        queue = self.sender_dict.get(tx.sender)
+        replaced = queue.get(tx.nonce) if queue else None
+        if replaced is not None:
+            if not force and tx.gasprice < replaced.tx.gasprice:
+                return False
+            self.remove_transaction(replaced.tx_hash)
+        elif not self.__make_room(tx, queue):
+            self.num_rejected += 1
+            return False
+
         prio = PRIO_INFINITY if force else -tx.gasprice
-        heapq.heappush(self.txs, OrderableTx(prio, self.counter, tx))
+        item = OrderableTx(prio, self.counter, tx, tx_hash)
         self.counter += 1
+        self.tx_dict[tx_hash] = item
+        queue = self.sender_dict.setdefault(tx.sender, SenderQueue())
+        queue.put(item)
+        if queue.head() is item:
+            heapq.heappush(self.txs, item)
+        self.__push_tail(queue)
+        return True
+
+    def __make_room(self, tx, queue):
+        """ Evict the transactions needed to add tx to the queue of its sender.
+        Returns False if tx should be rejected instead.
+        """
+        if (
+            queue
+            and self.max_size_per_sender
+            and len(queue) >= self.max_size_per_sender
+        ):
+            tail = queue.tail()
+            if tx.nonce > tail.tx.nonce:
+                return False
+            self.__evict(tail)
+
+        if self.max_size is None or len(self.tx_dict) < self.max_size:
+            return True
+        tail = self.__peek_tail()
+        if tail is None:
+            return False
+        queue = self.sender_dict.get(tx.sender)
+        executable = queue is None or tx.nonce < queue.head().tx.nonce
+        if (executable, tx.gasprice) <= tail.prio:
+            return False
+        self.__evict(tail)
+        return True
+
+    def __evict(self, item):
+        self.remove_transaction(item.tx_hash)
+        self.num_evicted += 1
+
+    def __push_tail(self, queue):
+        tail = queue.tail()
+        heapq.heappush(
+            self.tails,
+            OrderableTx(
+                (len(queue) == 1, tail.tx.gasprice),
+                tail.counter,
+                tail.tx,
+                tail.tx_hash,
+            ),
+        )
+
+    def __peek_tail(self):
+        """ The cheapest tail of the sender queues, non-executable ones first """
+        while self.tails:
+            item = heapq.heaptop(self.tails)
+            queue = self.sender_dict.get(item.tx.sender)
+            tail = queue.tail() if queue else None
+            if (
+                tail is not None
+                and tail.tx_hash == item.tx_hash
+                and item.prio[0] == (len(queue) == 1)
+            ):
+                return item
+            heapq.heappop(self.tails)
+        return None
+
+    def remove_transaction(self, tx_hash):
+        """ Returns the removed tx or None if it is not in the queue """
+        item = self.tx_dict.pop(tx_hash, None)
+        if item is None:
+            return None
+
+        queue = self.sender_dict[item.tx.sender]
+        is_head = queue.head() is item
+        queue.remove(item.tx.nonce)
+        if not queue:
+            del self.sender_dict[item.tx.sender]
+        else:
+            if is_head:
+                heapq.heappush(self.txs, queue.head())
+            self.__push_tail(queue)
+        self.__compact()
+        return item.tx
+
+    def __is_executable(self, item):
+        """ Whether the heap entry is still the head of its sender queue """
+        queue = self.sender_dict.get(item.tx.sender)
+        if queue is None:
+            return False
+        head = queue.head()
+        return head is not None and head.tx_hash == item.tx_hash
+
+    def __compact(self):
+        """ Rebuild the heaps once most of the entries are invalidated """
+        num_entries = len(self.txs) + len(self.aside) + len(self.tails)
+        if num_entries <= 4 * len(self.sender_dict) + 1024:
+            return
+        self.txs = [queue.head() for queue in self.sender_dict.values()]
+        heapq.heapify(self.txs)
+        self.aside = []
+        self.tails = []
+        for queue in self.sender_dict.values():
+            self.__push_tail(queue)
 
     def pop_transaction(self, max_gas=9999999999,
                         max_seek_depth=16, min_gasprice=0):
         while len(self.aside) and max_gas >= heapq.heaptop(self.aside).prio:
             item = heapq.heappop(self.aside)
-            item.prio = -item.tx.gasprice
-            heapq.heappush(self.txs, item)
-        for i in range(min(len(self.txs), max_seek_depth)):
+            if self.__is_executable(item):
+                heapq.heappush(self.txs, self.tx_dict[item.tx_hash])
+        seek_depth = 0
+        while len(self.txs) and seek_depth < max_seek_depth:
             item = heapq.heaptop(self.txs)
+            if self.tx_dict.get(item.tx_hash) is not item or not self.__is_executable(item):
+                heapq.heappop(self.txs)
+                continue
+            seek_depth += 1
             if item.tx.startgas > max_gas:
                 heapq.heappop(self.txs)
-                item.prio = item.tx.startgas
-                heapq.heappush(self.aside, item)
+                heapq.heappush(
+                    self.aside,
+                    OrderableTx(item.tx.startgas, item.counter, item.tx, item.tx_hash))
             elif item.tx.gasprice >= min_gasprice or item.prio == PRIO_INFINITY:
                 heapq.heappop(self.txs)
-                return item.tx
+                return self.remove_transaction(item.tx_hash)
             else:
                 return None
         return None
-
-    def peek(self, num=None):
-        if num:
-            return self.txs[0:num]
-        else:
-            return self.txs
-
-    def diff(self, txs):
-        remove_hashes = [tx.hash for tx in txs]
-        keep_txs = [item for item in self.txs if item.tx.hash not in remove_hashes]
-        keep_aside = [item for item in self.aside if item.tx.hash not in remove_hashes]
-        q = TransactionQueue()
-        q.txs = keep_txs
-        q.aside = keep_aside
-        heapq.heapify(q.txs)
-        heapq.heapify(q.aside)
-        return q
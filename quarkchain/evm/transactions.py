@@ -9,7 +9,7 @@ from rlp.sedes import big_endian_int, binary, BigEndianInt
 from quarkchain.rlp.utils import str_to_bytes, ascii_chr
 
 from quarkchain.evm import opcodes
-from quarkchain.utils import sha3_256, is_p2, check
+from quarkchain.utils import sha3_256, is_p2, check, LRUCache
 from quarkchain.evm.solidity_abi_utils import tx_to_typed_data, typed_signature_hash
 
 # in the yellow paper it is specified that s should be smaller than
@@ -17,6 +17,12 @@ from quarkchain.evm.solidity_abi_utils import tx_to_typed_data, typed_signature_
 secpk1n = 115792089237316195423570985008687907852837564279074904382605163141518161494337
 null_address = b'\xff' * 20
 
+# senders recovered from the signatures keyed by tx hash shared by all the tx objects
+# in the process, so that decoding a tx again (e.g., from a block that includes a tx
+# validated when it was added to the tx queue) does not repeat the ECDSA recovery
+SENDER_CACHE_SIZE = 65536
+sender_cache = LRUCache(SENDER_CACHE_SIZE)
+
 
 class Transaction(rlp.Serializable):
 
@@ -103,18 +109,25 @@ class Transaction(rlp.Serializable):
             if self.r == 0 and self.s == 0:
                 self._sender = null_address
             else:
-                if self.r >= secpk1n or self.s >= secpk1n or self.r == 0 or self.s == 0:
-                    raise InvalidTransaction("Invalid signature values!")
-                if self.version == 0:
-                    pub = ecrecover_to_pub(self.hash_unsigned, self.v, self.r, self.s)
-                if self.version == 1:
-                    pub = ecrecover_to_pub(self.hash_typed, self.v, self.r, self.s)
-                if pub == b'\x00' * 64:
-                    raise InvalidTransaction(
-                        "Invalid signature (zero privkey cannot sign)")
-                self._sender = sha3_256(pub)[-20:]
+                tx_hash = self.hash
+                self._sender = sender_cache.get(tx_hash)
+                if self._sender is None:
+                    self._sender = self.__recover_sender()
+                    sender_cache.put(tx_hash, self._sender)
         return self._sender
 
+    def __recover_sender(self):
+        if self.r >= secpk1n or self.s >= secpk1n or self.r == 0 or self.s == 0:
+            raise InvalidTransaction("Invalid signature values!")
+        if self.version == 0:
+            pub = ecrecover_to_pub(self.hash_unsigned, self.v, self.r, self.s)
+        if self.version == 1:
+            pub = ecrecover_to_pub(self.hash_typed, self.v, self.r, self.s)
+        if pub == b'\x00' * 64:
+            raise InvalidTransaction(
+                "Invalid signature (zero privkey cannot sign)")
+        return sha3_256(pub)[-20:]
+
     @sender.setter
     def sender(self, value):
         self._sender = value
@@ -141,16 +141,32 @@ def is_key_value_type(node_type):
 BLANK_NODE = b''
 BLANK_ROOT = utils.sha3_256(rlp.encode(b''))
 
+# decoded nodes keyed by node hash shared by all the tries in the process,
+# bounded by the total size in bytes of the rlp encodings of the nodes, not the
+# memory taken by the decoded nodes, which is a few times larger
+NODE_CACHE_SIZE = 32 * 1024 * 1024
+node_cache = utils.LRUCache(NODE_CACHE_SIZE)
+
+
+def _copy_node(node):
+    """ nodes are updated in place so the cached ones must not be handed out """
+    return [_copy_node(item) if isinstance(item, list) else item
+            for item in node]
+
 
 class Trie(object):
 
-    def __init__(self, db, root_hash=BLANK_ROOT):
+    def __init__(self, db, root_hash=BLANK_ROOT, dirty_nodes=None):
         """it also present a dictionary like interface
 
         :param db key value database
         :root: blank or trie node in form of [key, value] or [v0,v1..v15,v]
+        :param dirty_nodes: if not None, new nodes are kept in this dict
+            (hash -> rlp) instead of being written to db until flush().
+            The dict can be shared by several tries over the same db.
         """
         self.db = db  # Pass in a database object directly
+        self.dirty_nodes = dirty_nodes
         self.set_root_hash(root_hash)
         self.deletes = []
 
@@ -179,9 +195,63 @@ class Trie(object):
     def _update_root_hash(self):
         val = rlp_encode(self.root_node)
         key = utils.sha3_256(val)
-        self.db.put(key, val)
+        self._put_node(key, val)
         self._root_hash = key
 
+    def _put_node(self, key, value):
+        if self.dirty_nodes is None:
+            self.db.put(key, value)
+        else:
+            self.dirty_nodes[key] = value
+
+    def _get_node(self, key):
+        if self.dirty_nodes is not None and key in self.dirty_nodes:
+            return self.dirty_nodes[key]
+        return self.db[key]
+
+    def collect_dirty_nodes(self, root_hash, nodes, on_leaf=None):
+        """ add the dirty nodes reachable from root_hash to nodes (hash -> rlp)
+
+        :param on_leaf: called with (value, nodes) for each value in a dirty
+            node, e.g., to follow the storage tries of the accounts
+        """
+        self._collect_dirty_nodes(root_hash, nodes, on_leaf)
+        return nodes
+
+    def _collect_dirty_nodes(self, encoded, nodes, on_leaf):
+        if isinstance(encoded, list):
+            node = encoded
+        else:
+            rlpnode = self.dirty_nodes.get(encoded)
+            if rlpnode is None:
+                # blank or already in db, and so is the sub-tree
+                return
+            nodes[encoded] = rlpnode
+            node = rlp.decode(rlpnode)
+
+        node_type = self._get_node_type(node)
+        if node_type == NODE_TYPE_BRANCH:
+            for item in node[:16]:
+                self._collect_dirty_nodes(item, nodes, on_leaf)
+            if node[16] and on_leaf:
+                on_leaf(node[16], nodes)
+        elif node_type == NODE_TYPE_EXTENSION:
+            self._collect_dirty_nodes(node[1], nodes, on_leaf)
+        elif node_type == NODE_TYPE_LEAF and on_leaf:
+            on_leaf(node[1], nodes)
+
+    def flush(self, on_leaf=None):
+        """ write the dirty nodes reachable from the current root to db in one
+        batch and drop all the others (e.g., nodes of intermediate roots)
+        """
+        if self.dirty_nodes is None:
+            return
+        nodes = self.collect_dirty_nodes(self._root_hash, dict(), on_leaf)
+        with self.db.write_batch():
+            for key, value in nodes.items():
+                self.db.put(key, value)
+        self.dirty_nodes.clear()
+
     @root_hash.setter
     def root_hash(self, value):
         self.set_root_hash(value)
@@ -222,7 +292,7 @@ class Trie(object):
 
         hashkey = utils.sha3_256(rlpnode)
         if put_in_db:
-            self.db.put(hashkey, rlpnode)
+            self._put_node(hashkey, rlpnode)
         return hashkey
 
     def _decode_to_node(self, encoded):
@@ -230,8 +300,12 @@ class Trie(object):
             return BLANK_NODE
         if isinstance(encoded, list):
             return encoded
-        o = rlp.decode(self.db[encoded])
-        return o
+        o = node_cache.get(encoded)
+        if o is None:
+            rlpnode = self._get_node(encoded)
+            o = rlp.decode(rlpnode)
+            node_cache.put(encoded, o, len(rlpnode))
+        return _copy_node(o)
 
     def _get_node_type(self, node):
         """ get node type and content
@@ -836,6 +910,51 @@ class Trie(object):
             key = nibbles_to_bin(without_terminator(nibbles))
             yield key, value
 
+    def _iter_from(self, node, start, path):
+        """yield (key, value) stored in this and the descendant nodes in the
+        order of the keys, skipping the keys less than path + start
+
+        :param start: nibbles of the lower bound after path, which is empty
+            if all the keys under path are not less than the bound
+        """
+        node_type = self._get_node_type(node)
+
+        if node_type == NODE_TYPE_BLANK:
+            return
+
+        if node_type == NODE_TYPE_BRANCH:
+            # the key of the value is path, which is less than its children
+            if node[16] and not start:
+                yield path, node[16]
+            for i in range(16):
+                if start and i < start[0]:
+                    continue
+                sub_start = start[1:] if start and i == start[0] else []
+                sub_node = self._decode_to_node(node[i])
+                yield from self._iter_from(sub_node, sub_start, path + [i])
+            return
+
+        key = without_terminator(unpack_to_nibbles(node[0]))
+        if node_type == NODE_TYPE_LEAF:
+            if key >= start:
+                yield path + key, node[1]
+            return
+
+        # extension
+        if key < start[:len(key)]:
+            return
+        sub_start = start[len(key):] if key == start[:len(key)] else []
+        sub_node = self._decode_to_node(node[1])
+        yield from self._iter_from(sub_node, sub_start, path + key)
+
+    def iter_from(self, start_key=b''):
+        """yield (key, value) in the order of the keys, from the first key not
+        less than start_key, e.g., to serve the trie in ranges
+        """
+        for nibbles, value in self._iter_from(
+                self.root_node, bin_to_nibbles(start_key), []):
+            yield nibbles_to_bin(nibbles), value
+
     def _to_dict(self, node):
         """convert (key, value) stored in this and the descendant nodes
         to dict items.
@@ -942,6 +1061,8 @@ class Trie(object):
     def root_hash_valid(self):
         if self.root_hash == BLANK_ROOT:
             return True
+        if self.dirty_nodes is not None and self.root_hash in self.dirty_nodes:
+            return True
         return self.root_hash in self.db
 
 
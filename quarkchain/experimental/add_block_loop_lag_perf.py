@@ -0,0 +1,80 @@
+# Lag of the event loop while a large minor block is added
+#
+# Adds a block with many txs to a ShardState while an EventLoopLagMonitor samples the
+# event loop, once running ShardState.add_block() on the loop as Shard.add_block() used
+# to, and once in a single-thread executor as Shard.run_state_op() does, and reports
+# the max and average lag of the loop.
+
+import argparse
+import asyncio
+import profile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from quarkchain.cluster.tests.test_utils import (
+    create_shard_state_with_accounts,
+    create_transfer_block,
+)
+from quarkchain.core import Address, ByteBuffer, Identity, MinorBlock
+from quarkchain.evm import transactions
+from quarkchain.utils import EventLoopLagMonitor
+
+
+def run(block_data, acc, executor):
+    # a fresh state and block so that no sender is recovered yet
+    transactions.sender_cache.clear()
+    state = create_shard_state_with_accounts([acc])
+    block = MinorBlock.deserialize(ByteBuffer(block_data))
+    loop = asyncio.get_event_loop()
+    monitor = EventLoopLagMonitor(interval=0.01, warning_lag=float("inf"), loop=loop)
+
+    async def add_block():
+        await asyncio.sleep(0.1)
+        monitor.reset()
+        start_time = time.time()
+        if executor is None:
+            state.add_block(block)
+        else:
+            await loop.run_in_executor(executor, state.add_block, block)
+        duration = time.time() - start_time
+        await asyncio.sleep(0.02)
+        return duration
+
+    monitor.start()
+    duration = loop.run_until_complete(add_block())
+    monitor.stop()
+    return duration, monitor
+
+
+def test_perf(num_tx=5000):
+    identity = Identity.create_random_identity()
+    acc = Address.create_from_identity(identity, full_shard_id=0)
+    print("Creating a block with %d tx" % num_tx)
+    state = create_shard_state_with_accounts([acc])
+    block_data = create_transfer_block(state, identity, acc, num_tx).serialize()
+
+    for name, executor in [
+        ("on the event loop", None),
+        ("in the state thread", ThreadPoolExecutor(max_workers=1)),
+    ]:
+        duration, monitor = run(block_data, acc, executor)
+        print(
+            "Block added %s in %.2f seconds, loop lag max %.3f avg %.3f seconds"
+            % (name, duration, monitor.max_lag, monitor.average_lag())
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_tx", default=5000, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run("test_perf({})".format(args.num_tx))
+    else:
+        test_perf(args.num_tx)
+
+
+if __name__ == "__main__":
+    main()
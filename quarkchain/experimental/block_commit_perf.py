@@ -0,0 +1,67 @@
+# Performance of committing minor blocks to a rocksdb database
+#
+# Compares ShardState.add_block() with all the writes of a block grouped into one
+# rocksdb WriteBatch against issuing one rocksdb write per key.
+
+import argparse
+import contextlib
+import profile
+import tempfile
+import time
+
+from quarkchain.cluster.tests.test_utils import (
+    get_test_env,
+    create_shard_state_with_accounts,
+    create_transfer_block,
+)
+from quarkchain.core import Address, Identity
+from quarkchain.db import PersistentDb
+
+
+class UnbatchedPersistentDb(PersistentDb):
+    """ Issue one rocksdb write per key, i.e., ignore write_batch() """
+
+    @contextlib.contextmanager
+    def write_batch(self):
+        yield self
+
+
+def run(db_class, num_blocks, num_tx):
+    identity = Identity.create_random_identity()
+    acc = Address.create_from_identity(identity, full_shard_id=0)
+    with tempfile.TemporaryDirectory() as db_path:
+        env = get_test_env()
+        env.db = db_class(db_path, clean=True)
+        state = create_shard_state_with_accounts([acc], env=env)
+        duration = 0
+        for i in range(num_blocks):
+            block = create_transfer_block(state, identity, acc, num_tx, i * num_tx)
+            start_time = time.time()
+            state.add_block(block)
+            duration += time.time() - start_time
+    return num_blocks / duration
+
+
+def test_perf(num_blocks=10, num_tx=1000):
+    print("Adding %d blocks with %d tx each" % (num_blocks, num_tx))
+    bps = run(UnbatchedPersistentDb, num_blocks, num_tx)
+    print("Blocks per second (one write per key): %.2f" % bps)
+    bps = run(PersistentDb, num_blocks, num_tx)
+    print("Blocks per second (write batch): %.2f" % bps)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_blocks", default=10, type=int)
+    parser.add_argument("--num_tx", default=1000, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run("test_perf({}, {})".format(args.num_blocks, args.num_tx))
+    else:
+        test_perf(args.num_blocks, args.num_tx)
+
+
+if __name__ == "__main__":
+    main()
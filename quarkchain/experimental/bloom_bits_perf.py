@@ -0,0 +1,80 @@
+# Performance of finding the blocks matching a log filter
+#
+# Compares ShardDbOperator.get_minor_block_heights_by_bloom() with the bloom bits index
+# against checking the header bloom of every block in the range (as for the sections
+# not indexed).
+
+import argparse
+import os
+import profile
+import random
+import time
+
+from quarkchain.cluster.shard_db_operator import ShardDbOperator
+from quarkchain.cluster.tests.test_utils import get_test_env
+from quarkchain.core import Branch, MinorBlock, MinorBlockHeader, MinorBlockMeta
+from quarkchain.db import InMemoryDb
+from quarkchain.evm.bloom import bloom
+
+
+def create_db(env, num_blocks, num_logs, address):
+    db_op = ShardDbOperator(
+        InMemoryDb(), env, Branch.create(env.quark_chain_config.SHARD_SIZE, 0)
+    )
+    hash_prev = bytes(32)
+    for i in range(num_blocks):
+        header_bloom = 0
+        for j in range(num_logs):
+            header_bloom |= bloom(os.urandom(20)) | bloom(os.urandom(32))
+        # about one block in a thousand has a log of the address
+        if random.randrange(1000) == 0:
+            header_bloom |= bloom(address)
+        block = MinorBlock(
+            MinorBlockHeader(
+                height=i, hash_prev_minor_block=hash_prev, bloom=header_bloom
+            ),
+            MinorBlockMeta(),
+        )
+        with db_op.db.write_batch():
+            db_op.put_minor_block(block, [])
+            db_op.put_minor_block_index(block)
+        hash_prev = block.header.get_hash()
+    return db_op
+
+
+def test_perf(num_blocks=100000, num_logs=5):
+    env = get_test_env()
+    address = os.urandom(20)
+    print("Creating %d blocks with %d logs each" % (num_blocks, num_logs))
+    db_op = create_db(env, num_blocks, num_logs, address)
+    bloom_bits = [[bloom(address)]]
+
+    start_time = time.time()
+    heights = list(db_op.get_minor_block_heights_by_bloom(bloom_bits, 0, num_blocks))
+    duration = time.time() - start_time
+    print("Found %d blocks in %.3f seconds (bloom bits)" % (len(heights), duration))
+
+    for key in [k for k in db_op.db.kv if k.startswith(b"bbs_")]:
+        db_op.db.remove(key)
+    start_time = time.time()
+    heights1 = list(db_op.get_minor_block_heights_by_bloom(bloom_bits, 0, num_blocks))
+    duration = time.time() - start_time
+    print("Found %d blocks in %.3f seconds (headers)" % (len(heights1), duration))
+    assert heights == heights1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_blocks", default=100000, type=int)
+    parser.add_argument("--num_logs", default=5, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run("test_perf({}, {})".format(args.num_blocks, args.num_logs))
+    else:
+        test_perf(args.num_blocks, args.num_logs)
+
+
+if __name__ == "__main__":
+    main()
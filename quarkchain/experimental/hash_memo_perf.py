@@ -0,0 +1,80 @@
+# Hash computations saved by memoizing the hashes of headers and transactions
+#
+# Imports a minor block received from the network (i.e., freshly deserialized) with
+# ShardState.add_block() and counts how many times get_hash() and friends are called
+# against how many hashes are actually computed.
+
+import argparse
+import profile
+import time
+
+from quarkchain.cluster.tests.test_utils import (
+    create_shard_state_with_accounts,
+    create_transfer_block,
+)
+from quarkchain.core import Address, Identity, HashMemoSerializable, MinorBlock
+
+
+class HashCounter:
+    """ Count the hash lookups and the actual hash computations of HashMemoSerializable """
+
+    def __init__(self):
+        self.lookups = 0
+        self.computations = 0
+        self.memoize_hash = HashMemoSerializable.memoize_hash
+
+    def __enter__(self):
+        counter = self
+
+        def memoize_hash(obj, name, hash_func):
+            def counted_hash_func():
+                counter.computations += 1
+                return hash_func()
+
+            counter.lookups += 1
+            return counter.memoize_hash(obj, name, counted_hash_func)
+
+        HashMemoSerializable.memoize_hash = memoize_hash
+        return self
+
+    def __exit__(self, *exc):
+        HashMemoSerializable.memoize_hash = self.memoize_hash
+
+
+def test_perf(num_tx=1000):
+    identity = Identity.create_random_identity()
+    acc = Address.create_from_identity(identity, full_shard_id=0)
+    state = create_shard_state_with_accounts([acc])
+    print("Creating a block with %d tx" % num_tx)
+    data = create_transfer_block(state, identity, acc, num_tx).serialize()
+
+    with HashCounter() as counter:
+        start_time = time.time()
+        state.add_block(MinorBlock.deserialize(data))
+        duration = time.time() - start_time
+
+    print("Block imported in %.2f seconds" % duration)
+    print(
+        "Hash lookups %d computations %d saved %d"
+        % (
+            counter.lookups,
+            counter.computations,
+            counter.lookups - counter.computations,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_tx", default=1000, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run("test_perf({})".format(args.num_tx))
+    else:
+        test_perf(args.num_tx)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# Throughput of adding minor blocks with the txs executed sequentially vs in parallel
+#
+# A block of num_tx txs from num_senders senders is added to a ShardState, once with
+# the txs applied one by one and once with ParallelTxExecutor, which executes them
+# speculatively in a pool of worker processes and only re-executes the txs conflicting
+# with an earlier tx of the block (e.g., the following txs of the same sender).  The
+# txs are either transfers to new accounts or calls to a contract incrementing a
+# counter per caller.  The speedup is bounded by the number of cores of the machine.
+
+import argparse
+import profile
+import time
+
+from quarkchain.cluster.parallel_tx_executor import ParallelTxExecutor
+from quarkchain.cluster.tests.test_utils import (
+    create_shard_state_with_accounts,
+    create_transfer_transaction,
+)
+from quarkchain.core import Address, ByteBuffer, Code, Identity, MinorBlock, Transaction
+from quarkchain.evm import transactions
+from quarkchain.evm.messages import mk_contract_address
+from quarkchain.evm.transactions import Transaction as EvmTransaction
+
+# increments the counter of msg.sender, i.e., storage[caller] += 1
+COUNTER_PER_CALLER_BYTECODE = "600880600b6000396000f3" + "3354600101335500"
+
+
+def create_contract(state, identity, acc):
+    evm_tx = EvmTransaction(
+        nonce=0,
+        gasprice=1,
+        startgas=1000000,
+        value=0,
+        to=b"",
+        data=bytes.fromhex(COUNTER_PER_CALLER_BYTECODE),
+        from_full_shard_id=acc.full_shard_id,
+        to_full_shard_id=acc.full_shard_id,
+        network_id=state.env.quark_chain_config.NETWORK_ID,
+    )
+    evm_tx.sign(identity.get_key())
+    block = state.create_block_to_mine(address=acc)
+    block.add_tx(Transaction(code=Code.create_evm_code(evm_tx)))
+    state.finalize_and_add_block(block)
+    return block, Address(mk_contract_address(acc.recipient, 0, 0), 0)
+
+
+def create_block(state, id_list, acc_list, num_tx, contract):
+    block = state.create_block_to_mine(address=Address.create_random_account(0))
+    nonce_list = [state.get_transaction_count(acc.recipient) for acc in acc_list]
+    for i in range(num_tx):
+        sender = i % len(acc_list)
+        block.add_tx(
+            create_transfer_transaction(
+                shard_state=state,
+                key=id_list[sender].get_key(),
+                from_address=acc_list[sender],
+                to_address=contract or Address.create_random_account(0),
+                value=0 if contract else 1,
+                gas=100000 if contract else 21000,
+                nonce=nonce_list[sender] + i // len(acc_list),
+            )
+        )
+    state.finalize_and_add_block(block)
+    return block.serialize()
+
+
+def run(acc_list, pre_blocks, block_data, num_workers):
+    # a fresh state and block so that no sender is recovered yet
+    transactions.sender_cache.clear()
+    state = create_shard_state_with_accounts(acc_list)
+    for block in pre_blocks:
+        state.add_block(block)
+    state.parallel_tx_executor = ParallelTxExecutor(num_workers, min_tx_count=1)
+    if num_workers > 0:
+        # the workers are long-lived, so their start-up (importing the modules) is not
+        # counted
+        time.sleep(3)
+    block = MinorBlock.deserialize(ByteBuffer(block_data))
+    start_time = time.time()
+    state.add_block(block)
+    duration = time.time() - start_time
+    state.parallel_tx_executor.shutdown()
+    return duration, state.parallel_tx_executor
+
+
+def test_perf(num_tx=200, num_senders=200, num_workers=4):
+    id_list = [Identity.create_random_identity() for _ in range(num_senders)]
+    acc_list = [Address.create_from_identity(i, full_shard_id=0) for i in id_list]
+    state = create_shard_state_with_accounts(acc_list)
+    pre_block, contract = create_contract(state, id_list[0], acc_list[0])
+
+    for name, to in [("transfers", None), ("contract calls", contract)]:
+        print("Creating a block of %d %s from %d senders" % (num_tx, name, num_senders))
+        block_data = create_block(state, id_list, acc_list, num_tx, to)
+        # the next block is created on top of the same parent
+        state = create_shard_state_with_accounts(acc_list)
+        state.add_block(pre_block)
+        for workers in [0, num_workers]:
+            duration, executor = run(acc_list, [pre_block], block_data, workers)
+            print(
+                "%d workers: %.2f tx/s, %d merged, %d re-executed"
+                % (
+                    workers,
+                    num_tx / duration,
+                    executor.num_merged,
+                    executor.num_reexecuted,
+                )
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_tx", default=200, type=int)
+    parser.add_argument("--num_senders", default=200, type=int)
+    parser.add_argument("--num_workers", default=4, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run(
+            "test_perf({}, {}, {})".format(
+                args.num_tx, args.num_senders, args.num_workers
+            )
+        )
+    else:
+        test_perf(args.num_tx, args.num_senders, args.num_workers)
+
+
+if __name__ == "__main__":
+    main()
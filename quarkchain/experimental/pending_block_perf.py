@@ -0,0 +1,74 @@
+# Latency of refreshing the work to mine as the tx queue grows
+#
+# Adds txs to a ShardState in batches and calls ShardState.create_block_to_mine() after
+# each batch, as the miner or a remote getWork does, once with the pending block whose
+# evm state the txs are applied to as they are added, and once rebuilding the block
+# from the parent state with all the queued txs on every call, as it used to.
+
+import argparse
+import profile
+import time
+
+from quarkchain.cluster.tests.test_utils import (
+    create_shard_state_with_accounts,
+    create_transfer_transaction,
+)
+from quarkchain.core import Address, Identity
+
+
+def run(acc_list, tx_list, batch_size, rebuild):
+    state = create_shard_state_with_accounts(acc_list, balance=10 ** 18)
+    coinbase = Address.create_random_account(full_shard_id=0)
+    durations = []
+    for i in range(0, len(tx_list), batch_size):
+        for tx in tx_list[i : i + batch_size]:
+            assert state.add_tx(tx)
+        if rebuild:
+            state.pending_block = None
+        start_time = time.time()
+        block = state.create_block_to_mine(address=coinbase)
+        durations.append(time.time() - start_time)
+        assert len(block.tx_list) == min(i + batch_size, len(tx_list))
+    return durations
+
+
+def test_perf(num_tx=1000, batch_size=100):
+    # the tx queue takes one tx per sender on top of the tip
+    id_list = [Identity.create_random_identity() for _ in range(num_tx)]
+    acc_list = [Address.create_from_identity(i, full_shard_id=0) for i in id_list]
+    state = create_shard_state_with_accounts(acc_list, balance=10 ** 18)
+    print("Creating %d transactions" % num_tx)
+    tx_list = [
+        create_transfer_transaction(
+            shard_state=state,
+            key=identity.get_key(),
+            from_address=acc,
+            to_address=Address.create_random_account(full_shard_id=0),
+            value=1,
+        )
+        for identity, acc in zip(id_list, acc_list)
+    ]
+
+    for name, rebuild in [("rebuilt", True), ("pending", False)]:
+        durations = run(acc_list, tx_list, batch_size, rebuild)
+        print(
+            "Work refreshed (%s) in %s ms at every %d tx"
+            % (name, ", ".join("%.1f" % (d * 1000) for d in durations), batch_size)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_tx", default=1000, type=int)
+    parser.add_argument("--batch_size", default=100, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run("test_perf({}, {})".format(args.num_tx, args.batch_size))
+    else:
+        test_perf(args.num_tx, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Throughput of adding minor blocks to the shards of a slave in one process vs a worker
+# process per shard (--process_per_shard)
+#
+# Starts a cluster of a master and a slave running num_shards shards, once as a SlaveServer
+# whose shards share its process, where their EVM execution is serialized by the GIL, and
+# once as a SlaveRouter running each shard in a worker process.  The same blocks of num_tx
+# transfers are added to all the shards concurrently through the master, and the aggregate
+# blocks and txs per second are reported.  Run it under taskset to limit the cores, e.g.,
+# taskset -c 0-3.
+
+import argparse
+import asyncio
+import multiprocessing
+import profile
+import time
+
+from quarkchain.cluster.shard_state import ShardState
+from quarkchain.cluster.tests.test_utils import (
+    create_test_clusters,
+    create_transfer_block,
+    get_test_env,
+    shutdown_clusters,
+)
+from quarkchain.core import Address, Identity
+from quarkchain.genesis import GenesisManager
+from quarkchain.utils import check
+
+BALANCE = 10 ** 20
+
+
+def create_blocks(identity, num_shards, shard_id, num_blocks, num_tx):
+    """ Returns the blocks of the shard, which are chained on a local copy of the shard """
+    acc = Address.create_from_identity(identity, full_shard_id=shard_id)
+    # the same genesis as the clusters
+    env = get_test_env(acc, genesis_minor_quarkash=BALANCE, shard_size=num_shards)
+    state = ShardState(env=env, shard_id=shard_id)
+    state.init_genesis_state(GenesisManager(env.quark_chain_config).create_root_block())
+    blocks = []
+    for n in range(num_blocks):
+        block = create_transfer_block(state, identity, acc, num_tx, nonce=n * num_tx)
+        state.add_block(block)
+        blocks.append(block)
+    return blocks
+
+
+def run(identity, blocks_list, process_per_shard):
+    """ Returns the seconds to add the blocks to a new cluster """
+    acc = Address.create_from_identity(identity, full_shard_id=0)
+    clusters = create_test_clusters(
+        1,
+        acc,
+        len(blocks_list),
+        1,
+        None,
+        process_per_shard=process_per_shard,
+        genesis_minor_quarkash=BALANCE,
+    )
+    master = clusters[0].master
+
+    async def add_blocks(blocks):
+        for block in blocks:
+            check(
+                await master.add_raw_minor_block(block.header.branch, block.serialize())
+            )
+
+    start_time = time.time()
+    asyncio.get_event_loop().run_until_complete(
+        asyncio.gather(*[add_blocks(blocks) for blocks in blocks_list])
+    )
+    duration = time.time() - start_time
+    shutdown_clusters(clusters)
+    return duration
+
+
+def test_perf(num_shards=4, num_blocks=5, num_tx=200):
+    identity = Identity.create_random_identity()
+    print(
+        "Creating %d blocks with %d tx for each of %d shards"
+        % (num_blocks, num_tx, num_shards)
+    )
+    blocks_list = [
+        create_blocks(identity, num_shards, shard_id, num_blocks, num_tx)
+        for shard_id in range(num_shards)
+    ]
+
+    print("Adding the blocks on %d cores" % multiprocessing.cpu_count())
+    for name, process_per_shard in [
+        ("one process", False),
+        ("process per shard", True),
+    ]:
+        duration = run(identity, blocks_list, process_per_shard)
+        print(
+            "Blocks per second (%s): %.2f, txs per second: %.2f"
+            % (
+                name,
+                num_shards * num_blocks / duration,
+                num_shards * num_blocks * num_tx / duration,
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_shards", default=4, type=int)
+    parser.add_argument("--num_blocks", default=5, type=int)
+    parser.add_argument("--num_tx", default=200, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run(
+            "test_perf({}, {}, {})".format(
+                args.num_shards, args.num_blocks, args.num_tx
+            )
+        )
+    else:
+        test_perf(args.num_shards, args.num_blocks, args.num_tx)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# Performance of recovering the shard state from a rocksdb database on restart
+#
+# Compares ShardDbOperator.recover_state() reading the compact header keys in bulk
+# against reading the full blocks (as for the blocks stored before the header keys
+# were introduced).
+
+import argparse
+import os
+import profile
+import random
+import tempfile
+import time
+
+from quarkchain.cluster.shard_db_operator import ShardDbOperator
+from quarkchain.cluster.tests.test_utils import get_test_env
+from quarkchain.core import (
+    Branch,
+    Code,
+    MinorBlock,
+    MinorBlockHeader,
+    MinorBlockMeta,
+    RootBlock,
+    RootBlockHeader,
+    Transaction,
+)
+from quarkchain.db import PersistentDb
+from quarkchain.evm.transactions import Transaction as EvmTransaction
+
+
+class CountingPersistentDb(PersistentDb):
+    """ Count the bytes read from the database """
+
+    bytes_read = 0
+
+    def get(self, key, default=None):
+        value = super().get(key, default)
+        self.bytes_read += len(value) if value else 0
+        return value
+
+    def multi_get(self, keys):
+        result = super().multi_get(keys)
+        self.bytes_read += sum(len(v) for v in result.values() if v)
+        return result
+
+
+def create_tx_list(num_tx):
+    tx_list = []
+    for i in range(num_tx):
+        evm_tx = EvmTransaction(
+            nonce=i,
+            gasprice=random.randint(1, 10 ** 9),
+            startgas=21000,
+            to=os.urandom(20),
+            value=random.randint(1, 10 ** 18),
+            data=b"",
+            v=27,
+            r=random.getrandbits(256),
+            s=random.getrandbits(256),
+        )
+        tx_list.append(Transaction(code=Code.create_evm_code(evm_tx)))
+    return tx_list
+
+
+def create_db(env, db_path, num_blocks, num_tx):
+    db = CountingPersistentDb(db_path, clean=True)
+    db_op = ShardDbOperator(
+        db, env, Branch.create(env.quark_chain_config.SHARD_SIZE, 0)
+    )
+    root_block = RootBlock(RootBlockHeader())
+    db_op.put_root_block(root_block)
+    tx_list = create_tx_list(num_tx)
+    hash_prev = bytes(32)
+    for i in range(num_blocks):
+        block = MinorBlock(
+            MinorBlockHeader(height=i, hash_prev_minor_block=hash_prev),
+            MinorBlockMeta(),
+            tx_list=tx_list,
+        )
+        with db.write_batch():
+            db_op.put_minor_block(block, [])
+            db_op.put_minor_block_index(block)
+        hash_prev = block.header.get_hash()
+    return db, root_block.header, block.header
+
+
+def recover(env, db, r_header, m_header):
+    db_op = ShardDbOperator(
+        db, env, Branch.create(env.quark_chain_config.SHARD_SIZE, 0)
+    )
+    db.bytes_read = 0
+    start_time = time.time()
+    db_op.recover_state(r_header, m_header)
+    duration = time.time() - start_time
+    assert len(db_op.m_header_pool) == m_header.height + 1
+    return duration, db.bytes_read
+
+
+def test_perf(num_blocks=100000, num_tx=10):
+    env = get_test_env()
+    # recover all the blocks
+    env.quark_chain_config.ROOT.MAX_STALE_ROOT_BLOCK_HEIGHT_DIFF = num_blocks
+    shard_config = env.quark_chain_config.SHARD_LIST[0]
+    assert shard_config.max_minor_blocks_in_memory >= num_blocks
+
+    print("Creating %d blocks with %d tx each" % (num_blocks, num_tx))
+    with tempfile.TemporaryDirectory() as db_path:
+        db, r_header, m_header = create_db(env, db_path, num_blocks, num_tx)
+
+        duration, bytes_read = recover(env, db, r_header, m_header)
+        print(
+            "Recovered in %.2f seconds, %d bytes read (header keys)"
+            % (duration, bytes_read)
+        )
+
+        with db.write_batch():
+            for key, _ in db.range_iter(b"mblockheader_", b"mblockheader`"):
+                db.remove(key)
+            for key, _ in db.range_iter(b"rheader_", b"rheader`"):
+                db.remove(key)
+        duration, bytes_read = recover(env, db, r_header, m_header)
+        print(
+            "Recovered in %.2f seconds, %d bytes read (full blocks)"
+            % (duration, bytes_read)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_blocks", default=100000, type=int)
+    parser.add_argument("--num_tx", default=10, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run("test_perf({}, {})".format(args.num_blocks, args.num_tx))
+    else:
+        test_perf(args.num_blocks, args.num_tx)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Root blocks per second of a cluster catching up with the root chain of a peer
+#
+# A local cluster adds num_blocks root blocks, each confirming a new minor block of
+# every shard, while another cluster is disconnected.  Once connected, the master of
+# the latter syncs the root blocks, with the minor blocks of up to blocks_in_flight root
+# blocks synced by the slaves ahead of adding them.  With one block in flight, the
+# minor blocks of a root block are only requested once the previous root block is
+# added, i.e., one root block at a time.
+
+import argparse
+import asyncio
+import profile
+import time
+
+from quarkchain.cluster.master import SyncTask
+from quarkchain.cluster.tests.test_utils import ClusterContext
+from quarkchain.core import Address
+from quarkchain.utils import call_async
+
+
+def add_root_block(cluster, acc, include_genesis):
+    header_list = []
+    for shard_id in range(cluster.master.env.quark_chain_config.SHARD_SIZE):
+        shard_state = cluster.get_shard_state(shard_id)
+        if include_genesis:
+            header_list.append(shard_state.header_tip)
+        block = shard_state.create_block_to_mine()
+        assert call_async(
+            cluster.master.add_raw_minor_block(block.header.branch, block.serialize())
+        )
+        header_list.append(block.header)
+    root_block = cluster.master.root_state.create_block_to_mine(header_list, acc)
+    call_async(cluster.master.add_root_block(root_block))
+    return root_block
+
+
+async def wait_for_root_tip(cluster, header):
+    while cluster.master.root_state.tip != header:
+        await asyncio.sleep(0.01)
+
+
+def run(num_blocks, shard_size, blocks_in_flight):
+    SyncTask.MAX_BLOCKS_IN_FLIGHT = blocks_in_flight
+    acc = Address.create_random_account(full_shard_id=0)
+    with ClusterContext(2, acc, shard_size=shard_size) as clusters:
+        clusters[1].peer.close()
+        for i in range(num_blocks):
+            root_block = add_root_block(clusters[0], acc, i == 0)
+
+        start_time = time.time()
+        call_async(
+            clusters[1].network.connect(
+                "127.0.0.1", clusters[0].master.env.cluster_config.P2P_PORT
+            )
+        )
+        call_async(wait_for_root_tip(clusters[1], root_block.header))
+        return time.time() - start_time
+
+
+def test_perf(num_blocks=200, shard_size=4, blocks_in_flight=8):
+    for in_flight in [1, blocks_in_flight]:
+        duration = run(num_blocks, shard_size, in_flight)
+        print(
+            "Synced %d root blocks of %d shards with %d blocks in flight: %.2f blocks/s"
+            % (num_blocks, shard_size, in_flight, num_blocks / duration)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_blocks", default=200, type=int)
+    parser.add_argument("--shard_size", default=4, type=int)
+    parser.add_argument("--blocks_in_flight", default=8, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run(
+            "test_perf({}, {}, {})".format(
+                args.num_blocks, args.shard_size, args.blocks_in_flight
+            )
+        )
+    else:
+        test_perf(args.num_blocks, args.shard_size, args.blocks_in_flight)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Headers per second of verifying the seals of a batch of synced headers
+#
+# Mines num_headers root block headers with qkchash at difficulty 1 and verifies their
+# seals the way a sync task validates a downloaded batch, with validate_seal() one at
+# a time and with SealVerification in a pool of num_workers processes first.  The
+# seal cache is cleared before each run, and a second pass over the same headers
+# (e.g., when the blocks are added after the headers are validated) hits the cache.
+
+import argparse
+import asyncio
+import profile
+import time
+
+from qkchash.qkcpow import QkchashMiner
+from quarkchain.cluster import miner
+from quarkchain.cluster.miner import validate_seal
+from quarkchain.cluster.seal_verification import SealVerification
+from quarkchain.config import ConsensusType
+from quarkchain.core import RootBlockHeader
+
+
+def create_headers(num_headers):
+    header_list = []
+    for i in range(num_headers):
+        header = RootBlockHeader(height=i + 1, create_time=42 + i, difficulty=1)
+        nonce, mixhash = QkchashMiner(1, header.get_hash_for_mining()).mine(rounds=1)
+        header.nonce = int.from_bytes(nonce, byteorder="big")
+        header.mixhash = mixhash
+        header_list.append(header)
+    return header_list
+
+
+def run(header_list, num_workers):
+    loop = asyncio.get_event_loop()
+    verification = SealVerification(num_workers, loop)
+    miner.seal_cache.clear()
+    start_time = time.time()
+    loop.run_until_complete(verification.verify(header_list, ConsensusType.POW_QKCHASH))
+    for header in header_list:
+        validate_seal(header, ConsensusType.POW_QKCHASH)
+    duration = time.time() - start_time
+
+    start_time = time.time()
+    for header in header_list:
+        validate_seal(header, ConsensusType.POW_QKCHASH)
+    cached_duration = time.time() - start_time
+    verification.shutdown()
+    return duration, cached_duration
+
+
+def test_perf(num_headers=500, num_workers=4):
+    print("Mining %d headers" % num_headers)
+    header_list = create_headers(num_headers)
+    for workers in [0, num_workers]:
+        duration, cached_duration = run(header_list, workers)
+        print(
+            "%d workers: %.2f headers/s, %.2f headers/s cached"
+            % (workers, num_headers / duration, num_headers / cached_duration)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_headers", default=500, type=int)
+    parser.add_argument("--num_workers", default=4, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run("test_perf({}, {})".format(args.num_headers, args.num_workers))
+    else:
+        test_perf(args.num_headers, args.num_workers)
+
+
+if __name__ == "__main__":
+    main()
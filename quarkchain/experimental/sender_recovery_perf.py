@@ -0,0 +1,77 @@
+# Performance of recovering the tx senders of a batch of txs with a process pool
+#
+# Creates signed txs from random senders, re-creates them from their bytes so that
+# the senders are not known, and measures SenderRecovery.recover() on the whole batch
+# for different numbers of worker processes, where 0 recovers the senders one at a
+# time in the calling process as Shard.add_tx_list() did before.
+
+import argparse
+import asyncio
+import profile
+import time
+
+from quarkchain.cluster.sender_recovery import SenderRecovery
+from quarkchain.core import Address, Code, Identity, Transaction
+from quarkchain.evm import transactions
+from quarkchain.evm.transactions import Transaction as EvmTransaction
+
+
+def create_transactions(num_tx):
+    tx_list = []
+    for i in range(num_tx):
+        identity = Identity.create_random_identity()
+        evm_tx = EvmTransaction(
+            nonce=i,
+            gasprice=1,
+            startgas=21000,
+            to=Address.create_random_account().recipient,
+            value=1,
+            data=b"",
+            from_full_shard_id=0,
+            to_full_shard_id=0,
+            network_id=1,
+        )
+        evm_tx.sign(key=identity.get_key())
+        tx_list.append(Code.create_evm_code(evm_tx).code)
+    return tx_list
+
+
+def test_perf(num_tx=10000, workers="0,1,2,4"):
+    print("Creating %d transactions" % num_tx)
+    code_list = create_transactions(num_tx)
+    loop = asyncio.get_event_loop()
+
+    for num_workers in [int(w) for w in workers.split(",")]:
+        transactions.sender_cache.clear()
+        tx_list = [Transaction(code=Code(code)) for code in code_list]
+        recovery = SenderRecovery(num_workers, loop)
+        # start the worker processes before timing
+        loop.run_until_complete(recovery.recover(tx_list[:num_workers]))
+
+        start_time = time.time()
+        loop.run_until_complete(recovery.recover(tx_list))
+        for tx in tx_list:
+            tx.code.get_evm_transaction().sender
+        duration = time.time() - start_time
+        recovery.shutdown()
+        print(
+            "Senders recovered per second with %d workers: %.2f"
+            % (num_workers, num_tx / duration)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_tx", default=10000, type=int)
+    parser.add_argument("--workers", default="0,1,2,4", type=str)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run("test_perf({}, '{}')".format(args.num_tx, args.workers))
+    else:
+        test_perf(args.num_tx, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# Performance of deserializing minor blocks
+#
+# Compares MinorBlockHeader.deserialize() and MinorBlock.deserialize() using the
+# serializers compiled from FIELDS against deserializing the fields one by one
+# through the serializer objects.
+
+import argparse
+import os
+import profile
+import random
+import time
+
+from quarkchain.core import (
+    ByteBuffer,
+    Code,
+    MinorBlock,
+    MinorBlockHeader,
+    MinorBlockMeta,
+    Serializable,
+    Transaction,
+)
+from quarkchain.evm.transactions import Transaction as EvmTransaction
+
+
+def deserialize_field_by_field(cls, bb):
+    if not isinstance(bb, ByteBuffer):
+        bb = ByteBuffer(bb)
+    kwargs = dict()
+    for name, ser in cls.FIELDS:
+        if isinstance(ser, type) and issubclass(ser, Serializable):
+            kwargs[name] = deserialize_field_by_field(ser, bb)
+        elif hasattr(ser, "ser") and isinstance(ser.ser, type):
+            # list of Serializable
+            size = bb.get_uint(ser.size_bytes)
+            kwargs[name] = [
+                deserialize_field_by_field(ser.ser, bb) for _ in range(size)
+            ]
+        else:
+            kwargs[name] = ser.deserialize(bb)
+    return cls(**kwargs)
+
+
+def create_block(num_tx):
+    block = MinorBlock(MinorBlockHeader(), MinorBlockMeta())
+    for i in range(num_tx):
+        evm_tx = EvmTransaction(
+            nonce=i,
+            gasprice=random.randint(1, 10 ** 9),
+            startgas=21000,
+            to=os.urandom(20),
+            value=random.randint(1, 10 ** 18),
+            data=b"",
+            v=27,
+            r=random.getrandbits(256),
+            s=random.getrandbits(256),
+        )
+        block.add_tx(Transaction(code=Code.create_evm_code(evm_tx)))
+    return block
+
+
+def test_perf(num_blocks=10, num_tx=10000):
+    data = MinorBlockHeader().serialize()
+    start_time = time.time()
+    for i in range(num_tx):
+        header = deserialize_field_by_field(MinorBlockHeader, data)
+    duration = time.time() - start_time
+    print("Headers per second (field by field): %.2f" % (num_tx / duration))
+
+    start_time = time.time()
+    for i in range(num_tx):
+        header1 = MinorBlockHeader.deserialize(data)
+    duration = time.time() - start_time
+    print("Headers per second (compiled): %.2f" % (num_tx / duration))
+    assert header1 == header
+
+    print("Creating a block with %d tx" % num_tx)
+    data = create_block(num_tx).serialize()
+
+    start_time = time.time()
+    for i in range(num_blocks):
+        block = deserialize_field_by_field(MinorBlock, data)
+    duration = time.time() - start_time
+    print("Blocks per second (field by field): %.2f" % (num_blocks / duration))
+
+    start_time = time.time()
+    for i in range(num_blocks):
+        block1 = MinorBlock.deserialize(data)
+        block1.tx_list
+    duration = time.time() - start_time
+    print("Blocks per second (compiled): %.2f" % (num_blocks / duration))
+    assert block1 == block
+
+    start_time = time.time()
+    for i in range(num_blocks):
+        MinorBlock.deserialize(data)
+    duration = time.time() - start_time
+    print("Blocks per second (tx_list not decoded): %.2f" % (num_blocks / duration))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_blocks", default=10, type=int)
+    parser.add_argument("--num_tx", default=10000, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run("test_perf({}, {})".format(args.num_blocks, args.num_tx))
+    else:
+        test_perf(args.num_blocks, args.num_tx)
+
+
+if __name__ == "__main__":
+    main()
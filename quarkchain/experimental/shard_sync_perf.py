@@ -0,0 +1,89 @@
+# Blocks per second of a shard catching up with its peers in local clusters
+#
+# num_peers clusters add num_blocks blocks to shard 0 while another cluster is
+# disconnected.  The cluster then connects to all of them and a new block triggers
+# the sync of its shard, which downloads the blocks in batches of batch_size from the
+# peers, with up to MAX_BATCHES_IN_FLIGHT requests at a time, and adds them as they
+# arrive.  With one batch in flight, the next batch is only requested once the previous
+# one is added, i.e., the network and the cpu take turns.
+
+import argparse
+import asyncio
+import profile
+import time
+
+from quarkchain.cluster.shard import SyncTask
+from quarkchain.cluster.tests.test_utils import ClusterContext
+from quarkchain.core import Address
+from quarkchain.utils import call_async
+
+
+def add_block(cluster):
+    block = cluster.get_shard_state(0).create_block_to_mine()
+    assert call_async(
+        cluster.master.add_raw_minor_block(block.header.branch, block.serialize())
+    )
+    return block
+
+
+async def wait_for_tip(cluster, header):
+    while cluster.get_shard_state(0).header_tip != header:
+        await asyncio.sleep(0.01)
+
+
+def run(num_peers, num_blocks, batches_in_flight):
+    SyncTask.MAX_BATCHES_IN_FLIGHT = batches_in_flight
+    acc = Address.create_random_account(full_shard_id=0)
+    with ClusterContext(num_peers + 1, acc) as clusters:
+        syncing_cluster = clusters[-1]
+        syncing_cluster.peer.close()
+        for i in range(num_blocks):
+            block = add_block(clusters[0])
+        for cluster in clusters[1:num_peers]:
+            call_async(asyncio.wait_for(wait_for_tip(cluster, block.header), 60))
+
+        for cluster in clusters[:num_peers]:
+            call_async(
+                syncing_cluster.network.connect(
+                    "127.0.0.1", cluster.master.env.cluster_config.P2P_PORT
+                )
+            )
+        start_time = time.time()
+        block = add_block(clusters[0])
+        call_async(wait_for_tip(syncing_cluster, block.header))
+        return time.time() - start_time
+
+
+def test_perf(num_peers=2, num_blocks=1000, batch_size=100, batches_in_flight=4):
+    SyncTask.BLOCK_BATCH_SIZE = batch_size
+    for in_flight in [1, batches_in_flight]:
+        duration = run(num_peers, num_blocks, in_flight)
+        print(
+            "Synced %d blocks from %d peers with %d batches in flight: %.2f blocks/s"
+            % (num_blocks + 1, num_peers, in_flight, (num_blocks + 1) / duration)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_peers", default=2, type=int)
+    parser.add_argument("--num_blocks", default=1000, type=int)
+    parser.add_argument("--batch_size", default=100, type=int)
+    parser.add_argument("--batches_in_flight", default=4, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run(
+            "test_perf({}, {}, {}, {})".format(
+                args.num_peers, args.num_blocks, args.batch_size, args.batches_in_flight
+            )
+        )
+    else:
+        test_perf(
+            args.num_peers, args.num_blocks, args.batch_size, args.batches_in_flight
+        )
+
+
+if __name__ == "__main__":
+    main()
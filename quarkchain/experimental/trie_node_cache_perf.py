@@ -0,0 +1,97 @@
+# Performance of validating transactions against a large state
+#
+# Each ShardState.add_tx() validates the tx against an ephemeral clone of the state,
+# which starts with a cold trie.  Compares the throughput with and without the
+# decoded trie node cache (quarkchain.evm.trie.node_cache).
+
+import argparse
+import os
+import profile
+import time
+
+from quarkchain.cluster.tests.test_utils import (
+    get_test_env,
+    create_shard_state_with_accounts,
+    create_transfer_transaction,
+)
+from quarkchain.core import Address, Identity
+from quarkchain.evm import trie
+from quarkchain.evm.transaction_queue import TransactionQueue
+
+
+def create_shard_state(num_accounts, senders):
+    env = get_test_env()
+    env.quark_chain_config.TRANSACTION_QUEUE_SIZE_LIMIT_PER_SHARD = len(senders) * 2
+    state = create_shard_state_with_accounts(
+        senders, balance=10 ** 18, gas_limit=None, env=env
+    )
+
+    evm_state = state.evm_state
+    for i in range(num_accounts - len(senders)):
+        evm_state.set_balance(os.urandom(20), 1)
+        if (i + 1) % 10000 == 0:
+            evm_state.commit()
+    evm_state.commit()
+    return state
+
+
+def run(state, tx_list):
+    state.tx_queue = TransactionQueue()
+    start_time = time.time()
+    for tx in tx_list:
+        assert state.add_tx(tx)
+    return len(tx_list) / (time.time() - start_time)
+
+
+def test_perf(num_accounts=1000000, num_tx=10000):
+    print("Creating state with %d accounts" % num_accounts)
+    id_list = [Identity.create_random_identity() for _ in range(num_tx)]
+    acc_list = [Address.create_from_identity(i, full_shard_id=0) for i in id_list]
+    state = create_shard_state(num_accounts, acc_list)
+
+    print("Creating %d transactions" % num_tx)
+    tx_list = []
+    for identity, acc in zip(id_list, acc_list):
+        tx_list.append(
+            create_transfer_transaction(
+                shard_state=state,
+                key=identity.get_key(),
+                from_address=acc,
+                to_address=Address.create_random_account(full_shard_id=0),
+                value=1,
+                nonce=0,
+            )
+        )
+
+    trie.node_cache.set_max_size(0)
+    print("Validations per second (no node cache): %.2f" % run(state, tx_list))
+
+    trie.node_cache.set_max_size(trie.NODE_CACHE_SIZE)
+    trie.node_cache.hits = trie.node_cache.misses = 0
+    print("Validations per second (node cache): %.2f" % run(state, tx_list))
+    print(
+        "Node cache hits %d misses %d hit rate %.2f size %d bytes"
+        % (
+            trie.node_cache.hits,
+            trie.node_cache.misses,
+            trie.node_cache.hit_rate(),
+            trie.node_cache.size,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_accounts", default=1000000, type=int)
+    parser.add_argument("--num_tx", default=10000, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run("test_perf({}, {})".format(args.num_accounts, args.num_tx))
+    else:
+        test_perf(args.num_accounts, args.num_tx)
+
+
+if __name__ == "__main__":
+    main()
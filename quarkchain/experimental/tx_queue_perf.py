@@ -0,0 +1,98 @@
+# Performance of creating a block to mine with a large tx queue
+#
+# Fills the tx queue of a ShardState with pending txs from many senders (each sender
+# with a run of nonces) and measures ShardState.create_block_to_mine() and adding the
+# mined block, which removes the included txs from the queue.  For comparison, also
+# times filtering the included txs out of a list of all the pending txs, which is
+# what the heap-based queue used to do on every new tip.
+
+import argparse
+import profile
+import time
+
+from quarkchain.cluster.tests.test_utils import (
+    get_test_env,
+    create_shard_state_with_accounts,
+)
+from quarkchain.core import Address, Code, Identity, Transaction
+from quarkchain.evm.transactions import Transaction as EvmTransaction
+
+
+def create_transactions(state, id_list, acc_list, num_tx):
+    tx_list = []
+    nonce = 0
+    while len(tx_list) < num_tx:
+        for identity, acc in zip(id_list, acc_list):
+            evm_tx = EvmTransaction(
+                nonce=nonce,
+                gasprice=1 + len(tx_list) % 100,
+                startgas=21000,
+                to=acc.recipient,
+                value=1,
+                data=b"",
+                from_full_shard_id=acc.full_shard_id,
+                to_full_shard_id=acc.full_shard_id,
+                network_id=state.env.quark_chain_config.NETWORK_ID,
+            )
+            evm_tx.sign(key=identity.get_key())
+            tx_list.append((evm_tx, Transaction(code=Code.create_evm_code(evm_tx))))
+        nonce += 1
+    return tx_list[:num_tx]
+
+
+def test_perf(num_tx=100000, num_senders=1000):
+    id_list = [Identity.create_random_identity() for _ in range(num_senders)]
+    acc_list = [Address.create_from_identity(i, full_shard_id=0) for i in id_list]
+    env = get_test_env()
+    # room for all the txs
+    env.quark_chain_config.TRANSACTION_QUEUE_SIZE_LIMIT_PER_SHARD = num_tx
+    env.quark_chain_config.TRANSACTION_QUEUE_SIZE_LIMIT_PER_SENDER = num_tx
+    state = create_shard_state_with_accounts(
+        acc_list, balance=10 ** 18, gas_limit=None, env=env
+    )
+
+    print("Creating %d transactions from %d senders" % (num_tx, num_senders))
+    tx_list = create_transactions(state, id_list, acc_list, num_tx)
+
+    start_time = time.time()
+    for evm_tx, tx in tx_list:
+        state.tx_queue.add_transaction(evm_tx, tx_hash=tx.get_hash())
+    duration = time.time() - start_time
+    print("Transactions queued per second: %.2f" % (num_tx / duration))
+
+    start_time = time.time()
+    block = state.create_block_to_mine(address=acc_list[0])
+    duration = time.time() - start_time
+    print(
+        "Block with %d tx created in %.2f seconds (%d pending)"
+        % (len(block.tx_list), duration, len(state.tx_queue))
+    )
+
+    start_time = time.time()
+    state.finalize_and_add_block(block)
+    duration = time.time() - start_time
+    print("Block added in %.2f seconds (%d pending)" % (duration, len(state.tx_queue)))
+
+    start_time = time.time()
+    remove_hashes = [tx.get_hash() for tx in block.tx_list]
+    keep_txs = [tx for _, tx in tx_list if tx.get_hash() not in remove_hashes]
+    duration = time.time() - start_time
+    print("Pending txs list filtered in %.2f seconds" % duration)
+    assert len(keep_txs) == len(state.tx_queue)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=False)
+    parser.add_argument("--num_tx", default=100000, type=int)
+    parser.add_argument("--num_senders", default=1000, type=int)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile.run("test_perf({}, {})".format(args.num_tx, args.num_senders))
+    else:
+        test_perf(args.num_tx, args.num_senders)
+
+
+if __name__ == "__main__":
+    main()
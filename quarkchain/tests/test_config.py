@@ -41,6 +41,7 @@ class TestShardConfig(unittest.TestCase):
     "MAX_NEIGHBORS": 32,
     "NETWORK_ID": 3,
     "TRANSACTION_QUEUE_SIZE_LIMIT_PER_SHARD": 10000,
+    "TRANSACTION_QUEUE_SIZE_LIMIT_PER_SENDER": 16,
     "BLOCK_EXTRA_DATA_SIZE_LIMIT": 1024,
     "PROOF_OF_PROGRESS_BLOCKS": 1,
     "GUARDIAN_PUBLIC_KEY": "ab856abd0983a82972021e454fcf66ed5940ed595b0898bcd75cbe2d0a51a00f5358b566df22395a2a8bf6c022c1d51a2c3defe654e91a8d244947783029694d",
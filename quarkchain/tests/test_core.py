@@ -1,14 +1,18 @@
+import copy
+import random
 import unittest
 
 from eth_keys import KeyAPI
 
 from quarkchain.core import (
     Branch,
+    Code,
     ShardInfo,
     biguint,
     Identity,
     Address,
     RootBlockHeader,
+    MinorBlock,
     MinorBlockHeader,
     MinorBlockMeta,
     ShardMask,
@@ -19,7 +23,13 @@ from quarkchain.core import (
     ByteBuffer,
     hash256,
     EnumSerializer,
+    CrossShardTransactionDeposit,
+    FixedSizeBytesSerializer,
+    PrependedSizeBytesSerializer,
+    UintSerializer,
 )
+from quarkchain.evm import transactions
+from quarkchain.evm.transactions import Transaction as EvmTransaction
 from quarkchain.tests.test_utils import create_random_test_transaction
 from quarkchain.utils import check
 
@@ -51,6 +61,69 @@ class TestTransaction(unittest.TestCase):
         self.assertTrue(tx1.verify_signature([id1.get_recipient()]))
 
 
+class TestMinorBlock(unittest.TestCase):
+    def create_block(self):
+        id1 = Identity.create_random_identity()
+        tx_list = [
+            create_random_test_transaction(id1, Address.create_random_account())
+            for _ in range(3)
+        ]
+        return MinorBlock(
+            MinorBlockHeader(height=1), MinorBlockMeta(), tx_list, b"tracking"
+        )
+
+    def test_lazy_tx_list(self):
+        block = self.create_block()
+        data = bytes(block.serialize())
+
+        block1 = MinorBlock.deserialize(data)
+        self.assertEqual(block1.header, block.header)
+        self.assertEqual(block1.serialize(), data)
+        self.assertIsNotNone(block1._undecoded_data)
+        self.assertEqual(copy.deepcopy(block1), block)
+        self.assertEqual(block1.tx_list, block.tx_list)
+        self.assertEqual(block1.tracking_data, b"tracking")
+        self.assertIsNone(block1._undecoded_data)
+        self.assertEqual(block1.serialize(), data)
+
+        block1 = MinorBlock.deserialize(data)
+        block1.add_tx(block.tx_list[0])
+        self.assertEqual(len(block1.tx_list), 4)
+        self.assertEqual(block1.tracking_data, b"tracking")
+
+        block1 = MinorBlock.deserialize(ByteBuffer(data))
+        self.assertIsNone(block1._undecoded_data)
+        self.assertEqual(block1, block)
+
+    def test_lazy_tx_list_seen_while_decoding(self):
+        block = self.create_block()
+        block1 = MinorBlock.deserialize(bytes(block.serialize()))
+        serializer = MinorBlock.FIELDS[3][1]
+        seen = []
+
+        class SpySerializer:
+            def deserialize(self, bb):
+                # another thread reading the block in the middle of the decoding
+                if not seen:
+                    seen.append(None)
+                    seen[0] = (block1.tx_list, block1.serialize())
+                return serializer.deserialize(bb)
+
+        MinorBlock.FIELDS[3] = ("tracking_data", SpySerializer())
+        try:
+            self.assertEqual(block1.tx_list, block.tx_list)
+        finally:
+            MinorBlock.FIELDS[3] = ("tracking_data", serializer)
+        self.assertEqual(seen[0], (block.tx_list, block.serialize()))
+
+    def test_mutable_data(self):
+        block = self.create_block()
+        barray = block.serialize()
+        block1 = MinorBlock.deserialize(barray)
+        barray[-1] = 0
+        self.assertEqual(block1.tracking_data, b"tracking")
+
+
 class TestBranch(unittest.TestCase):
     def test_branch(self):
         b = Branch.create(8, 6)
@@ -162,6 +235,119 @@ class TestRootBlockHeaderSignature(unittest.TestCase):
         self.assertTrue(header.verify_signature(private_key.public_key))
 
 
+class TestHashMemo(unittest.TestCase):
+    def test_minor_block_header_hash(self):
+        header = MinorBlockHeader()
+        h = header.get_hash()
+        h_for_mining = header.get_hash_for_mining()
+        self.assertIs(header.get_hash(), h)
+
+        header.nonce = 1
+        self.assertNotEqual(header.get_hash(), h)
+        self.assertEqual(header.get_hash_for_mining(), h_for_mining)
+        header1 = MinorBlockHeader.deserialize(header.serialize())
+        self.assertEqual(header.get_hash(), header1.get_hash())
+
+        header.height = 1
+        self.assertNotEqual(header.get_hash_for_mining(), h_for_mining)
+
+    def test_transaction_hash(self):
+        id1 = Identity.create_random_identity()
+        tx = create_random_test_transaction(id1, Address.create_random_account())
+        h = tx.get_hash()
+        h_unsigned = tx.get_hash_unsigned()
+
+        tx.sign([Identity.create_random_identity().get_key()])
+        self.assertNotEqual(tx.get_hash(), h)
+        self.assertEqual(tx.get_hash_unsigned(), h_unsigned)
+        tx1 = Transaction.deserialize(tx.serialize())
+        self.assertEqual(tx.get_hash(), tx1.get_hash())
+
+    def test_evm_transaction_memo(self):
+        id1 = Identity.create_random_identity()
+        evm_tx = EvmTransaction(
+            nonce=0,
+            gasprice=1,
+            startgas=21000,
+            to=Address.create_random_account().recipient,
+            value=1,
+            data=b"",
+        )
+        evm_tx.sign(id1.get_key())
+        code = Code.create_evm_code(evm_tx)
+        self.assertIs(code.get_evm_transaction(), evm_tx)
+
+        code1 = Code.deserialize(code.serialize())
+        evm_tx1 = code1.get_evm_transaction()
+        self.assertIsNot(evm_tx1, evm_tx)
+        self.assertIs(code1.get_evm_transaction(), evm_tx1)
+        self.assertEqual(evm_tx1, evm_tx)
+
+        # the decoded tx is dropped once the code is reassigned
+        code1.code = Code.create_evm_code(evm_tx1).code
+        self.assertIsNot(code1.get_evm_transaction(), evm_tx1)
+        self.assertEqual(code1.get_evm_transaction(), evm_tx)
+
+    def test_sender_cache(self):
+        id1 = Identity.create_random_identity()
+        evm_tx = EvmTransaction(
+            nonce=0,
+            gasprice=1,
+            startgas=21000,
+            to=Address.create_random_account().recipient,
+            value=1,
+            data=b"",
+        )
+        evm_tx.sign(id1.get_key())
+        data = Code.create_evm_code(evm_tx).serialize()
+
+        transactions.sender_cache.clear()
+        transactions.sender_cache.hits = transactions.sender_cache.misses = 0
+        sender = Code.deserialize(data).get_evm_transaction().sender
+        self.assertEqual(sender, id1.get_recipient())
+        self.assertEqual(transactions.sender_cache.misses, 1)
+        # decoded again (e.g., from a block) without recovering the sender
+        self.assertEqual(Code.deserialize(data).get_evm_transaction().sender, sender)
+        self.assertEqual(transactions.sender_cache.hits, 1)
+
+
+def create_random_value(ser):
+    if isinstance(ser, UintSerializer):
+        return random.randint(0, 256 ** ser.size - 1)
+    if isinstance(ser, FixedSizeBytesSerializer):
+        return bytes(random.getrandbits(8) for _ in range(ser.size))
+    if isinstance(ser, PrependedSizeBytesSerializer):
+        return bytes(random.getrandbits(8) for _ in range(random.randint(0, 10)))
+    if ser is biguint:
+        return random.getrandbits(random.randint(1, 256))
+    return ser(**{name: create_random_value(s) for name, s in ser.FIELDS})
+
+
+class TestCompiledSerializers(unittest.TestCase):
+    def test_round_trip(self):
+        for cls in [
+            MinorBlockHeader,
+            MinorBlockMeta,
+            RootBlockHeader,
+            CrossShardTransactionDeposit,
+        ]:
+            with self.subTest(cls.__name__):
+                for _ in range(100):
+                    obj = create_random_value(cls)
+                    # the byte format must be the same as serializing the fields one by one
+                    barray = bytearray()
+                    for name, ser in cls.FIELDS:
+                        ser.serialize(getattr(obj, name), barray)
+                    self.assertEqual(obj.serialize(), barray)
+                    self.assertEqual(cls.deserialize(barray), obj)
+
+    def test_invalid_fixed_size_bytes(self):
+        header = MinorBlockHeader(hash_prev_minor_block=bytes(31))
+        self.assertRaises(RuntimeError, header.serialize)
+        data = MinorBlockHeader().serialize()
+        self.assertRaises(RuntimeError, MinorBlockHeader.deserialize, data[:-1])
+
+
 class SimpleHeaderV0(Serializable):
     FIELDS = [
         ("version", uint32),
@@ -0,0 +1,98 @@
+import threading
+import unittest
+
+from quarkchain.db import InMemoryDb, OverlayDb
+
+
+class TestWriteBatch(unittest.TestCase):
+    def test_in_memory_db_write_batch(self):
+        db = InMemoryDb()
+        db.put(b"a", b"1")
+        db.put(b"b", b"2")
+        with db.write_batch():
+            db.put(b"c", b"3")
+            db.remove(b"a")
+            # pending writes are visible inside the batch
+            self.assertEqual(db.get(b"c"), b"3")
+            self.assertIsNone(db.get(b"a"))
+            self.assertNotIn(b"a", db)
+            # but not written yet
+            self.assertNotIn(b"c", db.kv)
+            self.assertIn(b"a", db.kv)
+            with self.assertRaises(KeyError):
+                db.remove(b"d")
+        self.assertEqual(db.kv, {b"b": b"2", b"c": b"3"})
+
+    def test_in_memory_db_write_batch_exception(self):
+        db = InMemoryDb()
+        db.put(b"a", b"1")
+        with self.assertRaises(ValueError):
+            with db.write_batch():
+                db.put(b"b", b"2")
+                db.remove(b"a")
+                raise ValueError()
+        self.assertEqual(db.kv, {b"a": b"1"})
+
+        # the db is usable after a failed batch
+        db.put(b"b", b"2")
+        self.assertEqual(db.get(b"b"), b"2")
+
+    def test_nested_write_batch(self):
+        db = InMemoryDb()
+        with db.write_batch():
+            db.put(b"a", b"1")
+            with db.write_batch():
+                db.put(b"b", b"2")
+            self.assertEqual(db.kv, {})
+        self.assertEqual(db.kv, {b"a": b"1", b"b": b"2"})
+
+    def test_overlay_db_write_batch(self):
+        db = InMemoryDb()
+        db.put(b"a", b"1")
+        overlay = OverlayDb(db)
+        with overlay.write_batch():
+            overlay.put(b"b", b"2")
+            overlay.delete(b"a")
+            self.assertNotIn(b"a", overlay)
+            self.assertEqual(overlay.get(b"b"), b"2")
+            self.assertEqual(overlay.overlay, {})
+        self.assertNotIn(b"a", overlay)
+        self.assertEqual(overlay.get(b"b"), b"2")
+        self.assertEqual(db.kv, {b"a": b"1"})
+
+    def test_in_memory_db_multi_get(self):
+        db = InMemoryDb()
+        db.put(b"a", b"1")
+        db.put(b"b", b"2")
+        with db.write_batch():
+            db.put(b"c", b"3")
+            db.remove(b"b")
+            self.assertEqual(
+                db.multi_get([b"a", b"b", b"c", b"d"]),
+                {b"a": b"1", b"b": None, b"c": b"3", b"d": None},
+            )
+
+    def test_write_batch_of_another_thread(self):
+        db = InMemoryDb()
+        db.put(b"a", b"1")
+        in_batch, read = threading.Event(), threading.Event()
+
+        def write():
+            with db.write_batch():
+                db.put(b"b", b"2")
+                db.remove(b"a")
+                in_batch.set()
+                read.wait()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        in_batch.wait()
+        # only the committed data is read outside the thread writing the batch
+        self.assertEqual(db.get(b"a"), b"1")
+        self.assertIsNone(db.get(b"b"))
+        self.assertNotIn(b"b", db)
+        db.put(b"c", b"3")
+        self.assertEqual(db.kv[b"c"], b"3")
+        read.set()
+        thread.join()
+        self.assertEqual(db.kv, {b"b": b"2", b"c": b"3"})
@@ -1,5 +1,8 @@
+import asyncio
 import pytest
 import random
+import threading
+import time
 
 from quarkchain.core import (
     Address,
@@ -10,7 +13,14 @@ from quarkchain.core import (
     random_bytes,
 )
 
-from quarkchain.utils import token_id_encode, token_id_decode, ZZZZZZZZZZZZ
+from quarkchain.utils import (
+    token_id_encode,
+    token_id_decode,
+    ZZZZZZZZZZZZ,
+    LRUCache,
+    HeightWindowPool,
+    EventLoopLagMonitor,
+)
 
 
 def create_test_transaction(
@@ -89,3 +99,120 @@ def test_token_id_exceptions():
         token_id_decode(-1)
     with pytest.raises(AssertionError):
         token_id_decode(ZZZZZZZZZZZZ + 1)
+
+
+def test_lru_cache():
+    cache = LRUCache(10)
+    cache.put(b"a", 1, size=4)
+    cache.put(b"b", 2, size=4)
+    assert cache.get(b"a") == 1
+    # evicts the least recently used one
+    cache.put(b"c", 3, size=4)
+    assert b"b" not in cache
+    assert cache.get(b"b") is None
+    assert cache.get(b"c") == 3
+    assert cache.size == 8
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # too large to be cached
+    cache.put(b"d", 4, size=11)
+    assert b"d" not in cache
+    assert len(cache) == 2
+
+    assert cache.pop(b"a") == 1
+    assert cache.size == 4
+    cache.set_max_size(0)
+    assert len(cache) == 0 and cache.size == 0
+
+
+def test_lru_cache_threads():
+    cache = LRUCache(100)
+    errors = []
+
+    def run(seed):
+        rand = random.Random(seed)
+        try:
+            for _ in range(20000):
+                key = rand.randrange(200)
+                if rand.random() < 0.5:
+                    cache.put(key, key, size=rand.randrange(1, 4))
+                elif rand.random() < 0.9:
+                    assert cache.get(key) in (None, key)
+                else:
+                    cache.pop(key)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert cache.size == sum(size for _, size in cache._entries.values())
+    assert cache.size <= cache.max_size
+
+
+def test_height_window_pool():
+    stored = {b"a": (1, 0), b"b": (2, 1), b"c": (3, 2), b"x": (-1, 0)}
+    pool = HeightWindowPool(2, lambda key: stored.get(key))
+    pool.put(b"b", 2, 1)
+    pool.put(b"a", 1, 0)
+    # nothing is read from db before any eviction
+    assert b"x" not in pool
+    pool.put(b"c", 3, 2)
+    # evicts the lowest block
+    assert len(pool) == 2
+    assert pool.evicted_height == 0
+    assert pool.get(b"a") == 1
+    assert b"x" in pool
+    # blocks above the evicted ones are only looked up in memory
+    del pool[b"c"]
+    assert pool.get(b"c") is None
+    assert pool.get(b"d", 4) == 4
+
+
+def test_height_window_pool_compact_and_missing():
+    stored = dict()
+
+    def load(key):
+        stored["loads"] = stored.get("loads", 0) + 1
+        return None
+
+    pool = HeightWindowPool(10, load)
+    for i in range(20):
+        pool.put(i, i, i)
+    # the heap does not grow with the blocks removed
+    for _ in range(100):
+        for i in range(15, 20):
+            del pool[i]
+        for i in range(15, 20):
+            pool.put(i, i, i)
+    assert len(pool._heights) <= 2 * len(pool) + 1
+    assert [pool.get(i) for i in range(10, 20)] == list(range(10, 20))
+
+    # a block not stored is only loaded once until it is put
+    assert pool.get(b"x") is None
+    assert b"x" not in pool
+    assert stored["loads"] == 1
+    pool.put(b"x", 1, 20)
+    assert pool.get(b"x") == 1
+
+
+def test_event_loop_lag_monitor():
+    loop = asyncio.get_event_loop()
+    monitor = EventLoopLagMonitor(interval=0.01, loop=loop)
+    monitor.start()
+
+    async def block_loop():
+        await asyncio.sleep(0.05)
+        time.sleep(0.2)
+        await asyncio.sleep(0.05)
+
+    loop.run_until_complete(block_loop())
+    monitor.stop()
+    assert monitor.num_samples > 0
+    assert monitor.max_lag >= 0.15
+    assert monitor.average_lag() <= monitor.max_lag
+    monitor.reset()
+    assert monitor.max_lag == 0 and monitor.average_lag() == 0
@@ -1,11 +1,14 @@
 import asyncio
+import collections
 import ctypes
 import hashlib
+import heapq
 import io
 import logging
 import os
 import re
 import sys
+import threading
 import time
 import traceback
 
@@ -441,6 +444,195 @@ def time_ms():
     return int(time.time() * 1e3)
 
 
+class LRUCache:
+    """ A least-recently-used cache bounded by the total size of its entries.
+    The size of an entry is given on put() and defaults to 1, i.e., bounded by the number of entries.
+    Hits and misses of get() are counted for sizing the cache.
+    Thread-safe, as the process-wide caches are shared by the event loop and the shard state threads.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size=1):
+        with self._lock:
+            self.__pop(key)
+            if size > self.max_size:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            self.__evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self.__pop(key, default)
+
+    def __pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self.size -= entry[1]
+        return entry[0]
+
+    def __evict(self):
+        while self.size > self.max_size:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def set_max_size(self, max_size):
+        with self._lock:
+            self.max_size = max_size
+            self.__evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class HeightWindowPool:
+    """ A dict-like pool of block hash -> value keeping the max_size highest blocks in memory.
+    The lower blocks are evicted and looked up with load(hash), which returns (value, height)
+    or None if the block is not stored.  Only the loaded blocks no higher than the evicted ones
+    are accepted so that the blocks near the tip are exactly the ones put into the pool,
+    e.g., the forks stored before a restart but not recovered are not picked up.
+    The hashes recently not found by load() are remembered until they are put into the pool.
+    """
+
+    def __init__(self, max_size, load):
+        self.max_size = max_size
+        self.load = load
+        # the highest height ever evicted from memory
+        self.evicted_height = -1
+        self._entries = dict()  # hash -> (value, height)
+        self._heights = []  # heap of (height, hash), may contain removed entries
+        self._missing = LRUCache(max_size)  # hash -> True of the blocks not stored
+
+    def put(self, key, value, height):
+        self._missing.pop(key)
+        self._entries[key] = (value, height)
+        heapq.heappush(self._heights, (height, key))
+        while len(self._entries) > self.max_size:
+            height, key = heapq.heappop(self._heights)
+            entry = self._entries.get(key, None)
+            if entry is None or entry[1] != height:
+                continue
+            del self._entries[key]
+            self.evicted_height = max(self.evicted_height, height)
+        self.__compact_heights()
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key, None)
+        if entry is not None:
+            return entry[0]
+        if self.evicted_height < 0 or key in self._missing:
+            return default
+        entry = self.load(key)
+        if entry is None:
+            self._missing.put(key, True)
+            return default
+        if entry[1] > self.evicted_height:
+            return default
+        return entry[0]
+
+    def pop(self, key, default=None):
+        """ Remove the block from memory only """
+        entry = self._entries.pop(key, None)
+        self.__compact_heights()
+        return default if entry is None else entry[0]
+
+    def __compact_heights(self):
+        # drop the removed or replaced entries once they make up half of the heap
+        if len(self._heights) <= 2 * len(self._entries) + 1:
+            return
+        self._heights = [(height, key) for key, (_, height) in self._entries.items()]
+        heapq.heapify(self._heights)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __delitem__(self, key):
+        if key not in self._entries:
+            raise KeyError(key)
+        self.pop(key)
+
+    def __len__(self):
+        """ Number of the blocks in memory """
+        return len(self._entries)
+
+
+class EventLoopLagMonitor:
+    """ Measure how late the event loop wakes up a task sleeping for interval seconds,
+    i.e., how long the loop is blocked by the callbacks running on it.
+    """
+
+    def __init__(self, interval=0.1, warning_lag=1.0, loop=None):
+        self.interval = interval
+        self.warning_lag = warning_lag
+        self.loop = loop or asyncio.get_event_loop()
+        self.num_samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = self.loop.create_task(self.__run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def reset(self):
+        self.num_samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    def average_lag(self):
+        return self.total_lag / self.num_samples if self.num_samples else 0.0
+
+    async def __run(self):
+        while True:
+            start_time = self.loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self.loop.time() - start_time - self.interval)
+            self.last_lag = lag
+            self.num_samples += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.warning_lag:
+                Logger.warning_every_sec(
+                    "event loop blocked for {:.3f} seconds".format(lag), 1
+                )
+
+
 TOKEN_BASE = 36
 ZZZZZZZZZZZZ = 4873763662273663091
 